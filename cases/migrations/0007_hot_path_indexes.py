@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0006_case_confluence_page_id_case_confluence_page_url_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['requester_id', '-created_at'], name='case_requester_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='case',
+            index=models.Index(fields=['-created_at'], name='case_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='followupquestion',
+            index=models.Index(fields=['case', 'status', 'order_index'], name='followup_case_status_order_idx'),
+        ),
+    ]
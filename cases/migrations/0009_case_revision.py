@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0008_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='case',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
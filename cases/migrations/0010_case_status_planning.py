@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0009_case_revision'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='case',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('planning', 'Planning'), ('in_progress', 'In progress'), ('ready_for_documents', 'Ready for documents'), ('documents_generated', 'Documents generated'), ('approved', 'Approved')], default='draft', max_length=64),
+        ),
+    ]
@@ -1,10 +1,12 @@
 # cases/models.py
+import copy
 import uuid
 from django.db import models
 
 
 class CaseStatus(models.TextChoices):
     DRAFT = "draft", "Draft"
+    PLANNING = "planning", "Planning"  # план уточняющих вопросов строится в фоне
     IN_PROGRESS = "in_progress", "In progress"
     READY_FOR_DOCUMENTS = "ready_for_documents", "Ready for documents"
     DOCUMENTS_GENERATED = "documents_generated", "Documents generated"
@@ -17,7 +19,7 @@ class Case(models.Model):
     Флоу:
     1) Создаём кейс (title + requester).
     2) Заполняем 8 базовых ответов + выбираем типы документов.
-    3) Генерируем план уточняющих вопросов.
+    3) Генерируем план уточняющих вопросов (в фоне, статус PLANNING).
     4) Пользователь отвечает на уточняющие вопросы.
     5) Генерируем документы.
     6) BA одобряет документы → отправляем всё в Confluence.
@@ -65,13 +67,110 @@ class Case(models.Model):
         help_text="URL созданной страницы в Confluence"
     )
 
+    # Ревизия кейса: растёт при изменении полей контекста (REVISION_FIELDS) и follow-up вопросов.
+    # Ключ кэша контекста кейса (documents.services.context_builder.get_case_context),
+    # поэтому массовые .update() по кейсам и вопросам должны вызывать bump_revision().
+    revision = models.PositiveIntegerField(default=0)
+
+    # Поля, из которых собирается контекст кейса (build_case_context);
+    # SNAPSHOT_CASE_KEYS — их подмножество. status, confluence_page_* и updated_at
+    # в контекст не входят и ревизию не сдвигают.
+    REVISION_FIELDS = (
+        "title",
+        "initial_answers",
+        "selected_document_types",
+        "confluence_space_key",
+        "confluence_space_name",
+    )
+
     class Meta:
         verbose_name = "Case"
         verbose_name_plural = "Cases"
+        indexes = [
+            # список кейсов заявителя, свежие сверху
+            models.Index(fields=["requester_id", "-created_at"], name="case_requester_created_idx"),
+            models.Index(fields=["-created_at"], name="case_created_idx"),
+            # фильтры списка кейсов + keyset-пагинация по -created_at
+            models.Index(fields=["status", "-created_at"], name="case_status_created_idx"),
+            models.Index(
+                fields=["confluence_space_key", "-created_at"],
+                name="case_space_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Case {self.id} (title={self.title}, status={self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_revision_values()
+        return instance
+
+    def _remember_revision_values(self):
+        # копия: JSON-поля (initial_answers) правят на месте
+        deferred = self.get_deferred_fields()
+        self._revision_values = {
+            name: copy.deepcopy(getattr(self, name))
+            for name in self.REVISION_FIELDS
+            if name not in deferred
+        }
+
+    def _revision_fields_changed(self, update_fields) -> bool:
+        names = [
+            name for name in self.REVISION_FIELDS
+            if update_fields is None or name in update_fields
+        ]
+        loaded = getattr(self, "_revision_values", None)
+        if loaded is None:
+            # объект не из БД — сравнить не с чем
+            return bool(names)
+        return any(name not in loaded or getattr(self, name) != loaded[name] for name in names)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            self._remember_revision_values()
+            return
+
+        update_fields = kwargs.get("update_fields")
+        if not self._revision_fields_changed(update_fields):
+            # ревизию не пишем вовсе: локальное значение могло отстать от БД
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.attname for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs["update_fields"] = [name for name in update_fields if name != "revision"]
+            super().save(*args, **kwargs)
+            return
+
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "revision"}
+
+        # инкремент в самом UPDATE — параллельные save() не теряют ревизии;
+        # локально previous + 1 без повторного SELECT: при гонке get_case_context
+        # всё равно сверяет ревизию с БД и перечитывает кейс
+        previous = self.revision
+        self.revision = models.F("revision") + 1
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            self.revision = previous
+            raise
+        self.revision = previous + 1
+        self._remember_revision_values()
+
+    @classmethod
+    def bump_revision(cls, case_id, **fields) -> None:
+        """
+        Сдвигает ревизию кейса без save() — для изменений, которые идут
+        мимо Case.save() (follow-up вопросы, массовые операции).
+        fields — другие поля кейса, которые пишутся тем же UPDATE.
+        """
+        cls.objects.filter(pk=case_id).update(revision=models.F("revision") + 1, **fields)
+
 
 class FollowupQuestionStatus(models.TextChoices):
     PENDING = "pending", "Pending"
@@ -120,6 +219,23 @@ class FollowupQuestion(models.Model):
         verbose_name = "Follow-up question"
         verbose_name_plural = "Follow-up questions"
         ordering = ["order_index", "created_at"]
+        indexes = [
+            # следующий вопрос: filter(case, status).order_by(order_index)
+            models.Index(
+                fields=["case", "status", "order_index"],
+                name="followup_case_status_order_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"FollowupQuestion {self.id} for case {self.case_id} ({self.status})"
+
+    # ответы на вопросы входят в контекст кейса — любое изменение сдвигает его ревизию
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Case.bump_revision(self.case_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Case.bump_revision(self.case_id)
+        return result
@@ -0,0 +1,88 @@
+# cases/pagination.py
+from datetime import datetime
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class CaseCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация списка кейсов по (-created_at, -id):
+    каждая страница — это WHERE (created_at, id) < <курсор> ORDER BY ... LIMIT,
+    поэтому время ответа не зависит ни от номера страницы, ни от числа кейсов.
+
+    Позиция курсора — пара "created_at|id": кейсы с одинаковым created_at
+    различаются по id, и страницы не теряют и не дублируют строки
+    (штатный CursorPagination смотрит только на первое поле сортировки).
+    """
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        # читаем на каждый запрос, а не при импорте — override_settings и
+        # изменение настройки без перезапуска воркера работают
+        self.page_size = int(getattr(settings, "CASES_PAGE_SIZE", 20))
+        return super().get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        if reverse:
+            queryset = queryset.order_by("created_at", "id")
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor and self.cursor.position is not None:
+            created_at, pk = self._parse_position(self.cursor.position)
+            op = "gt" if reverse else "lt"
+            queryset = queryset.filter(
+                Q(**{f"created_at__{op}": created_at})
+                | Q(created_at=created_at, **{f"id__{op}": pk})
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+
+        has_following = len(results) > len(self.page)
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if has_following else None
+        )
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = self.cursor.position is not None
+            self.has_previous = has_following
+            self.next_position = self.cursor.position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following
+            self.has_previous = bool(self.cursor and self.cursor.position is not None)
+            self.next_position = following_position
+            self.previous_position = self.cursor.position if self.cursor else None
+
+        # позиции уникальны, смещение внутри одинаковых значений не нужно
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f"{instance.created_at.isoformat()}|{instance.pk}"
+
+    def _parse_position(self, position):
+        try:
+            created_at, pk = position.split("|", 1)
+            return datetime.fromisoformat(created_at), UUID(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
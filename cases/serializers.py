@@ -7,7 +7,7 @@ from .models import (
     FollowupQuestion,
     FollowupQuestionStatus,
 )
-from .services.followup import generate_followup_questions_for_case
+from .services.followup import schedule_followup_plan
 
 
 # Ключи для 8 обязательных вопросов
@@ -107,6 +107,29 @@ class CaseSessionCreateSerializer(serializers.ModelSerializer):
         return case
 
 
+class CaseListSerializer(serializers.ModelSerializer):
+    """
+    Лёгкий сериализатор для GET /api/cases/ — только «шапка» кейса.
+    initial_answers / selected_document_types не читаются вовсе:
+    queryset списка ограничен .only(*CaseListSerializer.Meta.fields).
+    """
+
+    class Meta:
+        model = Case
+        fields = (
+            "id",
+            "title",
+            "requester_id",
+            "requester_name",
+            "status",
+            "confluence_space_key",
+            "confluence_space_name",
+            "created_at",
+            "updated_at",
+        )
+        read_only_fields = fields
+
+
 class CaseInitialAnswersSerializer(serializers.ModelSerializer):
     """
     Шаг 2: сохранение ответов на 8 вопросов и типов документов
@@ -199,8 +222,9 @@ class CaseInitialAnswersSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         """
         Обновляем initial_answers и selected_document_types,
-        Confluence-пространство, ставим статус IN_PROGRESS
-        и генерируем план уточняющих вопросов.
+        Confluence-пространство, ставим статус PLANNING
+        и запускаем построение плана уточняющих вопросов в фоне
+        (когда план готов, кейс переходит в IN_PROGRESS).
         """
         initial_answers = validated_data.get("initial_answers")
         selected_document_types = validated_data.get("selected_document_types")
@@ -219,11 +243,11 @@ class CaseInitialAnswersSerializer(serializers.ModelSerializer):
         if space_name is not None:
             instance.confluence_space_name = space_name
 
-        instance.status = CaseStatus.IN_PROGRESS
+        instance.status = CaseStatus.PLANNING
         instance.save()
 
-        # Генерация плана уточняющих вопросов (GPT/заглушка)
-        generate_followup_questions_for_case(instance)
+        # План уточняющих вопросов (GPT/fallback) строится вне запроса
+        schedule_followup_plan(instance)
 
         instance.refresh_from_db()
         return instance
@@ -292,6 +316,9 @@ class NextQuestionResponseSerializer(serializers.Serializer):
         child=serializers.CharField(), allow_empty=True
     )
     is_finished = serializers.BooleanField()
+    is_planning = serializers.BooleanField(
+        help_text="План вопросов ещё строится — повторите запрос позже.",
+    )
 
 
 class AnswerQuestionSerializer(serializers.Serializer):
@@ -303,3 +330,22 @@ class AnswerQuestionSerializer(serializers.Serializer):
         allow_blank=False,
         help_text="Ответ пользователя на уточняющий вопрос.",
     )
+
+
+class BulkAnswerQuestionsSerializer(serializers.Serializer):
+    """
+    Тело запроса при ответе сразу на несколько уточняющих вопросов.
+    """
+    answers = AnswerQuestionSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=100,
+        help_text="Список пар {question_id, answer}.",
+    )
+
+
+class BulkAnswerResponseSerializer(NextQuestionResponseSerializer):
+    """
+    Ответ на пачку ответов: сколько вопросов отвечено + следующий вопрос.
+    """
+    answered_count = serializers.IntegerField()
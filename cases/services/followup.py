@@ -3,11 +3,17 @@
 import json
 import logging
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 
-from openai import OpenAI
+from datetime import timedelta
 
-from cases.models import Case, FollowupQuestion, FollowupQuestionStatus
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from cases.models import Case, CaseStatus, FollowupQuestion, FollowupQuestionStatus
+from documents.services.llm_gateway import get_client
+from forte_ai_back import background
 
 logger = logging.getLogger(__name__)
 
@@ -104,25 +110,21 @@ def generate_followup_questions_for_case(case: Case) -> List[FollowupQuestion]:
     Генерирует план уточняющих вопросов для кейса с помощью GPT.
 
     Алгоритм:
-    1. Удаляем старые follow-up вопросы для кейса.
-    2. Формируем промпт на основе title, 8 ответов и типов документов.
-    3. Вызываем GPT (gpt-4.1-mini), просим вернуть строго JSON с полем questions[].
-    4. Валидируем ответ и создаём FollowupQuestion в БД.
-    5. Если что-то пошло не так — используем fallback-вопросы.
+    1. Формируем промпт на основе title, 8 ответов и типов документов.
+    2. Вызываем GPT (gpt-4.1-mini), просим вернуть строго JSON с полем questions[].
+       На ответ даётся FOLLOWUP_PLAN_LLM_TIMEOUT секунд, без повторов.
+    3. Валидируем ответ.
+    4. Если что-то пошло не так или GPT не уложился в бюджет — fallback-вопросы.
+    5. Одной транзакцией заменяем старый план новым (bulk_create).
     """
 
-    # Чистим прошлый план вопросов
-    case.followup_questions.all().delete()
-
     # Если нет initial_answers — генерировать нечего
     if not case.initial_answers:
         logger.warning(
             "generate_followup_questions_for_case: case %s has no initial_answers",
             case.id,
         )
-        return []
-
-    client = OpenAI()
+        return _replace_plan(case, [])
 
     system_prompt = (
         "Ты опытный бизнес-аналитик в крупном банке. "
@@ -160,7 +162,9 @@ def generate_followup_questions_for_case(case: Case) -> List[FollowupQuestion]:
     questions_def: List[Dict[str, Any]] = []
 
     try:
-        response = client.chat.completions.create(
+        # латентный бюджет: один запрос без повторов — дольше ждать хуже, чем fallback
+        response = get_client().chat.completions.create(
+            timeout=float(getattr(settings, "FOLLOWUP_PLAN_LLM_TIMEOUT", 20)),
             model=DEFAULT_GPT_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -226,15 +230,19 @@ def generate_followup_questions_for_case(case: Case) -> List[FollowupQuestion]:
         )
         questions_def = _fallback_questions(case)
 
-    # Если даже fallback пустой — выходим
-    if not questions_def:
-        return []
+    return _replace_plan(case, questions_def)
 
-    # Создаём вопросы в БД
-    created_questions: List[FollowupQuestion] = []
 
-    for index, q in enumerate(questions_def):
-        fq = FollowupQuestion.objects.create(
+def _replace_plan(case: Case, questions_def: List[Dict[str, Any]]) -> List[FollowupQuestion]:
+    """
+    Заменяет план вопросов кейса одной транзакцией: DELETE + один bulk INSERT,
+    и переводит кейс PLANNING -> IN_PROGRESS.
+    Под локом кейса перепроверяем статус: если кейс уже ушёл из PLANNING
+    (план записал recover_stuck_planning, пользователь начал отвечать),
+    опоздавший план отбрасываем — иначе он стёр бы вопросы вместе с ответами.
+    """
+    questions = [
+        FollowupQuestion(
             case=case,
             order_index=index,
             code=q.get("code"),
@@ -242,12 +250,192 @@ def generate_followup_questions_for_case(case: Case) -> List[FollowupQuestion]:
             target_document_types=q.get("target_document_types") or [],
             status=FollowupQuestionStatus.PENDING,
         )
-        created_questions.append(fq)
+        for index, q in enumerate(questions_def)
+    ]
+
+    with transaction.atomic():
+        locked_status = (
+            Case.objects.select_for_update()
+            .filter(pk=case.pk)
+            .values_list("status", flat=True)
+            .first()
+        )
+        if locked_status != CaseStatus.PLANNING:
+            logger.info(
+                "Case %s is no longer planning (status=%s), dropping late follow-up plan",
+                case.id,
+                locked_status,
+            )
+            return []
+
+        case.followup_questions.all().delete()
+        FollowupQuestion.objects.bulk_create(questions)
+        # delete()/bulk_create идут мимо FollowupQuestion.save() — ревизию сдвигаем
+        # тем же UPDATE, что и статус
+        Case.bump_revision(case.pk, status=CaseStatus.IN_PROGRESS, updated_at=timezone.now())
 
     logger.info(
         "Generated %d follow-up questions for case %s",
-        len(created_questions),
+        len(questions),
         case.id,
     )
 
-    return created_questions
+    return questions
+
+
+# ======================= Фоновое планирование =======================
+
+
+def plan_followup_questions(case_id) -> None:
+    """
+    Фоновая задача: строит план вопросов и переводит кейс PLANNING -> IN_PROGRESS.
+    Если кейс за это время ушёл из PLANNING (например, план уже собран
+    через recover_stuck_planning), план отбрасывается (см. _replace_plan).
+    """
+    case = Case.objects.filter(pk=case_id).first()
+    if case is None or case.status != CaseStatus.PLANNING:
+        return
+
+    try:
+        generate_followup_questions_for_case(case)
+    except Exception:
+        logger.exception("Follow-up planning failed for case %s, using fallback", case_id)
+        _replace_plan(case, _fallback_questions(case) if case.initial_answers else [])
+
+
+def schedule_followup_plan(case: Case) -> None:
+    """
+    Ставит построение плана вопросов в фон (после коммита транзакции).
+    Кейс должен быть уже сохранён в статусе PLANNING.
+    FOLLOWUP_PLAN_ASYNC=0 — строить сразу в запросе.
+    """
+    if getattr(settings, "FOLLOWUP_PLAN_ASYNC", True):
+        background.submit_on_commit(plan_followup_questions, case.id)
+    else:
+        plan_followup_questions(case.id)
+
+
+def recover_stuck_planning(case: Case) -> bool:
+    """
+    Фоновые задачи живут в памяти процесса: если процесс перезапустился,
+    кейс остаётся в PLANNING навсегда. Через FOLLOWUP_PLAN_STALE_SECONDS
+    без результата сразу пишем детерминированный fallback-план.
+    """
+    if case.status != CaseStatus.PLANNING:
+        return False
+
+    stale_after = timedelta(seconds=float(getattr(settings, "FOLLOWUP_PLAN_STALE_SECONDS", 120)))
+    if case.updated_at and timezone.now() - case.updated_at < stale_after:
+        return False
+
+    logger.warning("Follow-up planning for case %s is stuck, writing fallback plan", case.id)
+    _replace_plan(case, _fallback_questions(case) if case.initial_answers else [])
+    case.refresh_from_db(fields=["status", "revision", "updated_at"])
+    return True
+
+# ======================= Ответы и следующий вопрос =======================
+
+# колонки вопроса, нужные для ответа API и проставления ответов
+_QUESTION_STATE_FIELDS = ("id", "case_id", "order_index", "text", "target_document_types", "status")
+
+
+def get_next_question_state(
+    case: Case,
+    questions: Optional[Iterable[FollowupQuestion]] = None,
+) -> Dict[str, Any]:
+    """
+    Данные для NextQuestionResponseSerializer одним запросом (план — единицы
+    вопросов, поэтому total и первый pending считаем по уже загруженному списку).
+    Если вопросов не осталось — переводим кейс IN_PROGRESS -> READY_FOR_DOCUMENTS.
+    Пока план строится (PLANNING) — вопроса ещё нет, is_planning = true.
+    """
+    recover_stuck_planning(case)
+    if case.status == CaseStatus.PLANNING:
+        return {
+            "question_id": None,
+            "order_index": None,
+            "total_questions": 0,
+            "text": None,
+            "target_document_types": [],
+            "is_finished": False,
+            "is_planning": True,
+        }
+
+    if questions is None:
+        questions = case.followup_questions.only(*_QUESTION_STATE_FIELDS).order_by("order_index")
+    questions = sorted(questions, key=lambda q: q.order_index)
+
+    next_question = next(
+        (q for q in questions if q.status == FollowupQuestionStatus.PENDING),
+        None,
+    )
+
+    if next_question is None:
+        if case.status == CaseStatus.IN_PROGRESS:
+            case.status = CaseStatus.READY_FOR_DOCUMENTS
+            case.save(update_fields=["status"])
+
+        return {
+            "question_id": None,
+            "order_index": None,
+            "total_questions": len(questions),
+            "text": None,
+            "target_document_types": [],
+            "is_finished": True,
+            "is_planning": False,
+        }
+
+    return {
+        "question_id": next_question.id,
+        "order_index": next_question.order_index,
+        "total_questions": len(questions),
+        "text": next_question.text,
+        "target_document_types": next_question.target_document_types or [],
+        "is_finished": False,
+        "is_planning": False,
+    }
+
+
+def answer_followup_questions(
+    case: Case,
+    answers: List[Dict[str, Any]],
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Проставляет пачку ответов [{question_id, answer}] одной транзакцией
+    (bulk_update) и возвращает (число отвеченных вопросов, следующий вопрос).
+    Повторный question_id в пачке — побеждает последний ответ.
+    Вопросы чужого кейса -> ValueError, ничего не сохраняется.
+    """
+    by_id = {a["question_id"]: a["answer"] for a in answers}
+
+    with transaction.atomic():
+        questions = list(
+            case.followup_questions
+            .select_for_update()
+            .only(*_QUESTION_STATE_FIELDS, "answer_text", "updated_at")
+            .order_by("order_index")
+        )
+        known = {q.id: q for q in questions}
+
+        missing = [str(qid) for qid in by_id if qid not in known]
+        if missing:
+            raise ValueError(
+                f"Questions do not belong to this case or not found: {', '.join(missing)}"
+            )
+
+        now = timezone.now()
+        changed: List[FollowupQuestion] = []
+        for qid, answer in by_id.items():
+            question = known[qid]
+            question.answer_text = answer
+            question.status = FollowupQuestionStatus.ANSWERED
+            question.updated_at = now  # bulk_update не трогает auto_now
+            changed.append(question)
+
+        FollowupQuestion.objects.bulk_update(changed, ["answer_text", "status", "updated_at"])
+        # bulk_update идёт мимо FollowupQuestion.save()
+        Case.bump_revision(case.id)
+
+        state = get_next_question_state(case, questions)
+
+    return len(changed), state
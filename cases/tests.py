@@ -1,3 +1,350 @@
-from django.test import TestCase
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from cases.models import Case, CaseStatus, FollowupQuestion, FollowupQuestionStatus
+from cases.services import followup
+from documents.services.context_builder import SNAPSHOT_CASE_KEYS
+from documents.testing import (
+    ALL_DOC_TYPES,
+    SUPPORTED_VENDORS,
+    QueryBudgetTestMixin,
+    disable_seqscan,
+    first_answers,
+    hot_paths,
+    jwt_client,
+    make_case,
+    plan_uses_index,
+)
+
+
+class FollowupPlanTests(TestCase):
+    def setUp(self):
+        self.case = Case.objects.create(
+            title="followup test",
+            status=CaseStatus.PLANNING,
+            initial_answers={"idea": "Онлайн-заявка"},
+            selected_document_types=["vision", "scope"],
+        )
+
+    def test_plan_moves_case_to_in_progress(self):
+        questions = followup._replace_plan(self.case, [{"code": "q1", "text": "Вопрос?"}])
+
+        self.assertEqual(len(questions), 1)
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.status, CaseStatus.IN_PROGRESS)
+
+    def test_late_plan_after_recovery_is_dropped(self):
+        Case.objects.filter(pk=self.case.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.case.refresh_from_db()
+        self.assertTrue(followup.recover_stuck_planning(self.case))
+
+        answered = FollowupQuestion.objects.filter(case=self.case).order_by("order_index").first()
+        answered.answer_text = "Ответ пользователя"
+        answered.status = FollowupQuestionStatus.ANSWERED
+        answered.save()
+
+        # фоновый LLM-план опоздал
+        self.assertEqual(followup._replace_plan(self.case, [{"code": "late", "text": "Поздний вопрос?"}]), [])
+
+        answered.refresh_from_db()
+        self.assertEqual(answered.answer_text, "Ответ пользователя")
+        self.assertFalse(FollowupQuestion.objects.filter(case=self.case, code="late").exists())
+
+
+class CaseRevisionTests(TestCase):
+    """
+    Ревизия растёт только при изменении полей контекста и без лишнего SELECT.
+    """
+
+    def setUp(self):
+        Case.objects.create(title="revision test", initial_answers={"idea": "Онлайн-заявка"})
+        self.case = Case.objects.get()
+
+    def assertRevision(self, expected):
+        self.assertEqual(self.case.revision, expected)
+        self.assertEqual(Case.objects.values_list("revision", flat=True).get(), expected)
+
+    def test_snapshot_keys_are_revision_fields(self):
+        self.assertLessEqual(set(SNAPSHOT_CASE_KEYS), set(Case.REVISION_FIELDS))
+
+    def test_status_save_keeps_revision(self):
+        self.case.status = CaseStatus.DOCUMENTS_GENERATED
+        with self.assertNumQueries(1):
+            self.case.save(update_fields=["status"])
+        with self.assertNumQueries(1):
+            self.case.save()
+        self.assertRevision(0)
+
+    def test_context_field_change_bumps_revision_in_one_query(self):
+        self.case.title = "new title"
+        with self.assertNumQueries(1):
+            self.case.save(update_fields=["title"])
+        self.assertRevision(1)
+
+        self.case.initial_answers["idea"] = "Другая идея"
+        self.case.save()
+        self.assertRevision(2)
+
+    def test_stale_instance_does_not_roll_revision_back(self):
+        Case.bump_revision(self.case.pk)
+        self.case.status = CaseStatus.IN_PROGRESS
+        self.case.save()
+        self.assertEqual(Case.objects.values_list("revision", flat=True).get(), 1)
+
+
+class FollowupQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """
+    Число запросов не растёт с размером плана и укладывается в query_budgets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("budget@example.invalid", "pw", role=User.Role.ANALYTIC)
+
+    def setUp(self):
+        self.client = jwt_client(self.user)
+
+    def test_next_question_get(self):
+        for doc_count in (2, len(ALL_DOC_TYPES)):
+            case, _ = make_case(ALL_DOC_TYPES[:doc_count])
+            self.assertRequestQueries(self.client, "GET", f"/api/cases/{case.id}/next-question/", 3)
+
+    def test_bulk_answer_post(self):
+        for doc_count in (2, len(ALL_DOC_TYPES)):
+            case, _ = make_case(ALL_DOC_TYPES[:doc_count])
+            self.assertRequestQueries(
+                self.client,
+                "POST",
+                f"/api/cases/{case.id}/answer-questions/",
+                7,
+                first_answers(case),
+            )
+
+
+class BulkAnswerTests(TestCase):
+    """
+    POST /api/cases/{id}/answer-questions/: валидация, всё-или-ничего,
+    повторные question_id.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bulk@example.invalid", "pw", role=User.Role.ANALYTIC)
+
+    def setUp(self):
+        self.client = jwt_client(self.user)
+        self.case, _ = make_case(ALL_DOC_TYPES[:3])
+        self.questions = list(self.case.followup_questions.order_by("order_index"))
+        self.url = f"/api/cases/{self.case.id}/answer-questions/"
+
+    def _post(self, answers):
+        return self.client.post(self.url, {"answers": answers}, format="json")
+
+    def _answer(self, question, text="Ответ"):
+        return {"question_id": str(question.id), "answer": text}
+
+    def _answered(self):
+        return dict(
+            self.case.followup_questions
+            .filter(status=FollowupQuestionStatus.ANSWERED)
+            .values_list("code", "answer_text")
+        )
+
+    def test_answers_batch_and_returns_next_question(self):
+        resp = self._post([self._answer(self.questions[0], "Первый"), self._answer(self.questions[1], "Второй")])
+
+        self.assertEqual(resp.status_code, 200, resp.content)
+        body = resp.json()
+        self.assertEqual(body["answered_count"], 2)
+        self.assertEqual(body["question_id"], str(self.questions[2].id))
+        self.assertEqual(body["total_questions"], 3)
+        self.assertFalse(body["is_finished"])
+        self.assertEqual(
+            self._answered(),
+            {self.questions[0].code: "Первый", self.questions[1].code: "Второй"},
+        )
+
+    def test_last_answers_finish_the_plan(self):
+        resp = self._post([self._answer(q) for q in self.questions])
+
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertTrue(resp.json()["is_finished"])
+        self.assertIsNone(resp.json()["question_id"])
+        self.case.refresh_from_db()
+        self.assertEqual(self.case.status, CaseStatus.READY_FOR_DOCUMENTS)
+
+    def test_validation_errors(self):
+        question = self.questions[0]
+        for answers in (
+            [],
+            [{"question_id": "not-a-uuid", "answer": "Ответ"}],
+            [{"question_id": str(question.id)}],
+            [{"question_id": str(question.id), "answer": ""}],
+            [self._answer(question)] * 101,
+        ):
+            with self.subTest(answers=answers[:2]):
+                self.assertEqual(self._post(answers).status_code, 400)
+
+        self.assertEqual(self.client.post(self.url, {}, format="json").status_code, 400)
+        self.assertEqual(self._answered(), {})
+
+    def test_unknown_question_rejects_whole_batch(self):
+        other_case, _ = make_case(ALL_DOC_TYPES[:1])
+        foreign = other_case.followup_questions.get()
+        revision = Case.objects.get(pk=self.case.pk).revision
+
+        for stray in (foreign.id, uuid.uuid4()):
+            with self.subTest(stray=stray):
+                resp = self._post([
+                    self._answer(self.questions[0]),
+                    {"question_id": str(stray), "answer": "Ответ"},
+                ])
+                self.assertEqual(resp.status_code, 400)
+                self.assertIn(str(stray), resp.json()[0])
+
+        # валидный ответ из той же пачки не сохранён, ревизия кейса не сдвинулась
+        self.assertEqual(self._answered(), {})
+        self.assertEqual(Case.objects.get(pk=self.case.pk).revision, revision)
+        self.assertFalse(other_case.followup_questions.filter(status=FollowupQuestionStatus.ANSWERED).exists())
+
+    def test_failure_mid_batch_rolls_back(self):
+        with mock.patch.object(Case, "bump_revision", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                followup.answer_followup_questions(
+                    self.case,
+                    [{"question_id": q.id, "answer": "Ответ"} for q in self.questions[:2]],
+                )
+        self.assertEqual(self._answered(), {})
+
+    def test_duplicate_question_id_last_answer_wins(self):
+        question = self.questions[0]
+        resp = self._post([self._answer(question, "Черновик"), self._answer(question, "Итог")])
+
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp.json()["answered_count"], 1)
+        self.assertEqual(self._answered(), {question.code: "Итог"})
+
+    def test_client_cannot_answer_foreign_case(self):
+        Case.objects.filter(pk=self.case.pk).update(requester_id="someone-else")
+        client_user = User.objects.create_user("bulk-client@example.invalid", "pw")
+
+        resp = jwt_client(client_user).post(self.url, {"answers": [self._answer(self.questions[0])]}, format="json")
+
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(self._answered(), {})
+
+
+class CaseListPaginationTests(TestCase):
+    """
+    Cursor-пагинация и фильтры GET /api/cases/.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("list-admin@example.invalid", "pw", role=User.Role.ANALYTIC)
+        cls.client_user = User.objects.create_user("list-client@example.invalid", "pw")
+
+    def setUp(self):
+        self.client = jwt_client(self.admin)
+
+    def _create(self, count, **fields):
+        cases = [Case.objects.create(title=f"list {i}", **fields) for i in range(count)]
+        return [str(c.id) for c in cases]
+
+    def _walk(self, url, direction="next"):
+        pages = []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200, resp.content)
+            pages.append([row["id"] for row in resp.json()["results"]])
+            url = resp.json()[direction]
+        return pages
+
+    @override_settings(CASES_PAGE_SIZE=3)
+    def test_same_created_at_pages_have_no_gaps_or_duplicates(self):
+        ids = self._create(7)
+        # все кейсы с одним created_at — порядок держится только на id
+        Case.objects.update(created_at=timezone.now())
+
+        pages = self._walk("/api/cases/")
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        flat = [i for page in pages for i in page]
+        self.assertEqual(flat, sorted(ids, reverse=True))
+
+        # и обратно по previous с последней страницы
+        last = self.client.get("/api/cases/")
+        url = last.json()["next"]
+        url = self.client.get(url).json()["next"]
+        back = self._walk(url, direction="previous")
+        self.assertEqual(back, list(reversed(pages)))
+
+    def test_page_size_is_read_per_request(self):
+        self._create(3)
+        with override_settings(CASES_PAGE_SIZE=1):
+            self.assertEqual(len(self.client.get("/api/cases/").json()["results"]), 1)
+        with override_settings(CASES_PAGE_SIZE=2):
+            self.assertEqual(len(self.client.get("/api/cases/").json()["results"]), 2)
+        resp = self.client.get("/api/cases/", {"page_size": 3})
+        self.assertEqual(len(resp.json()["results"]), 3)
+
+    def test_newer_cases_come_first(self):
+        old, new = self._create(2)
+        Case.objects.filter(pk=old).update(created_at=timezone.now() - timedelta(days=1))
+        results = self.client.get("/api/cases/").json()["results"]
+        self.assertEqual([row["id"] for row in results], [new, old])
+
+    def test_invalid_cursor_is_404(self):
+        resp = self.client.get("/api/cases/", {"cursor": "garbage"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_filters(self):
+        draft = self._create(1, status=CaseStatus.DRAFT, requester_id="r1", confluence_space_key="AAA")
+        approved = self._create(1, status=CaseStatus.APPROVED, requester_id="r2", confluence_space_key="BBB")
+
+        def ids(params):
+            resp = self.client.get("/api/cases/", params)
+            self.assertEqual(resp.status_code, 200, resp.content)
+            return [row["id"] for row in resp.json()["results"]]
+
+        self.assertEqual(ids({"status": CaseStatus.DRAFT}), draft)
+        self.assertCountEqual(ids({"status": f"{CaseStatus.DRAFT},{CaseStatus.APPROVED}"}), draft + approved)
+        self.assertEqual(ids({"requester_id": "r2"}), approved)
+        self.assertEqual(ids({"confluence_space_key": "AAA"}), draft)
+        self.assertEqual(ids({"status": CaseStatus.DRAFT, "confluence_space_key": "BBB"}), [])
+
+        resp = self.client.get("/api/cases/", {"status": "nope"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("status", resp.json())
+
+    def test_client_sees_only_own_cases(self):
+        own = self._create(1, requester_id=str(self.client_user.id))
+        self._create(2, requester_id="someone-else")
+
+        client = jwt_client(self.client_user)
+        results = client.get("/api/cases/").json()["results"]
+        self.assertEqual([row["id"] for row in results], own)
+        # фильтр по чужому requester_id не расширяет видимость
+        results = client.get("/api/cases/", {"requester_id": "someone-else"}).json()["results"]
+        self.assertEqual(results, [])
+
+
+@skipUnless(connection.vendor in SUPPORTED_VENDORS, "EXPLAIN проверяется только для Postgres и SQLite")
+class CaseIndexUsageTests(TestCase):
+    """
+    Горячие запросы по кейсам и вопросам идут по индексам (см. manage.py explain_hot_paths).
+    """
+
+    def test_hot_paths_use_indexes(self):
+        disable_seqscan()
+        for name, queryset, expected in hot_paths():
+            if queryset.model not in (Case, FollowupQuestion):
+                continue
+            with self.subTest(name):
+                ok, plan = plan_uses_index(queryset, expected)
+                self.assertTrue(ok, f"expected one of {expected}:\n{plan}")
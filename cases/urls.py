@@ -5,6 +5,7 @@ from .views import (
     CaseDetailView,
     NextFollowupQuestionView,
     AnswerFollowupQuestionView,
+    BulkAnswerFollowupQuestionsView,
 )
 
 urlpatterns = [
@@ -34,4 +35,11 @@ urlpatterns = [
         AnswerFollowupQuestionView.as_view(),
         name="case-answer-question",
     ),
+
+    # Шаг 3 — ответить сразу на несколько уточняющих вопросов
+    path(
+        "cases/<uuid:pk>/answer-questions/",
+        BulkAnswerFollowupQuestionsView.as_view(),
+        name="case-answer-questions",
+    ),
 ]
@@ -2,19 +2,26 @@ from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound, ValidationError, PermissionDenied
 
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiExample,
+    OpenApiParameter,
 )
 
 from .models import Case, FollowupQuestion, FollowupQuestionStatus, CaseStatus
+from .pagination import CaseCursorPagination
 from .serializers import (
     CaseSessionCreateSerializer,
+    CaseListSerializer,
     CaseInitialAnswersSerializer,
     CaseDetailSerializer,
     NextQuestionResponseSerializer,
     AnswerQuestionSerializer,
+    BulkAnswerQuestionsSerializer,
+    BulkAnswerResponseSerializer,
 )
+from .services.followup import answer_followup_questions, get_next_question_state
 
 # ======================= Роли (AUTHORITY / ANALYTIC / CLIENT) =======================
 
@@ -76,7 +83,7 @@ def check_case_access(user, case: "Case") -> None:
         'Шаг 1. Создаёт новый бизнес-кейс/сессию. '
         'На этом шаге пользователь указывает только название (title) '
         'и, опционально, своё имя. В ответ возвращается uid кейса.\n\n'
-        'GET /api/cases/:\n'
+        'GET /api/cases/ — постраничный список кейсов:\n'
         '- CLIENT видит только СВОИ кейсы (requester_id = user.id)\n'
         '- AUTHORITY и ANALYTIC видят ВСЕ кейсы.'
     ),
@@ -95,13 +102,19 @@ def check_case_access(user, case: "Case") -> None:
 )
 class CaseSessionCreateView(generics.ListCreateAPIView):
     """
-    GET  /api/cases/   — список кейсов:
+    GET  /api/cases/   — список кейсов (cursor-пагинация, фильтры):
          - CLIENT: только свои
          - AUTHORITY / ANALYTIC: все
     POST /api/cases/   — создать новый кейс (сессию)
     """
-    queryset = Case.objects.all().order_by("-created_at")
+    queryset = Case.objects.all()
     serializer_class = CaseSessionCreateSerializer
+    pagination_class = CaseCursorPagination
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return CaseListSerializer
+        return super().get_serializer_class()
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -110,6 +123,9 @@ class CaseSessionCreateView(generics.ListCreateAPIView):
         if not getattr(user, "is_authenticated", False):
             return qs.none()
 
+        if self.request.method == "GET":
+            qs = self._filter_list(qs.only(*CaseListSerializer.Meta.fields))
+
         # админы (AUTHORITY / ANALYTIC) видят все кейсы
         if is_admin_user(user):
             return qs
@@ -117,6 +133,45 @@ class CaseSessionCreateView(generics.ListCreateAPIView):
         # обычный клиент — только свои
         return qs.filter(requester_id=str(user.id))
 
+    def _filter_list(self, qs):
+        params = self.request.query_params
+
+        statuses = [s for s in params.get("status", "").split(",") if s]
+        if statuses:
+            unknown = [s for s in statuses if s not in CaseStatus.values]
+            if unknown:
+                raise ValidationError({"status": f"Unknown status: {', '.join(unknown)}"})
+            qs = qs.filter(status__in=statuses)
+
+        requester_id = params.get("requester_id")
+        if requester_id:
+            qs = qs.filter(requester_id=requester_id)
+
+        space_key = params.get("confluence_space_key")
+        if space_key:
+            qs = qs.filter(confluence_space_key=space_key)
+
+        return qs
+
+    @extend_schema(
+        tags=['Cases'],
+        summary='Список кейсов (cursor-пагинация)',
+        description=(
+            'CLIENT видит только СВОИ кейсы, AUTHORITY и ANALYTIC — все.\n\n'
+            'Ответ: {next, previous, results}; следующая страница — по ссылке next '
+            '(курсор по -created_at, -id). Фильтры можно комбинировать.'
+        ),
+        parameters=[
+            OpenApiParameter("status", OpenApiTypes.STR, description="Статус или несколько через запятую"),
+            OpenApiParameter("requester_id", OpenApiTypes.STR, description="ID заявителя"),
+            OpenApiParameter("confluence_space_key", OpenApiTypes.STR, description="Ключ пространства Confluence"),
+            OpenApiParameter("page_size", OpenApiTypes.INT, description="Размер страницы (до 100)"),
+        ],
+        responses={200: CaseListSerializer(many=True)},
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 @extend_schema(
     tags=['Cases'],
@@ -124,8 +179,9 @@ class CaseSessionCreateView(generics.ListCreateAPIView):
     description=(
         'Шаг 2. Обновляет уже созданный кейс, добавляя ответы на 8 '
         'стартовых вопросов (initial_answers) и список типов документов '
-        '(selected_document_types). После этого статус кейса меняется '
-        'на "in_progress" и генерируется план уточняющих вопросов.'
+        '(selected_document_types). Запрос не ждёт LLM: кейс переходит в статус '
+        '"planning", план уточняющих вопросов строится в фоне, после чего '
+        'статус меняется на "in_progress" (см. is_planning в next-question).'
     ),
     request=CaseInitialAnswersSerializer,
     responses={200: CaseDetailSerializer},
@@ -191,7 +247,9 @@ class CaseDetailView(generics.GenericAPIView):
         'Возвращает первый по порядку неотвеченный уточняющий вопрос '
         'для указанного кейса. Если все вопросы уже отвечены или вопросов нет, '
         'возвращает is_finished = true и переводит кейс в статус '
-        '"ready_for_documents".'
+        '"ready_for_documents".\n\n'
+        'Пока план вопросов строится (статус кейса "planning"), '
+        'возвращает is_planning = true — запрос нужно повторить позже.'
     ),
     responses={200: NextQuestionResponseSerializer},
 )
@@ -200,6 +258,7 @@ class NextFollowupQuestionView(generics.GenericAPIView):
     GET /api/cases/{id}/next-question/
     """
     serializer_class = NextQuestionResponseSerializer
+    query_budgets = {"get": 4}
 
     def get(self, request, pk, *args, **kwargs):
         try:
@@ -209,36 +268,7 @@ class NextFollowupQuestionView(generics.GenericAPIView):
 
         check_case_access(request.user, case)
 
-        all_questions = case.followup_questions.all()
-        total_questions = all_questions.count()
-
-        next_question = all_questions.filter(
-            status=FollowupQuestionStatus.PENDING
-        ).order_by("order_index").first()
-
-        if next_question is None:
-            # нет ни одного ожидающего вопроса
-            if case.status == CaseStatus.IN_PROGRESS:
-                case.status = CaseStatus.READY_FOR_DOCUMENTS
-                case.save(update_fields=["status"])
-
-            data = {
-                "question_id": None,
-                "order_index": None,
-                "total_questions": total_questions,
-                "text": None,
-                "target_document_types": [],
-                "is_finished": True,
-            }
-        else:
-            data = {
-                "question_id": next_question.id,
-                "order_index": next_question.order_index,
-                "total_questions": total_questions,
-                "text": next_question.text,
-                "target_document_types": next_question.target_document_types or [],
-                "is_finished": False,
-            }
+        data = get_next_question_state(case)
 
         serializer = self.get_serializer(data)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -296,4 +326,62 @@ class AnswerFollowupQuestionView(generics.GenericAPIView):
         question.status = FollowupQuestionStatus.ANSWERED
         question.save(update_fields=["answer_text", "status"])
 
-        return Response(status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=['Follow-up Questions'],
+    summary='Ответить сразу на несколько уточняющих вопросов',
+    description=(
+        'Сохраняет пачку ответов одной транзакцией и возвращает следующий '
+        'неотвеченный вопрос (как next-question) + answered_count. '
+        'Если хотя бы один question_id не относится к кейсу — не сохраняется ничего.'
+    ),
+    request=BulkAnswerQuestionsSerializer,
+    responses={200: BulkAnswerResponseSerializer},
+    examples=[
+        OpenApiExample(
+            'Пример запроса',
+            value={
+                "answers": [
+                    {
+                        "question_id": "11111111-2222-3333-4444-555555555555",
+                        "answer": "Основные роли: продакт, риск-аналитик, бизнес-архитектор.",
+                    },
+                    {
+                        "question_id": "66666666-7777-8888-9999-000000000000",
+                        "answer": "Каналы: мобильное приложение и интернет-банк.",
+                    },
+                ],
+            },
+            request_only=True,
+        ),
+    ],
+)
+class BulkAnswerFollowupQuestionsView(generics.GenericAPIView):
+    """
+    POST /api/cases/{id}/answer-questions/
+    """
+    serializer_class = BulkAnswerQuestionsSerializer
+    query_budgets = {"post": 8}
+
+    def post(self, request, pk, *args, **kwargs):
+        try:
+            case = Case.objects.get(pk=pk)
+        except Case.DoesNotExist:
+            raise NotFound("Case not found")
+
+        check_case_access(request.user, case)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            answered_count, data = answer_followup_questions(
+                case, serializer.validated_data["answers"]
+            )
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+        response = BulkAnswerResponseSerializer({**data, "answered_count": answered_count})
+        return Response(response.data, status=status.HTTP_200_OK)
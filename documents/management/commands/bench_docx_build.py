@@ -0,0 +1,125 @@
+import io
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from docx import Document as DocxDocument
+
+from documents.services.artifacts.scope.docx import build_docx as build_scope_docx
+from documents.services.artifacts.vision.docx import build_docx as build_vision_docx
+from documents.services.docx_template import get_docx_template
+
+DEFAULT_TEXT = "Требует уточнения на основании исходных данных"
+
+VISION_SECTIONS = (
+    ("Business goals", "business_goals"),
+    ("Target users", "target_users"),
+    ("Expected outcomes", "expected_outcomes"),
+    ("Success criteria", "success_criteria"),
+    ("Risks and limitations", "risks_and_limitations"),
+)
+
+
+def _legacy_build_vision(structured) -> bytes:
+    """
+    Прежний сборщик Vision: новый DocxDocument() и add_paragraph(style=...) — эталон.
+    """
+    d = DocxDocument()
+    d.add_heading("Vision", level=1)
+    d.add_heading((structured.get("title") or "").strip() or "Vision", level=2)
+    d.add_heading("Problem statement", level=3)
+    d.add_paragraph((structured.get("problem_statement") or "").strip() or DEFAULT_TEXT)
+    for heading, key in VISION_SECTIONS:
+        d.add_heading(heading, level=3)
+        items = structured.get(key) or []
+        for item in items or [DEFAULT_TEXT]:
+            d.add_paragraph(str(item), style="List Bullet")
+    buf = io.BytesIO()
+    d.save(buf)
+    return buf.getvalue()
+
+
+def build_vision_structured(items: int):
+    return {
+        "title": "Синтетический Vision для бенчмарка",
+        "problem_statement": "Заявки обрабатываются вручную.\nСроки растут.",
+        "business_goals": [f"Цель {i}: сократить время обработки заявки" for i in range(items)],
+        "target_users": [f"Роль {i}" for i in range(items)],
+        "expected_outcomes": [f"Результат {i}" for i in range(items)],
+        "success_criteria": [f"Критерий {i}: SLA < {i + 1} ч" for i in range(items)],
+        "risks_and_limitations": [],
+    }
+
+
+def build_scope_structured(items: int):
+    return {
+        "summary": "Автоматизация приёма и проверки заявок",
+        "in_scope": [f"Функция {i}" for i in range(items)],
+        "out_of_scope": [f"Исключение {i}" for i in range(items)],
+        "business_processes_in_scope": [f"Процесс {i}" for i in range(items)],
+        "systems_in_scope": [f"Система {i}" for i in range(items)],
+        "assumptions": [],
+        "constraints": [f"Ограничение {i}" for i in range(items)],
+    }
+
+
+def _paragraphs(data: bytes):
+    return [(p.style.name, p.text) for p in DocxDocument(io.BytesIO(data)).paragraphs]
+
+
+def _measure(fn, arg, number: int):
+    started = time.perf_counter()
+    for _ in range(number):
+        fn(arg)
+    per_call = (time.perf_counter() - started) / number
+
+    tracemalloc.start()
+    fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call, peak
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк сборки DOCX: прежний DocxDocument() на документ против "
+        "закэшированного шаблона (docx_template). Время на документ и пик аллокаций."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, nargs="+", default=[5, 50, 200], help="Пунктов в каждом списке.")
+        parser.add_argument("--number", type=int, default=20, help="Сборок на замер.")
+        parser.add_argument("--template", default=None, help="Путь к корпоративному .docx (по умолчанию DOCX_TEMPLATE_PATH).")
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        template = get_docx_template(options["template"])  # разбор шаблона — вне замеров
+        self.stdout.write(f"template: {template.template_path or '<python-docx default>'}")
+
+        if options["template"] is None:
+            sample = build_vision_structured(5)
+            if _paragraphs(build_vision_docx(sample)) != _paragraphs(_legacy_build_vision(sample)):
+                raise CommandError("Template builder output differs from legacy builder")
+
+        self.stdout.write(
+            f"{'doc':>7} {'items':>6} {'legacy':>9} {'cached':>9} {'x':>6} "
+            f"{'legacy peak':>12} {'cached peak':>12}"
+        )
+        for items in options["items"]:
+            vision = build_vision_structured(items)
+            legacy_t, legacy_peak = _measure(_legacy_build_vision, vision, number)
+            new_t, new_peak = _measure(build_vision_docx, vision, number)
+            self._row("vision", items, legacy_t, new_t, legacy_peak, new_peak)
+
+            scope = build_scope_structured(items)
+            new_t, new_peak = _measure(build_scope_docx, scope, number)
+            self._row("scope", items, None, new_t, None, new_peak)
+
+    def _row(self, doc, items, legacy_t, new_t, legacy_peak, new_peak):
+        legacy_ms = f"{legacy_t * 1e3:>7.1f}ms" if legacy_t is not None else f"{'-':>9}"
+        ratio = f"{legacy_t / new_t:>5.1f}x" if legacy_t is not None else f"{'-':>6}"
+        legacy_kb = f"{legacy_peak / 1024:>10.0f}KB" if legacy_peak is not None else f"{'-':>12}"
+        self.stdout.write(
+            f"{doc:>7} {items:>6} {legacy_ms} {new_t * 1e3:>7.1f}ms {ratio} "
+            f"{legacy_kb} {new_peak / 1024:>10.0f}KB"
+        )
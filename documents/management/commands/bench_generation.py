@@ -0,0 +1,277 @@
+import contextlib
+import io
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from cases.models import Case, CaseStatus
+from cases.services.followup import generate_followup_questions_for_case
+from documents.models import DocumentType, GeneratedDocument, GenerationStatus
+from documents.services.context_builder import clear_case_context_cache
+from documents.services.ensure import ensure_case_documents, finalize_case_documents
+from documents.services.fake_llm import ERROR_KINDS
+from documents.services.llm_gateway import get_client, reset_clients
+
+DIAGRAM_TYPES = (
+    DocumentType.BPMN,
+    DocumentType.CONTEXT_DIAGRAM,
+    DocumentType.UML_USE_CASE_DIAGRAM,
+)
+
+
+def _initial_answers(n: int) -> Dict[str, str]:
+    return {
+        "idea": f"Онлайн-заявка на кредит для МСБ #{n}",
+        "target_users": "Предприниматели, кредитные менеджеры",
+        "problem": "Заявки принимаются в отделениях, решение занимает до 5 дней",
+        "ideal_flow": "Клиент подаёт заявку онлайн, скоринг, решение в течение часа",
+        "user_actions": "Заполнить анкету, загрузить документы, подписать договор",
+        "mvp": "Анкета, автоматический скоринг, статус заявки",
+        "constraints": "Требования регулятора, интеграция с АБС",
+        "success_criteria": "80% заявок онлайн, решение < 1 часа",
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк генерации кейс -> документы без сети: LLM_BACKEND=fake "
+        "(documents.services.fake_llm) с заданными задержкой, скоростью токенов и долей сбоев. "
+        "N временных кейсов проходят в K потоков план уточняющих вопросов, "
+        "ensure_case_documents и finalize_case_documents (DOCX, URL диаграмм) — как POST "
+        "/documents. Печатает пропускную способность, задержки по этапам и счётчики LLM, "
+        "проверяет, что все документы готовы. Кейсы и их DOCX удаляются в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cases", type=int, default=20)
+        parser.add_argument("--docs", type=int, default=len(DocumentType.values), help=f"Документов на кейс (1..{len(DocumentType.values)}).")
+        parser.add_argument("--concurrency", type=int, default=4, help="Кейсов параллельно.")
+        parser.add_argument("--serial", action="store_true", help="Документы кейса по очереди (DOCUMENTS_GENERATION_PARALLEL=0).")
+        parser.add_argument("--max-workers", type=int, default=None, help="DOCUMENTS_GENERATION_MAX_WORKERS на прогон.")
+        parser.add_argument("--skip-plan", action="store_true", help="Без плана уточняющих вопросов.")
+        parser.add_argument("--latency-ms", type=float, default=500, help="Медиана задержки до первого токена.")
+        parser.add_argument("--latency-sigma", type=float, default=0.3, help="Разброс логнормальной задержки.")
+        parser.add_argument("--tokens-per-second", type=float, default=0, help="Скорость ответа (0 — мгновенно).")
+        parser.add_argument("--error-rate", type=float, default=0, help="Доля сбойных вызовов LLM (0..1).")
+        parser.add_argument("--error-kinds", default=",".join(ERROR_KINDS))
+        parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After у 429, сек.")
+        parser.add_argument("--items", type=int, default=5, help="Пунктов в списках/шагов в диаграммах ответа.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--max-retries", type=int, default=None, help="LLM_MAX_RETRIES на прогон.")
+        parser.add_argument(
+            "--render-diagrams",
+            action="store_true",
+            help="Рендерить PNG диаграмм (PLANTUML_RENDER_MODE из настроек); по умолчанию — только URL.",
+        )
+
+    def handle(self, *args, **options):
+        doc_count = options["docs"]
+        if not 1 <= doc_count <= len(DocumentType.values):
+            raise CommandError(f"--docs must be in 1..{len(DocumentType.values)}")
+
+        overrides: Dict[str, Any] = {
+            "LLM_BACKEND": "fake",
+            "LLM_CACHE_ENABLED": False,  # каждый кейс должен дойти до LLM
+            "FAKE_LLM_LATENCY": options["latency_ms"] / 1000,
+            "FAKE_LLM_LATENCY_SIGMA": options["latency_sigma"],
+            "FAKE_LLM_TOKENS_PER_SECOND": options["tokens_per_second"],
+            "FAKE_LLM_ERROR_RATE": options["error_rate"],
+            "FAKE_LLM_ERROR_KINDS": options["error_kinds"],
+            "FAKE_LLM_RETRY_AFTER": options["retry_after"],
+            "FAKE_LLM_ITEMS": options["items"],
+            "FAKE_LLM_SEED": options["seed"],
+            # ограничиваем backoff (Retry-After у 429 соблюдается как есть),
+            # иначе при сбоях прогон меряет паузы, а не конвейер
+            "LLM_RETRY_BASE_DELAY": 0.05,
+            "LLM_RETRY_MAX_DELAY": max(options["retry_after"], 0.5),
+            "DOCUMENTS_GENERATION_PARALLEL": not options["serial"],
+        }
+        if options["max_workers"] is not None:
+            overrides["DOCUMENTS_GENERATION_MAX_WORKERS"] = options["max_workers"]
+        if options["max_retries"] is not None:
+            overrides["LLM_MAX_RETRIES"] = options["max_retries"]
+        if not options["render_diagrams"]:
+            overrides["PLANTUML_RENDER_MODE"] = "url"
+
+        if (
+            connection.vendor == "sqlite"
+            and options["concurrency"] > 1
+            and not connection.settings_dict["OPTIONS"].get("transaction_mode")
+        ):
+            self.stdout.write(self.style.WARNING(
+                "SQLite without SQLITE_TRANSACTION_MODE=IMMEDIATE: concurrent cases "
+                "may fail with \"database is locked\"."
+            ))
+
+        doc_types = DocumentType.values[:doc_count]
+        case_ids: List[Any] = []
+        problems: List[str] = []
+        try:
+            with override_settings(**overrides):
+                reset_clients()  # следующий get_client() — fake с настройками прогона
+                client = get_client()
+
+                case_ids = self._make_cases(options["cases"], doc_types)
+                self.stdout.write(
+                    f"Fake LLM: {len(case_ids)} cases x {doc_count} docs, concurrency={options['concurrency']}, "
+                    f"parallel docs={not options['serial']}, latency={options['latency_ms']:g}ms "
+                    f"(sigma {options['latency_sigma']:g}), tps={options['tokens_per_second']:g}, "
+                    f"errors={options['error_rate']:g}"
+                )
+
+                # генераторы BPMN/context печатают отладку в stdout — на прогоне она только мешает
+                quiet = options["verbosity"] < 2
+                with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+                    results = self._run(case_ids, options["concurrency"], not options["skip_plan"])
+                self._report(results, len(doc_types), client.stats())
+                self._check(case_ids, doc_types, results, problems, options["error_rate"])
+        finally:
+            self._cleanup(case_ids)
+            reset_clients()
+            clear_case_context_cache()
+
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Generation benchmark passed."))
+
+    # --- фикстуры ---
+
+    def _make_cases(self, count: int, doc_types: List[str]) -> List[Any]:
+        run = uuid.uuid4().hex[:8]
+        cases = [
+            Case(
+                title=f"Generation bench {run} #{n}",
+                initial_answers=_initial_answers(n),
+                selected_document_types=list(doc_types),
+                # как после POST /cases: план вопросов переводит кейс в IN_PROGRESS
+                status=CaseStatus.PLANNING,
+            )
+            for n in range(count)
+        ]
+        Case.objects.bulk_create(cases)
+        return [case.pk for case in cases]
+
+    def _cleanup(self, case_ids: List[Any]) -> None:
+        if not case_ids:
+            return
+        names = set(
+            GeneratedDocument.objects.filter(case_id__in=case_ids)
+            .exclude(docx_file="")
+            .values_list("docx_file", flat=True)
+        )
+        Case.objects.filter(pk__in=case_ids).delete()
+
+        # DOCX адресуются по хэшу содержимого — удаляем только ничьи
+        names -= set(GeneratedDocument.objects.filter(docx_file__in=names).values_list("docx_file", flat=True))
+        storage = GeneratedDocument._meta.get_field("docx_file").storage
+        for name in filter(None, names):
+            storage.delete(name)
+
+    # --- прогон ---
+
+    def _run(self, case_ids: List[Any], concurrency: int, with_plan: bool) -> List[Dict[str, Any]]:
+        def process(case_id) -> Dict[str, Any]:
+            result: Dict[str, Any] = {"plan": None, "documents": None, "errors": {}, "failure": None}
+            started = time.perf_counter()
+            try:
+                case = Case.objects.get(pk=case_id)
+                if with_plan:
+                    generate_followup_questions_for_case(case)
+                    result["plan"] = time.perf_counter() - started
+
+                docs_started = time.perf_counter()
+                docs, errors, generated = ensure_case_documents(case)
+                finalize_case_documents(case, docs, generated)
+                result["documents"] = time.perf_counter() - docs_started
+                result["errors"] = errors
+            except Exception as e:
+                result["failure"] = f"{type(e).__name__}: {e}"
+            finally:
+                result["total"] = time.perf_counter() - started
+                connections.close_all()
+            return result
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(process, case_ids))
+        self.elapsed = time.perf_counter() - started
+        return results
+
+    def _latencies(self, name: str, values: List[Optional[float]]) -> str:
+        values = [v for v in values if v is not None]
+        if not values:
+            return f"{name}: -"
+        return (
+            f"{name}: p50={statistics.median(values) * 1e3:.0f}ms "
+            f"p95={_percentile(values, 0.95) * 1e3:.0f}ms max={max(values) * 1e3:.0f}ms"
+        )
+
+    def _report(self, results: List[Dict[str, Any]], doc_count: int, stats: Dict[str, Any]) -> None:
+        elapsed = self.elapsed or 1e-9
+        cases = len(results)
+        failed_docs = sum(len(r["errors"]) for r in results)
+        docs = cases * doc_count - failed_docs
+
+        self.stdout.write(
+            f"throughput: {cases} cases in {elapsed:.2f}s — {cases / elapsed:.2f} cases/s, "
+            f"{docs / elapsed:.2f} docs/s, {stats['completion_tokens'] / elapsed:.0f} completion tokens/s"
+        )
+        self.stdout.write("latency " + " | ".join((
+            self._latencies("plan", [r["plan"] for r in results]),
+            self._latencies("documents", [r["documents"] for r in results]),
+            self._latencies("total", [r["total"] for r in results]),
+        )))
+        self.stdout.write(
+            f"llm: calls={stats['calls']} by_kind={stats['by_kind']} injected={stats['errors'] or 0} "
+            f"prompt_tokens={stats['prompt_tokens']} completion_tokens={stats['completion_tokens']}"
+        )
+        self.stdout.write(
+            f"failed: documents={failed_docs} cases={sum(1 for r in results if r['failure'])}"
+        )
+        for r in results:
+            if r["failure"]:
+                self.stdout.write(f"  {r['failure']}")
+        for error in [e for r in results for e in r["errors"].values()][:5]:
+            self.stdout.write(f"  {error}")
+
+    def _check(
+        self,
+        case_ids: List[Any],
+        doc_types: List[str],
+        results: List[Dict[str, Any]],
+        problems: List[str],
+        error_rate: float,
+    ) -> None:
+        failures = [r["failure"] for r in results if r["failure"]]
+        if failures:
+            problems.append(f"{len(failures)} cases failed outside document generation")
+
+        docs = list(GeneratedDocument.objects.filter(case_id__in=case_ids))
+        ready = [d for d in docs if d.generation_status == GenerationStatus.READY and d.structured_data]
+
+        # со сбоями документ может исчерпать повторы — это ожидаемо
+        if not error_rate and len(ready) != len(case_ids) * len(doc_types):
+            problems.append(f"{len(ready)} of {len(case_ids) * len(doc_types)} documents ready without injected faults")
+
+        for doc in ready:
+            if doc.doc_type in (DocumentType.VISION, DocumentType.SCOPE) and not doc.docx_file:
+                problems.append(f"{doc.doc_type} of case {doc.case_id} has no DOCX")
+                break
+            if doc.doc_type in DIAGRAM_TYPES and not (
+                "@startuml" in (doc.structured_data.get("plantuml") or "") and doc.diagram_url
+            ):
+                problems.append(f"{doc.doc_type} of case {doc.case_id} has no diagram")
+                break
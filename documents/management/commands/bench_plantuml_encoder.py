@@ -0,0 +1,129 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.services.plantuml_encoding import (
+    decode_plantuml,
+    deflate,
+    encode_compressed,
+    encode_plantuml,
+)
+
+_PU_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+
+
+def _legacy_encode_compressed(compressed: bytes) -> str:
+    """
+    Прежний побайтовый кодировщик (_append_3bytes/_encode_6bit) — эталон для сравнения.
+    """
+
+    def encode_6bit(b: int) -> str:
+        return _PU_ALPHABET[b & 0x3F]
+
+    def append_3bytes(b1: int, b2: int, b3: int) -> str:
+        c1 = b1 >> 2
+        c2 = ((b1 & 0x3) << 4) | (b2 >> 4)
+        c3 = ((b2 & 0xF) << 2) | (b3 >> 6)
+        c4 = b3 & 0x3F
+        return (
+            encode_6bit(c1 & 0x3F)
+            + encode_6bit(c2 & 0x3F)
+            + encode_6bit(c3 & 0x3F)
+            + encode_6bit(c4 & 0x3F)
+        )
+
+    res = []
+    i = 0
+    length = len(compressed)
+    while i < length:
+        b1 = compressed[i]
+        b2 = compressed[i + 1] if i + 1 < length else 0
+        b3 = compressed[i + 2] if i + 2 < length else 0
+        res.append(append_3bytes(b1, b2, b3))
+        i += 3
+    return "".join(res)
+
+
+def _legacy_encode_plantuml(text: str) -> str:
+    return _legacy_encode_compressed(deflate(text))
+
+
+def build_large_bpmn(steps: int) -> str:
+    """
+    Синтетическая activity/BPMN-диаграмма со swimlane'ами и ветвлениями.
+    """
+    lines = ["@startuml", "title Синтетический BPMN для бенчмарка", "start"]
+    lanes = ("Клиент", "AI-агент", "Бизнес-аналитик (BA)")
+    for i in range(steps):
+        lines.append(f"|{lanes[i % len(lanes)]}|")
+        lines.append(f":Шаг {i}: обработка заявки и сверка данных по кейсу №{i * 7919 % 10007};")
+        if i % 5 == 0:
+            lines.append(f"if (Проверка {i} пройдена?) then (да)")
+            lines.append(f"  :Передать на этап {i + 1};")
+            lines.append("else (нет)")
+            lines.append(f"  :Вернуть на доработку ({i});")
+            lines.append("endif")
+    lines += ["stop", "@enduml"]
+    return "\n".join(lines)
+
+
+def _best_of(fn, arg, repeat: int, number: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn(arg)
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарк кодировщика PlantUML: прежний побайтовый против "
+        "base64 + bytes.translate (plantuml_encoding) на больших BPMN-диаграммах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--steps",
+            type=int,
+            nargs="+",
+            default=[50, 500, 5000],
+            help="Размеры диаграмм (число шагов).",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Сколько серий замеров (берём лучшую).")
+        parser.add_argument("--number", type=int, default=20, help="Вызовов в одной серии.")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        number = options["number"]
+
+        header = (
+            f"{'steps':>6} {'source':>9} {'encoded':>9} "
+            f"{'legacy enc':>11} {'new enc':>9} {'x':>6} "
+            f"{'legacy full':>12} {'new full':>9} {'x':>6}"
+        )
+        self.stdout.write(header)
+
+        for steps in options["steps"]:
+            source = build_large_bpmn(steps)
+            compressed = deflate(source)
+
+            encoded = encode_plantuml(source)
+            if encoded != _legacy_encode_plantuml(source):
+                raise CommandError(f"Encoders disagree for steps={steps}")
+            if decode_plantuml(encoded) != source:
+                raise CommandError(f"Round-trip failed for steps={steps}")
+
+            legacy_enc = _best_of(_legacy_encode_compressed, compressed, repeat, number)
+            new_enc = _best_of(encode_compressed, compressed, repeat, number)
+            legacy_full = _best_of(_legacy_encode_plantuml, source, repeat, number)
+            new_full = _best_of(encode_plantuml, source, repeat, number)
+
+            self.stdout.write(
+                f"{steps:>6} {len(source.encode('utf-8')):>9} {len(encoded):>9} "
+                f"{legacy_enc * 1e6:>9.1f}us {new_enc * 1e6:>7.1f}us {legacy_enc / new_enc:>5.1f}x "
+                f"{legacy_full * 1e6:>10.1f}us {new_full * 1e6:>7.1f}us {legacy_full / new_full:>5.1f}x"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Outputs identical, round-trip OK."))
@@ -0,0 +1,91 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.urls import resolve
+
+from accounts.models import User
+from documents.models import DocumentStatus
+from documents.services.context_builder import clear_case_context_cache
+from documents.testing import ALL_DOC_TYPES, first_answers, jwt_client, make_case
+from forte_ai_back.query_budget import count_queries, get_view_budget
+
+# (метод, путь, тело); тело-функция получает кейс фикстуры
+BUDGET_CHECKS = [
+    ("GET", "/api/cases/{case}/documents/", None),
+    ("POST", "/api/cases/{case}/documents/?sync=1", None),
+    # один документ остаётся неодобренным — публикации в Confluence не будет
+    ("PATCH", "/api/documents/{doc}/review/", {"status": DocumentStatus.APPROVED_BY_BA}),
+    ("GET", "/api/cases/{case}/next-question/", None),
+    ("POST", "/api/cases/{case}/answer-questions/", first_answers),
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет бюджеты SQL-запросов (query_budgets у view) для эндпоинтов документов "
+        "на временных фикстурах: число запросов не больше бюджета и не растёт "
+        "с числом документов кейса. Все данные откатываются."
+    )
+
+    def handle(self, *args, **options):
+        failures = []
+        try:
+            with transaction.atomic():
+                self._run(failures)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        if failures:
+            raise CommandError("Query budgets exceeded:\n" + "\n\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("All query budgets OK."))
+
+    def _run(self, failures):
+        user = User.objects.create_user(
+            f"query-budget-{uuid.uuid4().hex[:8]}@example.invalid",
+            "pw",
+            role=User.Role.ANALYTIC,
+        )
+        # настоящий access-токен в cookie: бюджет включает SELECT пользователя
+        # в CookieJWTAuthentication (force_authenticate его пропускает)
+        client = jwt_client(user)
+
+        small_case, small_docs = make_case(ALL_DOC_TYPES[:2])
+        large_case, large_docs = make_case(ALL_DOC_TYPES)
+
+        for method, template, data in BUDGET_CHECKS:
+            counts = []
+            for case, docs in ((small_case, small_docs), (large_case, large_docs)):
+                path = template.format(case=case.id, doc=docs[0].id)
+                body = data(case) if callable(data) else data
+                budget = get_view_budget(resolve(path.split("?")[0]).func, method)
+
+                # холодный кэш контекста: предыдущий запрос не должен удешевлять следующий
+                clear_case_context_cache()
+                with count_queries() as counter:
+                    response = getattr(client, method.lower())(path, body, format="json")
+
+                if response.status_code >= 400:
+                    failures.append(f"{method} {path}: HTTP {response.status_code}")
+                    continue
+
+                counts.append(counter.count)
+                self.stdout.write(
+                    f"{method:<6} {template:<45} docs={len(docs)} "
+                    f"queries={counter.count} budget={budget}"
+                )
+                if budget is not None and counter.count > budget:
+                    failures.append(
+                        f"{method} {path}: {counter.count} queries > budget {budget}\n"
+                        f"{counter.format_statements()}"
+                    )
+
+            if len(counts) == 2 and counts[1] > counts[0]:
+                failures.append(
+                    f"{method} {template}: queries grow with documents ({counts[0]} -> {counts[1]}), N+1?"
+                )
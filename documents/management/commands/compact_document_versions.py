@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from documents.models import DocumentVersion
+from documents.services.version_store import compact_document_versions
+
+
+class Command(BaseCommand):
+    help = (
+        "Перепаковывает версии документов в формат keyframe + delta "
+        "(см. documents/services/version_store.py) и печатает экономию места."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--document", help="ID одного документа (по умолчанию — все).")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать, ничего не менять.")
+
+    def handle(self, *args, **options):
+        document_ids = (
+            [options["document"]]
+            if options["document"]
+            else list(
+                DocumentVersion.objects.values_list("document_id", flat=True)
+                .distinct()
+                .order_by("document_id")
+            )
+        )
+
+        totals = {"versions": 0, "keyframes": 0, "bytes_before": 0, "bytes_after": 0}
+        for document_id in document_ids:
+            with transaction.atomic():
+                stats = compact_document_versions(document_id, dry_run=options["dry_run"])
+            for key in totals:
+                totals[key] += stats[key]
+            self.stdout.write(
+                f"{document_id}: {stats['versions']} versions, {stats['keyframes']} keyframes, "
+                f"{stats['bytes_before']} -> {stats['bytes_after']} bytes"
+            )
+
+        saved = totals["bytes_before"] - totals["bytes_after"]
+        prefix = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}{len(document_ids)} documents, {totals['versions']} versions, "
+                f"{totals['keyframes']} keyframes: {totals['bytes_before']} -> "
+                f"{totals['bytes_after']} bytes (saved {saved})"
+            )
+        )
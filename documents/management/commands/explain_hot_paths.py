@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from documents.testing import SUPPORTED_VENDORS, disable_seqscan, hot_paths, plan_uses_index
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN для горячих запросов (документы, вопросы, кейсы): проверяет, "
+        "что план использует ожидаемые индексы. Postgres — с enable_seqscan=off "
+        "(на маленьких таблицах иначе всегда Seq Scan), SQLite — EXPLAIN QUERY PLAN."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plans", action="store_true", help="Печатать планы целиком.")
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor not in SUPPORTED_VENDORS:
+            raise CommandError(f"Unsupported database vendor: {vendor}")
+
+        failures = []
+        with transaction.atomic():
+            disable_seqscan()
+
+            for name, queryset, expected in hot_paths():
+                ok, plan = plan_uses_index(queryset, expected)
+                mark = "OK  " if ok else "FAIL"
+                self.stdout.write(f"{mark} {name}")
+                if options["verbose_plans"] or not ok:
+                    self.stdout.write("     " + plan.replace("\n", "\n     "))
+                if not ok:
+                    failures.append(f"{name}: expected one of {', '.join(expected)}")
+
+        if failures:
+            raise CommandError("Hot paths without expected index:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"All hot paths use their indexes ({vendor})."))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import GeneratedDocument
+from documents.services.docx_builders import DOCX_BUILDERS, default_workers
+from documents.services.docx_export import export_docx_for_documents
+
+DOC_FIELDS = (
+    "id", "case_id", "doc_type", "structured_data",
+    "docx_file", "docx_hash", "docx_generated_at", "updated_at",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пакетная выгрузка DOCX (vision/scope) для кейсов: сборка в пуле процессов, "
+        "запись в storage по мере готовности, в конце — пропускная способность."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("case_ids", nargs="*", help="ID кейсов (по умолчанию нужен --all).")
+        parser.add_argument("--all", action="store_true", help="Все кейсы с готовыми документами.")
+        parser.add_argument("--workers", type=int, default=default_workers(), help="Процессов сборки (1 — без пула).")
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Проверить и уже выгруженные DOCX: пересобираются только те, чей хэш устарел.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=200, help="Документов на один запрос к БД.")
+
+    def handle(self, *args, **options):
+        case_ids = options["case_ids"]
+        if not case_ids and not options["all"]:
+            raise CommandError("Pass case ids or --all.")
+
+        qs = GeneratedDocument.objects.filter(
+            doc_type__in=list(DOCX_BUILDERS),
+            structured_data__isnull=False,
+        )
+        if case_ids:
+            qs = qs.filter(case_id__in=case_ids)
+
+        # id забираем сразу, документы — пачками: не держим открытый курсор,
+        # пока в ту же таблицу пишутся docx_file
+        doc_ids = list(qs.order_by("case_id", "doc_type").values_list("pk", flat=True))
+        chunk_size = max(1, options["chunk_size"])
+
+        def docs():
+            for start in range(0, len(doc_ids), chunk_size):
+                chunk = doc_ids[start:start + chunk_size]
+                by_id = GeneratedDocument.objects.only(*DOC_FIELDS).in_bulk(chunk)
+                for pk in chunk:
+                    if pk in by_id:
+                        yield by_id[pk]
+
+        def on_result(doc, error):
+            if error:
+                self.stderr.write(f"FAIL {doc.case_id} {doc.doc_type}: {error}")
+
+        workers = max(1, options["workers"])
+        self.stdout.write(f"Exporting DOCX for {len(doc_ids)} documents with {workers} worker(s)...")
+
+        stats = export_docx_for_documents(
+            docs(),
+            force=options["force"],
+            workers=workers,
+            on_result=on_result,
+        )
+
+        seconds = stats["seconds"] or 1e-9
+        self.stdout.write(
+            f"built={stats['built']} reused={stats['reused']} skipped={stats['skipped']} failed={stats['failed']} "
+            f"size={stats['bytes'] / 1024 / 1024:.1f}MB in {stats['seconds']:.2f}s "
+            f"({stats['built'] / seconds:.1f} docs/s, {stats['bytes'] / 1024 / 1024 / seconds:.1f} MB/s)"
+        )
+        if stats["failed"]:
+            raise CommandError(f"{stats['failed']} documents failed")
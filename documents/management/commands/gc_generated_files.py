@@ -0,0 +1,96 @@
+import re
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from documents.models import GeneratedDocument
+from documents.services.docx_export import DOCX_DIR
+
+# /api/diagrams/<sha256>.<fmt> — ссылки на кэш диаграмм (plantuml_render.build_diagram_url)
+DIAGRAM_URL_RE = re.compile(r"/diagrams/([0-9a-f]{64})\.\w+")
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет из MEDIA_ROOT файлы, на которые не ссылается ни один документ: "
+        "DOCX в generated_docs/ (старые версии, суффиксы storage) и диаграммы "
+        "в кэше PlantUML. Свежие файлы (--min-age-hours) не трогаем — "
+        "их может как раз записывать параллельный запрос."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет удалено.")
+        parser.add_argument("--min-age-hours", type=float, default=24, help="Не удалять файлы моложе N часов.")
+        parser.add_argument("--skip-diagrams", action="store_true", help="Не трогать кэш диаграмм.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        min_age = timedelta(hours=options["min_age_hours"])
+
+        removed, freed = self._gc_docx(dry_run, min_age)
+        if not options["skip_diagrams"]:
+            r, f = self._gc_diagrams(dry_run, min_age)
+            removed += r
+            freed += f
+
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} files, {freed / 1024 / 1024:.1f}MB"))
+
+    def _gc_docx(self, dry_run, min_age):
+        storage = GeneratedDocument._meta.get_field("docx_file").storage
+        if not storage.exists(DOCX_DIR):
+            return 0, 0
+
+        referenced = set(
+            GeneratedDocument.objects
+            .exclude(docx_file__isnull=True)
+            .exclude(docx_file="")
+            .values_list("docx_file", flat=True)
+        )
+        cutoff = timezone.now() - min_age
+
+        removed = freed = 0
+        _, files = storage.listdir(DOCX_DIR)
+        for filename in files:
+            name = f"{DOCX_DIR}/{filename}"
+            if name in referenced or storage.get_modified_time(name) > cutoff:
+                continue
+            size = storage.size(name)
+            self.stdout.write(f"docx     {name} ({size} B)")
+            if not dry_run:
+                storage.delete(name)
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def _gc_diagrams(self, dry_run, min_age):
+        root = Path(settings.MEDIA_ROOT) / getattr(settings, "PLANTUML_CACHE_DIR", "diagrams")
+        if not root.is_dir():
+            return 0, 0
+
+        referenced = set()
+        for url in GeneratedDocument.objects.exclude(diagram_url__isnull=True).values_list("diagram_url", flat=True):
+            match = DIAGRAM_URL_RE.search(url or "")
+            if match:
+                referenced.add(match.group(1))
+        cutoff = time.time() - min_age.total_seconds()
+
+        removed = freed = 0
+        for path in root.glob("*/*"):
+            if not path.is_file():
+                continue
+            # <digest>.<fmt> и исходник <digest>.puml живут и удаляются вместе
+            digest = path.name.split(".", 1)[0]
+            if digest in referenced or path.stat().st_mtime > cutoff:
+                continue
+            size = path.stat().st_size
+            self.stdout.write(f"diagram  {path.relative_to(settings.MEDIA_ROOT)} ({size} B)")
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            removed += 1
+            freed += size
+        return removed, freed
@@ -0,0 +1,282 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.test.utils import override_settings
+
+from cases.models import Case
+from documents.models import DocumentStatus, DocumentType, GeneratedDocument, GenerationStatus
+from documents.services.confluence_publish import publish_case_to_confluence
+from documents.services.plantuml_render import diagram_digest, get_cached_diagram_path
+from integrations.confluence.fake_server import FakeConfluenceServer
+from integrations.confluence.service import list_spaces_short
+from integrations.confluence.transport import reset_transports
+
+LOAD_TEST_DIAGRAM = "@startuml\nactor User\nUser -> System : load test\n@enduml"
+# минимальный валидный PNG 1x1 — рендер PlantUML в прогоне не участвует
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+def _markdown(title: str, items: int) -> str:
+    bullets = "\n".join(f"- Пункт {i}: **важно** и `code_{i}`" for i in range(items))
+    return f"# {title}\n\n## Раздел\nТекст раздела.\n\n{bullets}\n"
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон публикации в Confluence против локального заменителя "
+        "(integrations.confluence.fake_server): N временных кейсов публикуются в K потоков — "
+        "холодная публикация, повторная без изменений (0 запросов) и правка одного документа "
+        "(1 PUT на кейс). Печатает пропускную способность, задержки, число соединений "
+        "и инъекций, проверяет число операций на сервере. Кейсы удаляются в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cases", type=int, default=20)
+        parser.add_argument("--docs", type=int, default=3, help=f"Документов на кейс (1..{len(DocumentType.values)}).")
+        parser.add_argument("--concurrency", type=int, default=8, help="Потоков публикации.")
+        parser.add_argument("--items", type=int, default=20, help="Пунктов списка в тексте документа.")
+        parser.add_argument("--attachments", action="store_true", help="Диаграммы у документов — грузить PNG-вложения.")
+        parser.add_argument(
+            "--base-url",
+            default=None,
+            help="Уже запущенный manage.py fake_confluence (по умолчанию — сервер в этом процессе).",
+        )
+        parser.add_argument("--latency-ms", type=float, default=20)
+        parser.add_argument("--jitter-ms", type=float, default=0)
+        parser.add_argument("--rate-429", type=float, default=0)
+        parser.add_argument("--rate-5xx", type=float, default=0)
+        parser.add_argument("--retry-after", type=float, default=0.05)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--pool-size", type=int, default=None, help="CONFLUENCE_HTTP_POOL_SIZE на прогон.")
+        parser.add_argument("--max-retries", type=int, default=None, help="CONFLUENCE_MAX_RETRIES на прогон.")
+
+    def handle(self, *args, **options):
+        doc_count = options["docs"]
+        if not 1 <= doc_count <= len(DocumentType.values):
+            raise CommandError(f"--docs must be in 1..{len(DocumentType.values)}")
+
+        server = None
+        base_url = options["base_url"]
+        if not base_url:
+            server = FakeConfluenceServer(
+                latency=options["latency_ms"] / 1000,
+                jitter=options["jitter_ms"] / 1000,
+                rate_429=options["rate_429"],
+                rate_5xx=options["rate_5xx"],
+                retry_after=options["retry_after"],
+                seed=options["seed"],
+            )
+            base_url = server.start()
+
+        overrides: Dict[str, Any] = {
+            "CONFLUENCE_BASE_URL": base_url,
+            "CONFLUENCE_USERNAME": "load-test",
+            "CONFLUENCE_API_TOKEN": "load-test",
+            # backoff без Retry-After (5xx, сетевые ошибки) не дольше паузы сервера;
+            # сам Retry-After соблюдается как есть
+            "CONFLUENCE_RETRY_MAX_DELAY": max(options["retry_after"], 0.5),
+        }
+        if options["pool_size"] is not None:
+            overrides["CONFLUENCE_HTTP_POOL_SIZE"] = options["pool_size"]
+        if options["max_retries"] is not None:
+            overrides["CONFLUENCE_MAX_RETRIES"] = options["max_retries"]
+
+        self.base_url = base_url
+        created_png = None
+        case_ids: List[Any] = []
+        problems: List[str] = []
+        try:
+            with override_settings(**overrides):
+                reset_transports()  # новый пул с настройками прогона
+
+                if options["attachments"]:
+                    created_png = self._seed_diagram_png()
+                doc_types = DocumentType.values[:doc_count]
+                case_ids = self._make_cases(options["cases"], doc_types, options["items"], options["attachments"])
+                self.stdout.write(
+                    f"Fake Confluence at {base_url}: {len(case_ids)} cases x {doc_count} docs, "
+                    f"concurrency={options['concurrency']}, latency={options['latency_ms']:g}ms, "
+                    f"429={options['rate_429']:g}, 5xx={options['rate_5xx']:g}"
+                )
+
+                self._spaces_pass(problems)
+                initial = self._server_stats()
+
+                # с инъекцией сбоев кейс может исчерпать повторы — это ожидаемо;
+                # тогда проверяем не каждый прогон, а сходимость в конце
+                strict = not (options["rate_429"] or options["rate_5xx"])
+                per_case_attachments = doc_count if options["attachments"] else 0
+                concurrency = options["concurrency"]
+
+                delta, failed = self._publish_pass("publish", case_ids, concurrency)
+                if strict:
+                    self._expect(problems, "publish", delta, "content.create", len(case_ids) * (doc_count + 1))
+                    self._expect(problems, "publish", delta, "attachment.put", len(case_ids) * per_case_attachments)
+
+                delta, failed_again = self._publish_pass("republish", case_ids, concurrency)
+                if strict and delta["requests"]:
+                    problems.append(f"republish: {delta['requests']} requests, expected 0")
+
+                GeneratedDocument.objects.filter(case_id__in=case_ids, doc_type=doc_types[0]).update(
+                    content=Concat("content", Value(f"\n\nПравка {uuid.uuid4().hex[:8]}\n"))
+                )
+                delta, failed_edit = self._publish_pass("edit one", case_ids, concurrency)
+                if strict:
+                    self._expect(problems, "edit one", delta, "content.update", len(case_ids))
+                    self._expect(problems, "edit one", delta, "content.create", 0)
+                    if failed or failed_again or failed_edit:
+                        problems.append(f"{failed + failed_again + failed_edit} publishes failed without injected faults")
+                elif failed_edit:
+                    _, failed = self._publish_pass("catch up", case_ids, concurrency)
+                    if failed:
+                        problems.append(f"{failed} cases still failing after catch-up pass")
+
+                # итог: ровно одна страница на кейс и документ, без дублей
+                total = self._delta(initial, self._server_stats())
+                self._expect(problems, "total", total, "content.create", len(case_ids) * (doc_count + 1))
+                page_ids = list(
+                    GeneratedDocument.objects.filter(case_id__in=case_ids).values_list("confluence_page_id", flat=True)
+                )
+                if None in page_ids or len(set(page_ids)) != len(page_ids):
+                    problems.append("documents without a page or sharing one")
+        finally:
+            Case.objects.filter(pk__in=case_ids).delete()
+            if created_png is not None:
+                created_png.unlink(missing_ok=True)
+            reset_transports()
+            if server is not None:
+                server.stop()
+
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Confluence publishing load test passed."))
+
+    # --- фикстуры ---
+
+    def _seed_diagram_png(self):
+        path = get_cached_diagram_path(diagram_digest(LOAD_TEST_DIAGRAM), "png")
+        if path.exists():
+            return None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(TINY_PNG)
+        return path
+
+    def _make_cases(self, count: int, doc_types: List[str], items: int, attachments: bool) -> List[Any]:
+        run = uuid.uuid4().hex[:8]
+        case_ids = []
+        docs = []
+        for n in range(count):
+            case = Case.objects.create(
+                title=f"Confluence load test {run} #{n}",
+                selected_document_types=list(doc_types),
+                confluence_space_key="LOAD",
+            )
+            case_ids.append(case.pk)
+            for doc_type in doc_types:
+                docs.append(
+                    GeneratedDocument(
+                        case=case,
+                        doc_type=doc_type,
+                        title=doc_type,
+                        content=_markdown(f"{doc_type} #{n}", items),
+                        structured_data={"plantuml": LOAD_TEST_DIAGRAM} if attachments else {},
+                        status=DocumentStatus.APPROVED_BY_BA,
+                        generation_status=GenerationStatus.READY,
+                    )
+                )
+        GeneratedDocument.objects.bulk_create(docs)
+        return case_ids
+
+    # --- прогоны ---
+
+    def _server_stats(self) -> Dict[str, Any]:
+        try:
+            return requests.get(f"{self.base_url}/__stats__", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            return {}
+
+    def _delta(self, before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+        def diff(key):
+            a, b = after.get(key) or {}, before.get(key) or {}
+            return {k: a.get(k, 0) - b.get(k, 0) for k in a if a.get(k, 0) - b.get(k, 0)}
+
+        return {
+            "requests": after.get("requests", 0) - before.get("requests", 0),
+            "connections": after.get("connections", 0) - before.get("connections", 0),
+            "ops": diff("ops"),
+            "injected": diff("injected"),
+        }
+
+    def _expect(self, problems: List[str], name: str, delta: Dict[str, Any], op: str, expected: int) -> None:
+        actual = delta["ops"].get(op, 0)
+        if actual != expected:
+            problems.append(f"{name}: {op}={actual}, expected {expected}")
+
+    def _spaces_pass(self, problems: List[str]) -> None:
+        before = self._server_stats()
+        started = time.perf_counter()
+        try:
+            spaces = list_spaces_short()
+        except Exception as e:
+            problems.append(f"spaces: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        delta = self._delta(before, self._server_stats())
+        self.stdout.write(
+            f"{'spaces':>10}: {len(spaces)} spaces in {elapsed:.2f}s, "
+            f"requests={delta['requests']} connections={delta['connections']} injected={delta['injected'] or 0}"
+        )
+
+    def _publish_pass(self, name: str, case_ids: List[Any], concurrency: int) -> Tuple[Dict[str, Any], int]:
+        def publish(case_id):
+            started = time.perf_counter()
+            try:
+                result = publish_case_to_confluence(Case.objects.get(pk=case_id))
+                return time.perf_counter() - started, result, None
+            except Exception as e:
+                return time.perf_counter() - started, None, f"{type(e).__name__}: {e}"
+            finally:
+                connections.close_all()
+
+        before = self._server_stats()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(publish, case_ids))
+        elapsed = time.perf_counter() - started
+        delta = self._delta(before, self._server_stats())
+
+        latencies = [r[0] for r in results]
+        errors = [r[2] for r in results if r[2]]
+        totals: Dict[str, int] = {}
+        for _, result, _ in results:
+            for key, value in (result or {}).items():
+                totals[key] = totals.get(key, 0) + value
+
+        self.stdout.write(
+            f"{name:>10}: {len(case_ids)} cases in {elapsed:.2f}s ({len(case_ids) / (elapsed or 1e-9):.1f} cases/s), "
+            f"p50={statistics.median(latencies) * 1e3:.0f}ms p95={_percentile(latencies, 0.95) * 1e3:.0f}ms "
+            f"max={max(latencies) * 1e3:.0f}ms | pages {totals or {}} | "
+            f"requests={delta['requests']} connections={delta['connections']} "
+            f"ops={delta['ops'] or {}} injected={delta['injected'] or 0} failed={len(errors)}"
+        )
+        for error in errors[:5]:
+            self.stdout.write(f"  {error}")
+        return delta, len(errors)
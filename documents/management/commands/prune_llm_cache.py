@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from documents.services import llm_cache
+
+
+class Command(BaseCommand):
+    help = "Вытесняет протухшие/лишние записи кэша ответов LLM (или очищает его целиком)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Удалить все записи кэша.",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            deleted = llm_cache.clear()
+        else:
+            deleted = llm_cache.evict()
+        self.stdout.write(f"Deleted {deleted} LLM cache entr(y/ies)")
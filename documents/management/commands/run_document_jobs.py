@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from documents.services.jobs import (
+    default_worker_id,
+    process_next_job,
+    requeue_stale_jobs,
+)
+
+
+class Command(BaseCommand):
+    help = "Воркер очереди генерации документов (DocumentGenerationJob в БД)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать все задачи в очереди и выйти.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=getattr(settings, "DOCUMENT_JOBS_POLL_INTERVAL", 2.0),
+            help="Пауза между опросами пустой очереди, сек.",
+        )
+        parser.add_argument(
+            "--max-jobs",
+            type=int,
+            default=0,
+            help="Выйти после N задач (0 — без ограничения).",
+        )
+        parser.add_argument(
+            "--worker-id",
+            default=None,
+            help="Идентификатор воркера (по умолчанию host:pid).",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = options["worker_id"] or default_worker_id()
+        poll_interval = options["poll_interval"]
+        max_jobs = options["max_jobs"]
+        processed = 0
+
+        self.stdout.write(f"Document job worker {worker_id} started")
+
+        while True:
+            close_old_connections()
+            requeue_stale_jobs()
+
+            job = process_next_job(worker_id)
+            if job is not None:
+                processed += 1
+                self.stdout.write(f"Job {job.id} (case {job.case_id}) -> {job.status}")
+                if max_jobs and processed >= max_jobs:
+                    break
+                continue
+
+            if options["once"]:
+                break
+
+            time.sleep(poll_interval)
+
+        self.stdout.write(f"Worker {worker_id} processed {processed} job(s)")
@@ -0,0 +1,67 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cases.models import Case
+from documents.models import DocumentStatus, DocumentType, GeneratedDocument, GenerationStatus
+from documents.testing import run_concurrent_edits
+
+
+class Command(BaseCommand):
+    help = (
+        "Стресс-тест нумерации версий: N потоков одновременно правят один документ "
+        "и создают снэпшоты (как параллельные llm-edit). Проверяет, что номера версий "
+        "идут подряд без дублей и совпадают с GeneratedDocument.current_version. "
+        "Временные кейс и документ удаляются в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--edits", type=int, default=10, help="Правок на поток.")
+
+    def handle(self, *args, **options):
+        threads_count = options["threads"]
+        edits = options["edits"]
+
+        case = Case.objects.create(title=f"version stress {uuid.uuid4().hex[:8]}")
+        doc = GeneratedDocument.objects.create(
+            case=case,
+            doc_type=DocumentType.VISION,
+            title="stress",
+            content="",
+            structured_data={"edits": []},
+            status=DocumentStatus.DRAFT,
+            generation_status=GenerationStatus.READY,
+        )
+
+        started = time.perf_counter()
+        errors, error_samples = run_concurrent_edits(doc, threads_count, edits)
+        elapsed = time.perf_counter() - started
+
+        try:
+            numbers = sorted(doc.versions.values_list("version", flat=True))
+            doc.refresh_from_db(fields=["current_version"])
+            expected = threads_count * edits
+
+            self.stdout.write(
+                f"{threads_count} threads x {edits} edits in {elapsed:.2f}s: "
+                f"{len(numbers)} versions, current_version={doc.current_version}, "
+                f"errors={dict(errors) or 0}"
+            )
+            for sample in error_samples:
+                self.stdout.write(f"  {sample}")
+
+            problems = []
+            if errors:
+                problems.append(f"snapshot errors: {dict(errors)}")
+            if numbers != list(range(1, expected + 1)):
+                problems.append(f"version numbers are not 1..{expected} without gaps/duplicates")
+            if doc.current_version != expected:
+                problems.append(f"current_version={doc.current_version}, expected {expected}")
+        finally:
+            case.delete()
+
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Version numbering is consistent."))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:05
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cases', '0006_case_confluence_page_id_case_confluence_page_url_and_more'),
+        ('documents', '0010_alter_generateddocument_diagram_url_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generateddocument',
+            name='doc_type',
+            field=models.CharField(choices=[('vision', 'Vision / Product Vision'), ('scope', 'Scope / Product Scope'), ('bpmn', 'BPMN Diagram'), ('context_diagram', 'Context Diagram'), ('uml_use_case_diagram', 'UML Use Case Diagram')], help_text='Тип документа (vision, scope, bpmn, context_diagram и т.д.).', max_length=50),
+        ),
+        migrations.CreateModel(
+            name='DocumentGenerationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('new', 'New'), ('generating', 'Generating'), ('ready', 'Ready'), ('failed', 'Failed')], default='new', max_length=50)),
+                ('doc_types', models.JSONField(blank=True, help_text='Типы документов, которые задача должна обеспечить.', null=True)),
+                ('requested_by', models.CharField(blank=True, help_text='ID пользователя, поставившего задачу.', max_length=128, null=True)),
+                ('worker_id', models.CharField(blank=True, help_text='Идентификатор воркера, который взял задачу.', max_length=128, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('did_generate_any', models.BooleanField(default=False)),
+                ('errors', models.JSONField(blank=True, help_text='Ошибки генерации по типам документов.', null=True)),
+                ('error_message', models.TextField(blank=True, help_text='Ошибка выполнения задачи целиком.', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('case', models.ForeignKey(help_text='Кейс, по которому генерируются документы.', on_delete=django.db.models.deletion.CASCADE, related_name='generation_jobs', to='cases.case')),
+            ],
+            options={
+                'verbose_name': 'Document generation job',
+                'verbose_name_plural': 'Document generation jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='docjob_status_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentVersion',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField(help_text='Порядковый номер версии (1, 2, 3 ...).')),
+                ('title', models.CharField(max_length=255)),
+                ('content', models.TextField(blank=True)),
+                ('structured_data', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reason', models.CharField(blank=True, help_text='Причина создания версии (generation, llm_edit, diagram_edit, restore_version).', max_length=50, null=True)),
+                ('document', models.ForeignKey(help_text='Документ, к которому относится версия.', on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='documents.generateddocument')),
+            ],
+            options={
+                'verbose_name': 'Document version',
+                'verbose_name_plural': 'Document versions',
+                'ordering': ['document', '-version'],
+                'unique_together': {('document', 'version')},
+            },
+        ),
+    ]
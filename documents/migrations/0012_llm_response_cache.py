@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_generation_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMResponseCache',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=100)),
+                ('prompt_hash', models.CharField(help_text='Хэш system+user промпта (как GeneratedDocument.prompt_hash).', max_length=64)),
+                ('response', models.JSONField(help_text='Распарсенный JSON-ответ модели.')),
+                ('raw', models.TextField(blank=True, default='', help_text='Сырой текст ответа.')),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'LLM response cache entry',
+                'verbose_name_plural': 'LLM response cache',
+            },
+        ),
+    ]
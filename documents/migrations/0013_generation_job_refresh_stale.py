@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_llm_response_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentgenerationjob',
+            name='refresh_stale',
+            field=models.BooleanField(default=False, help_text='Перегенерировать также устаревшие документы.'),
+        ),
+    ]
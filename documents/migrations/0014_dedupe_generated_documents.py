@@ -0,0 +1,71 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:17
+
+import logging
+
+from django.db import migrations
+from django.db.models import Count
+
+logger = logging.getLogger(__name__)
+
+# чем меньше, тем важнее сохранить: одобренный, затем просмотренный BA
+REVIEW_PRIORITY = {"approved_by_ba": 0, "rejected_by_ba": 1}
+
+
+def _keep_rank(doc):
+    return (REVIEW_PRIORITY.get(doc.status, 2), 0 if doc.structured_data else 1)
+
+
+def dedupe_case_doc_types(apps, schema_editor):
+    """
+    Перед уникальным (case, doc_type) оставляем по одному документу на пару:
+    приоритет у самого свежего одобренного BA, затем просмотренного BA,
+    затем с содержимым, затем просто самого свежего.
+    Удаление необратимо (вместе с версиями документа) — каждая удалённая
+    строка пишется в лог.
+    """
+    GeneratedDocument = apps.get_model("documents", "GeneratedDocument")
+
+    duplicates = (
+        GeneratedDocument.objects.values("case_id", "doc_type")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        docs = list(
+            GeneratedDocument.objects.filter(
+                case_id=row["case_id"],
+                doc_type=row["doc_type"],
+            ).order_by("-updated_at", "-created_at")
+        )
+        # min() стабилен: при равном ранге остаётся самый свежий
+        keep = min(docs, key=_keep_rank)
+        removed = [d for d in docs if d.pk != keep.pk]
+        for doc in removed:
+            logger.warning(
+                "Deleting duplicate document %s (case=%s doc_type=%s status=%s "
+                "generation_status=%s updated_at=%s has_content=%s), keeping %s",
+                doc.pk,
+                doc.case_id,
+                doc.doc_type,
+                doc.status,
+                doc.generation_status,
+                doc.updated_at,
+                bool(doc.structured_data),
+                keep.pk,
+            )
+        GeneratedDocument.objects.filter(pk__in=[d.pk for d in removed]).delete()
+
+
+class Migration(migrations.Migration):
+    """
+    Отдельной миграцией (своей транзакцией): на Postgres удаление строк
+    с отложенными FK-проверками и ALTER TABLE в одной транзакции конфликтуют.
+    """
+
+    dependencies = [
+        ('documents', '0013_generation_job_refresh_stale'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_case_doc_types, migrations.RunPython.noop),
+    ]
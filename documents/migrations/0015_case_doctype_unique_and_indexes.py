@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_dedupe_generated_documents'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='generateddocument',
+            index=models.Index(fields=['case', 'status'], name='gendoc_case_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='generateddocument',
+            constraint=models.UniqueConstraint(fields=('case', 'doc_type'), name='gendoc_case_doctype_uniq'),
+        ),
+    ]
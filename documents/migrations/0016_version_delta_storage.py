@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_case_doctype_unique_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentversion',
+            name='base_version',
+            field=models.PositiveIntegerField(blank=True, help_text='Номер keyframe-версии, относительно которой хранится delta.', null=True),
+        ),
+        migrations.AddField(
+            model_name='documentversion',
+            name='delta',
+            field=models.JSONField(blank=True, help_text='Текстовый diff content и JSON Patch structured_data относительно keyframe.', null=True),
+        ),
+        migrations.AddField(
+            model_name='documentversion',
+            name='storage',
+            field=models.CharField(choices=[('full', 'Full snapshot (keyframe)'), ('delta', 'Delta against keyframe')], default='full', help_text='full — полный снэпшот (keyframe), delta — разница с keyframe.', max_length=16),
+        ),
+    ]
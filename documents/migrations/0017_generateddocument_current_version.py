@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:22
+
+from django.db import migrations, models
+from django.db.models import IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_current_version(apps, schema_editor):
+    GeneratedDocument = apps.get_model("documents", "GeneratedDocument")
+    DocumentVersion = apps.get_model("documents", "DocumentVersion")
+
+    latest = (
+        DocumentVersion.objects.filter(document_id=OuterRef("pk"))
+        .values("document_id")
+        .annotate(max_version=Max("version"))
+        .values("max_version")
+    )
+    GeneratedDocument.objects.update(
+        current_version=Coalesce(Subquery(latest, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0016_version_delta_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generateddocument',
+            name='current_version',
+            field=models.PositiveIntegerField(default=0, help_text='Номер последней выданной версии документа (DocumentVersion.version).'),
+        ),
+        migrations.RunPython(backfill_current_version, migrations.RunPython.noop),
+    ]
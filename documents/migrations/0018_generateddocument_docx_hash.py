@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0017_generateddocument_current_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generateddocument',
+            name='docx_hash',
+            field=models.CharField(blank=True, help_text='Хэш structured_data + версии шаблона, из которых собран docx_file (пусто — файл загружен вручную или собран до введения хэша).', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0018_generateddocument_docx_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generateddocument',
+            name='confluence_attachments',
+            field=models.JSONField(blank=True, default=dict, help_text='Опубликованные вложения: имя файла -> хэш содержимого.'),
+        ),
+        migrations.AddField(
+            model_name='generateddocument',
+            name='confluence_content_hash',
+            field=models.CharField(blank=True, help_text='Хэш заголовка и тела страницы, опубликованных в Confluence.', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='generateddocument',
+            name='confluence_page_id',
+            field=models.CharField(blank=True, help_text='ID дочерней страницы документа в Confluence.', max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='generateddocument',
+            name='confluence_page_version',
+            field=models.PositiveIntegerField(default=0, help_text='Номер версии страницы Confluence после последней публикации.'),
+        ),
+    ]
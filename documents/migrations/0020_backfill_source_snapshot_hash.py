@@ -0,0 +1,113 @@
+"""
+Пересчёт source_snapshot_hash / prompt_hash под новые правила устаревания.
+
+Раньше source_snapshot_hash был хэшем всего контекста кейса (вместе со status
+и confluence_page_*), теперь — хэшем среза по doc_type, а промпт строится по
+контексту, суженному до doc_type. Без пересчёта после деплоя все
+существующие документы считались бы устаревшими.
+
+Документ получает новые хэши, только если его старый хэш совпадает с текущими
+данными кейса по старой формуле, т.е. он был актуален и до миграции.
+status и страница Confluence менялись уже после генерации (сама генерация
+переводит кейс в documents_generated), поэтому перебираем их варианты.
+Остальные документы не трогаем — refresh_stale их перегенерирует.
+"""
+from django.db import migrations
+
+from documents.services.utils import sha256_json
+
+# CaseStatus на момент миграции
+LEGACY_STATUSES = (
+    "draft",
+    "planning",
+    "in_progress",
+    "ready_for_documents",
+    "documents_generated",
+    "approved",
+)
+
+
+def _context(case, followups):
+    return {
+        "case": {
+            "id": str(case.id),
+            "title": case.title,
+            "initial_answers": case.initial_answers,
+            "selected_document_types": case.selected_document_types or [],
+            "confluence_space_key": case.confluence_space_key,
+            "confluence_space_name": case.confluence_space_name,
+        },
+        "followup_answers": followups,
+    }
+
+
+def _legacy_hashes(case, context):
+    pages = {(case.confluence_page_id, case.confluence_page_url), (None, None)}
+    hashes = set()
+    for status in LEGACY_STATUSES:
+        for page_id, page_url in pages:
+            legacy = dict(context["case"], status=status)
+            legacy["confluence_page_id"] = page_id
+            legacy["confluence_page_url"] = page_url
+            hashes.add(sha256_json({"case": legacy, "followup_answers": context["followup_answers"]}))
+    return hashes
+
+
+def backfill(apps, schema_editor):
+    # текущие формулы хэшей — ради них миграция и существует
+    from documents.services.context_builder import source_snapshot_hash
+    from documents.services.ensure import _artifact_prompts
+    from documents.services.utils import compute_prompt_hash
+
+    GeneratedDocument = apps.get_model("documents", "GeneratedDocument")
+    FollowupQuestion = apps.get_model("cases", "FollowupQuestion")
+
+    docs = (
+        GeneratedDocument.objects
+        .filter(structured_data__isnull=False)
+        .select_related("case")
+        .order_by("case_id")
+    )
+    contexts = {}
+    changed = []
+    for doc in docs.iterator():
+        case = doc.case
+        if case.pk not in contexts:
+            followups = [
+                {
+                    "order_index": q.order_index,
+                    "code": q.code,
+                    "text": q.text,
+                    "answer": q.answer_text,
+                    "target_document_types": q.target_document_types or [],
+                }
+                for q in FollowupQuestion.objects.filter(case=case, status="answered").order_by("order_index")
+            ]
+            context = _context(case, followups)
+            contexts = {case.pk: (context, _legacy_hashes(case, context))}
+
+        context, legacy_hashes = contexts[case.pk]
+        if doc.source_snapshot_hash not in legacy_hashes:
+            continue
+
+        try:
+            _, system_prompt, user_prompt = _artifact_prompts(doc.doc_type, context)
+        except ValueError:
+            continue
+        doc.source_snapshot_hash = source_snapshot_hash(context, doc.doc_type)
+        doc.prompt_hash = compute_prompt_hash(system_prompt, user_prompt)
+        changed.append(doc)
+
+    GeneratedDocument.objects.bulk_update(changed, ["source_snapshot_hash", "prompt_hash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cases", "0010_case_status_planning"),
+        ("documents", "0019_generateddocument_confluence_state"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
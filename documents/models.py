@@ -25,6 +25,11 @@ class GenerationStatus(models.TextChoices):
     FAILED = "failed", "Failed"
 
 
+class VersionStorage(models.TextChoices):
+    FULL = "full", "Full snapshot (keyframe)"
+    DELTA = "delta", "Delta against keyframe"
+
+
 class GeneratedDocument(models.Model):
     """
     Документ или диаграмма, сгенерированные GPT на основе кейса и ответов пользователя.
@@ -114,6 +119,14 @@ class GeneratedDocument(models.Model):
         help_text="Когда последний раз генерировался DOCX.",
     )
 
+    docx_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        help_text="Хэш structured_data + версии шаблона, из которых собран docx_file "
+                  "(пусто — файл загружен вручную или собран до введения хэша).",
+    )
+
     # URL PNG для диаграмм (BPMN, Context и т.п.) на PlantUML-сервере
     diagram_url = models.URLField(
         blank=True,
@@ -121,6 +134,38 @@ class GeneratedDocument(models.Model):
         help_text="Ссылка на картинку диаграммы (PNG) на PlantUML-сервере.",
     )
 
+    # дочерняя страница документа в Confluence (под страницей кейса)
+    confluence_page_id = models.CharField(
+        max_length=255,
+        blank=True,
+        null=True,
+        help_text="ID дочерней страницы документа в Confluence.",
+    )
+
+    confluence_page_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Номер версии страницы Confluence после последней публикации.",
+    )
+
+    confluence_content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        help_text="Хэш заголовка и тела страницы, опубликованных в Confluence.",
+    )
+
+    confluence_attachments = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Опубликованные вложения: имя файла -> хэш содержимого.",
+    )
+
+    # счётчик версий: номер новой версии выдаётся атомарным UPDATE ... + 1
+    current_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Номер последней выданной версии документа (DocumentVersion.version).",
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -128,6 +173,13 @@ class GeneratedDocument(models.Model):
         verbose_name = "Generated document"
         verbose_name_plural = "Generated documents"
         ordering = ["case", "doc_type", "created_at"]
+        constraints = [
+            # один документ каждого типа на кейс — на это опирается update_or_create в ensure
+            models.UniqueConstraint(fields=["case", "doc_type"], name="gendoc_case_doctype_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["case", "status"], name="gendoc_case_status_idx"),
+        ]
 
     def __str__(self):
         return f"{self.doc_type} for case={self.case_id} ({self.id})"
@@ -153,9 +205,27 @@ class DocumentVersion(models.Model):
     )
 
     title = models.CharField(max_length=255)
+    # у delta-версий content/structured_data пустые — см. services/version_store.py
     content = models.TextField(blank=True)
     structured_data = models.JSONField(blank=True, null=True)
 
+    storage = models.CharField(
+        max_length=16,
+        choices=VersionStorage.choices,
+        default=VersionStorage.FULL,
+        help_text="full — полный снэпшот (keyframe), delta — разница с keyframe.",
+    )
+    base_version = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Номер keyframe-версии, относительно которой хранится delta.",
+    )
+    delta = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Текстовый diff content и JSON Patch structured_data относительно keyframe.",
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     reason = models.CharField(
@@ -172,4 +242,123 @@ class DocumentVersion(models.Model):
         unique_together = ("document", "version")
 
     def __str__(self):
-        return f"Version {self.version} of doc={self.document_id}"
\ No newline at end of file
+        return f"Version {self.version} of doc={self.document_id}"
+
+
+class DocumentGenerationJob(models.Model):
+    """
+    Фоновая задача генерации документов по кейсу.
+    Очередь живёт прямо в БД: POST /documents/ ставит задачу,
+    воркер (manage.py run_document_jobs) забирает её и выполняет.
+    Статусы — те же GenerationStatus, что и у документов.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    case = models.ForeignKey(
+        Case,
+        on_delete=models.CASCADE,
+        related_name="generation_jobs",
+        help_text="Кейс, по которому генерируются документы.",
+    )
+
+    status = models.CharField(
+        max_length=50,
+        choices=GenerationStatus.choices,
+        default=GenerationStatus.NEW,
+    )
+
+    doc_types = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Типы документов, которые задача должна обеспечить.",
+    )
+
+    refresh_stale = models.BooleanField(
+        default=False,
+        help_text="Перегенерировать также устаревшие документы.",
+    )
+
+    requested_by = models.CharField(
+        max_length=128,
+        blank=True,
+        null=True,
+        help_text="ID пользователя, поставившего задачу.",
+    )
+
+    worker_id = models.CharField(
+        max_length=128,
+        blank=True,
+        null=True,
+        help_text="Идентификатор воркера, который взял задачу.",
+    )
+
+    attempts = models.PositiveIntegerField(default=0)
+
+    did_generate_any = models.BooleanField(default=False)
+
+    errors = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Ошибки генерации по типам документов.",
+    )
+
+    error_message = models.TextField(
+        blank=True,
+        null=True,
+        help_text="Ошибка выполнения задачи целиком.",
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Document generation job"
+        verbose_name_plural = "Document generation jobs"
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="docjob_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} for case={self.case_id} ({self.status})"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (GenerationStatus.READY, GenerationStatus.FAILED)
+
+
+class LLMResponseCache(models.Model):
+    """
+    Кэш ответов LLM, адресуемый по содержимому запроса:
+    key = sha256(модель + температура + response_format + хэш system/user промптов).
+    Одинаковый запрос возвращает сохранённый JSON без похода в сеть.
+    """
+
+    key = models.CharField(max_length=64, primary_key=True)
+
+    model = models.CharField(max_length=100)
+
+    prompt_hash = models.CharField(
+        max_length=64,
+        help_text="Хэш system+user промпта (как GeneratedDocument.prompt_hash).",
+    )
+
+    response = models.JSONField(help_text="Распарсенный JSON-ответ модели.")
+
+    raw = models.TextField(blank=True, default="", help_text="Сырой текст ответа.")
+
+    hit_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True)
+    expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    class Meta:
+        verbose_name = "LLM response cache entry"
+        verbose_name_plural = "LLM response cache"
+
+    def __str__(self):
+        return f"{self.model}:{self.key[:12]} (hits={self.hit_count})"
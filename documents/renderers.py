@@ -0,0 +1,15 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Нужен только для content negotiation: чтобы DRF не отвечал 406
+    на Accept: text/event-stream. Сам поток отдаёт StreamingHttpResponse.
+    """
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
@@ -1,13 +1,50 @@
 from rest_framework import serializers
 
 from .models import GeneratedDocument, DocumentStatus, DocumentVersion
+from .services.projection import parse_fields_param
+from .services.version_store import get_version_payload
 
 
-class GeneratedDocumentSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
     """
-    Основной сериализатор для документа:
+    Оставляет в ответе только выбранные поля: fields=[...] в конструкторе
+    или ?fields=a,b,c в запросе (из context["request"]).
+    Неизвестные имена игнорируются; default_fields — набор по умолчанию.
+    """
+
+    default_fields = None
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is None:
+            fields = parse_fields_param(self.context.get("request"))
+        if fields is None:
+            fields = self.default_fields
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def resolve_fields(cls, request=None, fields=None):
+        """
+        Итоговый список полей (для .only() в queryset) — до создания сериализатора.
+        """
+        if fields is None:
+            fields = parse_fields_param(request)
+        if fields is None:
+            fields = cls.default_fields
+        if fields is None:
+            return list(cls.Meta.fields)
+        return [f for f in cls.Meta.fields if f in fields]
+
+
+class GeneratedDocumentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Основной сериализатор для документа (поддерживает ?fields=):
     - docx_url: абсолютная ссылка на DOCX (по FileField)
-    - diagram_url: уже готовый URL на PlantUML-сервер (строка из модели)
+    - diagram_url: URL картинки диаграммы (наш /api/diagrams/... или PlantUML-сервер)
     """
 
     docx_url = serializers.SerializerMethodField(read_only=True)
@@ -50,6 +87,14 @@ class GeneratedDocumentSerializer(serializers.ModelSerializer):
             "updated_at",
         )
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get("request")
+        diagram_url = data.get("diagram_url")
+        if request and diagram_url and diagram_url.startswith("/"):
+            data["diagram_url"] = request.build_absolute_uri(diagram_url)
+        return data
+
     def get_docx_url(self, obj) -> str | None:
         request = self.context.get("request")
         if not obj.docx_file:
@@ -87,7 +132,18 @@ class DocumentLLMEditSerializer(serializers.Serializer):
 
 # 🔥 НОВОЕ: версии
 
-class DocumentVersionSerializer(serializers.ModelSerializer):
+class DocumentVersionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    По умолчанию — только метаданные версии; полный снэпшот
+    по запросу: ?fields=id,version,content,structured_data.
+    """
+
+    default_fields = ("id", "version", "title", "created_at", "reason")
+
+    # delta-версии восстанавливаются из keyframe (services/version_store.py)
+    content = serializers.SerializerMethodField()
+    structured_data = serializers.SerializerMethodField()
+
     class Meta:
         model = DocumentVersion
         fields = (
@@ -96,8 +152,22 @@ class DocumentVersionSerializer(serializers.ModelSerializer):
             "title",
             "created_at",
             "reason",
+            "content",
+            "structured_data",
         )
 
+    def _payload(self, obj):
+        payloads = self.context.get("version_payloads")
+        if payloads is not None and obj.pk in payloads:
+            return payloads[obj.pk]
+        return get_version_payload(obj)
+
+    def get_content(self, obj) -> str:
+        return self._payload(obj)["content"]
+
+    def get_structured_data(self, obj) -> dict | None:
+        return self._payload(obj)["structured_data"]
+
 
 class DocumentVersionSelectSerializer(serializers.Serializer):
     """
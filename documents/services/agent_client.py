@@ -2,15 +2,14 @@ from __future__ import annotations
 
 import json
 import logging
-from typing import Any, Dict, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from django.conf import settings
-from openai import OpenAI
 
-logger = logging.getLogger(__name__)
+from . import llm_cache
+from .llm_gateway import call_with_retries, chat_completion, get_client
 
-# Просто alias, чтобы при желании можно было подменять
-AgentClient = OpenAI
+logger = logging.getLogger(__name__)
 
 
 # ========= 1. Вызов workflow (AI Agent) =========
@@ -24,7 +23,7 @@ def run_workflow(
     """
     Вызов OpenAI Workflow (AI Agent) по ID.
     """
-    client = AgentClient()
+    client = get_client()
 
     used_model = model or getattr(
         settings,
@@ -39,7 +38,8 @@ def run_workflow(
         list(input_data.keys()),
     )
 
-    run = client.workflows.runs.create(
+    run = call_with_retries(
+        client.workflows.runs.create,
         workflow_id=workflow_id,
         input=input_data,
         model=used_model,
@@ -86,6 +86,8 @@ def chat_json(
     system_prompt: str,
     user_prompt: str,
     response_format: Dict[str, Any],
+    use_cache: bool = True,
+    validate: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
 ) -> Tuple[Dict[str, Any], str]:
     """
     Вызов GPT, который должен вернуть JSON по заданной json_schema.
@@ -95,12 +97,24 @@ def chat_json(
       - system_prompt: системный промпт
       - user_prompt: промпт пользователя
       - response_format: dict с json_schema (как в DIAGRAM_EDIT)
+      - use_cache: брать/класть ответ в LLMResponseCache
+      - validate: проверка ответа; в кэш кладётся только прошедший её ответ
 
     Возвращает:
       - data: dict, распарсенный JSON из ответа модели
       - raw: str, сырой текст ответа (для логов/отладки)
     """
-    client = AgentClient()
+    cache_key = llm_cache.build_cache_key(
+        model=model,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        response_format=response_format,
+    )
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            data = cached.response
+            return (validate(data) if validate else data), cached.raw
 
     logger.info(
         "Calling chat_json with model=%s, response_format=%s",
@@ -108,7 +122,7 @@ def chat_json(
         response_format.get("type"),
     )
 
-    completion = client.chat.completions.create(
+    completion = chat_completion(
         model=model,
         messages=[
             {"role": "system", "content": system_prompt},
@@ -131,5 +145,15 @@ def chat_json(
         raise ValueError(
             f"LLM JSON response is not an object. Raw content:\n{raw}"
         )
+    validated = validate(data) if validate else data
+
+    llm_cache.put(
+        cache_key,
+        model=model,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        response=data,
+        raw=raw,
+    )
 
-    return data, raw
\ No newline at end of file
+    return validated, raw
\ No newline at end of file
@@ -9,7 +9,7 @@ from . import prompt, schema
 logger = logging.getLogger(__name__)
 
 
-def generate(case_context: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+def generate(case_context: Dict[str, Any], *, use_cache: bool = True) -> Tuple[Dict[str, Any], str]:
     """
     Генерация BPMN-диаграммы через LLM.
 
@@ -27,26 +27,15 @@ def generate(case_context: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
         case_context["case"]["title"],
     )
 
-    raw_data, used_model = chat_json(
+    data, used_model = chat_json(
         system_prompt,
         user_prompt,
         model=getattr(settings, "OPENAI_MODEL_BPMN", settings.OPENAI_MODEL_SCOPE),
+        use_cache=use_cache,
+        # в кэш попадает только ответ, прошедший валидацию
+        validate=schema.validate,
     )
 
-    # DEBUG: что вернул GPT
-    print("\n========== RAW BPMN FROM LLM ==========")
-    print(raw_data)
-    print("=======================================\n")
-
-    logger.info(
-        "BPMN | raw_data type=%s keys=%s",
-        type(raw_data),
-        list(raw_data.keys()) if isinstance(raw_data, dict) else None,
-    )
-
-    # Приводим к стабильной схеме
-    data = schema.validate(raw_data)
-
     # DEBUG: что после валидации
     print("\n========== VALIDATED BPMN DATA ==========")
     print(data)
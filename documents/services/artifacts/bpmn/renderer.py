@@ -1,33 +1,23 @@
 from pathlib import Path
 from typing import Dict, Any, Tuple
 
-import requests
-from django.conf import settings
-
 from . import prompt, schema
+from ...plantuml_render import render_diagram
 
 
 def _call_plantuml_server(plantuml_code: str) -> bytes:
     """
-    Отправляем PlantUML-код на сервер и получаем PNG-байты.
+    Получаем PNG-байты диаграммы.
 
-    Используем POST без компрессии (так проще),
-    сервер https://www.plantuml.com/plantuml/png это понимает.
+    Рендер — через локальный пул PlantUML-воркеров или PlantUML-сервер,
+    повторные вызовы с тем же кодом берутся из кэша на диске.
     """
-    url = settings.PLANTUML_SERVER_URL.rstrip("/")
-
-    resp = requests.post(
-        url,
-        data=plantuml_code.encode("utf-8"),
-        timeout=15,
-    )
-    resp.raise_for_status()
-    return resp.content
+    return render_diagram(plantuml_code, "png")
 
 
 def render_bpmn_image(plantuml_code: str, output_path: Path) -> None:
     """
-    Рендерит PNG через PlantUML-сервер и сохраняет в output_path.
+    Рендерит PNG через PlantUML и сохраняет в output_path.
     """
     png_bytes = _call_plantuml_server(plantuml_code)
 
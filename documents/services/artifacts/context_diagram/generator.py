@@ -11,7 +11,7 @@ from . import prompt, schema
 logger = logging.getLogger(__name__)
 
 
-def generate(case_context: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+def generate(case_context: Dict[str, Any], *, use_cache: bool = True) -> Tuple[Dict[str, Any], str]:
     """
     Генерация контекстной диаграммы через LLM.
 
@@ -29,20 +29,15 @@ def generate(case_context: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
         case_context["case"]["title"],
     )
 
-    raw_data, used_model = chat_json(
+    data, used_model = chat_json(
         system_prompt,
         user_prompt,
         model=getattr(settings, "OPENAI_MODEL_CONTEXT", settings.OPENAI_MODEL_SCOPE),
+        use_cache=use_cache,
+        # в кэш попадает только ответ, прошедший валидацию
+        validate=schema.validate,
     )
 
-    # ==== DEBUG: смотрим, что реально вернул GPT ====
-    print("\n========== RAW CONTEXT DIAGRAM FROM LLM ==========")
-    print(raw_data)
-    print("=======================================\n")
-
-    # Валидация / нормализация
-    data = schema.validate(raw_data)
-
     print("\n========== VALIDATED CONTEXT DIAGRAM DATA ==========")
     print(data)
     print("plantuml (first 400 chars):")
@@ -1,51 +1,40 @@
-import io
-from typing import Any, Dict, List
+from typing import Any, Dict
 
-from docx import Document as DocxDocument
+from ...docx_template import new_docx
 
 DEFAULT_TEXT = "Требует уточнения на основании исходных данных"
 
 
-def _add_bullets(doc: DocxDocument, items: List[str]) -> None:
-    if not items:
-        doc.add_paragraph(DEFAULT_TEXT, style="List Bullet")
-        return
-    for x in items:
-        doc.add_paragraph(str(x), style="List Bullet")
-
-
 def build_docx(structured: Dict[str, Any]) -> bytes:
     """
     Собирает DOCX для Scope на основе structured_data.
-    Возвращает байты файла.
+    Возвращает байты файла (шаблон — см. docx_template).
     """
-    d = DocxDocument()
+    d = new_docx()
 
     summary = (structured.get("summary") or "").strip() or DEFAULT_TEXT
 
-    d.add_heading("Scope", level=1)
+    d.heading("Scope", level=1)
 
-    d.add_heading("Summary", level=3)
-    d.add_paragraph(summary)
+    d.heading("Summary", level=3)
+    d.paragraph(summary)
 
-    d.add_heading("In vision", level=3)
-    _add_bullets(d, structured.get("in_scope") or [])
+    d.heading("In vision", level=3)
+    d.bullets(structured.get("in_scope") or [], DEFAULT_TEXT)
 
-    d.add_heading("Out of vision", level=3)
-    _add_bullets(d, structured.get("out_of_scope") or [])
+    d.heading("Out of vision", level=3)
+    d.bullets(structured.get("out_of_scope") or [], DEFAULT_TEXT)
 
-    d.add_heading("Business processes in vision", level=3)
-    _add_bullets(d, structured.get("business_processes_in_scope") or [])
+    d.heading("Business processes in vision", level=3)
+    d.bullets(structured.get("business_processes_in_scope") or [], DEFAULT_TEXT)
 
-    d.add_heading("Systems in vision", level=3)
-    _add_bullets(d, structured.get("systems_in_scope") or [])
+    d.heading("Systems in vision", level=3)
+    d.bullets(structured.get("systems_in_scope") or [], DEFAULT_TEXT)
 
-    d.add_heading("Assumptions", level=3)
-    _add_bullets(d, structured.get("assumptions") or [])
+    d.heading("Assumptions", level=3)
+    d.bullets(structured.get("assumptions") or [], DEFAULT_TEXT)
 
-    d.add_heading("Constraints", level=3)
-    _add_bullets(d, structured.get("constraints") or [])
+    d.heading("Constraints", level=3)
+    d.bullets(structured.get("constraints") or [], DEFAULT_TEXT)
 
-    buf = io.BytesIO()
-    d.save(buf)
-    return buf.getvalue()
+    return d.to_bytes()
@@ -7,7 +7,7 @@ from . import prompt
 MODEL_NAME = "gpt-5.1"
 
 
-def generate(case_context: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+def generate(case_context: Dict[str, Any], *, use_cache: bool = True) -> Tuple[Dict[str, Any], str]:
     """
     Генерирует structured_data для UML use case диаграммы.
 
@@ -22,6 +22,7 @@ def generate(case_context: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
         system_prompt=system_prompt,
         user_prompt=user_prompt,
         model=MODEL_NAME,
+        use_cache=use_cache,
     )
 
     plantuml = (data.get("plantuml") or "").strip()
@@ -1,12 +1,34 @@
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterator, Tuple
 from django.conf import settings
 
 from . import prompt, schema
-from ...llm_client import chat_json
+from ...llm_client import chat_json, stream_chat_json
 
 
-def generate(case_context: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+def generate(case_context: Dict[str, Any], *, use_cache: bool = True) -> Tuple[Dict[str, Any], str]:
     user_prompt = prompt.build_user_prompt(case_context)
-    data, used_model = chat_json(prompt.SYSTEM_PROMPT, user_prompt, model=settings.OPENAI_MODEL_VISION)
-    data = schema.validate(data)
-    return data, used_model
+    return chat_json(
+        prompt.SYSTEM_PROMPT,
+        user_prompt,
+        model=settings.OPENAI_MODEL_VISION,
+        use_cache=use_cache,
+        validate=schema.validate,
+    )
+
+
+def stream(case_context: Dict[str, Any], *, use_cache: bool = True) -> Tuple[Iterator[str], str]:
+    """
+    Потоковая генерация: (итератор текстовых дельт JSON, модель).
+    Ответ в кэш попадает только после schema.validate; вызывающий
+    валидирует собранный ответ сам (для structured_data).
+    """
+    user_prompt = prompt.build_user_prompt(case_context)
+    model = settings.OPENAI_MODEL_VISION
+    deltas = stream_chat_json(
+        prompt.SYSTEM_PROMPT,
+        user_prompt,
+        model=model,
+        use_cache=use_cache,
+        validate=schema.validate,
+    )
+    return deltas, model
@@ -1,6 +1,7 @@
-import json
 from typing import Any, Dict
 
+from ...context_builder import dump_case_context
+
 PROMPT_VERSION = "scope:v1"
 
 SYSTEM_PROMPT = """
@@ -27,7 +28,7 @@ SYSTEM_PROMPT = """
 
 
 def build_user_prompt(case_context: Dict[str, Any]) -> str:
-    payload = json.dumps(case_context, ensure_ascii=False, indent=2)
+    payload = dump_case_context(case_context)
     return (
         "На основе данных ниже сгенерируй JSON для документа Vision.\n"
         "Данные кейса и ответы:\n\n"
@@ -1,59 +1,29 @@
 from __future__ import annotations
 
 import logging
-import zlib
+from typing import Iterable, List, Optional
 
 from django.conf import settings
+from django.utils import timezone
 
 from documents.models import GeneratedDocument, DocumentType
 
+from .plantuml_encoding import encode_plantuml
+from .plantuml_render import (
+    RENDER_MODE_SERVER,
+    RENDER_MODE_URL,
+    build_diagram_url,
+    get_or_render_diagram,
+    get_render_mode,
+    local_renderer_available,
+    store_diagram_source,
+)
+
 logger = logging.getLogger(__name__)
 
 # публичный дефолт, если в settings ничего не указано
 DEFAULT_PLANTUML_SERVER = "https://www.plantuml.com/plantuml"
 
-# ====== кодирование PlantUML в short URL (как в оф. доках) ======
-
-_PU_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
-
-
-def _encode_6bit(b: int) -> str:
-    return _PU_ALPHABET[b & 0x3F]
-
-
-def _append_3bytes(b1: int, b2: int, b3: int) -> str:
-    c1 = b1 >> 2
-    c2 = ((b1 & 0x3) << 4) | (b2 >> 4)
-    c3 = ((b2 & 0xF) << 2) | (b3 >> 6)
-    c4 = b3 & 0x3F
-    return (
-        _encode_6bit(c1 & 0x3F)
-        + _encode_6bit(c2 & 0x3F)
-        + _encode_6bit(c3 & 0x3F)
-        + _encode_6bit(c4 & 0x3F)
-    )
-
-
-def encode_plantuml(text: str) -> str:
-    """
-    Deflate (wbits=-MAX_WBITS) + спец. base64 от PlantUML.
-    Результат — короткая строка, которую подставляем в /png/<code>.
-    """
-    data = text.encode("utf-8")
-    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
-    compressed = compressor.compress(data) + compressor.flush()
-
-    res: list[str] = []
-    i = 0
-    length = len(compressed)
-    while i < length:
-        b1 = compressed[i]
-        b2 = compressed[i + 1] if i + 1 < length else 0
-        b3 = compressed[i + 2] if i + 2 < length else 0
-        res.append(_append_3bytes(b1, b2, b3))
-        i += 3
-    return "".join(res)
-
 
 def build_plantuml_url(uml_code: str) -> str:
     """
@@ -66,6 +36,28 @@ def build_plantuml_url(uml_code: str) -> str:
     return server.rstrip("/") + "/png/" + encoded
 
 
+def build_diagram_url_for_code(uml_code: str) -> str:
+    """
+    URL картинки для документа. Вызывается на пути генерации, поэтому
+    внешний PlantUML-сервер здесь не вызывается:
+    - режим "url" (по умолчанию, если нет локального jar) — ссылка прямо на PlantUML-сервер;
+    - иначе сохраняем исходник и отдаём наш URL; PNG рендерим заранее, только
+      если есть локальный jar, в остальных случаях — лениво в DiagramImageView.
+    """
+    mode = get_render_mode()
+    if mode == RENDER_MODE_URL:
+        return build_plantuml_url(uml_code)
+
+    digest = store_diagram_source(uml_code)
+    if mode != RENDER_MODE_SERVER and local_renderer_available():
+        try:
+            get_or_render_diagram(uml_code, "png", local_only=True)
+        except Exception:
+            logger.exception("Failed to render PlantUML diagram locally, will render on request")
+
+    return build_diagram_url(digest, "png")
+
+
 # ====== fallback PlantUML, если GPT ничего не вернул ======
 
 
@@ -92,13 +84,17 @@ stop
 """
 
 
-def ensure_bpmn_url_for_document(
-    doc: GeneratedDocument,
-    force: bool = False,
-) -> GeneratedDocument:
+DIAGRAM_DOC_TYPES = (
+    DocumentType.BPMN,
+    DocumentType.CONTEXT_DIAGRAM,
+    DocumentType.UML_USE_CASE_DIAGRAM,
+)
+
+
+def resolve_diagram_url(doc: GeneratedDocument, force: bool = False) -> Optional[str]:
     """
-    Генерирует и сохраняет URL на PlantUML-диаграмму
-    для документов с типом BPMN / CONTEXT_DIAGRAM / UML_USE_CASE_DIAGRAM.
+    Считает (и при необходимости рендерит) URL диаграммы документа, ничего не сохраняя.
+    None — если документ не диаграмма или URL уже есть и force=False.
 
     Берёт PlantUML-код из:
     - structured_data["plantuml"]  (основной кейс)
@@ -106,17 +102,12 @@ def ensure_bpmn_url_for_document(
     - или doc.content
     Если нигде кода нет — использует fallback.
     """
-
-    if doc.doc_type not in (
-        DocumentType.BPMN,
-        DocumentType.CONTEXT_DIAGRAM,
-        DocumentType.UML_USE_CASE_DIAGRAM,
-    ):
-        return doc
+    if doc.doc_type not in DIAGRAM_DOC_TYPES:
+        return None
 
     # если URL уже есть и не просили пересоздать — выходим
     if doc.diagram_url and not force:
-        return doc
+        return None
 
     structured = doc.structured_data or {}
 
@@ -142,7 +133,45 @@ def ensure_bpmn_url_for_document(
         plantuml_code[:400],
     )
 
-    url = build_plantuml_url(plantuml_code)
+    return build_diagram_url_for_code(plantuml_code)
+
+
+def ensure_bpmn_url_for_document(
+    doc: GeneratedDocument,
+    force: bool = False,
+) -> GeneratedDocument:
+    """
+    Генерирует и сохраняет URL на PlantUML-диаграмму
+    для документов с типом BPMN / CONTEXT_DIAGRAM / UML_USE_CASE_DIAGRAM.
+    """
+    url = resolve_diagram_url(doc, force=force)
+    if url is None:
+        return doc
+
     doc.diagram_url = url
     doc.save(update_fields=["diagram_url", "updated_at"])
     return doc
+
+
+def ensure_diagram_urls(
+    docs: Iterable[GeneratedDocument],
+    force: bool = False,
+) -> List[GeneratedDocument]:
+    """
+    Пакетный вариант ensure_bpmn_url_for_document: все новые URL
+    сохраняются одним bulk_update, а не save() на каждый документ.
+    Возвращает документы, у которых URL поменялся.
+    """
+    changed: List[GeneratedDocument] = []
+    now = timezone.now()
+    for doc in docs:
+        url = resolve_diagram_url(doc, force=force)
+        if url is None:
+            continue
+        doc.diagram_url = url
+        doc.updated_at = now
+        changed.append(doc)
+
+    if changed:
+        GeneratedDocument.objects.bulk_update(changed, ["diagram_url", "updated_at"])
+    return changed
@@ -1,45 +1,220 @@
 # documents/services/confluence_publish.py
+"""
+Инкрементальная публикация кейса в Confluence.
+
+Страница кейса — оглавление (макрос children), под ней — дочерняя страница
+на каждый одобренный документ. Для каждого документа храним id страницы,
+её версию, хэш опубликованного тела и хэши вложений (GeneratedDocument.confluence_*):
+- тело не изменилось — ни одного запроса;
+- изменилось — один PUT с версией + 1;
+- DOCX и PNG диаграмм загружаются вложениями, только если поменялся их хэш.
+Текст документа рендерится из Markdown в storage format (confluence_storage).
+Страницы ссылаются на вложения по имени файла, поэтому новое вложение
+не требует обновлять тело страницы.
+"""
+import hashlib
 import html
 import logging
-from typing import List
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
 
 from cases.models import Case, CaseStatus
+from forte_ai_back import background
 from documents.models import GeneratedDocument, DocumentStatus
 from integrations.confluence_client import ConfluenceClient
 
+from .confluence_storage import markdown_to_storage
+from .docx_builders import supports_docx
+from .plantuml_render import diagram_digest, render_diagram
+from .utils import sha256_text
+
 logger = logging.getLogger(__name__)
 
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# кейсы, публикация которых уже идёт в этом процессе: case_id -> "перезапустить
+# после текущей" (документ одобрили/изменили, пока шла публикация)
+_inflight_lock = threading.Lock()
+_inflight: Dict = {}
 
-def _build_html_for_case(case: Case, docs: List[GeneratedDocument]) -> str:
+
+@dataclass
+class _Attachment:
+    filename: str
+    content_hash: str
+    content_type: str
+    load: Callable[[], bytes]
+
+
+def _build_case_page_html(case: Case) -> str:
     parts: List[str] = []
     parts.append(f"<h1>{html.escape(case.title)}</h1>")
     parts.append("<p>Сгенерированные и одобренные документы Talap AI.</p>")
+    # оглавление строит сам Confluence — страницу кейса не нужно трогать,
+    # когда появляются или меняются документы
+    parts.append('<ac:structured-macro ac:name="children" />')
+    return "".join(parts)
 
-    for doc in docs:
-        parts.append(f"<h2>{html.escape(doc.title)}</h2>")
-        # doc.content у нас в Markdown → для простоты заворачиваем в <pre>
-        parts.append("<pre>")
-        parts.append(html.escape(doc.content or ""))
-        parts.append("</pre>")
 
-    return "".join(parts)
+def _read_docx(doc: GeneratedDocument) -> bytes:
+    with doc.docx_file.open("rb") as f:
+        return f.read()
+
+
+def _docx_attachment(doc: GeneratedDocument) -> Optional[_Attachment]:
+    if not supports_docx(doc.doc_type) or not doc.docx_file:
+        return None
+
+    # docx_hash пуст у загруженных вручную файлов — хэшируем байты
+    if doc.docx_hash:
+        content_hash, load = doc.docx_hash, (lambda: _read_docx(doc))
+    else:
+        try:
+            data = _read_docx(doc)
+        except OSError:
+            logger.warning("DOCX file %s of document %s is missing", doc.docx_file.name, doc.id)
+            return None
+        content_hash, load = hashlib.sha256(data).hexdigest(), (lambda: data)
+
+    return _Attachment(
+        filename=f"{doc.doc_type}.docx",
+        content_hash=content_hash,
+        content_type=DOCX_CONTENT_TYPE,
+        load=load,
+    )
+
+
+def _document_markdown(doc: GeneratedDocument) -> str:
+    """
+    Markdown для страницы. Диаграмму из structured_data, которой нет
+    в тексте (BPMN/context пишут в content только описание), ставим в начало.
+    """
+    content = doc.content or ""
+    structured = doc.structured_data if isinstance(doc.structured_data, dict) else {}
+    plantuml = (structured.get("plantuml") or "").strip()
+    if plantuml and plantuml not in content:
+        content = f"```plantuml\n{plantuml}\n```\n\n{content}"
+    return content
+
+
+def _diagram_attachment(filename: str, source: str) -> _Attachment:
+    return _Attachment(
+        filename=filename,
+        content_hash=diagram_digest(source),
+        content_type="image/png",
+        load=lambda: render_diagram(source, "png"),
+    )
+
+
+def _build_document_page(doc: GeneratedDocument) -> Tuple[str, List[_Attachment]]:
+    """
+    Тело дочерней страницы (storage format) и её вложения.
+    """
+    fragment = markdown_to_storage(_document_markdown(doc), attachment_prefix=doc.doc_type)
+
+    attachments: List[_Attachment] = []
+    parts: List[str] = []
+
+    docx = _docx_attachment(doc)
+    if docx is not None:
+        attachments.append(docx)
+        filename = html.escape(docx.filename)
+        parts.append(
+            f'<p><ac:link><ri:attachment ri:filename="{filename}" />'
+            f"<ac:plain-text-link-body><![CDATA[Скачать {docx.filename}]]></ac:plain-text-link-body>"
+            f"</ac:link></p>"
+        )
 
+    attachments += [_diagram_attachment(name, source) for name, source in fragment.diagrams]
+    parts.append(fragment.html)
+    return "".join(parts), attachments
 
-def publish_case_to_confluence(case: Case) -> None:
+
+def _document_page_title(case: Case, doc: GeneratedDocument) -> str:
+    # заголовки страниц уникальны в пределах space
+    return f"{case.title} — {doc.title}"
+
+
+def _publish_document(
+    client: ConfluenceClient,
+    case: Case,
+    doc: GeneratedDocument,
+    stats: Dict[str, int],
+) -> None:
+    title = _document_page_title(case, doc)
+    body, attachments = _build_document_page(doc)
+    content_hash = sha256_text(title + "\n" + body)
+
+    update_fields: List[str] = []
+
+    if not doc.confluence_page_id:
+        page_id, _ = client.create_page(
+            space_key=case.confluence_space_key,
+            title=title,
+            html_body=body,
+            parent_id=case.confluence_page_id,
+        )
+        doc.confluence_page_id = page_id
+        doc.confluence_page_version = 1
+        doc.confluence_content_hash = content_hash
+        doc.confluence_attachments = {}
+        update_fields += ["confluence_page_id", "confluence_page_version", "confluence_content_hash"]
+        stats["created"] += 1
+    elif doc.confluence_content_hash != content_hash:
+        doc.confluence_page_version = client.update_page(
+            doc.confluence_page_id,
+            title=title,
+            html_body=body,
+            version=doc.confluence_page_version,
+        )
+        doc.confluence_content_hash = content_hash
+        update_fields += ["confluence_page_version", "confluence_content_hash"]
+        stats["updated"] += 1
+    else:
+        stats["unchanged"] += 1
+
+    # состояние страницы сохраняем до загрузки вложений: если она упадёт,
+    # повторная публикация не создаст страницу второй раз
+    if update_fields:
+        doc.save(update_fields=update_fields)
+
+    published = dict(doc.confluence_attachments or {})
+    for attachment in attachments:
+        if published.get(attachment.filename) == attachment.content_hash:
+            continue
+        try:
+            data = attachment.load()
+        except Exception:
+            # нет файла или не отрендерилась диаграмма — хэш не записываем,
+            # вложение догрузится при следующей публикации
+            logger.exception("Failed to load attachment %s for document %s", attachment.filename, doc.id)
+            continue
+        client.upload_attachment(
+            doc.confluence_page_id,
+            attachment.filename,
+            data,
+            attachment.content_type,
+        )
+        published[attachment.filename] = attachment.content_hash
+        doc.confluence_attachments = published
+        doc.save(update_fields=["confluence_attachments"])
+        stats["attachments"] += 1
+
+
+def publish_case_to_confluence(case: Case) -> Dict[str, int]:
     """
-    Создаёт страницу в Confluence, если:
-    - указан confluence_space_key,
-    - есть хотя бы один документ со статусом APPROVED_BY_BA,
-    - страница ещё не создавалась.
+    Публикует одобренные документы кейса, если указан confluence_space_key:
+    создаёт страницу кейса (один раз) и дочерние страницы документов,
+    дальше отправляет только изменившиеся страницы и вложения.
     """
+    stats = {"created": 0, "updated": 0, "unchanged": 0, "attachments": 0}
+
     if not case.confluence_space_key:
         logger.info("Case %s has no confluence_space_key, skip publish", case.id)
-        return
-
-    if case.confluence_page_id:
-        logger.info("Case %s already has confluence_page_id=%s, skip",
-                    case.id, case.confluence_page_id)
-        return
+        return stats
 
     docs = list(
         GeneratedDocument.objects.filter(
@@ -49,19 +224,82 @@ def publish_case_to_confluence(case: Case) -> None:
     )
     if not docs:
         logger.info("Case %s has no approved documents yet, skip publish", case.id)
-        return
+        return stats
 
-    html_body = _build_html_for_case(case, docs)
     client = ConfluenceClient()
-    page_id, page_url = client.create_page(
-        space_key=case.confluence_space_key,
-        title=case.title,
-        html_body=html_body,
+
+    if not case.confluence_page_id:
+        page_id, page_url = client.create_page(
+            space_key=case.confluence_space_key,
+            title=case.title,
+            html_body=_build_case_page_html(case),
+        )
+        case.confluence_page_id = page_id
+        case.confluence_page_url = page_url
+        case.status = CaseStatus.APPROVED
+        case.save(update_fields=["confluence_page_id", "confluence_page_url", "status"])
+    elif not GeneratedDocument.objects.filter(case=case, confluence_page_id__isnull=False).exists():
+        # страница кейса опубликована прежним способом (все документы в <pre>
+        # одной страницей) — один раз превращаем её в оглавление
+        client.update_page(
+            case.confluence_page_id,
+            title=case.title,
+            html_body=_build_case_page_html(case),
+            version=client.get_page_version(case.confluence_page_id),
+        )
+
+    for doc in docs:
+        _publish_document(client, case, doc, stats)
+
+    logger.info(
+        "Case %s published to Confluence page %s: %s",
+        case.id, case.confluence_page_url, stats,
     )
+    return stats
+
+
+def publish_case_to_confluence_by_id(case_id) -> None:
+    """
+    Фоновая задача: перечитывает кейс и публикует его. Если публикацию
+    запросили ещё раз, пока она шла, — прогоняет её повторно (изменения
+    дойдут, а лишних запросов не будет: неизменное не отправляется).
+    """
+    with _inflight_lock:
+        if case_id in _inflight:
+            _inflight[case_id] = True
+            logger.info("Case %s is already being published, rerun queued", case_id)
+            return
+        _inflight[case_id] = False
 
-    case.confluence_page_id = page_id
-    case.confluence_page_url = page_url
-    case.status = CaseStatus.APPROVED
-    case.save(update_fields=["confluence_page_id", "confluence_page_url", "status"])
+    try:
+        while True:
+            case = Case.objects.filter(pk=case_id).first()
+            if case is not None:
+                publish_case_to_confluence(case)
+
+            # решение "завершить" и снятие отметки — под одним локом,
+            # иначе запрос на повтор между ними потеряется
+            with _inflight_lock:
+                if case is None or not _inflight.get(case_id):
+                    _inflight.pop(case_id, None)
+                    return
+                _inflight[case_id] = False
+    except BaseException:
+        with _inflight_lock:
+            _inflight.pop(case_id, None)
+        raise
+
+
+def schedule_case_publish(case: Case) -> None:
+    """
+    Ставит публикацию кейса в фон (после коммита транзакции), чтобы
+    ответ на ревью документа не ждал Confluence.
+    CONFLUENCE_PUBLISH_ASYNC=0 — публиковать сразу в запросе.
+    """
+    if not case.confluence_space_key:
+        return
 
-    logger.info("Case %s published to Confluence page %s", case.id, page_url)
+    if getattr(settings, "CONFLUENCE_PUBLISH_ASYNC", True):
+        background.submit_on_commit(publish_case_to_confluence_by_id, case.id)
+    else:
+        publish_case_to_confluence_by_id(case.id)
@@ -0,0 +1,306 @@
+# documents/services/confluence_storage.py
+"""
+Markdown документов -> Confluence storage format (XHTML + макросы).
+
+Поддерживается то, что пишут наши рендереры и LLM: заголовки, абзацы,
+маркированные/нумерованные списки (с вложенностью), таблицы, цитаты,
+горизонтальная линия, блоки кода и inline-разметка (**жирный**, *курсив*,
+`код`, [ссылки](url)).
+
+Блоки ```plantuml``` в зависимости от CONFLUENCE_PLANTUML_MODE:
+- "attachment" (по умолчанию) — картинка-вложение <prefix>-<N>.png; исходники
+  возвращаются в StorageFragment.diagrams, PNG загружает публикация;
+- "macro" — макрос plantuml (нужен плагин PlantUML for Confluence).
+Имена вложений — по порядковому номеру блока, поэтому изменение диаграммы
+меняет только вложение, а не тело страницы.
+
+Результат кэшируется в памяти процесса по хэшу Markdown
+(CONFLUENCE_STORAGE_CACHE_SIZE), так что массовая публикация не
+перерендеривает неизменившиеся документы.
+"""
+import html
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+from .utils import sha256_text
+
+# поднимать при изменении вёрстки — иначе кэш отдаст старый фрагмент
+STORAGE_FORMAT_VERSION = "1"
+
+PLANTUML_MODES = ("attachment", "macro")
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_LIST_RE = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)\s*([\w+-]*)\s*$")
+_HR_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+
+_CODE_SPAN_RE = re.compile(r"`([^`]+)`")
+_LINK_RE = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+_BOLD_RE = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+_ITALIC_RE = re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?!\w)|(?<![\w_])_(?!\s)(.+?)(?<!\s)_(?!\w)")
+
+
+@dataclass(frozen=True)
+class StorageFragment:
+    html: str
+    # (имя вложения, исходник PlantUML) — только в режиме "attachment"
+    diagrams: Tuple[Tuple[str, str], ...] = field(default_factory=tuple)
+
+
+def _cdata(text: str) -> str:
+    # "]]>" внутри CDATA разрывает секцию — разбиваем её на две
+    return "<![CDATA[" + text.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+
+def _inline(text: str) -> str:
+    """
+    Inline-разметка строки; код внутри `...` не форматируется.
+    """
+    parts: List[str] = []
+    pos = 0
+    for match in _CODE_SPAN_RE.finditer(text):
+        parts.append(_format_text(text[pos:match.start()]))
+        parts.append(f"<code>{html.escape(match.group(1))}</code>")
+        pos = match.end()
+    parts.append(_format_text(text[pos:]))
+    return "".join(parts)
+
+
+def _format_text(text: str) -> str:
+    links: List[str] = []
+
+    def link(match: "re.Match[str]") -> str:
+        links.append(
+            f'<a href="{html.escape(match.group(2))}">{_emphasis(html.escape(match.group(1)))}</a>'
+        )
+        return f"\x00{len(links) - 1}\x00"
+
+    text = _LINK_RE.sub(link, text)
+    text = _emphasis(html.escape(text, quote=False))
+    return re.sub(r"\x00(\d+)\x00", lambda m: links[int(m.group(1))], text)
+
+
+def _emphasis(text: str) -> str:
+    text = _BOLD_RE.sub(lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>", text)
+    return _ITALIC_RE.sub(lambda m: f"<em>{m.group(1) or m.group(2)}</em>", text)
+
+
+def _table_cells(line: str) -> List[str]:
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+class _Renderer:
+    def __init__(self, plantuml_mode: str, attachment_prefix: str):
+        self.plantuml_mode = plantuml_mode
+        self.attachment_prefix = attachment_prefix
+        self.out: List[str] = []
+        self.diagrams: List[Tuple[str, str]] = []
+        self.paragraph: List[str] = []
+        # открытые списки: (отступ, "ul" | "ol")
+        self.lists: List[Tuple[int, str]] = []
+
+    # --- блоки ---
+
+    def flush_paragraph(self) -> None:
+        if self.paragraph:
+            self.out.append("<p>" + "<br />".join(_inline(line) for line in self.paragraph) + "</p>")
+            self.paragraph = []
+
+    def close_lists(self, indent: int = -1) -> None:
+        while self.lists and self.lists[-1][0] > indent:
+            _, tag = self.lists.pop()
+            self.out.append(f"</li></{tag}>")
+
+    def flush(self) -> None:
+        self.flush_paragraph()
+        self.close_lists()
+
+    def list_item(self, indent: int, marker: str, text: str) -> None:
+        self.flush_paragraph()
+        tag = "ol" if marker[0].isdigit() else "ul"
+
+        self.close_lists(indent)
+        if self.lists and self.lists[-1][0] == indent and self.lists[-1][1] != tag:
+            # сменился тип списка на том же уровне — новый список
+            self.close_lists(indent - 1)
+
+        if self.lists and self.lists[-1][0] == indent:
+            self.out.append("</li><li>")
+        else:
+            self.lists.append((indent, tag))
+            self.out.append(f"<{tag}><li>")
+        self.out.append(_inline(text))
+
+    def code_block(self, lang: str, code: str) -> None:
+        self.flush()
+        if lang.lower() in ("plantuml", "puml"):
+            self.plantuml(code)
+            return
+
+        parts = ['<ac:structured-macro ac:name="code">']
+        if lang:
+            parts.append(f'<ac:parameter ac:name="language">{html.escape(lang)}</ac:parameter>')
+        parts.append(f"<ac:plain-text-body>{_cdata(code)}</ac:plain-text-body>")
+        parts.append("</ac:structured-macro>")
+        self.out.append("".join(parts))
+
+    def plantuml(self, source: str) -> None:
+        if self.plantuml_mode == "macro":
+            self.out.append(
+                '<ac:structured-macro ac:name="plantuml">'
+                f"<ac:plain-text-body>{_cdata(source)}</ac:plain-text-body>"
+                "</ac:structured-macro>"
+            )
+            return
+
+        filename = f"{self.attachment_prefix}-{len(self.diagrams) + 1}.png"
+        self.diagrams.append((filename, source))
+        self.out.append(
+            f'<p><ac:image><ri:attachment ri:filename="{html.escape(filename)}" /></ac:image></p>'
+        )
+
+    def table(self, header: List[str], rows: List[List[str]]) -> None:
+        self.flush()
+        parts = ["<table><tbody><tr>"]
+        parts += [f"<th>{_inline(cell)}</th>" for cell in header]
+        parts.append("</tr>")
+        for row in rows:
+            row = (row + [""] * len(header))[:len(header)]
+            parts.append("<tr>" + "".join(f"<td>{_inline(cell)}</td>" for cell in row) + "</tr>")
+        parts.append("</tbody></table>")
+        self.out.append("".join(parts))
+
+    # --- разбор ---
+
+    def render(self, markdown: str) -> StorageFragment:
+        lines = markdown.replace("\r\n", "\n").split("\n")
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+
+            fence = _FENCE_RE.match(line)
+            if fence:
+                end = i + 1
+                while end < len(lines) and not lines[end].strip().startswith(fence.group(1)):
+                    end += 1
+                self.code_block(fence.group(2), "\n".join(lines[i + 1:end]))
+                i = end + 1
+                continue
+
+            if not line.strip():
+                self.flush_paragraph()
+                # пустая строка между пунктами не рвёт список
+                if not (i + 1 < len(lines) and _LIST_RE.match(lines[i + 1])):
+                    self.close_lists()
+                i += 1
+                continue
+
+            heading = _HEADING_RE.match(line)
+            if heading:
+                self.flush()
+                level = len(heading.group(1))
+                self.out.append(f"<h{level}>{_inline(heading.group(2))}</h{level}>")
+                i += 1
+                continue
+
+            if _HR_RE.match(line):
+                self.flush()
+                self.out.append("<hr />")
+                i += 1
+                continue
+
+            item = _LIST_RE.match(line)
+            if item:
+                self.list_item(len(item.group(1).expandtabs(4)), item.group(2), item.group(3))
+                i += 1
+                continue
+
+            if "|" in line and i + 1 < len(lines) and _TABLE_SEP_RE.match(lines[i + 1]):
+                header = _table_cells(line)
+                i += 2
+                rows = []
+                while i < len(lines) and "|" in lines[i] and lines[i].strip():
+                    rows.append(_table_cells(lines[i]))
+                    i += 1
+                self.table(header, rows)
+                continue
+
+            if line.lstrip().startswith(">"):
+                self.flush()
+                quote = []
+                while i < len(lines) and lines[i].lstrip().startswith(">"):
+                    quote.append(lines[i].lstrip()[1:].strip())
+                    i += 1
+                self.out.append("<blockquote><p>" + "<br />".join(_inline(q) for q in quote) + "</p></blockquote>")
+                continue
+
+            if self.lists and line.startswith(" "):
+                # продолжение текста пункта списка
+                self.out.append("<br />" + _inline(line.strip()))
+                i += 1
+                continue
+
+            self.close_lists()
+            self.paragraph.append(line.strip())
+            i += 1
+
+        self.flush()
+        return StorageFragment(html="".join(self.out), diagrams=tuple(self.diagrams))
+
+
+def plantuml_mode() -> str:
+    mode = getattr(settings, "CONFLUENCE_PLANTUML_MODE", "attachment")
+    return mode if mode in PLANTUML_MODES else "attachment"
+
+
+_cache_lock = threading.Lock()
+_cache: "OrderedDict[str, StorageFragment]" = OrderedDict()
+
+
+def _cache_size() -> int:
+    return int(getattr(settings, "CONFLUENCE_STORAGE_CACHE_SIZE", 512))
+
+
+def markdown_to_storage(
+    markdown: str,
+    *,
+    attachment_prefix: str = "diagram",
+    mode: Optional[str] = None,
+) -> StorageFragment:
+    """
+    Storage-фрагмент для Markdown; повторный вызов с тем же текстом — из кэша.
+    """
+    mode = mode or plantuml_mode()
+    key = sha256_text("\n".join((STORAGE_FORMAT_VERSION, mode, attachment_prefix, markdown or "")))
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    fragment = _Renderer(mode, attachment_prefix).render(markdown or "")
+
+    size = _cache_size()
+    if size > 0:
+        with _cache_lock:
+            _cache[key] = fragment
+            while len(_cache) > size:
+                _cache.popitem(last=False)
+    return fragment
+
+
+def clear_storage_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
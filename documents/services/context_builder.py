@@ -1,14 +1,90 @@
 # documents/services/context_builder.py
-from typing import Any, Dict, List
+"""
+Контекст кейса для генерации, хэширования и редактирования документов.
+
+Контекст собирается один раз на ревизию кейса (Case.revision) и кэшируется
+в процессе по ключу case_id:revision (get_case_context). Вместе с ним
+запоминаются JSON-представление для промптов и хэши исходных данных по doc_type.
+"""
+import json
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
 
 from cases.models import Case, FollowupQuestionStatus
 from .utils import sha256_json
 
+# Поля кейса, от которых зависит содержимое документов (подмножество Case.REVISION_FIELDS).
+# status / confluence_page_* меняются как следствие генерации и публикации,
+# поэтому не входят ни в хэш исходных данных, ни в контекст кейса.
+SNAPSHOT_CASE_KEYS = (
+    "title",
+    "initial_answers",
+    "confluence_space_key",
+    "confluence_space_name",
+)
+
+# Коды target_document_types у follow-up вопросов, относящиеся к типу документа
+# (кроме самого doc_type). Фронт и fallback-план используют "use_case".
+EXTRA_ANSWER_TARGETS = {
+    "uml_use_case_diagram": {"use_case"},
+}
+
+
+class CaseContext(dict):
+    """
+    Контекст кейса (обычный dict для генераторов и промптов) + ревизия,
+    по которой он собран, и лениво посчитанные производные.
+    Один экземпляр делят все потребители ревизии — его нельзя менять.
+    """
+
+    def __init__(self, payload: Dict[str, Any], *, case_id=None, revision: Optional[int] = None):
+        super().__init__(payload)
+        self.case_id = case_id
+        self.revision = revision
+        self._snapshot_hashes: Dict[Optional[str], str] = {}
+        self._scoped: Dict[str, "CaseContext"] = {}
+
+    @cached_property
+    def prompt_json(self) -> str:
+        return dump_case_context(dict(self))
+
+    def snapshot_hash(self, doc_type: Optional[str] = None) -> str:
+        snapshot_hash = self._snapshot_hashes.get(doc_type)
+        if snapshot_hash is None:
+            snapshot_hash = sha256_json(build_source_snapshot(self, doc_type))
+            self._snapshot_hashes[doc_type] = snapshot_hash
+        return snapshot_hash
+
+    def for_doc_type(self, doc_type: str) -> "CaseContext":
+        scoped = self._scoped.get(doc_type)
+        if scoped is None:
+            scoped = CaseContext(
+                _scoped_payload(self, doc_type),
+                case_id=self.case_id,
+                revision=self.revision,
+            )
+            self._scoped[doc_type] = scoped
+        return scoped
+
 
-def build_case_context(case: Case) -> Dict[str, Any]:
+def dump_case_context(case_context: Dict[str, Any]) -> str:
+    """
+    JSON контекста кейса для промптов (для CaseContext — уже готовый).
+    """
+    if isinstance(case_context, CaseContext):
+        return case_context.prompt_json
+    return json.dumps(case_context, ensure_ascii=False, indent=2)
+
+
+def build_case_context(case: Case) -> CaseContext:
     """
     Собираем единый контекст по кейсу, который потом
     скармливается в GPT при генерации всех артефактов.
+    Без кэша — обычно нужен get_case_context().
     """
 
     followups = case.followup_questions.filter(
@@ -31,24 +107,136 @@ def build_case_context(case: Case) -> Dict[str, Any]:
         "case": {
             "id": str(case.id),
             "title": case.title,
-            "status": case.status,
             "initial_answers": case.initial_answers,
             "selected_document_types": case.selected_document_types or [],
             # ✅ добавили привязку к Confluence
             "confluence_space_key": case.confluence_space_key,
             "confluence_space_name": case.confluence_space_name,
-            "confluence_page_id": case.confluence_page_id,
-            "confluence_page_url": case.confluence_page_url,
         },
         "followup_answers": followup_block,
     }
-    return payload
+    return CaseContext(payload, case_id=case.id, revision=case.revision)
+
+
+# ====== кэш по ревизии кейса ======
+
+_cache_lock = threading.Lock()
+_cache: "OrderedDict[Tuple[Any, int], CaseContext]" = OrderedDict()
+
+
+def _cache_size() -> int:
+    return int(getattr(settings, "CASE_CONTEXT_CACHE_SIZE", 256))
+
+
+def get_case_context(case: Case) -> CaseContext:
+    """
+    Контекст кейса из кэша по case_id:revision. Актуальная ревизия читается
+    из БД (один запрос по pk), поэтому устаревший объект case не вернёт
+    старый контекст: при расхождении кейс перечитывается.
+    """
+    revision = Case.objects.filter(pk=case.pk).values_list("revision", flat=True).first()
+    if revision is None:
+        # кейс не сохранён или уже удалён — кэшировать нечего
+        return build_case_context(case)
+
+    key = (case.pk, revision)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+
+    if revision != case.revision:
+        case = Case.objects.get(pk=case.pk)
+
+    context = build_case_context(case)
+    size = _cache_size()
+    if size > 0:
+        with _cache_lock:
+            _cache[(case.pk, case.revision)] = context
+            while len(_cache) > size:
+                _cache.popitem(last=False)
+    return context
+
+
+def clear_case_context_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def is_answer_relevant(answer: Dict[str, Any], doc_type: Optional[str]) -> bool:
+    """
+    Влияет ли ответ на follow-up вопрос на документ doc_type.
+    Вопросы без target_document_types считаются общими.
+    """
+    if doc_type is None:
+        return True
+    targets = answer.get("target_document_types") or []
+    if not targets:
+        return True
+    accepted = {doc_type} | EXTRA_ANSWER_TARGETS.get(doc_type, set())
+    return any(t in accepted for t in targets)
+
+
+def build_source_snapshot(
+    case_context: Dict[str, Any],
+    doc_type: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Срез контекста, от которого зависит документ doc_type:
+    содержательные поля кейса + ответы на follow-up вопросы,
+    чьи target_document_types включают этот doc_type.
+    """
+    case_block = case_context.get("case", {})
+    return {
+        "doc_type": doc_type,
+        "case": {k: case_block.get(k) for k in SNAPSHOT_CASE_KEYS},
+        "followup_answers": [
+            a for a in case_context.get("followup_answers", [])
+            if is_answer_relevant(a, doc_type)
+        ],
+    }
+
+
+def _scoped_payload(case_context: Dict[str, Any], doc_type: str) -> Dict[str, Any]:
+    snapshot = build_source_snapshot(case_context, doc_type)
+    case_block = case_context.get("case", {})
+    return {
+        "case": {"id": case_block.get("id"), **snapshot["case"]},
+        "followup_answers": snapshot["followup_answers"],
+    }
+
+
+def scope_case_context(case_context: Dict[str, Any], doc_type: str) -> Dict[str, Any]:
+    """
+    Контекст для генерации документа doc_type: ровно те данные, что входят
+    в его source_snapshot_hash (+ id кейса). Поэтому промпт документа
+    меняется только вместе с его хэшем исходных данных или шаблоном,
+    а ответы для других типов документов не сбивают кэш LLM.
+    """
+    if isinstance(case_context, CaseContext):
+        return case_context.for_doc_type(doc_type)
+    return _scoped_payload(case_context, doc_type)
+
+
+def source_snapshot_hash(case_context: Dict[str, Any], doc_type: Optional[str] = None) -> str:
+    if isinstance(case_context, CaseContext):
+        return case_context.snapshot_hash(doc_type)
+    return sha256_json(build_source_snapshot(case_context, doc_type))
 
 
-def build_source_snapshot_hash(case: Case) -> str:
+def build_source_snapshot_hash(
+    case: Case,
+    doc_type: Optional[str] = None,
+    *,
+    case_context: Optional[Dict[str, Any]] = None,
+) -> str:
     """
-    Хешируем текущий контекст кейса.
+    Хешируем исходные данные кейса для документа doc_type.
     Если что-то в кейсе поменялось (ответы, Confluence-пространство),
-    хеш тоже поменяется — можно понимать, что документы устарели.
+    хеш тоже поменяется — можно понимать, что документ устарел.
+    Ответы, адресованные другим типам документов, на хеш не влияют.
     """
-    return sha256_json(build_case_context(case))
+    if case_context is None:
+        case_context = get_case_context(case)
+    return source_snapshot_hash(case_context, doc_type)
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 import re
 from typing import Any
 
@@ -8,7 +7,7 @@ from django.utils import timezone
 
 from documents.models import GeneratedDocument, DocumentType
 from .agent_client import chat_json
-from .context_builder import build_case_context
+from .context_builder import dump_case_context, get_case_context
 
 MODEL_NAME = "gpt-5.1"
 
@@ -101,8 +100,8 @@ def _build_user_prompt_for_diagram(
     case = getattr(doc, "case", None)
     case_title = getattr(case, "title", "") or ""
 
-    case_context = build_case_context(case) if case is not None else {}
-    case_context_json = json.dumps(case_context, ensure_ascii=False, indent=2)
+    case_context = get_case_context(case) if case is not None else {}
+    case_context_json = dump_case_context(case_context)
 
     return (
         f"Тип диаграммы: {doc.doc_type}\n"
@@ -123,6 +122,21 @@ def _build_user_prompt_for_diagram(
     )
 
 
+def _validate_edit_response(data):
+    """
+    Ответ с некорректным PlantUML в кэш LLM не попадает.
+    """
+    plantuml = (data.get("plantuml") or "").strip()
+    if not plantuml:
+        raise ValueError("LLM did not return plantuml field")
+    if "@startuml" not in plantuml or "@enduml" not in plantuml:
+        raise ValueError(
+            "Неверный формат PlantUML: код должен содержать директивы '@startuml' и '@enduml'. "
+            "Модель вернула некорректный код, попробуйте переформулировать инструкции."
+        )
+    return data
+
+
 def apply_diagram_llm_edit(doc: GeneratedDocument, instructions: str) -> GeneratedDocument:
     """
     Правка диаграмм (BPMN / Context / UML Use Case) через GPT, с учётом контекста кейса.
@@ -150,20 +164,11 @@ def apply_diagram_llm_edit(doc: GeneratedDocument, instructions: str) -> Generat
         system_prompt=SYSTEM_PROMPT_DIAGRAM_EDIT,
         user_prompt=user_prompt,
         response_format=RESPONSE_FORMAT_DIAGRAM_EDIT,
+        validate=_validate_edit_response,
     )
 
-    new_plantuml = (data.get("plantuml") or "").strip()
-    if not new_plantuml:
-        raise ValueError("LLM did not return plantuml field")
-
     # 🔧 фиксим кривые строки вида ("Текст") as UC_X
-    new_plantuml = normalize_usecase_syntax(new_plantuml)
-
-    if "@startuml" not in new_plantuml or "@enduml" not in new_plantuml:
-        raise ValueError(
-            "Неверный формат PlantUML: код должен содержать директивы '@startuml' и '@enduml'. "
-            "Модель вернула некорректный код, попробуйте переформулировать инструкции."
-        )
+    new_plantuml = normalize_usecase_syntax(data["plantuml"].strip())
 
     structured = doc.structured_data or {}
     if not isinstance(structured, dict):
@@ -1,7 +1,8 @@
 from typing import Any, Dict, Tuple
 
 from documents.models import DocumentType
-from .utils import sha256_text
+
+from .context_builder import scope_case_context
 
 # ------- VISION -------
 from .artifacts.vision import prompt as vision_prompt
@@ -57,20 +58,41 @@ def get_artifact_prompt_bundle(doc_type: str) -> Tuple[str, str, str]:
     raise ValueError(f"Unsupported doc_type: {doc_type}")
 
 
-def compute_prompt_hash(system_prompt: str, user_prompt: str) -> str:
+def render_text_document(
+    doc_type: str,
+    structured: Dict[str, Any],
+    case_context: Dict[str, Any],
+) -> Tuple[str, str]:
     """
-    Хешируем фактические строковые промпты (system + user),
-    чтобы понимать, когда документ устарел.
+    Рендер уже провалидированных Vision/Scope: возвращает (content_md, title).
+    Общий для обычной и потоковой (streaming) генерации.
     """
-    return sha256_text(system_prompt + "\n---\n" + user_prompt)
+    if doc_type == DocumentType.VISION:
+        content = render_vision(structured)
+        title = (
+            structured.get("title")
+            or case_context["case"]["title"]
+        )
+        title = (title or "").strip() or case_context["case"]["title"]
+        return content, title
+
+    if doc_type == DocumentType.SCOPE:
+        content = render_scope(structured)
+        title = f"Scope: {case_context['case']['title']}"
+        return content, title
+
+    raise ValueError(f"Unsupported text doc_type: {doc_type}")
 
 
 def generate_structured_and_render(
     doc_type: str,
     case_context: Dict[str, Any],
+    *,
+    use_cache: bool = True,
 ) -> Tuple[Dict[str, Any], str, str, str]:
     """
     Главный диспетчер генерации артефактов.
+    use_cache=False — не брать ответ LLM из кэша (перегенерация).
 
     Возвращает кортеж:
     - structured_data: Dict[str, Any] — то, что кладём в structured_data
@@ -78,28 +100,23 @@ def generate_structured_and_render(
     - title: str — заголовок документа
     - used_model: str — имя LLM-модели (для логирования/аудита)
     """
+    case_context = scope_case_context(case_context, doc_type)
 
     # ---------- VISION ----------
     if doc_type == DocumentType.VISION:
-        structured, used_model = generate_vision(case_context)
-        content = render_vision(structured)
-        title = (
-            structured.get("title")
-            or case_context["case"]["title"]
-        )
-        title = (title or "").strip() or case_context["case"]["title"]
+        structured, used_model = generate_vision(case_context, use_cache=use_cache)
+        content, title = render_text_document(doc_type, structured, case_context)
         return structured, content, title, used_model
 
     # ---------- SCOPE ----------
     if doc_type == DocumentType.SCOPE:
-        structured, used_model = generate_scope(case_context)
-        content = render_scope(structured)
-        title = f"Scope: {case_context['case']['title']}"
+        structured, used_model = generate_scope(case_context, use_cache=use_cache)
+        content, title = render_text_document(doc_type, structured, case_context)
         return structured, content, title, used_model
 
     # ---------- BPMN ----------
     if doc_type == DocumentType.BPMN:
-        structured, used_model = generate_bpmn(case_context)
+        structured, used_model = generate_bpmn(case_context, use_cache=use_cache)
         # render_bpmn обычно формирует markdown с ```plantuml``` блоком
         content = render_bpmn(structured)
         title = f"BPMN: {case_context['case']['title']}"
@@ -107,7 +124,7 @@ def generate_structured_and_render(
 
     # ---------- CONTEXT DIAGRAM ----------
     if doc_type == DocumentType.CONTEXT_DIAGRAM:
-        structured, used_model = generate_context(case_context)
+        structured, used_model = generate_context(case_context, use_cache=use_cache)
         # renderer формирует понятный текст + ```plantuml``` с контекстной диаграммой
         content = render_context(structured)
         title = f"Context: {case_context['case']['title']}"
@@ -115,7 +132,7 @@ def generate_structured_and_render(
 
     # ---------- UML USE CASE DIAGRAM ----------
     if doc_type == DocumentType.UML_USE_CASE_DIAGRAM:
-        structured, used_model = generate_usecase(case_context)
+        structured, used_model = generate_usecase(case_context, use_cache=use_cache)
         # renderer оборачивает PlantUML в ```plantuml``` и добавляет текст/ноты
         content = render_usecase(structured)
         title = f"Use Case: {case_context['case']['title']}"
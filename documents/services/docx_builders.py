@@ -0,0 +1,122 @@
+# documents/services/docx_builders.py
+"""
+Сборка DOCX вне request-потока: python-docx — чистый CPU (lxml), поэтому
+пачку документов выгоднее собирать в пуле процессов.
+
+Модуль намеренно не трогает ORM: сборщики получают (doc_type, structured_data)
+и возвращают байты, поэтому их можно выполнять в дочерних процессах без
+django.setup(). Шаблон DOCX разбирается один раз на процесс (docx_template),
+при fork пула дочерние процессы получают его уже готовым.
+
+- docx_content_hash(doc_type, structured) — ключ файла: содержимое + версия
+  шаблона и сборщиков; одинаковый хэш — байт-в-байт тот же документ по смыслу;
+- build_docx_bytes(doc_type, structured) — один документ в текущем процессе;
+- build_docx_many(jobs, workers=N) — пачка в пуле процессов; результаты
+  отдаются по мере готовности, в работе держится не больше N * DOCX_BUILD_INFLIGHT_PER_WORKER
+  задач, так что память не растёт с размером выгрузки.
+"""
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Optional, Set, Tuple
+
+from .artifacts.scope.docx import build_docx as build_scope_docx
+from .artifacts.vision.docx import build_docx as build_vision_docx
+from .docx_template import get_docx_template
+from .utils import sha256_json
+
+# doc_type -> сборщик; ключи совпадают с DocumentType
+DOCX_BUILDERS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {
+    "vision": build_vision_docx,
+    "scope": build_scope_docx,
+}
+
+# поднимать при изменении вёрстки в сборщиках — иначе не пересоберутся уже выгруженные DOCX
+DOCX_BUILDER_VERSION = "2"
+
+DOCX_BUILD_INFLIGHT_PER_WORKER = 4
+
+DocxJob = Tuple[Hashable, str, Optional[Dict[str, Any]]]  # (key, doc_type, structured_data)
+DocxResult = Tuple[Hashable, Optional[bytes], Optional[str]]  # (key, bytes, error)
+
+
+def supports_docx(doc_type: str) -> bool:
+    return doc_type in DOCX_BUILDERS
+
+
+def docx_content_hash(doc_type: str, structured: Optional[Dict[str, Any]]) -> str:
+    return sha256_json(
+        {
+            "builder": DOCX_BUILDER_VERSION,
+            "template": get_docx_template().version,
+            "doc_type": doc_type,
+            "structured_data": structured,
+        }
+    )
+
+
+def build_docx_bytes(doc_type: str, structured: Optional[Dict[str, Any]]) -> Optional[bytes]:
+    """
+    DOCX для документа; None — нечего собирать или тип не поддерживается.
+    """
+    builder = DOCX_BUILDERS.get(doc_type)
+    if builder is None or not structured:
+        return None
+    return builder(structured)
+
+
+def _build_job(job: DocxJob) -> DocxResult:
+    key, doc_type, structured = job
+    try:
+        return key, build_docx_bytes(doc_type, structured), None
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}"
+
+
+def default_workers() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def _mp_context():
+    # fork дешевле и не требует повторного импорта Django в дочернем процессе;
+    # где fork недоступен — платформенный способ по умолчанию
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def build_docx_many(jobs: Iterable[DocxJob], *, workers: Optional[int] = None) -> Iterator[DocxResult]:
+    """
+    Собирает DOCX для jobs и отдаёт (key, bytes, error) в порядке готовности.
+    workers=1 — всё в текущем процессе, без пула.
+    Ошибка одного документа не останавливает остальные.
+    """
+    workers = workers or default_workers()
+    if workers <= 1:
+        for job in jobs:
+            yield _build_job(job)
+        return
+
+    # шаблон разбираем до fork — дочерние процессы получат его готовым
+    get_docx_template()
+
+    max_inflight = workers * DOCX_BUILD_INFLIGHT_PER_WORKER
+    jobs = iter(jobs)
+    pending: Set[Future] = set()
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context()) as pool:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_inflight:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(_build_job, job))
+
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
@@ -1,56 +1,149 @@
-from typing import Optional
+import time
+from typing import Dict, Iterable, Optional
 
 from django.core.files.base import ContentFile
 from django.utils import timezone
 
 from documents.models import GeneratedDocument
-from documents.models import DocumentType
 
-from .artifacts.vision.docx import build_docx as build_vision_docx
-from .artifacts.scope.docx import build_docx as build_scope_docx
+from .docx_builders import build_docx_bytes, build_docx_many, docx_content_hash, supports_docx
+
+# generated_docs/ — как upload_to у GeneratedDocument.docx_file
+DOCX_DIR = "generated_docs"
 
 
 def _build_docx_bytes_for_type(doc: GeneratedDocument) -> Optional[bytes]:
     """
-    Делегируем сборку DOCX в конкретный артефакт.
+    Делегируем сборку DOCX в конкретный артефакт (см. docx_builders.DOCX_BUILDERS).
     """
-    if not doc.structured_data:
-        return None
+    return build_docx_bytes(doc.doc_type, doc.structured_data)
+
 
-    if doc.doc_type == DocumentType.VISION:
-        return build_vision_docx(doc.structured_data)
+def docx_storage_name(doc_type: str, content_hash: str) -> str:
+    """
+    Имя файла по хэшу содержимого: одинаковые structured_data (+ шаблон) —
+    один и тот же файл, без суффиксов storage и сирот.
+    """
+    return f"{DOCX_DIR}/{doc_type}_{content_hash}.docx"
 
-    if doc.doc_type == DocumentType.SCOPE:
-        return build_scope_docx(doc.structured_data)
 
-    # пока другие типы не поддерживаем
-    return None
+def _is_current(doc: GeneratedDocument, content_hash: str) -> bool:
+    return (
+        doc.docx_hash == content_hash
+        and bool(doc.docx_file and doc.docx_file.name)
+        and doc.docx_file.storage.exists(doc.docx_file.name)
+    )
+
+
+def _store_docx(doc: GeneratedDocument, content_hash: str, content_bytes: Optional[bytes] = None) -> bool:
+    """
+    Привязывает к документу файл с хэшем content_hash. Если такой файл уже
+    лежит в storage (этот же или другой документ с тем же содержимым) —
+    переиспользуем его, content_bytes не нужен. Возвращает True, если файл записан.
+    """
+    storage = doc.docx_file.storage
+    name = docx_storage_name(doc.doc_type, content_hash)
+
+    written = False
+    if not storage.exists(name):
+        if content_bytes is None:
+            content_bytes = _build_docx_bytes_for_type(doc)
+        # при гонке двух запросов storage выдаст другое имя — файл от этого не портится
+        name = storage.save(name, ContentFile(content_bytes))
+        written = True
+
+    doc.docx_file.name = name
+    doc.docx_hash = content_hash
+    doc.docx_generated_at = timezone.now()
+    doc.save(update_fields=["docx_file", "docx_hash", "docx_generated_at", "updated_at"])
+    return written
 
 
 def ensure_docx_for_document(doc: GeneratedDocument, *, force: bool = False) -> GeneratedDocument:
     """
     Убедиться, что у документа есть docx_file.
     Если он уже есть и force=False — ничего не делаем.
+    force=True — привести файл к текущему structured_data: если хэш
+    не поменялся, ничего не пересобираем.
     """
-    if not doc.structured_data:
-        # нечего экспортировать
+    if not doc.structured_data or not supports_docx(doc.doc_type):
+        # нечего экспортировать / неподдерживаемый тип
         return doc
 
     if doc.docx_file and doc.docx_file.name and not force:
         return doc
 
-    content_bytes = _build_docx_bytes_for_type(doc)
-    if content_bytes is None:
-        return doc  # неподдерживаемый тип
-
-    if doc.doc_type == DocumentType.VISION:
-        filename = f"{doc.case_id}_vision.docx"
-    elif doc.doc_type == DocumentType.SCOPE:
-        filename = f"{doc.case_id}_scope.docx"
-    else:
-        filename = f"{doc.case_id}_{doc.doc_type}.docx"
+    content_hash = docx_content_hash(doc.doc_type, doc.structured_data)
+    if _is_current(doc, content_hash):
+        return doc
 
-    doc.docx_file.save(filename, ContentFile(content_bytes), save=False)
-    doc.docx_generated_at = timezone.now()
-    doc.save(update_fields=["docx_file", "docx_generated_at", "updated_at"])
+    _store_docx(doc, content_hash)
     return doc
+
+
+def export_docx_for_documents(
+    docs: Iterable[GeneratedDocument],
+    *,
+    force: bool = False,
+    workers: Optional[int] = None,
+    on_result=None,
+) -> Dict[str, float]:
+    """
+    Пакетная выгрузка DOCX: сборка в пуле процессов (docx_builders.build_docx_many),
+    запись в storage — в текущем процессе сразу по готовности каждого файла.
+    docs можно передавать итератором (queryset.iterator()) — в памяти держится
+    только окно документов, которые сейчас собираются.
+
+    on_result(doc, error) вызывается после каждого документа.
+    Документы с неизменным хэшем не пересобираются, а файл с тем же хэшем,
+    уже лежащий в storage, переиспользуется без сборки (reused).
+    Возвращает {"built", "reused", "skipped", "failed", "bytes", "seconds"}.
+    """
+    stats = {"built": 0, "reused": 0, "skipped": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+    in_flight: Dict = {}
+
+    def jobs():
+        for doc in docs:
+            if not supports_docx(doc.doc_type) or not doc.structured_data:
+                stats["skipped"] += 1
+                continue
+            if doc.docx_file and doc.docx_file.name and not force:
+                stats["skipped"] += 1
+                continue
+
+            content_hash = docx_content_hash(doc.doc_type, doc.structured_data)
+            if _is_current(doc, content_hash):
+                stats["skipped"] += 1
+                continue
+            if doc.docx_file.storage.exists(docx_storage_name(doc.doc_type, content_hash)):
+                _store_docx(doc, content_hash)
+                stats["reused"] += 1
+                if on_result is not None:
+                    on_result(doc, None)
+                continue
+
+            in_flight[doc.pk] = (doc, content_hash)
+            yield doc.pk, doc.doc_type, doc.structured_data
+
+    started = time.perf_counter()
+    for pk, content_bytes, error in build_docx_many(jobs(), workers=workers):
+        doc, content_hash = in_flight.pop(pk)
+        if error is None and content_bytes is not None:
+            try:
+                _store_docx(doc, content_hash, content_bytes)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+        if error is None and content_bytes is not None:
+            stats["built"] += 1
+            stats["bytes"] += len(content_bytes)
+        elif error is None:
+            stats["skipped"] += 1
+        else:
+            stats["failed"] += 1
+
+        if on_result is not None:
+            on_result(doc, error)
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
@@ -0,0 +1,170 @@
+# documents/services/docx_template.py
+"""
+Шаблон DOCX, разобранный один раз на процесс.
+
+DocxDocument() на каждый документ заново распаковывает и парсит шаблон
+python-docx, а add_paragraph(style="...") на каждом абзаце ищет стиль
+перебором всех стилей шаблона. Здесь:
+- шаблон (DOCX_TEMPLATE_PATH — корпоративный .docx со стилями, нумерацией,
+  колонтитулами; по умолчанию — шаблон python-docx) парсится один раз,
+  каждый документ начинается с его копии в памяти (copy.deepcopy);
+- id стилей резолвятся один раз, абзацы клонируются из готовых заготовок
+  <w:p> со стилем, текст подставляется прямо в <w:t>.
+
+Содержимое тела корпоративного шаблона (титульный лист и т.п.) сохраняется,
+документ дописывается после него.
+"""
+import copy
+import hashlib
+import io
+import logging
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import docx
+from docx import Document as DocxDocument
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+
+logger = logging.getLogger(__name__)
+
+# стили, которые используют сборщики артефактов
+KNOWN_STYLES = ("Heading 1", "Heading 2", "Heading 3", "List Bullet")
+
+
+def _configured_template_path() -> Optional[str]:
+    # в дочерних процессах пула (spawn) Django может быть не настроен
+    from django.conf import settings
+
+    if settings.configured:
+        return getattr(settings, "DOCX_TEMPLATE_PATH", "") or None
+    return os.getenv("DOCX_TEMPLATE_PATH") or None
+
+
+class DocxTemplate:
+    def __init__(self, template_path: Optional[str] = None):
+        self.template_path = template_path
+        if template_path:
+            with open(template_path, "rb") as f:
+                raw = f.read()
+            # версия шаблона входит в хэш содержимого DOCX (docx_builders.docx_content_hash)
+            self.version = hashlib.sha256(raw).hexdigest()
+            self._document = DocxDocument(io.BytesIO(raw))
+        else:
+            self.version = f"python-docx:{docx.__version__}"
+            self._document = DocxDocument()
+
+        self._prototypes: Dict[Optional[str], object] = {}
+        for name in (None,) + KNOWN_STYLES:
+            self._prototypes[name] = self._make_prototype(name)
+
+    def _make_prototype(self, style_name: Optional[str]):
+        p = OxmlElement("w:p")
+        if style_name is not None:
+            try:
+                style_id = self._document.styles[style_name].style_id
+            except KeyError:
+                logger.warning(
+                    "DOCX template %s has no style %r, using default paragraph style",
+                    self.template_path or "<python-docx default>",
+                    style_name,
+                )
+            else:
+                p_pr = OxmlElement("w:pPr")
+                p_style = OxmlElement("w:pStyle")
+                p_style.set(qn("w:val"), style_id)
+                p_pr.append(p_style)
+                p.append(p_pr)
+
+        r = OxmlElement("w:r")
+        t = OxmlElement("w:t")
+        t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+        r.append(t)
+        p.append(r)
+        return p
+
+    def new_document(self) -> "DocxBuilder":
+        return DocxBuilder(self, copy.deepcopy(self._document))
+
+
+class DocxBuilder:
+    """
+    Документ на основе DocxTemplate: heading / paragraph / bullets -> to_bytes().
+    """
+
+    def __init__(self, template: DocxTemplate, document):
+        self._template = template
+        self.document = document
+        self._body = document.element.body
+        self._sect_pr = self._body.sectPr
+
+    def _append(self, p) -> None:
+        if self._sect_pr is not None:
+            self._sect_pr.addprevious(p)
+        else:
+            self._body.append(p)
+
+    def paragraph(self, text: str, style: Optional[str] = None) -> None:
+        prototype = self._template._prototypes.get(style)
+        if prototype is None:
+            # стиль не из KNOWN_STYLES — обычный путь python-docx
+            self.document.add_paragraph(text, style=style)
+            return
+
+        text = str(text)
+        p = copy.deepcopy(prototype)
+        if "\n" in text or "\t" in text or "\r" in text:
+            # переносы и табуляции python-docx раскладывает в <w:br/> / <w:tab/>
+            p.remove(p.find(qn("w:r")))
+            self._append(p)
+            Paragraph(p, self.document).add_run(text)
+            return
+
+        p.find(qn("w:r")).find(qn("w:t")).text = text
+        self._append(p)
+
+    def heading(self, text: str, level: int = 1) -> None:
+        self.paragraph(text, style=f"Heading {level}")
+
+    def bullets(self, items: Iterable, default: str) -> None:
+        items = list(items or [])
+        if not items:
+            self.paragraph(default, style="List Bullet")
+            return
+        for item in items:
+            self.paragraph(str(item), style="List Bullet")
+
+    def to_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        self.document.save(buf)
+        return buf.getvalue()
+
+
+_lock = threading.Lock()
+_templates: Dict[Optional[str], DocxTemplate] = {}
+
+
+def get_docx_template(template_path: Optional[str] = None) -> DocxTemplate:
+    """
+    Шаблон из кэша процесса (по пути; None — DOCX_TEMPLATE_PATH из настроек).
+    """
+    path = template_path or _configured_template_path()
+    template = _templates.get(path)
+    if template is None:
+        with _lock:
+            template = _templates.get(path)
+            if template is None:
+                template = DocxTemplate(path)
+                _templates[path] = template
+    return template
+
+
+def new_docx(template_path: Optional[str] = None) -> DocxBuilder:
+    return get_docx_template(template_path).new_document()
+
+
+def clear_docx_template_cache() -> None:
+    with _lock:
+        _templates.clear()
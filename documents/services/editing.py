@@ -67,6 +67,14 @@ def _build_edit_user_prompt(doc: GeneratedDocument, instructions: str) -> str:
     )
 
 
+def _validate_edit_response(raw):
+    if not isinstance(raw, dict):
+        raise ValueError("Ожидался JSON с полем 'structured'")
+    if not isinstance(raw.get("structured"), dict):
+        raise ValueError("Поле 'structured' отсутствует или имеет неверный формат")
+    return raw
+
+
 def apply_llm_edit(doc: GeneratedDocument, instructions: str) -> GeneratedDocument:
     """
     Вносит правки в structured_data через GPT и пересобирает Markdown-контент.
@@ -85,14 +93,9 @@ def apply_llm_edit(doc: GeneratedDocument, instructions: str) -> GeneratedDocume
         system_prompt,
         user_prompt,
         model=getattr(settings, "OPENAI_MODEL_SCOPE", settings.OPENAI_MODEL_VISION),
+        validate=_validate_edit_response,
     )
-
-    if not isinstance(raw, dict):
-        raise ValueError("Ожидался JSON с полем 'structured'")
-
-    new_structured = raw.get("structured")
-    if not isinstance(new_structured, dict):
-        raise ValueError("Поле 'structured' отсутствует или имеет неверный формат")
+    new_structured = raw["structured"]
 
     case = getattr(doc, "case", None)
     case_title = getattr(case, "title", "") or "Без названия"
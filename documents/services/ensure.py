@@ -1,9 +1,13 @@
 import logging
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from django.db import transaction
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
 
-from cases.models import Case
+from cases.models import Case, CaseStatus
 from documents.models import (
     GeneratedDocument,
     GenerationStatus,
@@ -11,14 +15,23 @@ from documents.models import (
     DocumentStatus,
 )
 
-from .context_builder import build_case_context, build_source_snapshot_hash
-from .dispatcher import compute_prompt_hash, generate_structured_and_render
+from .context_builder import (
+    build_source_snapshot_hash,
+    get_case_context,
+    scope_case_context,
+    source_snapshot_hash,
+)
+from .dispatcher import generate_structured_and_render, get_artifact_prompt_bundle
+from .projection import has_structured_data
+from .utils import compute_prompt_hash
 from .artifacts.vision import prompt as vision_prompt
 from .artifacts.scope import prompt as scope_prompt
 from .artifacts.bpmn import prompt as bpmn_prompt
 from .artifacts.context_diagram import prompt as ctx_prompt
 from .artifacts.usecase import prompt as usecase_prompt
 from .versioning import create_document_version_snapshot  # 👈 НОВОЕ
+from .docx_export import ensure_docx_for_document
+from .bpmn_image_export import ensure_diagram_urls
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +44,22 @@ SUPPORTED_DOC_TYPES = {
 }
 
 
+def get_target_doc_types(case: Case) -> List[str]:
+    """
+    Типы документов, которые нужно обеспечить по кейсу.
+    Если selected_document_types пуст — по умолчанию VISION + SCOPE.
+    """
+    selected = case.selected_document_types or [DocumentType.VISION, DocumentType.SCOPE]
+    return [t for t in selected if t in SUPPORTED_DOC_TYPES]
+
+
 def _artifact_prompts(doc_type: str, case_context: dict) -> Tuple[str, str, str]:
     """
     Возвращает (prompt_version, system_prompt, user_prompt)
     — нужно только для логирования/хэша промпта.
+    Промпты строятся по контексту, суженному до doc_type (как при генерации).
     """
+    case_context = scope_case_context(case_context, doc_type)
     if doc_type == DocumentType.VISION:
         return (
             vision_prompt.PROMPT_VERSION,
@@ -74,80 +98,319 @@ def _artifact_prompts(doc_type: str, case_context: dict) -> Tuple[str, str, str]
     raise ValueError(f"Unsupported doc_type: {doc_type}")
 
 
-def ensure_case_documents(case: Case) -> Tuple[List[GeneratedDocument], Dict[str, str], bool]:
+def _generate_artifact(
+    doc_type: str,
+    case_context: dict,
+    use_cache: bool = True,
+) -> Tuple[Dict[str, Any], str, str, str]:
+    """
+    Обёртка над generate_structured_and_render для запуска в пуле потоков.
+    Соединения с БД у Django потоко-локальные — закрываем их за собой,
+    чтобы воркеры пула не оставляли висящие коннекты.
+    """
+    try:
+        return generate_structured_and_render(doc_type, case_context, use_cache=use_cache)
+    finally:
+        connections.close_all()
+
+
+def _run_generation(
+    doc_types: List[str],
+    case_context: dict,
+    *,
+    parallel: bool,
+    bypass_cache: Set[str] = frozenset(),
+) -> Dict[str, Tuple[Optional[tuple], Optional[Exception]]]:
+    """
+    Запускает генерацию артефактов: параллельно (ограниченный пул потоков)
+    или последовательно. Возвращает {doc_type: (result, error)}.
+    Для типов из bypass_cache ответ LLM не берётся из кэша.
+    """
+    outcomes: Dict[str, Tuple[Optional[tuple], Optional[Exception]]] = {}
+
+    if not parallel or len(doc_types) <= 1:
+        for doc_type in doc_types:
+            try:
+                result = generate_structured_and_render(
+                    doc_type,
+                    case_context,
+                    use_cache=doc_type not in bypass_cache,
+                )
+                outcomes[doc_type] = (result, None)
+            except Exception as e:
+                outcomes[doc_type] = (None, e)
+        return outcomes
+
+    max_workers = min(
+        len(doc_types),
+        max(1, int(getattr(settings, "DOCUMENTS_GENERATION_MAX_WORKERS", 5))),
+    )
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="doc-gen") as pool:
+        futures = {
+            doc_type: pool.submit(_generate_artifact, doc_type, case_context, doc_type not in bypass_cache)
+            for doc_type in doc_types
+        }
+        for doc_type, future in futures.items():
+            try:
+                outcomes[doc_type] = (future.result(), None)
+            except Exception as e:
+                outcomes[doc_type] = (None, e)
+
+    return outcomes
+
+
+def is_generation_in_flight(doc: GeneratedDocument) -> bool:
+    """
+    Документ сейчас генерирует другой запрос (и не завис по таймауту).
+    """
+    if doc.generation_status != GenerationStatus.GENERATING:
+        return False
+    timeout = int(getattr(settings, "DOCUMENTS_GENERATION_TIMEOUT", 600))
+    return bool(doc.updated_at and doc.updated_at > timezone.now() - timedelta(seconds=timeout))
+
+
+def save_generated_document(
+    case_id,
+    doc_type: str,
+    result: Tuple[Dict[str, Any], str, str, str],
+    *,
+    case_context: dict,
+    snapshot_hash: str,
+) -> GeneratedDocument:
+    """
+    Сохраняет результат генерации (structured, content, title, used_model)
+    в документ кейса и создаёт версию — одной короткой транзакцией.
+    """
+    structured, content, title, used_model = result
+    prompt_version, system_prompt, user_prompt = _artifact_prompts(doc_type, case_context)
+    p_hash = compute_prompt_hash(system_prompt, user_prompt)
+
+    with transaction.atomic():
+        doc = GeneratedDocument.objects.select_for_update().get(
+            case_id=case_id,
+            doc_type=doc_type,
+        )
+        doc.title = title
+        doc.content = content
+        doc.structured_data = structured
+        doc.llm_model = used_model
+        doc.prompt_version = prompt_version
+        doc.prompt_hash = p_hash
+        doc.source_snapshot_hash = snapshot_hash
+        doc.status = DocumentStatus.DRAFT
+        doc.generation_status = GenerationStatus.READY
+        doc.error_message = None
+        doc.save()
+
+        # 🔥 создаём версию после генерации
+        create_document_version_snapshot(doc, reason="generation")
+
+    return doc
+
+
+def mark_generation_failed(case_id, doc_type: str, error: Exception) -> None:
+    GeneratedDocument.objects.filter(case_id=case_id, doc_type=doc_type).update(
+        generation_status=GenerationStatus.FAILED,
+        error_message=str(error),
+    )
+
+
+def get_stale_reason(doc: GeneratedDocument, case_context: dict) -> Optional[str]:
+    """
+    Почему документ устарел относительно текущих данных кейса (None — актуален):
+    - "prompt_version": поменялась версия промпта артефакта;
+    - "source_snapshot": поменялись исходные данные кейса или ответы
+      на follow-up вопросы, адресованные этому типу документа;
+    - "prompt_hash": при тех же данных поменялся текст промпта
+      (шаблон правили без смены PROMPT_VERSION).
+    """
+    if not has_structured_data(doc):
+        return None
+
+    prompt_version, _, _ = get_artifact_prompt_bundle(doc.doc_type)
+    if doc.prompt_version != prompt_version:
+        return "prompt_version"
+
+    snapshot_hash = source_snapshot_hash(case_context, doc.doc_type)
+    if doc.source_snapshot_hash != snapshot_hash:
+        return "source_snapshot"
+
+    if doc.prompt_hash:
+        _, system_prompt, user_prompt = _artifact_prompts(doc.doc_type, case_context)
+        if doc.prompt_hash != compute_prompt_hash(system_prompt, user_prompt):
+            return "prompt_hash"
+
+    return None
+
+
+def get_stale_doc_types(
+    case: Case,
+    docs: List[GeneratedDocument],
+    case_context: Optional[dict] = None,
+) -> List[str]:
+    """
+    Типы документов кейса, которые устарели и будут перегенерированы в режиме refresh_stale.
+    """
+    if case_context is None:
+        case_context = get_case_context(case)
+    return [
+        d.doc_type
+        for d in docs
+        if d.doc_type in SUPPORTED_DOC_TYPES and get_stale_reason(d, case_context)
+    ]
+
+
+def ensure_case_documents(
+    case: Case,
+    *,
+    parallel: Optional[bool] = None,
+    refresh_stale: bool = False,
+) -> Tuple[List[GeneratedDocument], Dict[str, str], List[str]]:
     """
     Ленивое создание документов:
     - Работает при любом статусе кейса.
     - Создаёт только те документы, у которых ещё нет structured_data.
+    - С refresh_stale=True дополнительно перегенерирует устаревшие документы
+      (см. get_stale_reason); текущее содержимое остаётся до готовности новой версии.
     - Если selected_document_types пуст — по умолчанию VISION + SCOPE.
+
+    Генерация идёт в три шага:
+    1) под коротким локом кейса помечаем нужные документы как GENERATING;
+    2) вызываем LLM по всем типам без транзакции (по умолчанию параллельно,
+       см. DOCUMENTS_GENERATION_PARALLEL / DOCUMENTS_GENERATION_MAX_WORKERS);
+    3) сохраняем каждый результат в своей короткой транзакции.
+
+    Возвращает (документы кейса, ошибки по doc_type, типы, сгенерированные в этом вызове).
     """
-    selected = case.selected_document_types or [DocumentType.VISION, DocumentType.SCOPE]
-    target = [t for t in selected if t in SUPPORTED_DOC_TYPES]
+    target = get_target_doc_types(case)
+
+    if parallel is None:
+        parallel = getattr(settings, "DOCUMENTS_GENERATION_PARALLEL", True)
 
     errors: Dict[str, str] = {}
-    did_generate_any = False
+    generated: List[str] = []
 
-    case_context = build_case_context(case)
-    snapshot_hash = build_source_snapshot_hash(case)
+    case_context = get_case_context(case)
+    snapshot_hashes = {
+        doc_type: build_source_snapshot_hash(case, doc_type, case_context=case_context)
+        for doc_type in target
+    }
 
+    # ---------- 1. Резервируем документы под генерацию ----------
+    to_generate: List[str] = []
+    # устаревшие документы: кэш LLM вернул бы тот же ответ, что и в прошлый раз
+    regenerated: Set[str] = set()
     with transaction.atomic():
         locked_case = Case.objects.select_for_update().get(pk=case.pk)
 
+        existing: Dict[str, GeneratedDocument] = {}
+        for doc in GeneratedDocument.objects.filter(case=locked_case, doc_type__in=target):
+            existing.setdefault(doc.doc_type, doc)
+
         for doc_type in target:
-            existing = GeneratedDocument.objects.filter(
-                case=locked_case,
-                doc_type=doc_type,
-            ).first()
+            doc = existing.get(doc_type)
 
-            if existing and existing.structured_data:
+            if doc and is_generation_in_flight(doc):
+                logger.info(
+                    "doc_type=%s for case=%s is already being generated, skip",
+                    doc_type,
+                    locked_case.id,
+                )
                 continue
 
-            try:
-                doc, _ = GeneratedDocument.objects.update_or_create(
-                    case=locked_case,
-                    doc_type=doc_type,
-                    defaults={
-                        "generation_status": GenerationStatus.GENERATING,
-                        "error_message": None,
-                        "status": DocumentStatus.DRAFT,
-                        "title": f"{doc_type}: {locked_case.title}",
-                        "content": "",
-                        "structured_data": None,
-                        "source_snapshot_hash": snapshot_hash,
-                    },
-                )
+            if doc and doc.structured_data:
+                if not refresh_stale:
+                    continue
 
-                prompt_version, system_prompt, user_prompt = _artifact_prompts(doc_type, case_context)
-                p_hash = compute_prompt_hash(system_prompt, user_prompt)
+                reason = get_stale_reason(doc, case_context)
+                if reason is None:
+                    continue
 
-                structured, content, title, used_model = generate_structured_and_render(
+                logger.info(
+                    "doc_type=%s for case=%s is stale (%s), regenerating",
                     doc_type,
-                    case_context,
+                    locked_case.id,
+                    reason,
                 )
+                # старое содержимое не трогаем, пока не готова новая версия
+                GeneratedDocument.objects.filter(pk=doc.pk).update(
+                    generation_status=GenerationStatus.GENERATING,
+                    error_message=None,
+                    updated_at=timezone.now(),
+                )
+                to_generate.append(doc_type)
+                regenerated.add(doc_type)
+                continue
 
-                doc.title = title
-                doc.content = content
-                doc.structured_data = structured
-                doc.llm_model = used_model
-                doc.prompt_version = prompt_version
-                doc.prompt_hash = p_hash
-                doc.source_snapshot_hash = snapshot_hash
-                doc.generation_status = GenerationStatus.READY
-                doc.error_message = None
-                doc.save()
+            GeneratedDocument.objects.update_or_create(
+                case=locked_case,
+                doc_type=doc_type,
+                defaults={
+                    "generation_status": GenerationStatus.GENERATING,
+                    "error_message": None,
+                    "status": DocumentStatus.DRAFT,
+                    "title": f"{doc_type}: {locked_case.title}",
+                    "content": "",
+                    "structured_data": None,
+                    "source_snapshot_hash": snapshot_hashes[doc_type],
+                },
+            )
+            to_generate.append(doc_type)
 
-                # 🔥 создаём версию после генерации
-                create_document_version_snapshot(doc, reason="generation")
+    # ---------- 2. LLM-вызовы вне транзакции ----------
+    outcomes = _run_generation(to_generate, case_context, parallel=parallel, bypass_cache=regenerated)
 
-                did_generate_any = True
+    # ---------- 3. Сохраняем результаты короткими транзакциями ----------
+    for doc_type in to_generate:
+        result, error = outcomes[doc_type]
 
-            except Exception as e:
-                logger.exception("Failed ensuring doc_type=%s for case=%s", doc_type, locked_case.id)
-                errors[doc_type] = str(e)
-                GeneratedDocument.objects.filter(case=locked_case, doc_type=doc_type).update(
-                    generation_status=GenerationStatus.FAILED,
-                    error_message=str(e),
-                )
+        try:
+            if error is not None:
+                raise error
+
+            save_generated_document(
+                case.pk,
+                doc_type,
+                result,
+                case_context=case_context,
+                snapshot_hash=snapshot_hashes[doc_type],
+            )
+            generated.append(doc_type)
+
+        except Exception as e:
+            logger.exception("Failed ensuring doc_type=%s for case=%s", doc_type, case.pk)
+            errors[doc_type] = str(e)
+            mark_generation_failed(case.pk, doc_type, e)
 
     docs = list(GeneratedDocument.objects.filter(case=case).order_by("doc_type"))
-    return docs, errors, did_generate_any
\ No newline at end of file
+    return docs, errors, generated
+
+
+def finalize_case_documents(
+    case: Case,
+    docs: List[GeneratedDocument],
+    generated: Iterable[str] = (),
+) -> None:
+    """
+    Доводит документы до выдачи после ensure_case_documents:
+    - для текстовых документов — DOCX;
+    - для диаграмм — URL картинки (см. bpmn_image_export);
+    - переводит кейс в DOCUMENTS_GENERATED, если что-то сгенерировали.
+
+    generated — типы, сгенерированные в этом прогоне: у перегенерированных
+    документов DOCX и URL диаграммы уже есть, но от старого содержимого,
+    поэтому для них они пересобираются принудительно.
+    """
+    generated = set(generated)
+
+    for doc in docs:
+        if doc.doc_type in (DocumentType.VISION, DocumentType.SCOPE):
+            ensure_docx_for_document(doc, force=doc.doc_type in generated)
+
+    # URL диаграмм — одним bulk_update на документы каждого режима
+    ensure_diagram_urls([d for d in docs if d.doc_type in generated], force=True)
+    ensure_diagram_urls([d for d in docs if d.doc_type not in generated], force=False)
+
+    if generated and case.status != CaseStatus.DOCUMENTS_GENERATED:
+        case.status = CaseStatus.DOCUMENTS_GENERATED
+        case.save(update_fields=["status"])
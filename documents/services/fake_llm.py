@@ -0,0 +1,600 @@
+# documents/services/fake_llm.py
+"""
+Локальный заменитель OpenAI для офлайн-прогонов и бенчмарков генерации
+(LLM_BACKEND="fake", manage.py bench_generation).
+
+Повторяет ту часть SDK, которой мы пользуемся:
+- chat.completions.create(...) — обычный ответ и stream=True (чанки с delta);
+- workflows.runs.create(...) — объект с .output (agent_client.run_workflow).
+Ответы — настоящие типы openai (ChatCompletion / ChatCompletionChunk с usage).
+
+Содержимое детерминировано: тип артефакта узнаём по system prompt
+(Vision, Scope, BPMN, Context, Use Case, план уточняющих вопросов), ответ —
+заготовка, проходящая schema.validate соответствующего генератора, с меткой
+из хэша user prompt (разные кейсы — разные документы и DOCX).
+Для response_format с json_schema ответ собирается по самой схеме.
+
+Задержки и сбои (FAKE_LLM_*):
+- время до первого токена — логнормальное: медиана LATENCY, разброс LATENCY_SIGMA;
+- дальше ответ "печатается" со скоростью TOKENS_PER_SECOND (0 — мгновенно);
+- доля ERROR_RATE вызовов падает ошибкой из ERROR_KINDS: rate_limit (429 с
+  Retry-After), server_error (500) или timeout — те же исключения openai,
+  что повторяет llm_gateway.call_with_retries;
+- аргумент timeout вызова соблюдается: не уложились — APITimeoutError;
+- SEED делает последовательность задержек и сбоев воспроизводимой
+  (при параллельных вызовах — с точностью до порядка потоков).
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import openai
+from django.conf import settings
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice, ChoiceDelta
+
+ERROR_KINDS = ("rate_limit", "server_error", "timeout")
+
+FAKE_BASE_URL = "http://fake-llm.invalid/v1"
+
+# ~4 символа на токен — как грубая оценка tiktoken для смешанного текста
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_CHARS = 16
+
+
+@dataclass(frozen=True)
+class FakeLLMConfig:
+    latency: float = 0.5
+    latency_sigma: float = 0.3
+    tokens_per_second: float = 0.0
+    error_rate: float = 0.0
+    error_kinds: Tuple[str, ...] = ERROR_KINDS
+    retry_after: float = 1.0
+    items: int = 5
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_settings(cls) -> "FakeLLMConfig":
+        kinds = getattr(settings, "FAKE_LLM_ERROR_KINDS", ",".join(ERROR_KINDS))
+        if isinstance(kinds, str):
+            kinds = [k.strip() for k in kinds.split(",")]
+        kinds = tuple(k for k in kinds if k in ERROR_KINDS) or ERROR_KINDS
+
+        seed = getattr(settings, "FAKE_LLM_SEED", None)
+        return cls(
+            latency=float(getattr(settings, "FAKE_LLM_LATENCY", 0.5)),
+            latency_sigma=float(getattr(settings, "FAKE_LLM_LATENCY_SIGMA", 0.3)),
+            tokens_per_second=float(getattr(settings, "FAKE_LLM_TOKENS_PER_SECOND", 0)),
+            error_rate=float(getattr(settings, "FAKE_LLM_ERROR_RATE", 0)),
+            error_kinds=kinds,
+            retry_after=float(getattr(settings, "FAKE_LLM_RETRY_AFTER", 1)),
+            items=max(1, int(getattr(settings, "FAKE_LLM_ITEMS", 5))),
+            seed=None if seed in (None, "") else int(seed),
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+# ======================= Заготовки ответов =======================
+
+
+@lru_cache(maxsize=1)
+def _system_prompt_kinds() -> Dict[str, str]:
+    from .artifacts.bpmn import prompt as bpmn_prompt
+    from .artifacts.context_diagram import prompt as ctx_prompt
+    from .artifacts.scope import prompt as scope_prompt
+    from .artifacts.usecase import prompt as usecase_prompt
+    from .artifacts.vision import prompt as vision_prompt
+
+    return {
+        vision_prompt.SYSTEM_PROMPT: "vision",
+        scope_prompt.SYSTEM_PROMPT: "scope",
+        bpmn_prompt.SYSTEM_PROMPT: "bpmn",
+        ctx_prompt.SYSTEM_PROMPT: "context_diagram",
+        usecase_prompt.SYSTEM_PROMPT: "usecase",
+    }
+
+
+def detect_kind(system_prompt: str) -> Optional[str]:
+    kind = _system_prompt_kinds().get(system_prompt)
+    if kind is None and '"questions"' in (system_prompt or ""):
+        kind = "followup"  # cases.services.followup — промпт собирается на лету
+    return kind
+
+
+def _lines(prefix: str, tag: str, count: int) -> List[str]:
+    return [f"{prefix} {i + 1} ({tag})" for i in range(count)]
+
+
+def _bpmn_plantuml(tag: str, count: int) -> str:
+    steps = "\n".join(f":Шаг {i + 1} процесса {tag};" for i in range(count))
+    return (
+        "@startuml\n"
+        f"title Процесс {tag}\n"
+        "start\n"
+        f"{steps}\n"
+        "if (Проверка пройдена?) then (да)\n"
+        "  :Одобрить заявку;\n"
+        "else (нет)\n"
+        "  :Вернуть на доработку;\n"
+        "endif\n"
+        "stop\n"
+        "@enduml"
+    )
+
+
+def _context_plantuml(tag: str, count: int) -> str:
+    systems = "\n".join(f'rectangle "Внешняя система {i + 1}" as Ext{i + 1}' for i in range(count))
+    flows = "\n".join(f"System --> Ext{i + 1} : запрос {i + 1}" for i in range(count))
+    return (
+        "@startuml\n"
+        f"title Контекст {tag}\n"
+        'actor "Клиент" as Client\n'
+        f'rectangle "Система {tag}" as System\n'
+        f"{systems}\n"
+        "Client --> System : заявка\n"
+        f"{flows}\n"
+        "@enduml"
+    )
+
+
+def _usecase_plantuml(tag: str, count: int) -> str:
+    cases = "\n".join(f'  usecase "Сценарий {i + 1}" as UC{i + 1}' for i in range(count))
+    links = "\n".join(f"User --> UC{i + 1}" for i in range(count))
+    return (
+        "@startuml\n"
+        "left to right direction\n"
+        f"title Use Case {tag}\n"
+        'actor "Пользователь" as User\n'
+        f'rectangle "Система {tag}" {{\n'
+        f"{cases}\n"
+        "}\n"
+        f"{links}\n"
+        "@enduml"
+    )
+
+
+def canned_payload(kind: Optional[str], tag: str, items: int) -> Dict[str, Any]:
+    """
+    Заготовка JSON-ответа для типа артефакта; проходит schema.validate генератора.
+    """
+    if kind == "vision":
+        return {
+            "title": f"Vision: инициатива {tag}",
+            "problem_statement": f"Заявки по инициативе {tag} обрабатываются вручную, сроки растут.",
+            "business_goals": _lines("Бизнес-цель", tag, items),
+            "target_users": _lines("Роль пользователя", tag, items),
+            "expected_outcomes": _lines("Ожидаемый результат", tag, items),
+            "success_criteria": _lines("Критерий успеха", tag, items),
+            "risks_and_limitations": _lines("Риск", tag, items),
+        }
+    if kind == "scope":
+        return {
+            "summary": f"Автоматизация приёма и проверки заявок ({tag}).",
+            "in_scope": _lines("Функция", tag, items),
+            "out_of_scope": _lines("Исключение", tag, items),
+            "business_processes_in_scope": _lines("Процесс", tag, items),
+            "systems_in_scope": _lines("Система", tag, items),
+            "assumptions": _lines("Допущение", tag, items),
+            "constraints": _lines("Ограничение", tag, items),
+        }
+    if kind == "bpmn":
+        return {"plantuml": _bpmn_plantuml(tag, items), "notes": _lines("Комментарий", tag, 2)}
+    if kind == "context_diagram":
+        return {"plantuml": _context_plantuml(tag, items), "notes": _lines("Комментарий", tag, 2)}
+    if kind == "usecase":
+        return {"plantuml": _usecase_plantuml(tag, items), "notes": _lines("Комментарий", tag, 2)}
+    if kind == "followup":
+        # пустые target_document_types — followup подставит типы кейса
+        return {
+            "questions": [
+                {"code": f"q_{i + 1}", "text": f"Уточняющий вопрос {i + 1} ({tag})?", "target_document_types": []}
+                for i in range(items)
+            ]
+        }
+    return {"result": f"Ответ {tag}"}
+
+
+def payload_from_schema(schema: Dict[str, Any], tag: str, items: int, name: str = "value") -> Any:
+    """
+    Минимальный пример по JSON Schema (response_format={"type": "json_schema"}).
+    Строковое поле plantuml получает валидную диаграмму.
+    """
+    if "enum" in schema and schema["enum"]:
+        return schema["enum"][0]
+
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+
+    if kind == "object":
+        return {
+            key: payload_from_schema(sub or {}, tag, items, key)
+            for key, sub in (schema.get("properties") or {}).items()
+        }
+    if kind == "array":
+        return [payload_from_schema(schema.get("items") or {}, tag, items, name) for _ in range(items)]
+    if kind == "integer":
+        return items
+    if kind == "number":
+        return float(items)
+    if kind == "boolean":
+        return True
+    if name == "plantuml":
+        return _usecase_plantuml(tag, items)
+    return f"{name} ({tag})"
+
+
+# ======================= Ядро =======================
+
+
+@dataclass
+class _Plan:
+    content: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    first_token_delay: float
+    generation_time: float
+    error: Optional[str]
+    timeout: Optional[float]
+
+
+class _FakeLLMCore:
+    def __init__(self, config: FakeLLMConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.calls = 0
+            self.streams = 0
+            self.by_kind: Counter = Counter()
+            self.errors: Counter = Counter()
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "streams": self.streams,
+                "by_kind": dict(self.by_kind),
+                "errors": dict(self.errors),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+    def _draw(self) -> Tuple[float, Optional[str]]:
+        config = self.config
+        with self.lock:
+            if config.latency > 0:
+                delay = config.latency * math.exp(self.random.gauss(0, config.latency_sigma))
+            else:
+                delay = 0.0
+            error = None
+            if config.error_rate and self.random.random() < config.error_rate:
+                error = self.random.choice(config.error_kinds)
+        return delay, error
+
+    def plan(self, kwargs: Dict[str, Any], *, stream: bool = False) -> _Plan:
+        messages = kwargs.get("messages") or []
+        system_prompt = "\n".join(
+            m.get("content") or "" for m in messages if m.get("role") in ("system", "developer")
+        )
+        user_prompt = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+        tag = hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()[:8]
+        kind = detect_kind(system_prompt)
+
+        response_format = kwargs.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = (response_format.get("json_schema") or {}).get("schema") or {}
+            content = json.dumps(payload_from_schema(schema, tag, self.config.items), ensure_ascii=False)
+        elif response_format.get("type") == "json_object" or kind is not None:
+            content = json.dumps(canned_payload(kind, tag, self.config.items), ensure_ascii=False)
+        else:
+            content = f"Ответ ({tag})"
+
+        delay, error = self._draw()
+        prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+        completion_tokens = estimate_tokens(content)
+        tps = self.config.tokens_per_second
+
+        with self.lock:
+            self.calls += 1
+            self.streams += int(stream)
+            self.by_kind[kind or "other"] += 1
+            if error:
+                self.errors[error] += 1
+            else:
+                self.prompt_tokens += prompt_tokens
+                self.completion_tokens += completion_tokens
+
+        timeout = kwargs.get("timeout")
+        return _Plan(
+            content=content,
+            model=kwargs.get("model") or "fake",
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            first_token_delay=delay,
+            generation_time=completion_tokens / tps if tps > 0 else 0.0,
+            error=error,
+            timeout=float(timeout) if isinstance(timeout, (int, float)) else None,
+        )
+
+    # --- ошибки ---
+
+    def error_delay(self, plan: _Plan) -> float:
+        # 429 отдаётся сразу, 500 — после "обработки", timeout — по таймауту клиента
+        if plan.error == "rate_limit":
+            return 0.0
+        return min(plan.first_token_delay, plan.timeout) if plan.timeout is not None else plan.first_token_delay
+
+    def build_error(self, plan: _Plan) -> Exception:
+        request = httpx.Request("POST", f"{FAKE_BASE_URL}/chat/completions")
+        if plan.error == "rate_limit":
+            response = httpx.Response(
+                429,
+                headers={"retry-after": f"{self.config.retry_after:g}"},
+                request=request,
+            )
+            return openai.RateLimitError("Rate limit reached (fake)", response=response, body=None)
+        if plan.error == "server_error":
+            response = httpx.Response(500, request=request)
+            return openai.InternalServerError("Internal server error (fake)", response=response, body=None)
+        return openai.APITimeoutError(request=request)
+
+    def times_out(self, plan: _Plan) -> bool:
+        return plan.timeout is not None and plan.first_token_delay + plan.generation_time > plan.timeout
+
+    # --- ответы ---
+
+    def completion(self, plan: _Plan) -> ChatCompletion:
+        return ChatCompletion(
+            id=f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+            object="chat.completion",
+            created=int(time.time()),
+            model=plan.model,
+            choices=[
+                Choice(
+                    index=0,
+                    finish_reason="stop",
+                    message=ChatCompletionMessage(role="assistant", content=plan.content),
+                )
+            ],
+            usage=self.usage(plan),
+        )
+
+    def usage(self, plan: _Plan) -> CompletionUsage:
+        return CompletionUsage(
+            prompt_tokens=plan.prompt_tokens,
+            completion_tokens=plan.completion_tokens,
+            total_tokens=plan.prompt_tokens + plan.completion_tokens,
+        )
+
+    def chunks(self, plan: _Plan) -> Iterator[Tuple[float, ChatCompletionChunk]]:
+        """
+        (пауза перед чанком, чанк): пауза пропорциональна его токенам.
+        """
+        chunk_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        tps = self.config.tokens_per_second
+
+        def make(content: Optional[str], finish_reason: Optional[str] = None, usage=None) -> ChatCompletionChunk:
+            return ChatCompletionChunk(
+                id=chunk_id,
+                object="chat.completion.chunk",
+                created=created,
+                model=plan.model,
+                choices=[
+                    ChunkChoice(
+                        index=0,
+                        delta=ChoiceDelta(role="assistant", content=content),
+                        finish_reason=finish_reason,
+                    )
+                ],
+                usage=usage,
+            )
+
+        text = plan.content
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            piece = text[start:start + STREAM_CHUNK_CHARS]
+            yield (estimate_tokens(piece) / tps if tps > 0 else 0.0), make(piece)
+        yield 0.0, make(None, "stop", self.usage(plan))
+
+
+# ======================= Синхронный клиент =======================
+
+
+class _Stream:
+    def __init__(self, core: _FakeLLMCore, plan: _Plan):
+        self._iterator = self._iterate(core, plan)
+        self._closed = False
+
+    def _iterate(self, core: _FakeLLMCore, plan: _Plan) -> Iterator[ChatCompletionChunk]:
+        time.sleep(plan.first_token_delay)
+        for pause, chunk in core.chunks(plan):
+            if self._closed:
+                return
+            if pause:
+                time.sleep(pause)
+            yield chunk
+
+    def __iter__(self):
+        return self._iterator
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class _Completions:
+    def __init__(self, core: _FakeLLMCore):
+        self._core = core
+
+    def create(self, **kwargs: Any):
+        core = self._core
+        stream = bool(kwargs.get("stream"))
+        plan = core.plan(kwargs, stream=stream)
+
+        if plan.error:
+            time.sleep(core.error_delay(plan))
+            raise core.build_error(plan)
+        if core.times_out(plan):
+            time.sleep(plan.timeout)
+            raise openai.APITimeoutError(request=httpx.Request("POST", f"{FAKE_BASE_URL}/chat/completions"))
+
+        if stream:
+            return _Stream(core, plan)
+        time.sleep(plan.first_token_delay + plan.generation_time)
+        return core.completion(plan)
+
+
+class _Runs:
+    def __init__(self, core: _FakeLLMCore):
+        self._core = core
+
+    def create(self, *, workflow_id: str, input: Dict[str, Any], model: Optional[str] = None, **kwargs: Any):
+        # workflow use case диаграммы — отвечаем как генератор use case
+        from .artifacts.usecase import prompt as usecase_prompt
+
+        core = self._core
+        plan = core.plan({
+            "model": model,
+            "messages": [
+                {"role": "system", "content": usecase_prompt.SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps(input, ensure_ascii=False, default=str)},
+            ],
+            "response_format": {"type": "json_object"},
+        })
+        if plan.error:
+            time.sleep(core.error_delay(plan))
+            raise core.build_error(plan)
+        time.sleep(plan.first_token_delay + plan.generation_time)
+        return SimpleNamespace(id=f"run-fake-{uuid.uuid4().hex[:12]}", workflow_id=workflow_id, output=json.loads(plan.content))
+
+
+class FakeLLMClient:
+    """
+    Синхронный клиент с интерфейсом OpenAI: chat.completions.create, workflows.runs.create.
+    """
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self._core = _FakeLLMCore(config or FakeLLMConfig.from_settings())
+        self.chat = SimpleNamespace(completions=_Completions(self._core))
+        self.workflows = SimpleNamespace(runs=_Runs(self._core))
+
+    @property
+    def config(self) -> FakeLLMConfig:
+        return self._core.config
+
+    def stats(self) -> Dict[str, Any]:
+        return self._core.stats()
+
+    def reset_stats(self) -> None:
+        self._core.reset_stats()
+
+    def close(self) -> None:
+        pass
+
+
+# ======================= Асинхронный клиент =======================
+
+
+class _AsyncStream:
+    def __init__(self, core: _FakeLLMCore, plan: _Plan):
+        self._core = core
+        self._plan = plan
+        self._chunks: Optional[Iterator[Tuple[float, ChatCompletionChunk]]] = None
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatCompletionChunk:
+        if self._closed:
+            raise StopAsyncIteration
+        if self._chunks is None:
+            await asyncio.sleep(self._plan.first_token_delay)
+            self._chunks = self._core.chunks(self._plan)
+        try:
+            pause, chunk = next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+        if pause:
+            await asyncio.sleep(pause)
+        return chunk
+
+    async def close(self) -> None:
+        self._closed = True
+
+
+class _AsyncCompletions:
+    def __init__(self, core: _FakeLLMCore):
+        self._core = core
+
+    async def create(self, **kwargs: Any):
+        core = self._core
+        stream = bool(kwargs.get("stream"))
+        plan = core.plan(kwargs, stream=stream)
+
+        if plan.error:
+            await asyncio.sleep(core.error_delay(plan))
+            raise core.build_error(plan)
+        if core.times_out(plan):
+            await asyncio.sleep(plan.timeout)
+            raise openai.APITimeoutError(request=httpx.Request("POST", f"{FAKE_BASE_URL}/chat/completions"))
+
+        if stream:
+            return _AsyncStream(core, plan)
+        await asyncio.sleep(plan.first_token_delay + plan.generation_time)
+        return core.completion(plan)
+
+
+class AsyncFakeLLMClient:
+    """
+    Асинхронный близнец FakeLLMClient (chat.completions.create).
+    """
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self._core = _FakeLLMCore(config or FakeLLMConfig.from_settings())
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(self._core))
+
+    @property
+    def config(self) -> FakeLLMConfig:
+        return self._core.config
+
+    def stats(self) -> Dict[str, Any]:
+        return self._core.stats()
+
+    def reset_stats(self) -> None:
+        self._core.reset_stats()
+
+    async def close(self) -> None:
+        pass
+
+
+def build_client(*, asynchronous: bool = False):
+    """
+    Фабрика для LLM_BACKEND="fake" (см. llm_gateway.get_client).
+    """
+    return AsyncFakeLLMClient() if asynchronous else FakeLLMClient()
@@ -0,0 +1,317 @@
+# documents/services/jobs.py
+"""
+Очередь фоновой генерации документов поверх БД.
+
+POST /api/cases/{id}/documents/ ставит DocumentGenerationJob,
+воркер (manage.py run_document_jobs) забирает задачи по одной
+атомарным UPDATE ... WHERE status='new' и выполняет ensure_case_documents.
+Внешний брокер не нужен — работает на SQLite и Postgres.
+
+Без отдельного воркера задачу после постановки подхватывает пул фоновых
+задач процесса (forte_ai_back.background, DOCUMENT_JOBS_RUN_IN_PROCESS).
+Захват тот же, поэтому оба способа можно совмещать; при выделенных
+воркерах DOCUMENT_JOBS_RUN_IN_PROCESS=0 разгружает веб-процессы.
+"""
+import logging
+import os
+import socket
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from cases.models import Case
+from forte_ai_back import background
+from documents.models import (
+    DocumentGenerationJob,
+    DocumentStatus,
+    GeneratedDocument,
+    GenerationStatus,
+)
+
+from .ensure import (
+    ensure_case_documents,
+    finalize_case_documents,
+    get_target_doc_types,
+    is_generation_in_flight,
+)
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATUSES = (GenerationStatus.NEW, GenerationStatus.GENERATING)
+
+
+class JobConflict(RuntimeError):
+    """
+    По кейсу уже выполняется задача, а запрос требует другого режима
+    (refresh_stale), который в уже идущую генерацию не передать.
+    """
+
+    def __init__(self, message: str, job: DocumentGenerationJob):
+        super().__init__(message)
+        self.job = job
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def fail_queued_documents(case_id, doc_types, message: str) -> int:
+    """
+    Документы, которые enqueue пометил NEW, иначе навсегда остались бы "в очереди".
+    """
+    return GeneratedDocument.objects.filter(
+        case_id=case_id,
+        doc_type__in=doc_types or [],
+        generation_status=GenerationStatus.NEW,
+    ).update(
+        generation_status=GenerationStatus.FAILED,
+        error_message=message,
+        updated_at=timezone.now(),
+    )
+
+
+def enqueue_case_documents_job(
+    case: Case,
+    *,
+    requested_by: Optional[str] = None,
+    refresh_stale: bool = False,
+) -> Tuple[DocumentGenerationJob, bool]:
+    """
+    Ставит задачу генерации документов по кейсу.
+    Если по кейсу уже есть незавершённая задача — возвращает её (created=False).
+    refresh_stale — перегенерировать также устаревшие документы (см. ensure.get_stale_reason).
+    Ещё не захваченной задаче refresh_stale включается на месте; если задача
+    уже выполняется без него — JobConflict.
+
+    Документы, которые задача будет генерировать, сразу помечаются
+    generation_status=NEW, чтобы фронт видел их в прогрессе.
+    """
+    doc_types = get_target_doc_types(case)
+
+    with transaction.atomic():
+        locked_case = Case.objects.select_for_update().get(pk=case.pk)
+
+        active = (
+            DocumentGenerationJob.objects
+            .filter(case=locked_case, status__in=ACTIVE_JOB_STATUSES)
+            .order_by("created_at")
+            .first()
+        )
+        if active is not None:
+            if refresh_stale and not active.refresh_stale:
+                # условный UPDATE: воркер читает задачу уже после захвата
+                upgraded = DocumentGenerationJob.objects.filter(
+                    pk=active.pk,
+                    status=GenerationStatus.NEW,
+                ).update(refresh_stale=True, updated_at=timezone.now())
+                if not upgraded:
+                    raise JobConflict(
+                        "Document generation without refresh=stale is already running for this case.",
+                        active,
+                    )
+                active.refresh_stale = True
+            return active, False
+
+        existing: Dict[str, GeneratedDocument] = {}
+        for doc in GeneratedDocument.objects.filter(case=locked_case, doc_type__in=doc_types):
+            existing.setdefault(doc.doc_type, doc)
+
+        for doc_type in doc_types:
+            doc = existing.get(doc_type)
+            if doc and (doc.structured_data or is_generation_in_flight(doc)):
+                continue
+
+            GeneratedDocument.objects.update_or_create(
+                case=locked_case,
+                doc_type=doc_type,
+                defaults={
+                    "generation_status": GenerationStatus.NEW,
+                    "error_message": None,
+                    "status": DocumentStatus.DRAFT,
+                    "title": f"{doc_type}: {locked_case.title}",
+                },
+            )
+
+        job = DocumentGenerationJob.objects.create(
+            case=locked_case,
+            doc_types=doc_types,
+            refresh_stale=refresh_stale,
+            requested_by=requested_by,
+        )
+
+    logger.info("Enqueued document job %s for case %s (%s)", job.id, case.id, doc_types)
+    if getattr(settings, "DOCUMENT_JOBS_RUN_IN_PROCESS", True):
+        background.submit_on_commit(run_pending_jobs)
+    return job, True
+
+
+def claim_next_job(worker_id: Optional[str] = None) -> Optional[DocumentGenerationJob]:
+    """
+    Забирает самую старую задачу в статусе NEW.
+    Захват — условный UPDATE: если другой воркер успел раньше,
+    UPDATE вернёт 0 строк и мы пробуем следующего кандидата.
+    """
+    worker_id = worker_id or default_worker_id()
+
+    candidates = list(
+        DocumentGenerationJob.objects
+        .filter(status=GenerationStatus.NEW)
+        .order_by("created_at")
+        .values_list("pk", flat=True)[:10]
+    )
+    for job_id in candidates:
+        claimed = DocumentGenerationJob.objects.filter(
+            pk=job_id,
+            status=GenerationStatus.NEW,
+        ).update(
+            status=GenerationStatus.GENERATING,
+            worker_id=worker_id,
+            started_at=timezone.now(),
+            updated_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return DocumentGenerationJob.objects.select_related("case").get(pk=job_id)
+
+    return None
+
+
+def requeue_stale_jobs(stale_after: Optional[int] = None) -> int:
+    """
+    Возвращает в очередь задачи, чей воркер пропал (GENERATING дольше stale_after секунд).
+    Задачи, исчерпавшие DOCUMENT_JOBS_MAX_ATTEMPTS, помечаются FAILED.
+    """
+    if stale_after is None:
+        stale_after = int(getattr(settings, "DOCUMENTS_GENERATION_TIMEOUT", 600))
+    max_attempts = int(getattr(settings, "DOCUMENT_JOBS_MAX_ATTEMPTS", 3))
+    threshold = timezone.now() - timedelta(seconds=stale_after)
+
+    stale = DocumentGenerationJob.objects.filter(
+        status=GenerationStatus.GENERATING,
+        started_at__lt=threshold,
+    )
+    failed = 0
+    for job in stale.filter(attempts__gte=max_attempts).only("pk", "case_id", "doc_types"):
+        message = "Job exceeded max attempts"
+        claimed = DocumentGenerationJob.objects.filter(
+            pk=job.pk,
+            status=GenerationStatus.GENERATING,
+        ).update(
+            status=GenerationStatus.FAILED,
+            error_message=message,
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            failed += 1
+            fail_queued_documents(job.case_id, job.doc_types, message)
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status=GenerationStatus.NEW,
+        worker_id=None,
+        updated_at=timezone.now(),
+    )
+    if failed or requeued:
+        logger.warning("Stale document jobs: requeued=%s failed=%s", requeued, failed)
+    return requeued
+
+
+def run_job(job: DocumentGenerationJob) -> DocumentGenerationJob:
+    """
+    Выполняет уже захваченную задачу: генерация + DOCX/diagram_url.
+    """
+    case = job.case
+    logger.info("Running document job %s for case %s", job.id, case.id)
+
+    try:
+        docs, errors, generated = ensure_case_documents(
+            case,
+            refresh_stale=job.refresh_stale,
+        )
+        finalize_case_documents(case, docs, generated)
+    except Exception as e:
+        logger.exception("Document job %s failed", job.id)
+        job.status = GenerationStatus.FAILED
+        job.error_message = str(e)
+        fail_queued_documents(case.pk, job.doc_types, str(e))
+    else:
+        job.status = GenerationStatus.FAILED if errors and not generated else GenerationStatus.READY
+        job.errors = errors
+        job.did_generate_any = bool(generated)
+
+    job.finished_at = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "errors",
+            "did_generate_any",
+            "error_message",
+            "finished_at",
+            "updated_at",
+        ]
+    )
+    return job
+
+
+def process_next_job(worker_id: Optional[str] = None) -> Optional[DocumentGenerationJob]:
+    job = claim_next_job(worker_id)
+    if job is None:
+        return None
+    return run_job(job)
+
+
+def run_pending_jobs(worker_id: Optional[str] = None) -> int:
+    """
+    Выполняет задачи из очереди, пока она не опустеет (как run_document_jobs --once).
+    Вызывается в пуле фоновых задач процесса после постановки задачи.
+    """
+    requeue_stale_jobs()
+    processed = 0
+    while process_next_job(worker_id) is not None:
+        processed += 1
+    return processed
+
+
+def build_job_payload(job: DocumentGenerationJob) -> Dict[str, Any]:
+    """
+    Состояние задачи + статусы документов, которые она генерирует.
+    """
+    doc_types = job.doc_types or []
+    documents = [
+        {
+            "id": str(d["id"]),
+            "doc_type": d["doc_type"],
+            "generation_status": d["generation_status"],
+            "error_message": d["error_message"],
+        }
+        for d in (
+            GeneratedDocument.objects
+            .filter(case_id=job.case_id, doc_type__in=doc_types)
+            .order_by("doc_type")
+            .values("id", "doc_type", "generation_status", "error_message")
+        )
+    ]
+    done = sum(
+        1 for d in documents
+        if d["generation_status"] in (GenerationStatus.READY, GenerationStatus.FAILED)
+    )
+
+    return {
+        "job_id": str(job.id),
+        "case_id": str(job.case_id),
+        "status": job.status,
+        "is_finished": job.is_finished,
+        "refresh_stale": job.refresh_stale,
+        "doc_types": doc_types,
+        "progress": {"done": done, "total": len(doc_types)},
+        "documents": documents,
+        "did_generate_any": job.did_generate_any,
+        "errors": job.errors or {},
+        "error_message": job.error_message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
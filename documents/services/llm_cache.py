@@ -0,0 +1,161 @@
+# documents/services/llm_cache.py
+"""
+Персистентный кэш ответов LLM (таблица LLMResponseCache).
+
+Стоит перед llm_client.chat_json и agent_client.chat_json:
+одинаковые промпт + модель + температура + response_format
+возвращают сохранённый JSON без сетевого вызова.
+
+Вытеснение:
+- TTL: LLM_CACHE_TTL_SECONDS (0 — без срока);
+- LRU: при превышении LLM_CACHE_MAX_ENTRIES удаляются записи
+  с самым старым last_used_at.
+evict() запускается из put() раз в LLM_CACHE_EVICT_EVERY сохранений
+(протухшие записи get() и так не отдаёт), а по расписанию —
+manage.py prune_llm_cache.
+
+Любая ошибка кэша только логируется — генерация не должна от него падать.
+"""
+import logging
+import threading
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from documents.models import LLMResponseCache
+from .utils import compute_prompt_hash, sha256_json
+
+logger = logging.getLogger(__name__)
+
+_evict_lock = threading.Lock()
+_puts_since_evict = 0
+
+
+def is_enabled() -> bool:
+    return bool(getattr(settings, "LLM_CACHE_ENABLED", True))
+
+
+def build_cache_key(
+    *,
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    temperature: Optional[float] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+) -> str:
+    return sha256_json(
+        {
+            "model": model,
+            "temperature": temperature,
+            "response_format": response_format,
+            "prompt_hash": compute_prompt_hash(system_prompt, user_prompt),
+        }
+    )
+
+
+def get(key: str) -> Optional[LLMResponseCache]:
+    """
+    Возвращает живую запись кэша и отмечает её использование (для LRU).
+    """
+    if not is_enabled():
+        return None
+
+    now = timezone.now()
+    try:
+        entry = LLMResponseCache.objects.filter(key=key).first()
+        if entry is None:
+            return None
+
+        if entry.expires_at and entry.expires_at <= now:
+            LLMResponseCache.objects.filter(key=key).delete()
+            return None
+
+        LLMResponseCache.objects.filter(key=key).update(
+            hit_count=F("hit_count") + 1,
+            last_used_at=now,
+        )
+    except Exception:
+        logger.exception("LLM cache lookup failed for key=%s", key)
+        return None
+
+    logger.info("LLM cache hit key=%s model=%s", key[:12], entry.model)
+    return entry
+
+
+def put(
+    key: str,
+    *,
+    model: str,
+    system_prompt: str,
+    user_prompt: str,
+    response: Dict[str, Any],
+    raw: str = "",
+) -> None:
+    if not is_enabled():
+        return
+
+    now = timezone.now()
+    ttl = int(getattr(settings, "LLM_CACHE_TTL_SECONDS", 0) or 0)
+
+    try:
+        LLMResponseCache.objects.update_or_create(
+            key=key,
+            defaults={
+                "model": model,
+                "prompt_hash": compute_prompt_hash(system_prompt, user_prompt),
+                "response": response,
+                "raw": raw or "",
+                "last_used_at": now,
+                "expires_at": now + timedelta(seconds=ttl) if ttl else None,
+            },
+        )
+        if _evict_due():
+            evict()
+    except Exception:
+        logger.exception("LLM cache store failed for key=%s", key)
+
+
+def _evict_due() -> bool:
+    """
+    Считает put() процесса: True раз в LLM_CACHE_EVICT_EVERY сохранений.
+    """
+    global _puts_since_evict
+    every = int(getattr(settings, "LLM_CACHE_EVICT_EVERY", 100) or 0)
+    if every <= 0:
+        return False
+    with _evict_lock:
+        _puts_since_evict += 1
+        if _puts_since_evict < every:
+            return False
+        _puts_since_evict = 0
+        return True
+
+
+def evict() -> int:
+    """
+    Удаляет протухшие записи и лишние записи сверх LLM_CACHE_MAX_ENTRIES (LRU).
+    Возвращает количество удалённых записей.
+    """
+    deleted, _ = LLMResponseCache.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    max_entries = int(getattr(settings, "LLM_CACHE_MAX_ENTRIES", 0) or 0)
+    if max_entries:
+        boundary = (
+            LLMResponseCache.objects
+            .order_by("-last_used_at")
+            .values_list("last_used_at", flat=True)[max_entries:max_entries + 1]
+        )
+        boundary = list(boundary)
+        if boundary:
+            lru_deleted, _ = LLMResponseCache.objects.filter(last_used_at__lte=boundary[0]).delete()
+            deleted += lru_deleted
+
+    return deleted
+
+
+def clear() -> int:
+    deleted, _ = LLMResponseCache.objects.all().delete()
+    return deleted
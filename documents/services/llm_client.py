@@ -1,25 +1,59 @@
 import json
 import logging
-from typing import Any, Dict, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from django.conf import settings
-from openai import OpenAI
+
+from . import llm_cache
+from .llm_gateway import chat_completion
 
 logger = logging.getLogger(__name__)
-client = OpenAI()
+
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+Validator = Callable[[Dict[str, Any]], Dict[str, Any]]
 
 
-def chat_json(system_prompt: str, user_prompt: str, *, model: str, temperature: float | None = None) -> Tuple[Dict[str, Any], str]:
+def chat_json(
+    system_prompt: str,
+    user_prompt: str,
+    *,
+    model: str,
+    temperature: float | None = None,
+    use_cache: bool = True,
+    validate: Optional[Validator] = None,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    JSON-ответ модели (через LLMResponseCache).
+    validate (обычно schema.validate артефакта) применяется и к свежему,
+    и к кэшированному ответу; в кэш попадает только ответ, прошедший её, —
+    иначе битый ответ отдавался бы из кэша весь TTL.
+    use_cache=False — не читать кэш (force / перегенерация), свежий ответ
+    всё равно сохраняется.
+    """
     used_temp = settings.OPENAI_TEMPERATURE if temperature is None else float(temperature)
 
-    resp = client.chat.completions.create(
+    cache_key = llm_cache.build_cache_key(
+        model=model,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        temperature=used_temp,
+        response_format=JSON_OBJECT_FORMAT,
+    )
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            data = cached.response
+            return (validate(data) if validate else data), model
+
+    resp = chat_completion(
         model=model,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
         temperature=used_temp,
-        response_format={"type": "json_object"},
+        response_format=JSON_OBJECT_FORMAT,
     )
 
     raw = resp.choices[0].message.content or "{}"
@@ -28,5 +62,89 @@ def chat_json(system_prompt: str, user_prompt: str, *, model: str, temperature:
     except Exception:
         logger.exception("LLM returned non-JSON content: %s", raw[:3000])
         raise
+    validated = validate(data) if validate else data
+
+    llm_cache.put(
+        cache_key,
+        model=model,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        response=data,
+        raw=raw,
+    )
+
+    return validated, model
+
+
+def stream_chat_json(
+    system_prompt: str,
+    user_prompt: str,
+    *,
+    model: str,
+    temperature: float | None = None,
+    use_cache: bool = True,
+    validate: Optional[Validator] = None,
+) -> Iterator[str]:
+    """
+    Потоковый вариант chat_json: отдаёт текстовые дельты JSON-ответа
+    по мере генерации (stream=True). Полный ответ после разбора кладётся
+    в тот же кэш, что и у chat_json (если прошёл validate); при попадании
+    в кэш сразу отдаётся сохранённый сырой ответ одним куском.
+    """
+    used_temp = settings.OPENAI_TEMPERATURE if temperature is None else float(temperature)
+
+    cache_key = llm_cache.build_cache_key(
+        model=model,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        temperature=used_temp,
+        response_format=JSON_OBJECT_FORMAT,
+    )
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            yield cached.raw or json.dumps(cached.response, ensure_ascii=False)
+            return
+
+    stream = chat_completion(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=used_temp,
+        response_format=JSON_OBJECT_FORMAT,
+        stream=True,
+    )
+
+    parts: List[str] = []
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+    raw = "".join(parts) or "{}"
+    try:
+        data = json.loads(raw)
+    except Exception:
+        logger.exception("LLM returned non-JSON content: %s", raw[:3000])
+        raise
+    if validate:
+        validate(data)
 
-    return data, model
+    llm_cache.put(
+        cache_key,
+        model=model,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        response=data,
+        raw=raw,
+    )
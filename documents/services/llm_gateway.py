@@ -0,0 +1,229 @@
+# documents/services/llm_gateway.py
+"""
+Единая точка доступа к OpenAI.
+
+- get_client() / get_async_client() — общие на процесс клиенты
+  с пулом HTTP-соединений (keep-alive) и таймаутами из settings;
+- call_with_retries() / acall_with_retries() — одна политика повторов
+  (экспоненциальный backoff с jitter, Retry-After соблюдается как есть,
+  общее время повторов ограничено LLM_RETRY_DEADLINE) для всех генераторов;
+- chat_completion() / achat_completion() — chat.completions.create через всё это.
+
+LLM_BACKEND выбирает, кто отвечает: "openai" (по умолчанию), "fake" —
+локальный заменитель без сети (fake_llm, для бенчмарков и офлайн-прогонов)
+или dotted path к фабрике build_client(*, asynchronous: bool).
+
+Клиенты создаются лениво при первом обращении, поэтому модуль безопасно
+импортировать без OPENAI_API_KEY и до форка воркеров gunicorn.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+import httpx
+import openai
+from django.conf import settings
+from django.utils.module_loading import import_string
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # включая APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+LLM_BACKENDS = {
+    "fake": "documents.services.fake_llm.build_client",
+}
+
+_lock = threading.Lock()
+_client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(getattr(settings, "LLM_HTTP_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=int(getattr(settings, "LLM_HTTP_MAX_KEEPALIVE", 10)),
+        keepalive_expiry=float(getattr(settings, "LLM_HTTP_KEEPALIVE_EXPIRY", 60)),
+    )
+
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        float(getattr(settings, "LLM_HTTP_TIMEOUT", 300)),
+        connect=float(getattr(settings, "LLM_HTTP_CONNECT_TIMEOUT", 10)),
+    )
+
+
+def _backend_client(asynchronous: bool) -> Optional[Any]:
+    """
+    Клиент не-OpenAI бэкенда по LLM_BACKEND; None — обычный OpenAI.
+    """
+    backend = getattr(settings, "LLM_BACKEND", "openai") or "openai"
+    if backend == "openai":
+        return None
+    factory = import_string(LLM_BACKENDS.get(backend, backend))
+    return factory(asynchronous=asynchronous)
+
+
+def get_client() -> OpenAI:
+    """
+    Общий на процесс OpenAI-клиент (потокобезопасен, переиспользует соединения).
+    Встроенные повторы SDK выключены — повторяем через call_with_retries.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _backend_client(False) or OpenAI(
+                    http_client=httpx.Client(
+                        limits=_http_limits(),
+                        timeout=_http_timeout(),
+                    ),
+                    timeout=_http_timeout(),
+                    max_retries=0,
+                )
+    return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Асинхронный близнец get_client().
+    httpx.AsyncClient привязан к event loop, поэтому используйте его
+    из одного долгоживущего loop (ASGI-воркер, отдельный поток-воркер).
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = _backend_client(True) or AsyncOpenAI(
+                    http_client=httpx.AsyncClient(
+                        limits=_http_limits(),
+                        timeout=_http_timeout(),
+                    ),
+                    timeout=_http_timeout(),
+                    max_retries=0,
+                )
+    return _async_client
+
+
+def reset_clients() -> None:
+    """
+    Закрывает и сбрасывает синхронный клиент (например, после смены настроек
+    или LLM_BACKEND).
+    Асинхронный клиент закрывать нужно из его event loop.
+    """
+    global _client, _async_client
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_client = None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def compute_backoff(attempt: int) -> float:
+    """
+    Экспоненциальный backoff с "full jitter": случайная пауза в [0, base * 2^attempt],
+    но не больше LLM_RETRY_MAX_DELAY.
+    """
+    base = float(getattr(settings, "LLM_RETRY_BASE_DELAY", 1.0))
+    cap = float(getattr(settings, "LLM_RETRY_MAX_DELAY", 20.0))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _next_delay(error: Exception, attempt: int) -> float:
+    # Retry-After не режем: повтор раньше срока снова получит 429
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return retry_after
+    return compute_backoff(attempt)
+
+
+def _retry_deadline() -> float:
+    """
+    Момент (time.monotonic), после которого вызов больше не повторяем.
+    """
+    return time.monotonic() + float(getattr(settings, "LLM_RETRY_DEADLINE", 300.0))
+
+
+def _past_deadline(deadline: float, delay: float) -> bool:
+    return time.monotonic() + delay > deadline
+
+
+def call_with_retries(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    max_retries = int(getattr(settings, "LLM_MAX_RETRIES", 3))
+    deadline = _retry_deadline()
+
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= max_retries:
+                raise
+            delay = _next_delay(e, attempt)
+            if _past_deadline(deadline, delay):
+                raise
+            logger.warning(
+                "LLM call failed (%s), retry %d/%d in %.2fs",
+                type(e).__name__,
+                attempt + 1,
+                max_retries,
+                delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+async def acall_with_retries(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    max_retries = int(getattr(settings, "LLM_MAX_RETRIES", 3))
+    deadline = _retry_deadline()
+
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= max_retries:
+                raise
+            delay = _next_delay(e, attempt)
+            if _past_deadline(deadline, delay):
+                raise
+            logger.warning(
+                "Async LLM call failed (%s), retry %d/%d in %.2fs",
+                type(e).__name__,
+                attempt + 1,
+                max_retries,
+                delay,
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def chat_completion(**kwargs: Any):
+    return call_with_retries(get_client().chat.completions.create, **kwargs)
+
+
+async def achat_completion(**kwargs: Any):
+    return await acall_with_retries(get_async_client().chat.completions.create, **kwargs)
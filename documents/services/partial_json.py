@@ -0,0 +1,163 @@
+# documents/services/partial_json.py
+"""
+Разбор незавершённого JSON, который LLM отдаёт по кусочкам (stream=True).
+
+parse_partial_json() достраивает недописанный текст до валидного JSON:
+закрывает открытую строку и все открытые массивы/объекты. Если так не выходит
+(оборван ключ, число, literal `tru` и т.п.) — откатывается к последней
+«безопасной» границе (после закрытой строки, скобки или перед запятой).
+Он разбирает весь префикс заново, поэтому для потока дельт подходит
+TopLevelObjectParser — он смотрит только на новые символы.
+"""
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _scan(text: str) -> Tuple[bool, bool, str, List[Tuple[int, str]]]:
+    """
+    Возвращает (in_string, escape, closers, safe_points),
+    где safe_points — список (позиция обрезки, закрывающие скобки для неё).
+    """
+    stack: List[str] = []
+    in_string = False
+    escape = False
+    safe: List[Tuple[int, str]] = []
+
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                safe.append((i + 1, "".join(reversed(stack))))
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+            safe.append((i + 1, "".join(reversed(stack))))
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            safe.append((i + 1, "".join(reversed(stack))))
+        elif ch == ",":
+            safe.append((i, "".join(reversed(stack))))
+
+    return in_string, escape, "".join(reversed(stack)), safe
+
+
+def parse_partial_json(text: str) -> Optional[Any]:
+    """
+    Лучшее приближение к итоговому значению по префиксу JSON-текста.
+    None — если из префикса пока ничего не собрать.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    in_string, escape, closers, safe = _scan(text)
+
+    candidates: List[str] = []
+    if in_string:
+        body = text[:-1] if escape else text
+        candidates.append(body + '"' + closers)
+    else:
+        candidates.append(text + closers)
+
+    for pos, pos_closers in reversed(safe):
+        candidates.append(text[:pos] + pos_closers)
+
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+
+    return None
+
+
+def completed_top_level_keys(partial: Any, *, finished: bool) -> List[str]:
+    """
+    Ключи верхнего уровня, значения которых уже дописаны до конца.
+    Пока объект не закрыт, последний ключ может ещё расти — его не считаем.
+    """
+    if not isinstance(partial, dict):
+        return []
+    keys = list(partial.keys())
+    return keys if finished else keys[:-1]
+
+
+class TopLevelObjectParser:
+    """
+    Инкрементальный разбор потока JSON-объекта по дельтам.
+
+    feed(delta) просматривает только новые символы и возвращает пары
+    (ключ, значение) членов верхнего уровня, дописанных этой дельтой
+    (член закончен запятой или закрывающей скобкой объекта). Каждый член
+    разбирается json.loads один раз, так что весь поток — O(длины ответа),
+    а не O(n²), как при parse_partial_json на каждый префикс.
+    """
+
+    def __init__(self) -> None:
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member: List[str] = []
+        self.finished = False
+
+    def feed(self, delta: str) -> List[Tuple[str, Any]]:
+        completed: List[Tuple[str, Any]] = []
+        for ch in delta or "":
+            if self.finished:
+                break
+
+            if self._depth == 0:
+                # всё до открывающей скобки (пробелы и т.п.) пропускаем
+                if ch == "{":
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.finished = True
+                    completed.extend(self._flush())
+                    continue
+            elif ch == "," and self._depth == 1:
+                completed.extend(self._flush())
+                continue
+
+            self._member.append(ch)
+        return completed
+
+    def _flush(self) -> Iterable[Tuple[str, Any]]:
+        member = "".join(self._member).strip()
+        self._member = []
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except ValueError:
+            # битый член не роняет поток — итог всё равно проверит json.loads всего ответа
+            return []
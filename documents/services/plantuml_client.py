@@ -1,33 +1,20 @@
 import logging
 from typing import Optional
 
-import requests
-from django.conf import settings
+from .plantuml_render import render_diagram
 
 logger = logging.getLogger(__name__)
 
-DEFAULT_PLANTUML_SERVER_URL = "https://www.plantuml.com/plantuml/png"
 
-
-def render_plantuml_png(plantuml_text: str, timeout: int = 15) -> Optional[bytes]:
+def render_plantuml_png(plantuml_text: str) -> Optional[bytes]:
     """
-    Отправляет PlantUML-текст на сервер и возвращает бинарник PNG.
+    Рендерит PlantUML-текст в PNG и возвращает бинарник.
 
-    В прототипе используем публичный сервер.
-    В бою URL должен указывать на внутренний PlantUML-сервер банка.
+    Рендер идёт через plantuml_render: локальный пул PlantUML-воркеров
+    (или PlantUML-сервер, см. PLANTUML_RENDER_MODE) с кэшем на диске.
     """
-
-    server_url = getattr(settings, "PLANTUML_SERVER_URL", DEFAULT_PLANTUML_SERVER_URL)
-
     try:
-        # Сервер PlantUML поддерживает POST c raw body
-        resp = requests.post(
-            server_url,
-            data=plantuml_text.encode("utf-8"),
-            timeout=timeout,
-        )
-        resp.raise_for_status()
-        return resp.content
+        return render_diagram(plantuml_text, "png")
     except Exception:
-        logger.exception("Failed to render PlantUML PNG via %s", server_url)
+        logger.exception("Failed to render PlantUML PNG")
         return None
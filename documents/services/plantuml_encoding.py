@@ -0,0 +1,66 @@
+# documents/services/plantuml_encoding.py
+"""
+Кодирование PlantUML-текста в short URL (как в оф. доках): raw deflate + base64
+со своим алфавитом PlantUML.
+
+Алфавит PlantUML — это тот же base64, только с другой таблицей символов,
+поэтому вместо побайтового цикла на Python делаем base64.b64encode (C)
+и одну перекодировку таблицей через bytes.translate (C).
+
+Модуль не зависит от Django — его можно использовать из скриптов.
+"""
+import base64
+import zlib
+
+PLANTUML_ALPHABET = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+_BASE64_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+_TO_PLANTUML = bytes.maketrans(_BASE64_ALPHABET, PLANTUML_ALPHABET)
+_FROM_PLANTUML = bytes.maketrans(PLANTUML_ALPHABET, _BASE64_ALPHABET)
+
+
+def deflate(text: str) -> bytes:
+    """
+    Deflate (wbits=-MAX_WBITS, без zlib-заголовка), уровень 9.
+    """
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def encode_compressed(data: bytes) -> str:
+    """
+    Спец. base64 PlantUML для уже сжатых байт.
+    Неполная последняя тройка байт дополняется нулями (как в эталонной реализации),
+    поэтому символов '=' в результате не бывает.
+    """
+    pad = -len(data) % 3
+    if pad:
+        data += b"\x00" * pad
+    return base64.b64encode(data).translate(_TO_PLANTUML).decode("ascii")
+
+
+def encode_plantuml(text: str) -> str:
+    """
+    Deflate + спец. base64 от PlantUML.
+    Результат — короткая строка, которую подставляем в /png/<code>.
+    """
+    return encode_compressed(deflate(text))
+
+
+def decode_plantuml(code: str) -> str:
+    """
+    Обратное преобразование encode_plantuml (для проверок round-trip).
+    Нулевые байты дополнения после конца deflate-потока игнорируются.
+    """
+    raw = code.strip().encode("ascii")
+    if len(raw) % 4:
+        raise ValueError("Invalid PlantUML encoded string length")
+    if raw.translate(None, PLANTUML_ALPHABET):
+        raise ValueError("Invalid character in PlantUML encoded string")
+
+    compressed = base64.b64decode(raw.translate(_FROM_PLANTUML), validate=True)
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    data = decompressor.decompress(compressed)
+    if not decompressor.eof:
+        raise ValueError("Truncated PlantUML encoded string")
+    return data.decode("utf-8")
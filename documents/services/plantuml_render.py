@@ -0,0 +1,375 @@
+# documents/services/plantuml_render.py
+"""
+Локальный рендер PlantUML-диаграмм с кэшем на диске.
+
+- PlantUMLWorker — долгоживущий процесс `java -jar plantuml.jar -pipe`:
+  JVM стартует один раз, дальше диаграммы идут через stdin/stdout
+  и разделяются маркером -pipedelimitor;
+- пул таких воркеров на каждый формат (png / svg), размер — PLANTUML_POOL_SIZE;
+- если jar недоступен (или PLANTUML_RENDER_MODE="server") — POST на PLANTUML_SERVER_URL;
+  на пути генерации документов сервер не вызывается (см. bpmn_image_export):
+  картинка рендерится лениво, при первом GET /api/diagrams/...;
+- готовые картинки лежат в MEDIA_ROOT/<PLANTUML_CACHE_DIR>/<sha[:2]>/<sha>.<fmt>,
+  где sha — sha256 исходника; рядом хранится сам исходник (<sha>.puml),
+  чтобы недостающий формат можно было отрендерить по запросу.
+
+Документ ссылается на наш URL /api/diagrams/<sha>.<fmt>, поэтому просмотр
+диаграммы больше не ходит на внешний сервер.
+"""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import selectors
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+from django.conf import settings
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+RENDER_MODE_AUTO = "auto"      # локальный jar, если есть, иначе PlantUML-сервер
+RENDER_MODE_LOCAL = "local"    # только локальный jar
+RENDER_MODE_SERVER = "server"  # только PlantUML-сервер (но с кэшем на диске)
+RENDER_MODE_URL = "url"        # ссылка прямо на PlantUML-сервер, без рендера
+
+
+class PlantUMLRenderError(RuntimeError):
+    pass
+
+
+def get_render_mode() -> str:
+    """
+    PLANTUML_RENDER_MODE, а если он не задан — auto при доступном локальном jar
+    (пул JVM + кэш на диске), иначе url, как без jar было всегда.
+    """
+    mode = getattr(settings, "PLANTUML_RENDER_MODE", "")
+    if mode:
+        return mode
+    return RENDER_MODE_AUTO if local_renderer_available() else RENDER_MODE_URL
+
+
+def _render_timeout() -> float:
+    return float(getattr(settings, "PLANTUML_RENDER_TIMEOUT", 30))
+
+
+# ====== пул локальных воркеров ======
+
+
+class PlantUMLWorker:
+    """
+    Один процесс PlantUML в режиме -pipe. Не потокобезопасен —
+    одновременно им пользуется только один поток (это обеспечивает пул).
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self._delimiter = f"__PLANTUML_END_{uuid.uuid4().hex}__".encode("ascii")
+        self._buffer = b""
+        self._process = subprocess.Popen(
+            [
+                getattr(settings, "PLANTUML_JAVA_BIN", "java"),
+                "-Djava.awt.headless=true",
+                "-jar",
+                str(settings.PLANTUML_JAR_PATH),
+                "-pipe",
+                "-pipedelimitor",
+                self._delimiter.decode("ascii"),
+                f"-t{fmt}",
+                "-charset",
+                "UTF-8",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def render(self, source: str, timeout: float) -> bytes:
+        if not self.alive:
+            raise PlantUMLRenderError("PlantUML worker is not running")
+
+        payload = source.strip() + "\n"
+        self._process.stdin.write(payload.encode("utf-8"))
+        self._process.stdin.flush()
+
+        deadline = time.monotonic() + timeout
+        fd = self._process.stdout.fileno()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while True:
+                idx = self._buffer.find(self._delimiter)
+                if idx != -1:
+                    image = self._buffer[:idx]
+                    self._buffer = self._buffer[idx + len(self._delimiter):].lstrip(b"\r\n")
+                    if self._buffer:
+                        # несколько @startuml в одном исходнике — хвост не наш, воркер не переиспользуем
+                        raise PlantUMLRenderError("Unexpected extra output from PlantUML worker")
+                    if not image:
+                        raise PlantUMLRenderError("PlantUML worker returned empty image")
+                    return image
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PlantUMLRenderError("PlantUML worker timed out")
+
+                if not selector.select(remaining):
+                    continue
+
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise PlantUMLRenderError("PlantUML worker exited unexpectedly")
+                self._buffer += chunk
+
+    def close(self) -> None:
+        try:
+            if self._process.stdin:
+                self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+
+class PlantUMLWorkerPool:
+    """
+    Не больше size воркеров на формат; простаивающие воркеры переиспользуются,
+    сломанные (таймаут, падение JVM) — закрываются и создаются заново.
+    """
+
+    def __init__(self, fmt: str, size: int):
+        self.fmt = fmt
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: "queue.LifoQueue[PlantUMLWorker]" = queue.LifoQueue()
+
+    def render(self, source: str, timeout: Optional[float] = None) -> bytes:
+        timeout = _render_timeout() if timeout is None else timeout
+
+        if not self._slots.acquire(timeout=timeout):
+            raise PlantUMLRenderError("No free PlantUML worker")
+
+        worker: Optional[PlantUMLWorker] = None
+        try:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = None
+            if worker is None or not worker.alive:
+                worker = PlantUMLWorker(self.fmt)
+
+            try:
+                image = worker.render(source, timeout)
+            except Exception:
+                worker.close()
+                raise
+
+            self._idle.put(worker)
+            return image
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools_lock = threading.Lock()
+_pools: Dict[str, PlantUMLWorkerPool] = {}
+
+
+def get_worker_pool(fmt: str) -> PlantUMLWorkerPool:
+    pool = _pools.get(fmt)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(fmt)
+            if pool is None:
+                size = int(getattr(settings, "PLANTUML_POOL_SIZE", 2))
+                pool = PlantUMLWorkerPool(fmt, max(1, size))
+                _pools[fmt] = pool
+    return pool
+
+
+@atexit.register
+def shutdown_worker_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def local_renderer_available() -> bool:
+    jar = getattr(settings, "PLANTUML_JAR_PATH", "")
+    java = getattr(settings, "PLANTUML_JAVA_BIN", "java")
+    return bool(jar) and Path(jar).is_file() and shutil.which(java) is not None
+
+
+# ====== рендер через PlantUML-сервер ======
+
+_http = threading.local()
+
+
+def _session() -> requests.Session:
+    session = getattr(_http, "session", None)
+    if session is None:
+        session = requests.Session()
+        _http.session = session
+    return session
+
+
+def _render_via_server(source: str, fmt: str) -> bytes:
+    server = getattr(settings, "PLANTUML_SERVER_URL", "https://www.plantuml.com/plantuml")
+    url = f"{server.rstrip('/')}/{fmt}"
+    resp = _session().post(url, data=source.encode("utf-8"), timeout=_render_timeout())
+    resp.raise_for_status()
+    return resp.content
+
+
+def render_diagram_bytes(source: str, fmt: str = "png", *, local_only: bool = False) -> bytes:
+    """
+    Рендер без кэша: локальный пул воркеров или PlantUML-сервер — по PLANTUML_RENDER_MODE.
+    local_only=True — только локальный jar, без похода на сервер.
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported diagram format: {fmt}")
+
+    mode = RENDER_MODE_LOCAL if local_only else get_render_mode()
+
+    if mode in (RENDER_MODE_AUTO, RENDER_MODE_LOCAL):
+        if local_renderer_available():
+            try:
+                return get_worker_pool(fmt).render(source)
+            except Exception:
+                if mode == RENDER_MODE_LOCAL:
+                    raise
+                logger.exception("Local PlantUML render failed, falling back to server")
+        elif mode == RENDER_MODE_LOCAL:
+            raise PlantUMLRenderError("PLANTUML_JAR_PATH is not configured or java is missing")
+
+    return _render_via_server(source, fmt)
+
+
+# ====== кэш на диске ======
+
+
+def _normalize_source(source: str) -> str:
+    return source.strip() + "\n"
+
+
+def diagram_digest(source: str) -> str:
+    return hashlib.sha256(_normalize_source(source).encode("utf-8")).hexdigest()
+
+
+def _cache_dir(digest: str) -> Path:
+    subdir = getattr(settings, "PLANTUML_CACHE_DIR", "diagrams")
+    return Path(settings.MEDIA_ROOT) / subdir / digest[:2]
+
+
+def get_cached_diagram_path(digest: str, fmt: str) -> Path:
+    return _cache_dir(digest) / f"{digest}.{fmt}"
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def store_diagram_source(source: str) -> str:
+    """
+    Кладёт исходник в кэш (<sha>.puml), чтобы картинку можно было
+    отрендерить по запросу; возвращает sha.
+    """
+    digest = diagram_digest(source)
+    source_path = get_cached_diagram_path(digest, "puml")
+    if not source_path.exists():
+        _atomic_write(source_path, _normalize_source(source).encode("utf-8"))
+    return digest
+
+
+def get_or_render_diagram(source: str, fmt: str = "png", *, local_only: bool = False) -> Path:
+    """
+    Путь к отрендеренной диаграмме в кэше; рендерит только при промахе.
+    """
+    digest = diagram_digest(source)
+    path = get_cached_diagram_path(digest, fmt)
+    if path.exists():
+        return path
+
+    store_diagram_source(source)
+    _atomic_write(path, render_diagram_bytes(source, fmt, local_only=local_only))
+    return path
+
+
+def render_diagram(source: str, fmt: str = "png") -> bytes:
+    """
+    Байты картинки через кэш (для DOCX, вложений и т.п.).
+    """
+    return get_or_render_diagram(source, fmt).read_bytes()
+
+
+def diagram_exists(digest: str, fmt: str) -> bool:
+    """
+    Знаем ли мы такую диаграмму: есть готовая картинка или исходник для рендера.
+    """
+    return (
+        get_cached_diagram_path(digest, fmt).exists()
+        or get_cached_diagram_path(digest, "puml").exists()
+    )
+
+
+def get_or_render_by_digest(digest: str, fmt: str) -> Optional[Path]:
+    """
+    Для отдачи по URL: берёт картинку из кэша или рендерит её
+    из сохранённого исходника. None — если такой диаграммы мы не знаем.
+    """
+    path = get_cached_diagram_path(digest, fmt)
+    if path.exists():
+        return path
+
+    source_path = get_cached_diagram_path(digest, "puml")
+    if not source_path.exists():
+        return None
+
+    return get_or_render_diagram(source_path.read_text(encoding="utf-8"), fmt)
+
+
+def build_diagram_url(digest: str, fmt: str = "png") -> str:
+    """
+    Наш URL картинки. Если задан PUBLIC_BASE_URL — абсолютный,
+    иначе путь от корня сайта (абсолютным его делают view/сериализатор).
+    """
+    path = reverse("diagram-image", kwargs={"digest": digest, "fmt": fmt})
+    base = getattr(settings, "PUBLIC_BASE_URL", "")
+    return base.rstrip("/") + path if base else path
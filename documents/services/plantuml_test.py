@@ -5,12 +5,15 @@
 2) Кодирует его так же, как делает PlantUML (deflate + спец. base64).
 3) Шлёт GET на PLANTUML_SERVER_URL/png/<код>.
 4) Сохраняет картинку в plantuml_test.png рядом с файлом.
+
+Запуск из корня проекта: python -m documents.services.plantuml_test
 """
 
 import os
-import zlib
 import requests
 
+from documents.services.plantuml_encoding import decode_plantuml, encode_plantuml
+
 
 # ===== 1. Настройки =====
 
@@ -75,58 +78,7 @@ endif
 
 
 # ===== 3. Кодирование PlantUML =====
-
-def _encode6bit(b: int) -> str:
-    if b < 10:
-        return chr(48 + b)
-    b -= 10
-    if b < 26:
-        return chr(65 + b)
-    b -= 26
-    if b < 26:
-        return chr(97 + b)
-    b -= 26
-    if b == 0:
-        return "-"
-    if b == 1:
-        return "_"
-    return "?"
-
-
-def _append3bytes(b1: int, b2: int, b3: int) -> str:
-    c1 = b1 >> 2
-    c2 = ((b1 & 0x3) << 4) | (b2 >> 4)
-    c3 = ((b2 & 0xF) << 2) | (b3 >> 6)
-    c4 = b3 & 0x3F
-
-    r = ""
-    r += _encode6bit(c1 & 0x3F)
-    r += _encode6bit(c2 & 0x3F)
-    r += _encode6bit(c3 & 0x3F)
-    r += _encode6bit(c4 & 0x3F)
-    return r
-
-
-def encode_plantuml(text: str) -> str:
-    """
-    Deflate (wbits=-15) + спец. base64 от PlantUML.
-    """
-    data = text.encode("utf-8")
-    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
-    compressed = compressor.compress(data) + compressor.flush()
-
-    res = []
-    i = 0
-    length = len(compressed)
-    while i < length:
-        b1 = compressed[i]
-        b2 = compressed[i + 1] if i + 1 < length else 0
-        b3 = compressed[i + 2] if i + 2 < length else 0
-        res.append(_append3bytes(b1, b2, b3))
-        i += 3
-
-    return "".join(res)
-
+# Общий кодировщик: documents/services/plantuml_encoding.py
 
 def build_plantuml_url(code: str) -> str:
     encoded = encode_plantuml(code)
@@ -140,6 +92,7 @@ def main():
     print("Пример PlantUML-кода:\n", EXAMPLE_PLANTUML, "\n")
 
     url = build_plantuml_url(EXAMPLE_PLANTUML)
+    assert decode_plantuml(url.rsplit("/", 1)[1]) == EXAMPLE_PLANTUML
     print("GET", url)
 
     resp = requests.get(url, timeout=30)
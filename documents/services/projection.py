@@ -0,0 +1,79 @@
+# documents/services/projection.py
+"""
+Проекции документов для списков: тяжёлые колонки (content, structured_data —
+у диаграмм там ещё и сырой ответ LLM) не читаются из БД, если они не нужны.
+
+- ?fields=id,title,... — выбор полей ответа (parse_fields_param);
+- only_fields_for() — какие колонки модели нужны под выбранные поля сериализатора;
+- light_documents() — queryset без тяжёлых колонок + флаг has_structured_data,
+  которого хватает для проверок вида «документ уже сгенерирован».
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db.models import BooleanField, ExpressionWrapper, Q, QuerySet
+
+HEAVY_DOCUMENT_FIELDS = ("content", "structured_data")
+
+# поля сериализатора, которые вычисляются из других колонок модели
+DERIVED_FIELD_SOURCES: Dict[str, Tuple[str, ...]] = {
+    "docx_url": ("docx_file",),
+    # версии: содержимое delta-версий восстанавливается из keyframe
+    "content": ("content", "storage", "base_version", "delta", "document"),
+    "structured_data": ("structured_data", "storage", "base_version", "delta", "document"),
+}
+
+
+def parse_fields_param(request, param: str = "fields") -> Optional[List[str]]:
+    """
+    ?fields=id,title,status -> ["id", "title", "status"]; None — параметр не передан.
+    """
+    if request is None:
+        return None
+    raw = request.query_params.get(param)
+    if raw is None:
+        return None
+    return [f.strip() for f in raw.split(",") if f.strip()]
+
+
+def only_fields_for(
+    model,
+    fields: Iterable[str],
+    *,
+    always: Sequence[str] = ("id",),
+) -> List[str]:
+    """
+    Колонки модели для .only() под набор полей сериализатора
+    (вычисляемые поля раскрываются через DERIVED_FIELD_SOURCES).
+    """
+    concrete = {f.name for f in model._meta.concrete_fields}
+    columns: List[str] = list(always)
+    for name in fields:
+        for source in DERIVED_FIELD_SOURCES.get(name, (name,)):
+            if source in concrete and source not in columns:
+                columns.append(source)
+    return columns
+
+
+def light_documents(queryset: QuerySet, include: Iterable[str] = ()) -> QuerySet:
+    """
+    Документы без content/structured_data (кроме перечисленных в include),
+    но с has_structured_data.
+    """
+    deferred = [f for f in HEAVY_DOCUMENT_FIELDS if f not in set(include)]
+    return queryset.defer(*deferred).annotate(
+        has_structured_data=ExpressionWrapper(
+            Q(structured_data__isnull=False) & ~Q(structured_data={}),
+            output_field=BooleanField(),
+        )
+    )
+
+
+def has_structured_data(doc) -> bool:
+    """
+    Есть ли у документа structured_data — без чтения колонки,
+    если документ получен через light_documents().
+    """
+    flag = getattr(doc, "has_structured_data", None)
+    if flag is not None:
+        return bool(flag)
+    return bool(doc.structured_data)
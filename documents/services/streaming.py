@@ -0,0 +1,211 @@
+# documents/services/streaming.py
+"""
+Потоковая генерация Vision/Scope.
+
+stream_document_generation() читает ответ LLM по кусочкам, на лету разбирает
+незавершённый JSON (partial_json) и отдаёт готовые разделы документа
+по мере их появления — клиент видит первый раздел через секунды,
+а не после полной генерации. В конце документ валидируется, рендерится
+и сохраняется тем же путём, что и в ensure_case_documents.
+"""
+import json
+import logging
+from typing import Any, Dict, Iterator, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from cases.models import Case
+from documents.models import DocumentStatus, DocumentType, GeneratedDocument, GenerationStatus
+
+from .artifacts.scope import generator as scope_generator
+from .artifacts.scope import schema as scope_schema
+from .artifacts.vision import generator as vision_generator
+from .artifacts.vision import schema as vision_schema
+from .context_builder import build_source_snapshot_hash, get_case_context, scope_case_context
+from .dispatcher import render_text_document
+from .ensure import (
+    finalize_case_documents,
+    is_generation_in_flight,
+    mark_generation_failed,
+    save_generated_document,
+)
+from .partial_json import TopLevelObjectParser, completed_top_level_keys
+
+logger = logging.getLogger(__name__)
+
+STREAMABLE_DOC_TYPES = {
+    DocumentType.VISION: (vision_generator, vision_schema),
+    DocumentType.SCOPE: (scope_generator, scope_schema),
+}
+
+StreamEvent = Tuple[str, Dict[str, Any]]
+
+
+class StreamingNotSupported(ValueError):
+    pass
+
+
+def _reserve_document(case: Case, doc_type: str, snapshot_hash: str) -> bool:
+    """
+    Помечает документ как GENERATING под локом кейса.
+    False — если по документу уже идёт генерация.
+    """
+    with transaction.atomic():
+        locked_case = Case.objects.select_for_update().get(pk=case.pk)
+        doc = GeneratedDocument.objects.filter(case=locked_case, doc_type=doc_type).first()
+
+        if doc and is_generation_in_flight(doc):
+            return False
+
+        if doc and doc.structured_data:
+            # старое содержимое не трогаем, пока не готова новая версия
+            GeneratedDocument.objects.filter(pk=doc.pk).update(
+                generation_status=GenerationStatus.GENERATING,
+                error_message=None,
+                updated_at=timezone.now(),
+            )
+            return True
+
+        GeneratedDocument.objects.update_or_create(
+            case=locked_case,
+            doc_type=doc_type,
+            defaults={
+                "generation_status": GenerationStatus.GENERATING,
+                "error_message": None,
+                "status": DocumentStatus.DRAFT,
+                "title": f"{doc_type}: {locked_case.title}",
+                "content": "",
+                "structured_data": None,
+                "source_snapshot_hash": snapshot_hash,
+            },
+        )
+        return True
+
+
+def _abort_generation(case_id, doc_type: str) -> None:
+    """
+    Клиент отключился посреди генерации: документ не должен висеть
+    в GENERATING до DOCUMENTS_GENERATION_TIMEOUT. Если у документа было
+    прежнее содержимое — оно остаётся актуальным (READY), иначе FAILED.
+    """
+    in_flight = GeneratedDocument.objects.filter(
+        case_id=case_id,
+        doc_type=doc_type,
+        generation_status=GenerationStatus.GENERATING,
+    )
+    in_flight.filter(structured_data__isnull=False).update(
+        generation_status=GenerationStatus.READY,
+        updated_at=timezone.now(),
+    )
+    in_flight.filter(structured_data__isnull=True).update(
+        generation_status=GenerationStatus.FAILED,
+        error_message="Generation aborted: client disconnected",
+        updated_at=timezone.now(),
+    )
+
+
+def _document_payload(doc: GeneratedDocument) -> Dict[str, Any]:
+    return {
+        "id": str(doc.id),
+        "doc_type": doc.doc_type,
+        "title": doc.title,
+        "content": doc.content,
+        "generation_status": doc.generation_status,
+        "llm_model": doc.llm_model,
+    }
+
+
+def _replay_sections(doc: GeneratedDocument) -> Iterator[StreamEvent]:
+    structured = doc.structured_data or {}
+    for key, value in structured.items():
+        yield "section", {"doc_type": doc.doc_type, "key": key, "value": value}
+    yield "done", {"document": _document_payload(doc), "cached": True}
+
+
+def stream_document_generation(
+    case: Case,
+    doc_type: str,
+    *,
+    force: bool = False,
+) -> Iterator[StreamEvent]:
+    """
+    Генератор событий (event, payload):
+    - "section" — очередной полностью дописанный раздел верхнего уровня;
+    - "done"    — документ сохранён (DOCX собран), payload["document"];
+    - "error"   — генерация не удалась или уже идёт в другом процессе.
+
+    Без force уже сгенерированный документ не перегенерируется —
+    его разделы сразу отдаются из structured_data.
+    """
+    if doc_type not in STREAMABLE_DOC_TYPES:
+        raise StreamingNotSupported(f"Streaming is not supported for doc_type: {doc_type}")
+
+    generator, schema = STREAMABLE_DOC_TYPES[doc_type]
+
+    if not force:
+        existing = GeneratedDocument.objects.filter(case=case, doc_type=doc_type).first()
+        if existing and existing.structured_data and not is_generation_in_flight(existing):
+            yield from _replay_sections(existing)
+            return
+
+    case_context = scope_case_context(get_case_context(case), doc_type)
+    snapshot_hash = build_source_snapshot_hash(case, doc_type, case_context=case_context)
+
+    if not _reserve_document(case, doc_type, snapshot_hash):
+        yield "error", {"doc_type": doc_type, "detail": "Document is already being generated."}
+        return
+
+    deltas = None
+    try:
+        # force — пользователь просит новый вариант, а не ответ из кэша LLM
+        deltas, used_model = generator.stream(case_context, use_cache=not force)
+
+        buffer = []
+        sent = set()
+        parser = TopLevelObjectParser()
+        for delta in deltas:
+            buffer.append(delta)
+            for key, value in parser.feed(delta):
+                if key in sent:
+                    continue
+                sent.add(key)
+                yield "section", {"doc_type": doc_type, "key": key, "value": value}
+
+        raw = "".join(buffer) or "{}"
+        data = json.loads(raw)
+        for key in completed_top_level_keys(data, finished=True):
+            if key not in sent:
+                sent.add(key)
+                yield "section", {"doc_type": doc_type, "key": key, "value": data[key]}
+
+        structured = schema.validate(data)
+        content, title = render_text_document(doc_type, structured, case_context)
+        doc = save_generated_document(
+            case.pk,
+            doc_type,
+            (structured, content, title, used_model),
+            case_context=case_context,
+            snapshot_hash=snapshot_hash,
+        )
+        finalize_case_documents(case, [doc], generated=[doc_type])
+
+    except GeneratorExit:
+        # клиент закрыл соединение — GeneratorExit не Exception, ловим отдельно
+        logger.info("Client disconnected while streaming doc_type=%s for case=%s", doc_type, case.pk)
+        _abort_generation(case.pk, doc_type)
+        raise
+
+    except Exception as e:
+        logger.exception("Failed streaming doc_type=%s for case=%s", doc_type, case.pk)
+        mark_generation_failed(case.pk, doc_type, e)
+        yield "error", {"doc_type": doc_type, "detail": str(e)}
+        return
+
+    finally:
+        # прерываем чтение ответа LLM, если вышли раньше его конца
+        close = getattr(deltas, "close", None)
+        if close is not None:
+            close()
+
+    yield "done", {"document": _document_payload(doc), "cached": False}
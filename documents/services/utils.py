@@ -10,3 +10,11 @@ def sha256_text(text: str) -> str:
 def sha256_json(data: Dict[str, Any]) -> str:
     dumped = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
     return sha256_text(dumped)
+
+
+def compute_prompt_hash(system_prompt: str, user_prompt: str) -> str:
+    """
+    Хешируем фактические строковые промпты (system + user),
+    чтобы понимать, когда документ устарел.
+    """
+    return sha256_text(system_prompt + "\n---\n" + user_prompt)
@@ -0,0 +1,386 @@
+# documents/services/version_store.py
+"""
+Хранилище версий документа: keyframe + delta.
+
+Каждая DOCUMENT_VERSION_KEYFRAME_INTERVAL-я версия (и первая) — полный снэпшот
+(storage=full). Остальные хранят только разницу с последним keyframe (storage=delta):
+- content — построчный diff (difflib): ["=", n] / ["-", n] / ["+", [строки]];
+- structured_data — JSON Patch (RFC 6902: add / remove / replace);
+- title хранится всегда — он нужен списку версий и весит немного.
+
+Delta считается от keyframe, а не от предыдущей версии, поэтому восстановление —
+это всегда keyframe + одна delta. Если delta выходит больше
+DOCUMENT_VERSION_DELTA_MAX_RATIO от полного снэпшота — пишем новый keyframe.
+Недавно восстановленные версии держим в небольшом LRU (DOCUMENT_VERSION_LRU_SIZE).
+"""
+import copy
+import difflib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from documents.models import DocumentVersion, GeneratedDocument, VersionStorage
+
+VersionPayload = Dict[str, Any]  # {"title", "content", "structured_data"}
+
+
+# ====== текстовый diff ======
+
+
+def diff_text(old: str, new: str) -> List[list]:
+    old_lines = (old or "").splitlines(keepends=True)
+    new_lines = (new or "").splitlines(keepends=True)
+
+    ops: List[list] = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i2 - i1])
+            continue
+        if tag in ("delete", "replace"):
+            ops.append(["-", i2 - i1])
+        if tag in ("insert", "replace"):
+            ops.append(["+", new_lines[j1:j2]])
+    return ops
+
+
+def apply_text_diff(old: str, ops: List[list]) -> str:
+    old_lines = (old or "").splitlines(keepends=True)
+    out: List[str] = []
+    pos = 0
+    for op, arg in ops:
+        if op == "=":
+            out.extend(old_lines[pos:pos + arg])
+            pos += arg
+        elif op == "-":
+            pos += arg
+        elif op == "+":
+            out.extend(arg)
+        else:
+            raise ValueError(f"Unknown text diff op: {op}")
+    return "".join(out)
+
+
+# ====== JSON Patch ======
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def diff_json(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """
+    Минимальный JSON Patch old -> new (без move/copy).
+    """
+    ops: List[Dict[str, Any]] = []
+    _diff_json(old, new, path, ops)
+    return ops
+
+
+def _diff_json(old: Any, new: Any, path: str, ops: List[Dict[str, Any]]) -> None:
+    # контейнеры сравниваем поэлементно: в Python {"a": 1} == {"a": True},
+    # а в JSON это разные значения
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                _diff_json(old[key], value, child, ops)
+        return
+
+    if isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for i in range(common):
+            _diff_json(old[i], new[i], f"{path}/{i}", ops)
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        return
+
+    if old == new and type(old) is type(new):
+        return
+
+    ops.append({"op": "replace", "path": path, "value": new})
+
+
+def apply_json_patch(doc: Any, ops: List[Dict[str, Any]]) -> Any:
+    result = copy.deepcopy(doc)
+    for op in ops:
+        path = op["path"]
+        if path == "":
+            if op["op"] == "remove":
+                result = None
+            else:
+                result = copy.deepcopy(op["value"])
+            continue
+
+        tokens = [_unescape(t) for t in path.split("/")[1:]]
+        parent = result
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = int(last)
+            if op["op"] == "add":
+                parent.insert(index, copy.deepcopy(op["value"]))
+            elif op["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(op["value"])
+        else:
+            if op["op"] == "remove":
+                del parent[last]
+            else:
+                parent[last] = copy.deepcopy(op["value"])
+    return result
+
+
+# ====== keyframe + delta ======
+
+
+def _keyframe_interval() -> int:
+    return max(1, int(getattr(settings, "DOCUMENT_VERSION_KEYFRAME_INTERVAL", 10)))
+
+
+def _delta_max_ratio() -> float:
+    return float(getattr(settings, "DOCUMENT_VERSION_DELTA_MAX_RATIO", 0.5))
+
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def build_delta(base: VersionPayload, target: VersionPayload) -> Dict[str, Any]:
+    delta: Dict[str, Any] = {}
+    if (base.get("content") or "") != (target.get("content") or ""):
+        delta["content"] = diff_text(base.get("content") or "", target.get("content") or "")
+    structured_ops = diff_json(base.get("structured_data"), target.get("structured_data"))
+    if structured_ops:
+        delta["structured_data"] = structured_ops
+    return delta
+
+
+def apply_delta(base: VersionPayload, delta: Dict[str, Any], title: str) -> VersionPayload:
+    content = base.get("content") or ""
+    if "content" in delta:
+        content = apply_text_diff(content, delta["content"])
+
+    structured = base.get("structured_data")
+    if "structured_data" in delta:
+        structured = apply_json_patch(structured, delta["structured_data"])
+    else:
+        structured = copy.deepcopy(structured)
+
+    return {"title": title, "content": content, "structured_data": structured}
+
+
+def encode_version_fields(
+    payload: VersionPayload,
+    version_number: int,
+    keyframe: Optional[DocumentVersion],
+) -> Dict[str, Any]:
+    """
+    Поля DocumentVersion для новой версии: полный снэпшот или delta к keyframe.
+    """
+    full = {
+        "title": payload["title"],
+        "content": payload.get("content") or "",
+        "structured_data": payload.get("structured_data"),
+        "storage": VersionStorage.FULL,
+        "base_version": None,
+        "delta": None,
+    }
+
+    if keyframe is None or version_number - keyframe.version >= _keyframe_interval():
+        return full
+
+    delta = build_delta(_payload_of(keyframe), payload)
+    full_size = _size(payload.get("content") or "") + _size(payload.get("structured_data"))
+    if _size(delta) > full_size * _delta_max_ratio():
+        return full
+
+    return {
+        "title": payload["title"],
+        "content": "",
+        "structured_data": None,
+        "storage": VersionStorage.DELTA,
+        "base_version": keyframe.version,
+        "delta": delta,
+    }
+
+
+def _payload_of(version: DocumentVersion) -> VersionPayload:
+    return {
+        "title": version.title,
+        "content": version.content,
+        "structured_data": version.structured_data,
+    }
+
+
+def get_latest_keyframe(document_id) -> Optional[DocumentVersion]:
+    return (
+        DocumentVersion.objects
+        .filter(document_id=document_id, storage=VersionStorage.FULL)
+        .order_by("-version")
+        .first()
+    )
+
+
+def create_version(
+    document: GeneratedDocument,
+    version_number: int,
+    reason: Optional[str] = None,
+) -> DocumentVersion:
+    payload = {
+        "title": document.title,
+        "content": document.content,
+        "structured_data": document.structured_data,
+    }
+    fields = encode_version_fields(payload, version_number, get_latest_keyframe(document.pk))
+
+    version = DocumentVersion.objects.create(
+        document=document,
+        version=version_number,
+        reason=reason,
+        **fields,
+    )
+    _cache_put(version.pk, payload)
+    return version
+
+
+# ====== восстановление + LRU ======
+
+_lru_lock = threading.Lock()
+_lru: "OrderedDict[Any, VersionPayload]" = OrderedDict()
+
+
+def _cache_get(key) -> Optional[VersionPayload]:
+    with _lru_lock:
+        payload = _lru.get(key)
+        if payload is None:
+            return None
+        _lru.move_to_end(key)
+    return copy.deepcopy(payload)
+
+
+def _cache_put(key, payload: VersionPayload) -> None:
+    size = int(getattr(settings, "DOCUMENT_VERSION_LRU_SIZE", 128))
+    if size <= 0:
+        return
+    with _lru_lock:
+        _lru[key] = copy.deepcopy(payload)
+        _lru.move_to_end(key)
+        while len(_lru) > size:
+            _lru.popitem(last=False)
+
+
+def clear_version_cache() -> None:
+    with _lru_lock:
+        _lru.clear()
+
+
+def get_version_payloads(versions: Iterable[DocumentVersion]) -> Dict[Any, VersionPayload]:
+    """
+    Полное содержимое версий {version.pk: payload}. Нужные keyframe'ы
+    подгружаются одним запросом на всю пачку.
+    """
+    versions = list(versions)
+    result: Dict[Any, VersionPayload] = {}
+    pending: List[DocumentVersion] = []
+
+    for version in versions:
+        if version.storage != VersionStorage.DELTA:
+            result[version.pk] = _payload_of(version)
+            continue
+        cached = _cache_get(version.pk)
+        if cached is not None:
+            result[version.pk] = cached
+        else:
+            pending.append(version)
+
+    if pending:
+        wanted = {(v.document_id, v.base_version) for v in pending}
+        keyframes = {
+            (k.document_id, k.version): k
+            for k in DocumentVersion.objects.filter(
+                document_id__in={doc_id for doc_id, _ in wanted},
+                version__in={number for _, number in wanted},
+                storage=VersionStorage.FULL,
+            ).only("id", "document_id", "version", "title", "content", "structured_data")
+        }
+        for version in pending:
+            keyframe = keyframes.get((version.document_id, version.base_version))
+            if keyframe is None:
+                raise DocumentVersion.DoesNotExist(
+                    f"Keyframe v{version.base_version} for version {version.pk} not found"
+                )
+            payload = apply_delta(_payload_of(keyframe), version.delta or {}, version.title)
+            _cache_put(version.pk, payload)
+            result[version.pk] = payload
+
+    return result
+
+
+def get_version_payload(version: DocumentVersion) -> VersionPayload:
+    return get_version_payloads([version])[version.pk]
+
+
+# ====== перепаковка существующих версий ======
+
+
+def compact_document_versions(document_id, *, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Перекодирует все версии документа по текущей политике keyframe/delta.
+    Возвращает {"versions", "keyframes", "bytes_before", "bytes_after"}.
+    """
+    versions = list(DocumentVersion.objects.filter(document_id=document_id).order_by("version"))
+    payloads = get_version_payloads(versions)
+
+    stats = {"versions": len(versions), "keyframes": 0, "bytes_before": 0, "bytes_after": 0}
+    keyframe: Optional[DocumentVersion] = None
+    to_update: List[DocumentVersion] = []
+
+    for version in versions:
+        stats["bytes_before"] += _stored_size(version)
+
+        fields = encode_version_fields(payloads[version.pk], version.version, keyframe)
+        for name, value in fields.items():
+            setattr(version, name, value)
+        if version.storage == VersionStorage.FULL:
+            keyframe = version
+            stats["keyframes"] += 1
+
+        stats["bytes_after"] += _stored_size(version)
+        to_update.append(version)
+
+    if not dry_run and to_update:
+        DocumentVersion.objects.bulk_update(
+            to_update,
+            ["title", "content", "structured_data", "storage", "base_version", "delta"],
+            batch_size=200,
+        )
+        for version in to_update:
+            _cache_put(version.pk, payloads[version.pk])
+
+    return stats
+
+
+def _stored_size(version: DocumentVersion) -> int:
+    return (
+        len((version.content or "").encode("utf-8"))
+        + (_size(version.structured_data) if version.structured_data is not None else 0)
+        + (_size(version.delta) if version.delta is not None else 0)
+    )
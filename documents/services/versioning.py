@@ -1,23 +1,58 @@
 from typing import Optional
 
-from django.db.models import Max
+from django.db import connection, transaction
+from django.db.models import F
 
 from documents.models import GeneratedDocument, DocumentVersion
 
+from .version_store import create_version
+
+
+def _supports_update_returning() -> bool:
+    if connection.vendor == "postgresql":
+        return True
+    if connection.vendor == "sqlite":
+        import sqlite3
+
+        return sqlite3.sqlite_version_info >= (3, 35, 0)
+    return False
+
 
 def get_next_version_number(document: GeneratedDocument) -> int:
     """
-    Возвращает следующий номер версии документа.
+    Атомарно выдаёт следующий номер версии документа:
+    UPDATE ... SET current_version = current_version + 1 (RETURNING, где поддерживается).
+    Строка документа остаётся заблокированной до конца транзакции,
+    поэтому параллельные снэпшоты получают разные номера без MAX() и без гонок.
+    Вызывать внутри transaction.atomic().
     """
-    latest = (
-        DocumentVersion.objects
-        .filter(document=document)
-        .aggregate(max_ver=Max("version"))
-        .get("max_ver")
-    )
-    if latest is None:
-        return 1
-    return latest + 1
+    table = GeneratedDocument._meta.db_table
+    if _supports_update_returning():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {connection.ops.quote_name(table)} "
+                "SET current_version = current_version + 1 "
+                "WHERE id = %s RETURNING current_version",
+                [GeneratedDocument._meta.pk.get_db_prep_value(document.pk, connection)],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise GeneratedDocument.DoesNotExist(f"Document {document.pk} not found")
+        number = row[0]
+    else:
+        updated = GeneratedDocument.objects.filter(pk=document.pk).update(
+            current_version=F("current_version") + 1
+        )
+        if not updated:
+            raise GeneratedDocument.DoesNotExist(f"Document {document.pk} not found")
+        number = (
+            GeneratedDocument.objects.filter(pk=document.pk)
+            .values_list("current_version", flat=True)
+            .get()
+        )
+
+    document.current_version = number
+    return number
 
 
 def create_document_version_snapshot(
@@ -25,15 +60,9 @@ def create_document_version_snapshot(
     reason: Optional[str] = None,
 ) -> DocumentVersion:
     """
-    Создаёт снэпшот текущего состояния документа как новую версию.
+    Создаёт снэпшот текущего состояния документа как новую версию
+    (полный keyframe или delta — решает version_store).
     """
-    version_number = get_next_version_number(document)
-
-    return DocumentVersion.objects.create(
-        document=document,
-        version=version_number,
-        title=document.title,
-        content=document.content,
-        structured_data=document.structured_data,
-        reason=reason,
-    )
\ No newline at end of file
+    with transaction.atomic():
+        version_number = get_next_version_number(document)
+        return create_version(document, version_number, reason=reason)
@@ -0,0 +1,213 @@
+# documents/testing.py
+"""
+Общие помощники для тестов и проверочных management-команд:
+фикстуры кейсов с документами, JWT-клиент, проверка бюджетов запросов,
+конкурентные правки версий и EXPLAIN горячих запросов.
+"""
+import threading
+import uuid
+from collections import Counter
+
+from django.db import connection, connections
+from django.urls import resolve
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import CookieJWTAuthentication
+from cases.models import Case, CaseStatus, FollowupQuestion, FollowupQuestionStatus
+from documents.models import DocumentStatus, DocumentType, GeneratedDocument, GenerationStatus
+from documents.services.context_builder import clear_case_context_cache
+from documents.services.versioning import create_document_version_snapshot
+from forte_ai_back.query_budget import get_view_budget
+
+ALL_DOC_TYPES = [
+    DocumentType.VISION,
+    DocumentType.SCOPE,
+    DocumentType.BPMN,
+    DocumentType.CONTEXT_DIAGRAM,
+    DocumentType.UML_USE_CASE_DIAGRAM,
+]
+
+
+def first_answers(case):
+    question = case.followup_questions.order_by("order_index").first()
+    return {"answers": [{"question_id": str(question.id), "answer": "Ответ"}]}
+
+
+class QueryBudgetTestMixin:
+    """
+    Для TestCase: запрос с настоящим JWT ровно за expected запросов,
+    и expected укладывается в query_budgets view. Кэш контекста кейса
+    сбрасывается — бюджет считается для холодного процесса.
+    """
+
+    def assertRequestQueries(self, client, method, path, expected, data=None):
+        budget = get_view_budget(resolve(path.split("?")[0]).func, method)
+        self.assertIsNotNone(budget, f"{method} {path} has no query budget")
+        self.assertLessEqual(expected, budget, f"{method} {path}: budget {budget}")
+
+        clear_case_context_cache()
+        with self.assertNumQueries(expected):
+            response = getattr(client, method.lower())(path, data, format="json")
+        self.assertLess(response.status_code, 400, getattr(response, "data", None))
+        return response
+
+
+def jwt_client(user) -> APIClient:
+    """
+    APIClient, который ходит с access-токеном пользователя, как фронт.
+    """
+    client = APIClient()
+    client.cookies[CookieJWTAuthentication.access_cookie_name] = str(AccessToken.for_user(user))
+    return client
+
+
+def make_case(doc_types):
+    """
+    Кейс с уже готовыми документами: ensure/finalize не ходят в LLM, DOCX и PlantUML.
+    На каждый тип документа — по уточняющему вопросу.
+    """
+    case = Case.objects.create(
+        title=f"query budget {uuid.uuid4().hex[:8]}",
+        status=CaseStatus.IN_PROGRESS,
+        selected_document_types=list(doc_types),
+    )
+    FollowupQuestion.objects.bulk_create(
+        FollowupQuestion(
+            case=case,
+            order_index=index,
+            code=f"q_{doc_type}",
+            text=f"Вопрос по {doc_type}?",
+            target_document_types=[doc_type],
+        )
+        for index, doc_type in enumerate(doc_types)
+    )
+    docs = []
+    for doc_type in doc_types:
+        doc = GeneratedDocument(
+            case=case,
+            doc_type=doc_type,
+            title=doc_type,
+            content="content",
+            structured_data={"plantuml": "@startuml\n@enduml"},
+            status=DocumentStatus.DRAFT,
+            generation_status=GenerationStatus.READY,
+        )
+        if doc_type in (DocumentType.VISION, DocumentType.SCOPE):
+            doc.docx_file.name = f"generated_docs/{case.id}_{doc_type}.docx"
+        else:
+            doc.diagram_url = f"https://example.invalid/{doc_type}.png"
+        docs.append(doc)
+    GeneratedDocument.objects.bulk_create(docs)
+    return case, docs
+
+
+
+# ====== версии документа ======
+
+
+def run_concurrent_edits(doc, threads_count: int, edits: int):
+    """
+    threads_count потоков одновременно правят doc и создают снэпшоты,
+    каждый — edits раз. Возвращает (Counter ошибок по типу, до 5 примеров).
+    """
+    barrier = threading.Barrier(threads_count)
+    errors = Counter()
+    error_samples = []
+
+    def worker(worker_id: int):
+        try:
+            barrier.wait()
+            for i in range(edits):
+                # как во view llm-edit: свежий документ, правка, save, снэпшот
+                current = GeneratedDocument.objects.get(pk=doc.pk)
+                current.content = f"{current.content}\nworker {worker_id} edit {i}"
+                current.save(update_fields=["content", "updated_at"])
+                try:
+                    create_document_version_snapshot(current, reason="llm_edit")
+                except Exception as e:
+                    errors[type(e).__name__] += 1
+                    if len(error_samples) < 5:
+                        error_samples.append(repr(e))
+        finally:
+            connections.close_all()
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads_count)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return errors, error_samples
+
+
+
+# ====== EXPLAIN горячих запросов ======
+
+SUPPORTED_VENDORS = ("postgresql", "sqlite")
+
+
+def hot_paths():
+    """
+    (название, queryset, индексы, любой из которых должен быть в плане).
+    На SQLite уникальное ограничение (case, doc_type) живёт в sqlite_autoindex_*.
+    """
+    case_id = uuid.uuid4()
+    doc_uniq = ("gendoc_case_doctype_uniq", "sqlite_autoindex_documents_generateddocument")
+    return [
+        (
+            "ensure: document by (case, doc_type)",
+            GeneratedDocument.objects.filter(case_id=case_id, doc_type=DocumentType.VISION),
+            doc_uniq,
+        ),
+        (
+            "documents list: by case ordered by doc_type",
+            GeneratedDocument.objects.filter(case_id=case_id).order_by("doc_type"),
+            doc_uniq,
+        ),
+        (
+            "confluence publish: by (case, status)",
+            GeneratedDocument.objects.filter(
+                case_id=case_id,
+                status=DocumentStatus.APPROVED_BY_BA,
+            ).order_by("doc_type"),
+            # документов на кейс не больше числа типов, поэтому планировщик
+            # вправе выбрать и уникальный индекс по case — главное, не полный скан
+            ("gendoc_case_status_idx",) + doc_uniq,
+        ),
+        (
+            "next follow-up question: (case, status) ordered by order_index",
+            FollowupQuestion.objects.filter(
+                case_id=case_id,
+                status=FollowupQuestionStatus.PENDING,
+            ).order_by("order_index"),
+            ("followup_case_status_order_idx",),
+        ),
+        (
+            "my cases: by requester_id ordered by -created_at",
+            Case.objects.filter(requester_id="requester").order_by("-created_at"),
+            ("case_requester_created_idx",),
+        ),
+        (
+            "all cases: ordered by -created_at",
+            Case.objects.order_by("-created_at")[:20],
+            ("case_created_idx",),
+        ),
+    ]
+
+
+def disable_seqscan():
+    """
+    Postgres на маленьких таблицах всегда выбирает Seq Scan — в пределах
+    текущей транзакции запрещаем его, чтобы план показал доступный индекс.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+
+def plan_uses_index(queryset, expected) -> tuple:
+    """
+    (использует ли план один из индексов expected, текст плана).
+    """
+    plan = queryset.explain()
+    return any(index in plan for index in expected), plan
@@ -0,0 +1,1508 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+import docx
+import httpx
+import openai
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from cases.models import Case, CaseStatus, FollowupQuestion, FollowupQuestionStatus
+from documents.models import (
+    DocumentStatus,
+    DocumentType,
+    DocumentVersion,
+    GeneratedDocument,
+    GenerationStatus,
+    VersionStorage,
+)
+from documents.services import (
+    docx_export,
+    ensure,
+    fake_llm,
+    jobs,
+    llm_cache,
+    llm_client,
+    llm_gateway,
+    plantuml_render,
+    streaming,
+    version_store,
+)
+from documents.services.context_builder import get_case_context
+from documents.services.dispatcher import generate_structured_and_render
+from documents.services.versioning import create_document_version_snapshot
+from documents.services.artifacts.vision import prompt as vision_prompt
+from documents.services.artifacts.vision import schema as vision_schema
+from documents.services import confluence_publish, confluence_storage, docx_builders, docx_template
+from documents.services.bpmn_image_export import build_diagram_url_for_code
+from documents.services.partial_json import TopLevelObjectParser, parse_partial_json
+from documents.services.plantuml_encoding import decode_plantuml, deflate, encode_compressed, encode_plantuml
+from documents.testing import (
+    ALL_DOC_TYPES,
+    SUPPORTED_VENDORS,
+    QueryBudgetTestMixin,
+    disable_seqscan,
+    hot_paths,
+    jwt_client,
+    make_case,
+    plan_uses_index,
+    run_concurrent_edits,
+)
+from documents.views import CaseDocumentStreamView, DocumentGenerationJobEventsView
+from integrations.confluence.fake_server import FakeConfluenceServer
+from integrations.confluence.transport import reset_transports
+
+DIAGRAM = "@startuml\nactor User\nUser -> System : test\n@enduml"
+
+
+class DiagramUrlTests(SimpleTestCase):
+    """
+    URL диаграммы строится на пути генерации — внешний PlantUML-сервер там не вызывается.
+    """
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=media.name, PLANTUML_JAR_PATH="")
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        server = mock.patch.object(plantuml_render, "_render_via_server", side_effect=AssertionError("server called"))
+        self.server = server.start()
+        self.addCleanup(server.stop)
+
+    def test_default_mode_links_to_server_without_rendering(self):
+        with self.settings(PLANTUML_RENDER_MODE="url"):
+            url = build_diagram_url_for_code(DIAGRAM)
+        self.assertIn("/png/", url)
+        self.server.assert_not_called()
+
+    def test_auto_and_server_modes_defer_rendering_to_diagram_view(self):
+        digest = plantuml_render.diagram_digest(DIAGRAM)
+        for mode in ("auto", "server"):
+            with self.subTest(mode=mode), self.settings(PLANTUML_RENDER_MODE=mode):
+                url = build_diagram_url_for_code(DIAGRAM)
+                self.assertEqual(url, plantuml_render.build_diagram_url(digest, "png"))
+                self.assertTrue(plantuml_render.get_cached_diagram_path(digest, "puml").exists())
+                self.assertFalse(plantuml_render.get_cached_diagram_path(digest, "png").exists())
+        self.server.assert_not_called()
+
+    def test_unset_mode_uses_local_jar_when_available(self):
+        with self.settings(PLANTUML_RENDER_MODE=""):
+            with mock.patch.object(plantuml_render, "local_renderer_available", return_value=True):
+                self.assertEqual(plantuml_render.get_render_mode(), "auto")
+            with mock.patch.object(plantuml_render, "local_renderer_available", return_value=False):
+                self.assertEqual(plantuml_render.get_render_mode(), "url")
+        with self.settings(PLANTUML_RENDER_MODE="server"):
+            with mock.patch.object(plantuml_render, "local_renderer_available", return_value=True):
+                self.assertEqual(plantuml_render.get_render_mode(), "server")
+
+    def test_diagram_view_revalidation(self):
+        digest = plantuml_render.store_diagram_source(DIAGRAM)
+        path = plantuml_render.get_cached_diagram_path(digest, "png")
+        path.write_bytes(b"\x89PNG fake")
+        url = f"/api/diagrams/{digest}.png"
+
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b"".join(resp.streaming_content), b"\x89PNG fake")
+        etag = resp["ETag"]
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], etag)
+
+    def test_diagram_view_unknown_digest_is_404_even_with_etag(self):
+        digest = "ab" * 32
+        resp = self.client.get(f"/api/diagrams/{digest}.png", HTTP_IF_NONE_MATCH=f'"{digest}.png"')
+        self.assertEqual(resp.status_code, 404)
+        self.server.assert_not_called()
+
+
+def _reference_encode64(data: bytes) -> str:
+    """
+    Побайтовый encode64 из документации PlantUML (эталон для табличной версии).
+    """
+    def encode6bit(b):
+        if b < 10:
+            return chr(48 + b)
+        b -= 10
+        if b < 26:
+            return chr(65 + b)
+        b -= 26
+        if b < 26:
+            return chr(97 + b)
+        return "-" if b == 26 else "_"
+
+    out = []
+    for i in range(0, len(data), 3):
+        b1, b2, b3 = (data[i:i + 3] + b"\x00\x00")[:3]
+        out.append(encode6bit(b1 >> 2))
+        out.append(encode6bit(((b1 & 0x3) << 4) | (b2 >> 4)))
+        out.append(encode6bit(((b2 & 0xF) << 2) | (b3 >> 6)))
+        out.append(encode6bit(b3 & 0x3F))
+    return "".join(out)
+
+
+class PlantUMLEncodingTests(SimpleTestCase):
+    # пример из документации PlantUML (plantuml.com/text-encoding)
+    KNOWN_TEXT = "Bob -> Alice : hello"
+    KNOWN_CODE = "SyfFKj2rKt3CoKnELR1Io4ZDoSa70000"
+
+    def test_matches_plantuml_server_encoding(self):
+        self.assertEqual(encode_plantuml(self.KNOWN_TEXT), self.KNOWN_CODE)
+        self.assertEqual(decode_plantuml(self.KNOWN_CODE), self.KNOWN_TEXT)
+
+    def test_round_trip(self):
+        texts = [
+            "",
+            DIAGRAM,
+            "@startuml\n|Клиент|\n:Заполняет кейс 🚀;\n@enduml\n",
+            "a" * 10_000,
+        ] + ["x" * n for n in range(1, 8)]
+        for text in texts:
+            with self.subTest(length=len(text)):
+                code = encode_plantuml(text)
+                self.assertNotIn("=", code)
+                self.assertEqual(decode_plantuml(code), text)
+
+    def test_table_encoding_matches_reference_byte_loop(self):
+        for data in [b"", b"\x00", b"\xff\xfe", bytes(range(256)), deflate(DIAGRAM)]:
+            with self.subTest(length=len(data)):
+                self.assertEqual(encode_compressed(data), _reference_encode64(data))
+
+    def test_decode_rejects_malformed_codes(self):
+        code = encode_plantuml(DIAGRAM)
+        for bad in (code[:-1], code[:-4] + "+/==", code[: len(code) // 8 * 4]):
+            with self.subTest(bad=bad), self.assertRaises(ValueError):
+                decode_plantuml(bad)
+
+
+def _storage_text(fragment_html: str) -> str:
+    """
+    Текст plain-text-body после XML-разбора фрагмента (CDATA склеиваются).
+    """
+    root = ET.fromstring(
+        '<root xmlns:ac="urn:ac" xmlns:ri="urn:ri">' + fragment_html + "</root>"
+    )
+    return "".join(root.find(".//{urn:ac}plain-text-body").itertext())
+
+
+class ConfluenceStorageTests(SimpleTestCase):
+    """
+    Golden-выход Markdown -> Confluence storage format.
+    """
+
+    def setUp(self):
+        confluence_storage.clear_storage_cache()
+        self.addCleanup(confluence_storage.clear_storage_cache)
+
+    def render(self, markdown, **kwargs):
+        return confluence_storage.markdown_to_storage(markdown, **kwargs)
+
+    def test_lists_and_nesting(self):
+        markdown = "- a\n- b\n  - c\n    - d\n- e\n\n1. x\n2. y\n- z"
+        self.assertEqual(
+            self.render(markdown).html,
+            "<ul><li>a</li><li>b<ul><li>c<ul><li>d</li></ul></li></ul></li><li>e</li></ul>"
+            "<ol><li>x</li><li>y</li></ol>"
+            "<ul><li>z</li></ul>",
+        )
+
+    def test_table_pads_short_rows(self):
+        markdown = "| A | **B** |\n|---|:--:|\n| 1 | `x < y` |\n| only |"
+        self.assertEqual(
+            self.render(markdown).html,
+            "<table><tbody><tr><th>A</th><th><strong>B</strong></th></tr>"
+            "<tr><td>1</td><td><code>x &lt; y</code></td></tr>"
+            "<tr><td>only</td><td></td></tr></tbody></table>",
+        )
+
+    def test_headings_paragraphs_and_inline(self):
+        markdown = "# H1 <x>\nline *em* and [link](http://a?b=1&c=2)\nnext"
+        self.assertEqual(
+            self.render(markdown).html,
+            '<h1>H1 &lt;x&gt;</h1><p>line <em>em</em> and <a href="http://a?b=1&amp;c=2">link</a>'
+            "<br />next</p>",
+        )
+
+    def test_code_with_cdata_terminator_is_split(self):
+        code = "<a><![CDATA[x]]></a>"
+        fragment = self.render(f"```xml\n{code}\n```")
+        self.assertEqual(
+            fragment.html,
+            '<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">xml</ac:parameter>'
+            "<ac:plain-text-body><![CDATA[<a><![CDATA[x]]]]><![CDATA[></a>]]></ac:plain-text-body>"
+            "</ac:structured-macro>",
+        )
+        self.assertEqual(_storage_text(fragment.html), code)
+
+        macro = self.render("```plantuml\nX ]]> Y\n```", mode="macro")
+        self.assertEqual(_storage_text(macro.html), "X ]]> Y")
+        self.assertEqual(macro.diagrams, ())
+
+    def test_plantuml_attachments_are_numbered_per_document(self):
+        markdown = (
+            "Текст\n\n```plantuml\n@startuml\nA -> B\n@enduml\n```\n\n"
+            "```puml\n@startuml\nB -> C\n@enduml\n```"
+        )
+        fragment = self.render(markdown, attachment_prefix="vision", mode="attachment")
+        self.assertEqual(
+            fragment.html,
+            "<p>Текст</p>"
+            '<p><ac:image><ri:attachment ri:filename="vision-1.png" /></ac:image></p>'
+            '<p><ac:image><ri:attachment ri:filename="vision-2.png" /></ac:image></p>',
+        )
+        self.assertEqual(
+            fragment.diagrams,
+            (
+                ("vision-1.png", "@startuml\nA -> B\n@enduml"),
+                ("vision-2.png", "@startuml\nB -> C\n@enduml"),
+            ),
+        )
+
+        # правка диаграммы меняет только вложение, а не тело страницы
+        edited = self.render(markdown.replace("A -> B", "A -> D"), attachment_prefix="vision", mode="attachment")
+        self.assertEqual(edited.html, fragment.html)
+        self.assertNotEqual(edited.diagrams, fragment.diagrams)
+
+    def test_cache_key_covers_mode_prefix_and_format_version(self):
+        markdown = "```plantuml\n@startuml\n@enduml\n```"
+        first = self.render(markdown, attachment_prefix="bpmn", mode="attachment")
+        self.assertIs(self.render(markdown, attachment_prefix="bpmn", mode="attachment"), first)
+
+        self.assertEqual(self.render(markdown, attachment_prefix="scope", mode="attachment").diagrams[0][0], "scope-1.png")
+        self.assertIn('ac:name="plantuml"', self.render(markdown, attachment_prefix="bpmn", mode="macro").html)
+
+        with mock.patch.object(confluence_storage, "STORAGE_FORMAT_VERSION", "test"):
+            self.assertIsNot(self.render(markdown, attachment_prefix="bpmn", mode="attachment"), first)
+
+        with self.settings(CONFLUENCE_PLANTUML_MODE="macro"):
+            self.assertIn('ac:name="plantuml"', self.render(markdown, attachment_prefix="bpmn").html)
+
+    @override_settings(CONFLUENCE_STORAGE_CACHE_SIZE=0)
+    def test_cache_can_be_disabled(self):
+        first = self.render("text")
+        self.assertIsNot(self.render("text"), first)
+        self.assertEqual(self.render("text"), first)
+
+
+class DocxTemplateTests(SimpleTestCase):
+    """
+    Шаблон DOCX разбирается один раз; документы из заготовок абзацев
+    совпадают с собранными обычным python-docx.
+    """
+
+    def setUp(self):
+        docx_template.clear_docx_template_cache()
+        self.addCleanup(docx_template.clear_docx_template_cache)
+
+    def _paragraphs(self, data):
+        return [(p.style.name, p.text) for p in docx.Document(io.BytesIO(data)).paragraphs]
+
+    def test_same_paragraphs_as_python_docx(self):
+        reference = docx.Document()
+        reference.add_heading("Vision", level=1)
+        reference.add_paragraph("Текст\nс переносом")
+        reference.add_paragraph("Пункт", style="List Bullet")
+        reference.add_paragraph("Заголовок", style="Title")
+        buf = io.BytesIO()
+        reference.save(buf)
+
+        d = docx_template.new_docx()
+        d.heading("Vision", level=1)
+        d.paragraph("Текст\nс переносом")
+        d.bullets(["Пункт"], "нет")
+        d.paragraph("Заголовок", style="Title")  # стиль не из KNOWN_STYLES
+
+        self.assertEqual(self._paragraphs(d.to_bytes()), self._paragraphs(buf.getvalue()))
+
+    def test_template_is_parsed_once_and_documents_are_independent(self):
+        with mock.patch.object(docx_template, "DocxDocument", wraps=docx_template.DocxDocument) as parse:
+            first = docx_template.new_docx()
+            second = docx_template.new_docx()
+        self.assertEqual(parse.call_count, 1)
+
+        first.paragraph("только в первом")
+        self.assertEqual(self._paragraphs(second.to_bytes()), [])
+        self.assertEqual(self._paragraphs(docx_template.new_docx().to_bytes()), [])
+
+    def test_corporate_template_body_is_kept_and_versioned(self):
+        corporate = docx.Document()
+        corporate.add_paragraph("Титульный лист", style="Title")
+        with tempfile.NamedTemporaryFile(suffix=".docx", delete=False) as f:
+            corporate.save(f)
+        self.addCleanup(os.unlink, f.name)
+
+        default_hash = docx_builders.docx_content_hash("vision", {"title": "V"})
+        with override_settings(DOCX_TEMPLATE_PATH=f.name):
+            d = docx_template.new_docx()
+            d.heading("Vision", level=1)
+            self.assertEqual(
+                self._paragraphs(d.to_bytes()),
+                [("Title", "Титульный лист"), ("Heading 1", "Vision")],
+            )
+            # другой шаблон — другой хэш, DOCX пересоберутся
+            self.assertNotEqual(docx_builders.docx_content_hash("vision", {"title": "V"}), default_hash)
+
+
+class DocxExportTests(TestCase):
+    """
+    DOCX по хэшу содержимого: неизменённый документ не пересобирается,
+    одинаковое содержимое — один файл.
+    """
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media = media.name
+
+        build = mock.patch.object(
+            docx_export, "_build_docx_bytes_for_type", wraps=docx_export._build_docx_bytes_for_type
+        )
+        self.build = build.start()
+        self.addCleanup(build.stop)
+
+    def _doc(self, **structured):
+        return GeneratedDocument.objects.create(
+            case=Case.objects.create(title="docx"),
+            doc_type=DocumentType.VISION,
+            title="docx",
+            structured_data={"title": "Vision", **structured},
+        )
+
+    def test_unchanged_document_is_not_rebuilt(self):
+        doc = self._doc(problem_statement="Долгие заявки")
+        docx_export.ensure_docx_for_document(doc, force=True)
+        name, content_hash = doc.docx_file.name, doc.docx_hash
+        self.assertEqual(name, docx_export.docx_storage_name(doc.doc_type, content_hash))
+        self.assertEqual(self.build.call_count, 1)
+
+        doc = GeneratedDocument.objects.get(pk=doc.pk)
+        docx_export.ensure_docx_for_document(doc, force=True)
+        self.assertEqual(self.build.call_count, 1)
+        self.assertEqual(doc.docx_file.name, name)
+
+        doc.structured_data["problem_statement"] = "Заявки теряются"
+        docx_export.ensure_docx_for_document(doc, force=True)
+        self.assertEqual(self.build.call_count, 2)
+        self.assertNotEqual(doc.docx_hash, content_hash)
+        self.assertTrue(doc.docx_file.storage.exists(doc.docx_file.name))
+
+    def test_missing_file_is_rebuilt(self):
+        doc = self._doc()
+        docx_export.ensure_docx_for_document(doc, force=True)
+        doc.docx_file.storage.delete(doc.docx_file.name)
+
+        docx_export.ensure_docx_for_document(doc, force=True)
+        self.assertEqual(self.build.call_count, 2)
+        self.assertTrue(doc.docx_file.storage.exists(doc.docx_file.name))
+
+    def test_same_content_shares_one_file(self):
+        first = self._doc(problem_statement="Одно и то же")
+        second = self._doc(problem_statement="Одно и то же")
+
+        stats = docx_export.export_docx_for_documents([first, second], force=True, workers=1)
+
+        self.assertEqual((stats["built"], stats["reused"]), (1, 1))
+        self.assertEqual(first.docx_file.name, second.docx_file.name)
+        self.assertEqual(os.listdir(os.path.join(self.media, docx_export.DOCX_DIR)), [os.path.basename(first.docx_file.name)])
+
+        stats = docx_export.export_docx_for_documents(
+            GeneratedDocument.objects.filter(pk__in=[first.pk, second.pk]), force=True, workers=1
+        )
+        self.assertEqual((stats["built"], stats["skipped"]), (0, 2))
+
+
+class GcGeneratedFilesTests(TestCase):
+    """
+    manage.py gc_generated_files: удаляет только старые файлы без ссылок.
+    """
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, PLANTUML_CACHE_DIR="diagrams")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media = media.name
+        self.old = time.time() - 48 * 3600
+
+    def _file(self, relpath, old=True):
+        path = os.path.join(self.media, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * 10)
+        if old:
+            os.utime(path, (self.old, self.old))
+        return path
+
+    def _gc(self, *args):
+        out = io.StringIO()
+        call_command("gc_generated_files", *args, stdout=out)
+        return out.getvalue()
+
+    def test_removes_only_old_unreferenced_files(self):
+        kept_digest, orphan_digest = "a" * 64, "b" * 64
+        GeneratedDocument.objects.create(
+            case=Case.objects.create(title="gc"),
+            doc_type=DocumentType.VISION,
+            title="gc",
+            docx_file="generated_docs/vision_used.docx",
+        )
+        GeneratedDocument.objects.create(
+            case=Case.objects.create(title="gc"),
+            doc_type=DocumentType.BPMN,
+            title="gc",
+            diagram_url=f"https://api.example.invalid/api/diagrams/{kept_digest}.png",
+        )
+        used = self._file("generated_docs/vision_used.docx")
+        orphan = self._file("generated_docs/vision_orphan.docx")
+        fresh = self._file("generated_docs/vision_fresh.docx", old=False)
+        kept_png = self._file(f"diagrams/aa/{kept_digest}.png")
+        kept_src = self._file(f"diagrams/aa/{kept_digest}.puml")
+        orphan_png = self._file(f"diagrams/bb/{orphan_digest}.png")
+        orphan_src = self._file(f"diagrams/bb/{orphan_digest}.puml")
+
+        output = self._gc("--dry-run")
+        self.assertIn("Would remove 3 files", output)
+        self.assertTrue(all(os.path.exists(p) for p in (orphan, orphan_png, orphan_src)))
+
+        output = self._gc()
+        self.assertIn("Removed 3 files", output)
+        for path in (used, fresh, kept_png, kept_src):
+            self.assertTrue(os.path.exists(path), path)
+        for path in (orphan, orphan_png, orphan_src):
+            self.assertFalse(os.path.exists(path), path)
+
+    def test_skip_diagrams(self):
+        orphan_png = self._file(f"diagrams/cc/{'c' * 64}.png")
+        self._gc("--skip-diagrams")
+        self.assertTrue(os.path.exists(orphan_png))
+
+
+class ConfluencePublishTests(TestCase):
+    """
+    Инкрементальная публикация против локального заменителя Confluence:
+    неизменённый документ — ни одного запроса, изменённый — один PUT.
+    """
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+
+        self.server = FakeConfluenceServer(username="bot", api_token="token")
+        url = self.server.start()
+        self.addCleanup(self.server.stop)
+
+        override = override_settings(
+            MEDIA_ROOT=media.name,
+            CONFLUENCE_BASE_URL=url,
+            CONFLUENCE_USERNAME="bot",
+            CONFLUENCE_API_TOKEN="token",
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        reset_transports()
+        self.addCleanup(reset_transports)
+
+        self.case = Case.objects.create(title="Онлайн-заявка", confluence_space_key="OPS")
+        self.doc = GeneratedDocument.objects.create(
+            case=self.case,
+            doc_type=DocumentType.VISION,
+            title="Vision",
+            content="# Vision\n\n- пункт",
+            structured_data={"title": "Vision"},
+            status=DocumentStatus.APPROVED_BY_BA,
+        )
+        docx_export.ensure_docx_for_document(self.doc)
+
+    def _publish(self):
+        before = self.server.state.stats()
+        stats = confluence_publish.publish_case_to_confluence(Case.objects.get(pk=self.case.pk))
+        after = self.server.state.stats()
+        ops = {k: v - before["ops"].get(k, 0) for k, v in after["ops"].items() if v != before["ops"].get(k, 0)}
+        return stats, after["requests"] - before["requests"], ops
+
+    def test_first_publish_creates_pages_and_attachment(self):
+        stats, requests, ops = self._publish()
+
+        self.assertEqual((stats["created"], stats["attachments"]), (1, 1))
+        self.assertEqual(ops, {"content.create": 2, "attachment.put": 1})
+        self.assertEqual(requests, 3)
+
+        self.case.refresh_from_db()
+        self.doc.refresh_from_db()
+        self.assertEqual(self.case.status, CaseStatus.APPROVED)
+        page = self.server.state.pages[self.doc.confluence_page_id]
+        self.assertEqual(page["ancestors"], [self.case.confluence_page_id])
+        self.assertEqual(list(page["attachments"]), ["vision.docx"])
+        self.assertEqual(self.doc.confluence_page_version, 1)
+
+    def test_unchanged_document_sends_nothing(self):
+        self._publish()
+
+        stats, requests, ops = self._publish()
+
+        self.assertEqual(stats["unchanged"], 1)
+        self.assertEqual((requests, ops), (0, {}))
+
+    def test_edited_document_is_one_put(self):
+        self._publish()
+        GeneratedDocument.objects.filter(pk=self.doc.pk).update(content="# Vision\n\n- новый пункт")
+
+        stats, requests, ops = self._publish()
+
+        self.assertEqual(stats["updated"], 1)
+        self.assertEqual((requests, ops), (1, {"content.update": 1}))
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.confluence_page_version, 2)
+        self.assertIn("новый пункт", self.server.state.pages[self.doc.confluence_page_id]["body"])
+
+    def test_new_docx_is_uploaded_without_touching_the_page(self):
+        self._publish()
+        doc = GeneratedDocument.objects.get(pk=self.doc.pk)
+        doc.structured_data = {"title": "Vision", "problem_statement": "Заявки теряются"}
+        doc.save(update_fields=["structured_data"])
+        docx_export.ensure_docx_for_document(doc, force=True)
+
+        stats, requests, ops = self._publish()
+
+        self.assertEqual((stats["unchanged"], stats["attachments"]), (1, 1))
+        self.assertEqual((requests, ops), (1, {"attachment.put": 1}))
+
+
+class DocumentJobTests(TestCase):
+    def setUp(self):
+        self.case = Case.objects.create(
+            title="job test",
+            selected_document_types=[DocumentType.VISION, DocumentType.SCOPE],
+        )
+
+    def test_failed_job_marks_its_queued_documents_failed(self):
+        job, created = jobs.enqueue_case_documents_job(self.case)
+        self.assertTrue(created)
+        claimed = jobs.claim_next_job("test-worker")
+
+        with mock.patch.object(jobs, "ensure_case_documents", side_effect=RuntimeError("boom")):
+            jobs.run_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationStatus.FAILED)
+        statuses = set(
+            GeneratedDocument.objects.filter(case=self.case).values_list("generation_status", flat=True)
+        )
+        self.assertEqual(statuses, {GenerationStatus.FAILED})
+
+    @override_settings(DOCUMENT_JOBS_MAX_ATTEMPTS=1)
+    def test_stale_job_at_max_attempts_fails_its_queued_documents(self):
+        job, _ = jobs.enqueue_case_documents_job(self.case)
+        jobs.claim_next_job("dead-worker")
+
+        self.assertEqual(jobs.requeue_stale_jobs(stale_after=-1), 0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationStatus.FAILED)
+        statuses = set(
+            GeneratedDocument.objects.filter(case=self.case).values_list("generation_status", flat=True)
+        )
+        self.assertEqual(statuses, {GenerationStatus.FAILED})
+
+    def test_refresh_stale_upgrades_pending_job(self):
+        job, _ = jobs.enqueue_case_documents_job(self.case)
+
+        again, created = jobs.enqueue_case_documents_job(self.case, refresh_stale=True)
+
+        self.assertFalse(created)
+        self.assertEqual(again.pk, job.pk)
+        self.assertTrue(jobs.claim_next_job("test-worker").refresh_stale)
+
+    def test_refresh_stale_conflicts_with_running_job(self):
+        jobs.enqueue_case_documents_job(self.case)
+        jobs.claim_next_job("test-worker")
+
+        with self.assertRaises(jobs.JobConflict):
+            jobs.enqueue_case_documents_job(self.case, refresh_stale=True)
+        # без refresh_stale — по-прежнему возвращается идущая задача
+        self.assertFalse(jobs.enqueue_case_documents_job(self.case)[1])
+
+    @override_settings(DOCUMENT_JOBS_RUN_IN_PROCESS=True, BACKGROUND_TASKS_SYNC=True)
+    def test_enqueued_job_runs_in_process_without_worker(self):
+        with mock.patch.object(jobs, "ensure_case_documents", return_value=([], {}, [])), \
+                self.captureOnCommitCallbacks(execute=True):
+            job, _ = jobs.enqueue_case_documents_job(self.case)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationStatus.READY)
+
+    @override_settings(DOCUMENT_JOBS_RUN_IN_PROCESS=False)
+    def test_in_process_run_can_be_disabled(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            jobs.enqueue_case_documents_job(self.case)
+        self.assertEqual(callbacks, [])
+
+    @override_settings(DOCUMENT_JOBS_SSE_MAX_DURATION=0, DOCUMENT_JOBS_SSE_POLL_INTERVAL=0)
+    def test_event_stream_ends_at_cap_and_asks_client_to_reconnect(self):
+        job, _ = jobs.enqueue_case_documents_job(self.case)
+
+        events = list(DocumentGenerationJobEventsView._event_stream(job.pk))
+
+        self.assertTrue(events[0].startswith("retry: "))
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[1].startswith("event: progress"))
+
+
+@override_settings(LLM_CACHE_ENABLED=True, LLM_CACHE_EVICT_EVERY=3)
+class LLMCacheEvictionTests(TestCase):
+    def setUp(self):
+        counter = mock.patch.object(llm_cache, "_puts_since_evict", 0)
+        counter.start()
+        self.addCleanup(counter.stop)
+
+    def put(self, n):
+        llm_cache.put(f"key-{n}", model="m", system_prompt="s", user_prompt=str(n), response={"n": n})
+
+    def test_put_evicts_once_per_n_stores(self):
+        with mock.patch.object(llm_cache, "evict") as evict:
+            for n in range(7):
+                self.put(n)
+        self.assertEqual(evict.call_count, 2)
+
+    def test_put_between_evictions_only_upserts(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.put(0)
+            self.put(1)
+        self.assertFalse([q["sql"] for q in queries if q["sql"].startswith("DELETE")])
+
+
+def _completion(payload) -> SimpleNamespace:
+    content = payload if isinstance(payload, str) else json.dumps(payload)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _strict(data):
+    if "answer" not in data:
+        raise ValueError("answer is missing")
+    return data
+
+
+@override_settings(LLM_CACHE_ENABLED=True)
+class LLMCacheValidationTests(TestCase):
+    """
+    В кэш попадает только ответ, прошедший валидацию; use_cache=False кэш не читает.
+    """
+
+    def chat(self, **kwargs):
+        return llm_client.chat_json("system", "user", model="m", validate=_strict, **kwargs)
+
+    def test_valid_response_is_served_from_cache(self):
+        with mock.patch.object(llm_client, "chat_completion", return_value=_completion({"answer": 1})) as call:
+            self.assertEqual(self.chat(), ({"answer": 1}, "m"))
+            self.assertEqual(self.chat(), ({"answer": 1}, "m"))
+        self.assertEqual(call.call_count, 1)
+
+    def test_invalid_response_is_not_cached(self):
+        responses = [_completion({"wrong": 1}), _completion({"answer": 2})]
+        with mock.patch.object(llm_client, "chat_completion", side_effect=responses) as call:
+            with self.assertRaises(ValueError):
+                self.chat()
+            self.assertEqual(self.chat(), ({"answer": 2}, "m"))
+        self.assertEqual(call.call_count, 2)
+
+    def test_use_cache_false_calls_llm_and_refreshes_cache(self):
+        responses = [_completion({"answer": 1}), _completion({"answer": 2})]
+        with mock.patch.object(llm_client, "chat_completion", side_effect=responses) as call:
+            self.chat()
+            self.assertEqual(self.chat(use_cache=False), ({"answer": 2}, "m"))
+            self.assertEqual(self.chat(), ({"answer": 2}, "m"))
+        self.assertEqual(call.call_count, 2)
+
+
+class GenerationCacheBypassTests(TestCase):
+    """
+    ?force=1 у стрима и refresh_stale не берут ответ LLM из кэша.
+    """
+
+    def setUp(self):
+        self.case = Case.objects.create(
+            title="bypass",
+            initial_answers={"idea": "Онлайн-заявка"},
+            selected_document_types=[DocumentType.VISION],
+        )
+
+    def test_forced_stream_bypasses_llm_cache(self):
+        payload = vision_schema.validate(fake_llm.canned_payload("vision", "t", 2))
+        stream = mock.Mock(return_value=(iter([json.dumps(payload)]), "m"))
+        with mock.patch.object(streaming.vision_generator, "stream", stream), \
+                mock.patch.object(streaming, "finalize_case_documents"):
+            events = [event for event, _ in streaming.stream_document_generation(self.case, "vision", force=True)]
+        self.assertEqual(events[-1], "done")
+        stream.assert_called_once_with(mock.ANY, use_cache=False)
+
+    def test_refresh_stale_regenerates_without_cache(self):
+        result = ({"title": "t"}, "content", "title", "m")
+        with mock.patch.object(ensure, "generate_structured_and_render", return_value=result) as generate:
+            ensure.ensure_case_documents(self.case, parallel=False)
+            self.assertEqual(generate.call_args.kwargs, {"use_cache": True})
+
+            self.case.title = "changed"
+            self.case.save()
+            ensure.ensure_case_documents(self.case, parallel=False, refresh_stale=True)
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(generate.call_args.kwargs, {"use_cache": False})
+
+
+def _fake_generate(doc_type, case_context, use_cache=True):
+    return {"title": doc_type}, "content", f"{doc_type} title", "m"
+
+
+class ParallelGenerationTests(TestCase):
+    """
+    ensure_case_documents: LLM по типам документов вызывается параллельно
+    (не больше DOCUMENTS_GENERATION_MAX_WORKERS) и вне транзакции с локом кейса.
+    """
+
+    DOC_TYPES = [DocumentType.VISION, DocumentType.SCOPE, DocumentType.BPMN, DocumentType.CONTEXT_DIAGRAM]
+
+    def setUp(self):
+        self.case = Case.objects.create(title="parallel", selected_document_types=self.DOC_TYPES)
+
+    def _ensure(self, generate, **kwargs):
+        with mock.patch.object(ensure, "generate_structured_and_render", side_effect=generate):
+            return ensure.ensure_case_documents(self.case, **kwargs)
+
+    @override_settings(DOCUMENTS_GENERATION_MAX_WORKERS=5)
+    def test_doc_types_generate_concurrently(self):
+        # последовательный вызов не дождался бы остальных у барьера
+        barrier = threading.Barrier(len(self.DOC_TYPES), timeout=5)
+        threads = set()
+
+        def generate(doc_type, case_context, use_cache=True):
+            threads.add(threading.get_ident())
+            barrier.wait()
+            return _fake_generate(doc_type, case_context, use_cache)
+
+        docs, errors, generated = self._ensure(generate, parallel=True)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(generated, self.DOC_TYPES)
+        self.assertEqual(len(threads), len(self.DOC_TYPES))
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual({d.generation_status for d in docs}, {GenerationStatus.READY})
+
+    @override_settings(DOCUMENTS_GENERATION_MAX_WORKERS=2)
+    def test_worker_limit(self):
+        lock = threading.Lock()
+        active = [0, 0]  # сейчас, максимум
+
+        def generate(doc_type, case_context, use_cache=True):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return _fake_generate(doc_type, case_context, use_cache)
+
+        _, errors, generated = self._ensure(generate, parallel=True)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(generated), len(self.DOC_TYPES))
+        self.assertLessEqual(active[1], 2)
+
+    def test_failed_doc_type_does_not_affect_others(self):
+        def generate(doc_type, case_context, use_cache=True):
+            if doc_type == DocumentType.BPMN:
+                raise RuntimeError("LLM is down")
+            return _fake_generate(doc_type, case_context, use_cache)
+
+        docs, errors, generated = self._ensure(generate, parallel=True)
+
+        self.assertEqual(errors, {DocumentType.BPMN: "LLM is down"})
+        self.assertEqual(generated, [t for t in self.DOC_TYPES if t != DocumentType.BPMN])
+        statuses = {d.doc_type: d.generation_status for d in docs}
+        self.assertEqual(statuses.pop(DocumentType.BPMN), GenerationStatus.FAILED)
+        self.assertEqual(set(statuses.values()), {GenerationStatus.READY})
+
+    def test_llm_is_called_outside_the_case_lock(self):
+        outer = len(connection.atomic_blocks)
+        seen = []
+
+        def generate(doc_type, case_context, use_cache=True):
+            # документ уже зарезервирован, транзакция с select_for_update закрыта
+            seen.append((
+                len(connection.atomic_blocks) - outer,
+                GeneratedDocument.objects.get(case=self.case, doc_type=doc_type).generation_status,
+            ))
+            return _fake_generate(doc_type, case_context, use_cache)
+
+        self._ensure(generate, parallel=False)
+
+        self.assertEqual(seen, [(0, GenerationStatus.GENERATING)] * len(self.DOC_TYPES))
+
+    def test_in_flight_document_is_skipped(self):
+        GeneratedDocument.objects.create(
+            case=self.case,
+            doc_type=DocumentType.VISION,
+            title="vision",
+            generation_status=GenerationStatus.GENERATING,
+        )
+        generate = mock.Mock(side_effect=_fake_generate)
+
+        _, errors, generated = self._ensure(generate, parallel=True)
+
+        self.assertEqual(errors, {})
+        self.assertNotIn(DocumentType.VISION, generated)
+        self.assertNotIn(DocumentType.VISION, [c.args[0] for c in generate.call_args_list])
+
+
+class StaleRegenerationTests(TestCase):
+    """
+    refresh_stale перегенерирует только те типы, чьи исходные данные
+    или промпт поменялись, и пересобирает у них DOCX / URL диаграммы.
+    """
+
+    def setUp(self):
+        self.case = Case.objects.create(
+            title="stale",
+            initial_answers={"idea": "Онлайн-заявка"},
+            selected_document_types=[DocumentType.VISION, DocumentType.BPMN],
+        )
+        self.question = FollowupQuestion.objects.create(
+            case=self.case,
+            text="Какие роли участвуют?",
+            target_document_types=[DocumentType.BPMN],
+            status=FollowupQuestionStatus.ANSWERED,
+            answer_text="Клиент",
+        )
+        generate = mock.patch.object(ensure, "generate_structured_and_render", side_effect=_fake_generate)
+        self.generate = generate.start()
+        self.addCleanup(generate.stop)
+
+        _, errors, generated = ensure.ensure_case_documents(self.case, parallel=False)
+        self.assertEqual(errors, {})
+        self.assertEqual(generated, [DocumentType.VISION, DocumentType.BPMN])
+        self.generate.reset_mock()
+
+    def test_only_changed_doc_types_regenerate(self):
+        self.question.answer_text = "Клиент и кредитный инспектор"
+        self.question.save()
+
+        docs, errors, generated = ensure.ensure_case_documents(self.case, parallel=False, refresh_stale=True)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(generated, [DocumentType.BPMN])
+        self.assertEqual([c.args[0] for c in self.generate.call_args_list], [DocumentType.BPMN])
+
+        with mock.patch.object(ensure, "ensure_docx_for_document") as docx, \
+                mock.patch.object(ensure, "ensure_diagram_urls") as diagram_urls:
+            ensure.finalize_case_documents(self.case, docs, generated)
+
+        docx.assert_called_once_with(mock.ANY, force=False)
+        self.assertEqual(
+            [([d.doc_type for d in c.args[0]], c.kwargs["force"]) for c in diagram_urls.call_args_list],
+            [([DocumentType.BPMN], True), ([DocumentType.VISION], False)],
+        )
+
+    def test_regenerated_text_document_rebuilds_docx(self):
+        self.case.initial_answers = {"idea": "Онлайн-заявка с подписью"}
+        self.case.save()
+
+        docs, _, generated = ensure.ensure_case_documents(self.case, parallel=False, refresh_stale=True)
+        self.assertEqual(sorted(generated), [DocumentType.BPMN, DocumentType.VISION])
+
+        with mock.patch.object(ensure, "ensure_docx_for_document") as docx, \
+                mock.patch.object(ensure, "ensure_diagram_urls"):
+            ensure.finalize_case_documents(self.case, docs, generated)
+        docx.assert_called_once_with(mock.ANY, force=True)
+
+    def test_prompt_change_without_version_bump_is_stale(self):
+        doc = GeneratedDocument.objects.get(case=self.case, doc_type=DocumentType.VISION)
+        context = ensure.get_case_context(self.case)
+        self.assertIsNone(ensure.get_stale_reason(doc, context))
+
+        with mock.patch.object(ensure.vision_prompt, "SYSTEM_PROMPT", "другой промпт"):
+            self.assertEqual(ensure.get_stale_reason(doc, context), "prompt_hash")
+
+
+TEXT_CASES = [
+    ("", ""),
+    ("", "одна строка"),
+    ("одна строка", ""),
+    ("без перевода строки", "без перевода строки\n"),
+    ("a\nb\nc\n", "a\nb\nc"),
+    ("a\nb\nc", "a\nX\nc\nd\n"),
+    ("Заголовок\n\n- пункт 🚀\n", "Заголовок\n\n- пункт 🚀\n- ещё пункт — ✓\n"),
+    ("windows\r\nline\r\n", "windows\r\nline2\r\n"),
+    ("\n\n\n", "\n"),
+]
+
+JSON_CASES = [
+    (None, {"title": "t"}),
+    ({"title": "t"}, None),
+    ({"items": [1, 2, 3]}, {"items": [1, 3]}),
+    ({"items": [1]}, {"items": [1, 2, 3]}),
+    ({"items": [{"a": 1}, {"b": 2}]}, {"items": [{"a": 2}]}),
+    ({"a": {"b": {"c": 1}}}, {"a": {"b": {"d": [1, {"e": "ё"}]}}}),
+    ({"a/b": 1, "c~d": 2}, {"a/b": 3, "": 4}),
+    ({"flag": 1}, {"flag": True}),
+    ({"x": [1, 2]}, {"x": {"0": 1}}),
+    ([1, 2, 3], []),
+]
+
+
+class VersionDiffRoundTripTests(SimpleTestCase):
+    """
+    diff_text/apply_text_diff и diff_json/apply_json_patch восстанавливают новую версию точно.
+    """
+
+    def test_text_round_trip(self):
+        for old, new in TEXT_CASES:
+            with self.subTest(old=old, new=new):
+                ops = version_store.diff_text(old, new)
+                self.assertEqual(version_store.apply_text_diff(old, ops), new)
+
+    def test_json_round_trip(self):
+        for old, new in JSON_CASES:
+            with self.subTest(old=old, new=new):
+                ops = version_store.diff_json(old, new)
+                patched = version_store.apply_json_patch(old, ops)
+                self.assertEqual(patched, new)
+                self.assertEqual(json.dumps(patched, sort_keys=True), json.dumps(new, sort_keys=True))
+
+    def test_patch_does_not_mutate_base(self):
+        old = {"items": [{"a": 1}]}
+        version_store.apply_json_patch(old, version_store.diff_json(old, {"items": [{"a": 2}, {"b": 3}]}))
+        self.assertEqual(old, {"items": [{"a": 1}]})
+
+
+@override_settings(DOCUMENT_VERSION_KEYFRAME_INTERVAL=3, DOCUMENT_VERSION_DELTA_MAX_RATIO=10)
+class VersionStoreTests(TestCase):
+    """
+    full -> delta -> materialize через границы keyframe и после compact_document_versions.
+    """
+
+    def setUp(self):
+        version_store.clear_version_cache()
+        self.addCleanup(version_store.clear_version_cache)
+        case = Case.objects.create(title="versions")
+        self.doc = GeneratedDocument.objects.create(
+            case=case,
+            doc_type=DocumentType.VISION,
+            title="v0",
+            content="",
+            structured_data=None,
+        )
+
+    def _write_history(self):
+        expected = []
+        for i, (content, structured) in enumerate(zip(
+            [new for _, new in TEXT_CASES],
+            [new for _, new in JSON_CASES],
+        )):
+            self.doc.title = f"v{i}"
+            self.doc.content = content
+            self.doc.structured_data = structured
+            self.doc.save()
+            create_document_version_snapshot(self.doc, reason="test")
+            expected.append({"title": f"v{i}", "content": content, "structured_data": structured})
+        return expected
+
+    def _materialize(self):
+        version_store.clear_version_cache()
+        versions = list(DocumentVersion.objects.filter(document=self.doc).order_by("version"))
+        payloads = version_store.get_version_payloads(versions)
+        return versions, [payloads[v.pk] for v in versions]
+
+    def test_every_version_materializes_across_keyframes(self):
+        expected = self._write_history()
+
+        versions, payloads = self._materialize()
+
+        self.assertEqual(payloads, expected)
+        storages = [v.storage for v in versions]
+        self.assertIn(VersionStorage.DELTA, storages)
+        self.assertGreater(storages.count(VersionStorage.FULL), 1)
+        for version in versions:
+            if version.storage == VersionStorage.DELTA:
+                self.assertLess(version.version - version.base_version, 3)
+
+    def test_compaction_keeps_every_version_materializable(self):
+        with self.settings(DOCUMENT_VERSION_KEYFRAME_INTERVAL=1):
+            expected = self._write_history()
+        self.assertEqual(
+            set(DocumentVersion.objects.filter(document=self.doc).values_list("storage", flat=True)),
+            {VersionStorage.FULL},
+        )
+
+        stats = version_store.compact_document_versions(self.doc.pk)
+
+        versions, payloads = self._materialize()
+        self.assertEqual(payloads, expected)
+        self.assertEqual(stats["versions"], len(expected))
+        self.assertLess(stats["keyframes"], len(expected))
+        self.assertIn(VersionStorage.DELTA, [v.storage for v in versions])
+
+        # повторная перепаковка по другой политике — тоже без потерь
+        with self.settings(DOCUMENT_VERSION_KEYFRAME_INTERVAL=5):
+            version_store.compact_document_versions(self.doc.pk)
+        self.assertEqual(self._materialize()[1], expected)
+
+
+STREAMED_JSON = json.dumps(
+    {
+        "title": "Заявка {в} \"кавычках\", с запятой",
+        "business_goals": ["a, b", "c]"],
+        "nested": {"x": [1, {"y": "}"}], "z": None},
+        "escaped": "слэш \\ в конце \\",
+        "last": True,
+    },
+    ensure_ascii=False,
+    indent=2,
+)
+
+
+class PartialJsonTests(SimpleTestCase):
+    def test_parse_partial_json_closes_open_structures(self):
+        cases = [
+            ("", None),
+            ('{"a": "нача', {"a": "нача"}),
+            ('{"a": [1, 2', {"a": [1, 2]}),
+            ('{"a": {"b": "c"}, "d": tr', {"a": {"b": "c"}}),
+            ('{"a": 1, "b', {"a": 1}),
+            ('{"a": "x\\', {"a": "x"}),
+            ('[1, 2, 3]', [1, 2, 3]),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(parse_partial_json(text), expected)
+
+    def test_parser_emits_each_member_once_when_it_is_complete(self):
+        parser = TopLevelObjectParser()
+        emitted = []
+        for i, ch in enumerate(STREAMED_JSON):
+            for key, value in parser.feed(ch):
+                emitted.append((key, value))
+                # член отдаётся не раньше, чем дописан его разделитель
+                self.assertIn(STREAMED_JSON[i], ",}")
+
+        self.assertTrue(parser.finished)
+        self.assertEqual(emitted, list(json.loads(STREAMED_JSON).items()))
+
+    def test_parser_is_independent_of_chunk_boundaries(self):
+        expected = list(json.loads(STREAMED_JSON).items())
+        for size in (1, 2, 3, 7, 64, len(STREAMED_JSON)):
+            with self.subTest(size=size):
+                parser = TopLevelObjectParser()
+                emitted = []
+                for start in range(0, len(STREAMED_JSON), size):
+                    emitted.extend(parser.feed(STREAMED_JSON[start:start + size]))
+                self.assertEqual(emitted, expected)
+
+    def test_parser_ignores_trailing_text_and_non_objects(self):
+        parser = TopLevelObjectParser()
+        self.assertEqual(parser.feed('  {"a": 1} {"b": 2}'), [("a", 1)])
+        self.assertEqual(TopLevelObjectParser().feed("[1, 2]"), [])
+
+
+class DocumentStreamTests(TestCase):
+    def setUp(self):
+        self.case = Case.objects.create(
+            title="stream",
+            initial_answers={"idea": "Онлайн-заявка"},
+            selected_document_types=[DocumentType.VISION],
+        )
+        self.payload = vision_schema.validate(fake_llm.canned_payload("vision", "t", 2))
+
+    def _stream(self, chunks):
+        closed = []
+
+        def deltas():
+            try:
+                yield from chunks
+            finally:
+                closed.append(True)
+
+        stream = mock.Mock(return_value=(deltas(), "m"))
+        patcher = mock.patch.object(streaming.vision_generator, "stream", stream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return closed
+
+    def test_sections_are_streamed_as_they_complete(self):
+        text = json.dumps(self.payload, ensure_ascii=False)
+        self._stream([text[i:i + 5] for i in range(0, len(text), 5)])
+
+        with mock.patch.object(streaming, "finalize_case_documents"):
+            events = list(streaming.stream_document_generation(self.case, "vision"))
+
+        self.assertEqual(
+            [(e, p["key"]) for e, p in events if e == "section"],
+            [("section", key) for key in self.payload],
+        )
+        self.assertEqual(events[-1][0], "done")
+
+    def test_client_disconnect_fails_new_document(self):
+        text = json.dumps(self.payload, ensure_ascii=False)
+        closed = self._stream([text[:len(text) // 2], text[len(text) // 2:]])
+
+        events = streaming.stream_document_generation(self.case, "vision")
+        self.assertEqual(next(events)[0], "section")
+        events.close()
+
+        doc = GeneratedDocument.objects.get(case=self.case, doc_type="vision")
+        self.assertEqual(doc.generation_status, GenerationStatus.FAILED)
+        self.assertEqual(closed, [True])
+
+    def test_client_disconnect_keeps_previous_content_ready(self):
+        GeneratedDocument.objects.create(
+            case=self.case,
+            doc_type="vision",
+            title="old",
+            content="old",
+            structured_data={"title": "old"},
+            generation_status=GenerationStatus.READY,
+        )
+        text = json.dumps(self.payload, ensure_ascii=False)
+        self._stream([text[:len(text) // 2], text[len(text) // 2:]])
+
+        events = streaming.stream_document_generation(self.case, "vision", force=True)
+        next(events)
+        events.close()
+
+        doc = GeneratedDocument.objects.get(case=self.case, doc_type="vision")
+        self.assertEqual(doc.generation_status, GenerationStatus.READY)
+        self.assertEqual(doc.structured_data, {"title": "old"})
+
+    def test_sse_framing(self):
+        events = [
+            ("section", {"doc_type": "vision", "key": "title", "value": "строка\nс переводом"}),
+            ("done", {"document": {"id": "1"}, "cached": False}),
+        ]
+        with mock.patch("documents.views.stream_document_generation", return_value=(e for e in events)):
+            frames = list(CaseDocumentStreamView._event_stream(self.case, "vision", False))
+
+        self.assertEqual(len(frames), 2)
+        for frame, (event, payload) in zip(frames, events):
+            self.assertTrue(frame.endswith("\n\n"))
+            lines = frame[:-2].split("\n")
+            self.assertEqual(lines[0], f"event: {event}")
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(json.loads(lines[1][len("data: "):]), payload)
+
+    def test_closing_sse_stream_closes_generation(self):
+        inner = mock.MagicMock()
+        inner.__iter__.return_value = iter([("section", {"key": "a"})])
+        with mock.patch("documents.views.stream_document_generation", return_value=inner):
+            frames = CaseDocumentStreamView._event_stream(self.case, "vision", False)
+            next(frames)
+            frames.close()
+        inner.close.assert_called_once_with()
+
+
+def _rate_limit_error(retry_after: str) -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.invalid/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+@override_settings(LLM_MAX_RETRIES=3, LLM_RETRY_MAX_DELAY=20)
+class FakeLLMTests(TestCase):
+    """
+    LLM_BACKEND="fake": детерминированные ответы, которые принимают все
+    генераторы, потоковый режим и те же ошибки openai, что у настоящего API.
+    """
+
+    MESSAGES = [
+        {"role": "system", "content": vision_prompt.SYSTEM_PROMPT},
+        {"role": "user", "content": "Кейс: онлайн-заявка"},
+    ]
+
+    def setUp(self):
+        sleep = mock.patch.object(fake_llm.time, "sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def _client(self, **config):
+        return fake_llm.FakeLLMClient(fake_llm.FakeLLMConfig(**{"latency": 0, **config}))
+
+    def _create(self, client, messages=None, **kwargs):
+        return client.chat.completions.create(model="m", messages=messages or self.MESSAGES, **kwargs)
+
+    @override_settings(LLM_BACKEND="fake", FAKE_LLM_LATENCY=0, FAKE_LLM_ERROR_RATE=0)
+    def test_every_generator_accepts_fake_output(self):
+        llm_gateway.reset_clients()
+        self.addCleanup(llm_gateway.reset_clients)
+        self.assertIsInstance(llm_gateway.get_client(), fake_llm.FakeLLMClient)
+
+        case = Case.objects.create(title="fake llm", initial_answers={"idea": "Онлайн-заявка"})
+        context = get_case_context(case)
+        for doc_type in ALL_DOC_TYPES:
+            with self.subTest(doc_type=doc_type):
+                structured, _, title, _ = generate_structured_and_render(doc_type, context, use_cache=False)
+                self.assertTrue(structured)
+                self.assertTrue(title)
+        self.assertEqual(llm_gateway.get_client().stats()["errors"], {})
+
+    def test_responses_are_deterministic(self):
+        first = self._create(self._client()).choices[0].message.content
+        again = self._create(self._client()).choices[0].message.content
+        other = self._create(
+            self._client(),
+            [self.MESSAGES[0], {"role": "user", "content": "Кейс: другой"}],
+        ).choices[0].message.content
+
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        vision_schema.validate(json.loads(first))
+
+    def test_stream_matches_completion(self):
+        client = self._client()
+        completion = self._create(client)
+        chunks = list(self._create(client, stream=True))
+
+        text = "".join(c.choices[0].delta.content or "" for c in chunks)
+        self.assertEqual(text, completion.choices[0].message.content)
+        self.assertEqual(chunks[-1].choices[0].finish_reason, "stop")
+        self.assertEqual(chunks[-1].usage, completion.usage)
+        self.assertEqual(client.stats()["streams"], 1)
+
+    @override_settings(LLM_MAX_RETRIES=2)
+    def test_injected_rate_limit_goes_through_gateway_retries(self):
+        client = self._client(error_rate=1.0, error_kinds=("rate_limit",), retry_after=7)
+        with self.assertRaises(openai.RateLimitError):
+            llm_gateway.call_with_retries(client.chat.completions.create, model="m", messages=self.MESSAGES)
+
+        # time.sleep общий с fake_llm: 429 он отдаёт без паузы (sleep(0))
+        waits = [c.args[0] for c in self.sleep.call_args_list if c.args[0]]
+        self.assertEqual(waits, [7.0, 7.0])
+        self.assertEqual(client.stats()["errors"], {"rate_limit": 3})
+
+    def test_call_timeout_is_honoured(self):
+        client = self._client(latency=5, latency_sigma=0)
+        with self.assertRaises(openai.APITimeoutError):
+            self._create(client, timeout=1.0)
+        # ждёт не 5 с задержки ответа, а таймаут вызова
+        self.sleep.assert_called_once_with(1.0)
+
+    def test_seed_makes_faults_reproducible(self):
+        def run():
+            client = self._client(error_rate=0.5, seed=11)
+            outcome = []
+            for _ in range(20):
+                try:
+                    self._create(client)
+                    outcome.append(None)
+                except openai.OpenAIError as e:
+                    outcome.append(type(e).__name__)
+            return outcome
+
+        first = run()
+        self.assertEqual(first, run())
+        self.assertTrue(any(first) and not all(first))
+
+
+class LLMRetryAfterTests(SimpleTestCase):
+    """
+    Retry-After соблюдается как есть, а не обрезается до LLM_RETRY_MAX_DELAY;
+    общее время повторов ограничено LLM_RETRY_DEADLINE.
+    """
+
+    def setUp(self):
+        sleep = mock.patch.object(llm_gateway.time, "sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    @override_settings(LLM_RETRY_DEADLINE=300)
+    def test_retry_after_above_max_delay_is_honoured(self):
+        fn = mock.Mock(side_effect=[_rate_limit_error("45"), "ok"])
+        self.assertEqual(llm_gateway.call_with_retries(fn), "ok")
+        self.sleep.assert_called_once_with(45.0)
+
+    @override_settings(LLM_RETRY_DEADLINE=30)
+    def test_retry_after_past_deadline_raises_without_waiting(self):
+        fn = mock.Mock(side_effect=_rate_limit_error("45"))
+        with self.assertRaises(openai.RateLimitError):
+            llm_gateway.call_with_retries(fn)
+        self.assertEqual(fn.call_count, 1)
+        self.sleep.assert_not_called()
+
+
+class DocumentQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """
+    Число запросов не растёт с числом документов и укладывается в query_budgets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("budget@example.invalid", "pw", role=User.Role.ANALYTIC)
+
+    def setUp(self):
+        self.client = jwt_client(self.user)
+
+    def test_case_documents_get(self):
+        for doc_count in (2, len(ALL_DOC_TYPES)):
+            case, _ = make_case(ALL_DOC_TYPES[:doc_count])
+            self.assertRequestQueries(self.client, "GET", f"/api/cases/{case.id}/documents/", 5)
+
+    def test_case_documents_post_sync_without_generation(self):
+        for doc_count in (2, len(ALL_DOC_TYPES)):
+            case, _ = make_case(ALL_DOC_TYPES[:doc_count])
+            self.assertRequestQueries(self.client, "POST", f"/api/cases/{case.id}/documents/?sync=1", 9)
+
+    def test_document_review_patch(self):
+        for doc_count in (2, len(ALL_DOC_TYPES)):
+            _, docs = make_case(ALL_DOC_TYPES[:doc_count])
+            self.assertRequestQueries(
+                self.client,
+                "PATCH",
+                f"/api/documents/{docs[0].id}/review/",
+                4,
+                {"status": DocumentStatus.APPROVED_BY_BA},
+            )
+
+
+class DocumentProjectionTests(TestCase):
+    """
+    ?fields= и отложенные тяжёлые колонки: content/structured_data
+    не читаются из БД, пока их не попросили.
+    """
+
+    DOC_COLUMNS = ('"documents_generateddocument"."content"', '"documents_generateddocument"."structured_data"')
+    VERSION_COLUMNS = ('"documents_documentversion"."content"', '"documents_documentversion"."structured_data"')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("fields@example.invalid", "pw", role=User.Role.ANALYTIC)
+
+    def setUp(self):
+        self.client = jwt_client(self.user)
+        self.case, self.docs = make_case([DocumentType.VISION, DocumentType.BPMN])
+
+    def _get(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url, params or {})
+        self.assertEqual(resp.status_code, 200, resp.content)
+        return resp.json(), [q["sql"] for q in ctx.captured_queries]
+
+    def _selects(self, sqls, table):
+        return [sql for sql in sqls if sql.startswith("SELECT") and f'FROM "{table}"' in sql]
+
+    def assertNotSelected(self, column, sqls):
+        # колонка в списке SELECT, а не внутри выражения has_structured_data
+        for sql in sqls:
+            self.assertNotIn(f"{column},", sql)
+            self.assertNotIn(f"{column} FROM", sql)
+
+    def test_case_documents_skip_heavy_columns(self):
+        data, sqls = self._get(f"/api/cases/{self.case.id}/documents/")
+        self.assertNotIn("documents", data)
+        self.assertEqual(len(data["files"]), 2)
+        selects = self._selects(sqls, "documents_generateddocument")
+        self.assertTrue(selects)
+        for column in self.DOC_COLUMNS:
+            self.assertNotSelected(column, selects)
+
+    def test_case_documents_fields_projection(self):
+        data, sqls = self._get(f"/api/cases/{self.case.id}/documents/", {"fields": "id,title,bogus"})
+        self.assertEqual([set(d) for d in data["documents"]], [{"id", "title"}] * 2)
+        for column in self.DOC_COLUMNS:
+            self.assertNotSelected(column, self._selects(sqls, "documents_generateddocument"))
+
+        data, sqls = self._get(f"/api/cases/{self.case.id}/documents/", {"fields": "id,content"})
+        self.assertEqual([d["content"] for d in data["documents"]], ["content", "content"])
+        self.assertTrue(
+            any(self.DOC_COLUMNS[0] in sql for sql in self._selects(sqls, "documents_generateddocument"))
+        )
+        # structured_data не просили — колонка не читается
+        self.assertNotSelected(self.DOC_COLUMNS[1], self._selects(sqls, "documents_generateddocument"))
+
+    def test_versions_default_to_metadata(self):
+        doc = GeneratedDocument.objects.get(pk=self.docs[0].pk)
+        create_document_version_snapshot(doc, reason="first")
+        doc.content = "content v2"
+        doc.save(update_fields=["content"])
+        create_document_version_snapshot(doc, reason="second")
+        url = f"/api/documents/{doc.id}/versions/"
+
+        data, sqls = self._get(url)
+        self.assertEqual([v["version"] for v in data], [2, 1])
+        self.assertEqual(set(data[0]), {"id", "version", "title", "created_at", "reason"})
+        for column in self.VERSION_COLUMNS:
+            self.assertNotSelected(column, self._selects(sqls, "documents_documentversion"))
+
+        data, _ = self._get(url, {"fields": "version,content,structured_data"})
+        self.assertEqual([v["content"] for v in data], ["content v2", "content"])
+        self.assertEqual(data[1]["structured_data"], {"plantuml": "@startuml\n@enduml"})
+
+    def test_single_document_respects_fields(self):
+        doc = self.docs[0]
+        resp = self.client.patch(
+            f"/api/documents/{doc.id}/review/?fields=id,status",
+            {"status": DocumentStatus.APPROVED_BY_BA},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(resp.json(), {"id": str(doc.id), "status": DocumentStatus.APPROVED_BY_BA})
+
+
+@skipUnless(connection.vendor in SUPPORTED_VENDORS, "EXPLAIN проверяется только для Postgres и SQLite")
+class DocumentIndexUsageTests(TestCase):
+    """
+    Горячие запросы по документам идут по индексам (см. manage.py explain_hot_paths).
+    """
+
+    def test_hot_paths_use_indexes(self):
+        disable_seqscan()
+        for name, queryset, expected in hot_paths():
+            if queryset.model not in (GeneratedDocument,):
+                continue
+            with self.subTest(name):
+                ok, plan = plan_uses_index(queryset, expected)
+                self.assertTrue(ok, f"expected one of {expected}:\n{plan}")
+
+
+class DocumentVersionConcurrencyTests(TransactionTestCase):
+    """
+    Параллельные правки одного документа: номера версий идут подряд без дублей.
+    Нужна тестовая БД, доступная нескольким соединениям (не SQLite in-memory).
+    """
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("SQLite in-memory test DB: потоки не получают отдельных соединений")
+
+    def test_concurrent_snapshots_have_no_gaps_or_duplicates(self):
+        threads_count, edits = 4, 5
+        case = Case.objects.create(title="version concurrency")
+        doc = GeneratedDocument.objects.create(
+            case=case,
+            doc_type=DocumentType.VISION,
+            title="concurrency",
+            content="",
+            status=DocumentStatus.DRAFT,
+            generation_status=GenerationStatus.READY,
+        )
+
+        errors, samples = run_concurrent_edits(doc, threads_count, edits)
+
+        self.assertFalse(errors, samples)
+        expected = threads_count * edits
+        numbers = sorted(doc.versions.values_list("version", flat=True))
+        self.assertEqual(numbers, list(range(1, expected + 1)))
+        doc.refresh_from_db(fields=["current_version"])
+        self.assertEqual(doc.current_version, expected)
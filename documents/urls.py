@@ -2,11 +2,15 @@ from django.urls import path
 
 from .views import (
     CaseDocumentsView,
+    CaseDocumentStreamView,
     DocumentReviewView,
     DocumentUploadDocxView,
     DocumentLLMEditView,
     DocumentVersionsListView,
     DocumentUseVersionView,
+    DocumentGenerationJobView,
+    DocumentGenerationJobEventsView,
+    DiagramImageView,
 )
 
 urlpatterns = [
@@ -15,6 +19,11 @@ urlpatterns = [
         CaseDocumentsView.as_view(),
         name="case-documents",
     ),
+    path(
+        "cases/<uuid:pk>/documents/<str:doc_type>/stream/",
+        CaseDocumentStreamView.as_view(),
+        name="case-document-stream",
+    ),
     path(
         "documents/<uuid:pk>/review/",
         DocumentReviewView.as_view(),
@@ -42,4 +51,23 @@ urlpatterns = [
         DocumentUseVersionView.as_view(),
         name="document-use-version",
     ),
-]
\ No newline at end of file
+
+    # фоновая генерация документов
+    path(
+        "document-jobs/<uuid:pk>/",
+        DocumentGenerationJobView.as_view(),
+        name="document-job-detail",
+    ),
+    path(
+        "document-jobs/<uuid:pk>/events/",
+        DocumentGenerationJobEventsView.as_view(),
+        name="document-job-events",
+    ),
+
+    # картинки диаграмм из локального кэша PlantUML
+    path(
+        "diagrams/<slug:digest>.<slug:fmt>",
+        DiagramImageView.as_view(),
+        name="diagram-image",
+    ),
+]
@@ -1,23 +1,34 @@
+import json
 import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
 
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound, ValidationError, PermissionDenied
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
 
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from drf_spectacular.types import OpenApiTypes
 
-from cases.models import Case, CaseStatus
+from cases.models import Case
 from cases.views import check_case_access, is_admin_user, is_analytic_user
 
 from .models import (
     GeneratedDocument,
+    DocumentGenerationJob,
     DocumentType,
     DocumentStatus,
     DocumentVersion,
 )
+from .renderers import EventStreamRenderer
 from .serializers import (
     GeneratedDocumentSerializer,
     DocumentReviewSerializer,
@@ -26,11 +37,20 @@ from .serializers import (
     DocumentVersionSelectSerializer,
 )
 from .services.editing import apply_llm_edit
-from .services.ensure import ensure_case_documents
+from .services.ensure import (
+    ensure_case_documents,
+    finalize_case_documents,
+    get_stale_doc_types,
+)
+from .services.jobs import JobConflict, enqueue_case_documents_job, build_job_payload
+from .services.streaming import STREAMABLE_DOC_TYPES, stream_document_generation
+from .services.plantuml_render import SUPPORTED_FORMATS, diagram_exists, get_or_render_by_digest
+from .services.projection import light_documents, only_fields_for
 from .services.docx_export import ensure_docx_for_document
-from .services.confluence_publish import publish_case_to_confluence
+from .services.confluence_publish import schedule_case_publish
 from .services.bpmn_image_export import ensure_bpmn_url_for_document
 from .services.versioning import create_document_version_snapshot
+from .services.version_store import get_version_payload, get_version_payloads
 from .services.diagram_editing import apply_diagram_llm_edit  # important
 
 logger = logging.getLogger(__name__)
@@ -41,7 +61,11 @@ logger = logging.getLogger(__name__)
     summary="Список документов по кейсу (без генерации)",
     description=(
         "GET: возвращает список уже сгенерированных документов по кейсу и ссылки на файлы, "
-        "НЕ создавая новые документы и НЕ вызывая LLM.\n\n"
+        "НЕ создавая новые документы и НЕ вызывая LLM.\n"
+        "stale_doc_types — документы, которые устарели относительно текущих ответов "
+        "(их обновит POST с ?refresh=stale).\n"
+        "`?fields=id,title,content,...` — дополнительно вернуть documents с выбранными полями "
+        "документа; content/structured_data читаются из БД только если они перечислены.\n\n"
         "Права доступа:\n"
         "- CLIENT видит документы только своих кейсов;\n"
         "- AUTHORITY и ANALYTIC могут видеть документы любого кейса."
@@ -56,15 +80,22 @@ logger = logging.getLogger(__name__)
 class CaseDocumentsView(generics.GenericAPIView):
     """
     GET  /api/cases/{id}/documents/  — просто достаёт текущие документы (без генерации LLM)
-    POST /api/cases/{id}/documents/  — генерирует/обновляет документы и файлы (DOCX + diagram_url)
+    POST /api/cases/{id}/documents/  — ставит фоновую генерацию документов и файлов (DOCX + diagram_url),
+                                       с ?sync=1 — генерирует прямо в запросе
     """
 
     serializer_class = GeneratedDocumentSerializer
 
-    def _build_files_payload(self, request, case: Case):
-        docs = list(
-            GeneratedDocument.objects.filter(case=case).order_by("doc_type")
-        )
+    # бюджет SQL-запросов (см. forte_ai_back/query_budget.py), включая SELECT
+    # JWT-пользователя и ревизии кейса (context_builder.get_case_context, холодный кэш);
+    # POST — постановка задачи / ?sync=1 без фактической генерации
+    query_budgets = {"get": 5, "post": 9}
+
+    def _build_files_payload(self, request, case: Case, docs=None):
+        if docs is None:
+            docs = list(
+                GeneratedDocument.objects.filter(case=case).order_by("doc_type")
+            )
 
         files = []
         for doc in docs:
@@ -75,7 +106,9 @@ class CaseDocumentsView(generics.GenericAPIView):
                 docx_url = request.build_absolute_uri(doc.docx_file.url)
 
             diagram_url = doc.diagram_url
-            diagram_path = None  # локальных файлов не храним
+            if diagram_url and diagram_url.startswith("/"):
+                diagram_url = request.build_absolute_uri(diagram_url)
+            diagram_path = None  # картинка отдаётся по diagram_url из кэша диаграмм
 
             files.append(
                 {
@@ -101,31 +134,67 @@ class CaseDocumentsView(generics.GenericAPIView):
 
         check_case_access(request.user, case)
 
-        files = self._build_files_payload(request, case)
+        # content/structured_data читаем, только если их явно попросили в ?fields=
+        fields = None
+        if "fields" in request.query_params:
+            fields = GeneratedDocumentSerializer.resolve_fields(request)
+
+        docs = list(
+            light_documents(
+                GeneratedDocument.objects.filter(case=case).order_by("doc_type"),
+                include=fields or (),
+            )
+        )
+        files = self._build_files_payload(request, case, docs)
         payload = {
             "case_id": str(case.id),
             "case_title": case.title,
             "did_generate_any": False,
             "errors": {},
+            "stale_doc_types": get_stale_doc_types(case, docs),
             "files": files,
         }
+        if fields is not None:
+            payload["documents"] = GeneratedDocumentSerializer(
+                docs,
+                many=True,
+                fields=fields,
+                context=self.get_serializer_context(),
+            ).data
         return Response(payload, status=status.HTTP_200_OK)
 
     @extend_schema(
         tags=["Documents"],
-        summary="Сгенерировать/обновить документы по кейсу и вернуть список файлов",
+        summary="Поставить генерацию документов по кейсу в очередь",
         description=(
-            "POST: запускает ленивую генерацию документов по кейсу (vision/scope/bpmn/context/use case) "
-            "и создание файлов:\n"
+            "POST: ставит фоновую задачу ленивой генерации документов по кейсу "
+            "(vision/scope/bpmn/context/use case) и создания файлов:\n"
             "- для текстовых документов — DOCX;\n"
-            "- для диаграмм (BPMN, context_diagram, uml_use_case_diagram) — только URL на PlantUML-сервер.\n"
+            "- для диаграмм (BPMN, context_diagram, uml_use_case_diagram) — только URL на PlantUML-сервер.\n\n"
+            "Возвращает 202 и job_id. Прогресс — GET /api/document-jobs/{job_id}/ "
+            "или SSE-поток /api/document-jobs/{job_id}/events/.\n"
+            "Если по кейсу уже есть незавершённая задача — возвращается она.\n\n"
+            "`?refresh=stale` — перегенерировать также устаревшие документы "
+            "(поменялись ответы по кейсу или промпт). Ожидающей задаче режим "
+            "включается на месте; если задача уже выполняется без него — 409.\n"
+            "Задачи выполняет воркер `manage.py run_document_jobs`, а при "
+            "DOCUMENT_JOBS_RUN_IN_PROCESS=1 (по умолчанию) — и сам веб-процесс.\n"
+            "`?sync=1` — старое поведение: генерация прямо в запросе, ответ 200 со списком файлов."
         ),
         request=None,
         responses={
+            202: OpenApiResponse(
+                description="Задача генерации поставлена в очередь",
+                response=OpenApiTypes.OBJECT,
+            ),
             200: OpenApiResponse(
-                description="Список документов и файлов по кейсу после генерации",
+                description="Список документов и файлов по кейсу после генерации (?sync=1)",
                 response=OpenApiTypes.OBJECT,
-            )
+            ),
+            409: OpenApiResponse(
+                description="Задача без refresh=stale уже выполняется (в ответе — её состояние)",
+                response=OpenApiTypes.OBJECT,
+            ),
         },
     )
     def post(self, request, pk, *args, **kwargs):
@@ -136,38 +205,277 @@ class CaseDocumentsView(generics.GenericAPIView):
 
         check_case_access(request.user, case)
 
+        refresh_stale = request.query_params.get("refresh") == "stale"
+
+        if request.query_params.get("sync") in ("1", "true"):
+            return self._post_sync(request, case, refresh_stale=refresh_stale)
+
         try:
-            docs, errors, did_generate_any = ensure_case_documents(case)
+            job, created = enqueue_case_documents_job(
+                case,
+                requested_by=str(request.user.id) if request.user.is_authenticated else None,
+                refresh_stale=refresh_stale,
+            )
+        except JobConflict as e:
+            payload = build_job_payload(e.job)
+            payload["detail"] = str(e)
+            return Response(payload, status=status.HTTP_409_CONFLICT)
+
+        payload = build_job_payload(job)
+        payload["created"] = created
+        payload["status_url"] = request.build_absolute_uri(
+            reverse("document-job-detail", kwargs={"pk": job.id})
+        )
+        payload["events_url"] = request.build_absolute_uri(
+            reverse("document-job-events", kwargs={"pk": job.id})
+        )
+        return Response(payload, status=status.HTTP_202_ACCEPTED)
+
+    def _post_sync(self, request, case: Case, *, refresh_stale: bool = False):
+        try:
+            docs, errors, generated = ensure_case_documents(
+                case,
+                refresh_stale=refresh_stale,
+            )
         except Exception as e:
             raise ValidationError(str(e))
 
-        for doc in docs:
-            if doc.doc_type in (DocumentType.VISION, DocumentType.SCOPE):
-                ensure_docx_for_document(doc, force=False)
-
-            if doc.doc_type in (
-                DocumentType.BPMN,
-                DocumentType.CONTEXT_DIAGRAM,
-                DocumentType.UML_USE_CASE_DIAGRAM,
-            ):
-                ensure_bpmn_url_for_document(doc, force=False)
+        finalize_case_documents(case, docs, generated)
 
-        if did_generate_any and case.status != CaseStatus.DOCUMENTS_GENERATED:
-            case.status = CaseStatus.DOCUMENTS_GENERATED
-            case.save(update_fields=["status"])
-
-        files = self._build_files_payload(request, case)
+        # docs уже обновлены finalize_case_documents — повторно не читаем
+        files = self._build_files_payload(request, case, docs)
 
         payload = {
             "case_id": str(case.id),
             "case_title": case.title,
-            "did_generate_any": did_generate_any,
+            "did_generate_any": bool(generated),
             "errors": errors,
             "files": files,
         }
         return Response(payload, status=status.HTTP_200_OK)
 
 
+def _get_job_for_user(request, pk) -> DocumentGenerationJob:
+    try:
+        job = DocumentGenerationJob.objects.select_related("case").get(pk=pk)
+    except DocumentGenerationJob.DoesNotExist:
+        raise NotFound("Job not found")
+
+    check_case_access(request.user, job.case)
+    return job
+
+
+@extend_schema(
+    tags=["Documents"],
+    summary="Статус фоновой генерации документов",
+    description=(
+        "Возвращает статус задачи (new / generating / ready / failed), "
+        "прогресс и generation_status каждого документа задачи."
+    ),
+    responses={
+        200: OpenApiResponse(
+            description="Состояние задачи генерации",
+            response=OpenApiTypes.OBJECT,
+        )
+    },
+)
+class DocumentGenerationJobView(generics.GenericAPIView):
+    """
+    GET /api/document-jobs/{id}/
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        job = _get_job_for_user(request, pk)
+        return Response(build_job_payload(job), status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    tags=["Documents"],
+    summary="SSE-поток прогресса генерации документов",
+    description=(
+        "Server-Sent Events: событие `progress` при каждом изменении состояния задачи, "
+        "событие `done` с финальным состоянием, после чего поток закрывается.\n\n"
+        "Поток живёт не дольше DOCUMENT_JOBS_SSE_MAX_DURATION (30 с по умолчанию) и "
+        "закрывается без `done` — EventSource переподключается сам (поле `retry`), "
+        "можно также опрашивать GET /api/document-jobs/{id}/."
+    ),
+    responses={
+        200: OpenApiResponse(
+            description="text/event-stream",
+            response=OpenApiTypes.STR,
+        )
+    },
+)
+class DocumentGenerationJobEventsView(generics.GenericAPIView):
+    """
+    GET /api/document-jobs/{id}/events/
+    """
+
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, pk, *args, **kwargs):
+        job = _get_job_for_user(request, pk)
+
+        response = StreamingHttpResponse(
+            self._event_stream(job.pk),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    @staticmethod
+    def _event_stream(job_id):
+        poll_interval = float(getattr(settings, "DOCUMENT_JOBS_SSE_POLL_INTERVAL", 1.0))
+        # поток держит поток-воркер WSGI — короткий, клиент переподключается
+        max_duration = float(getattr(settings, "DOCUMENT_JOBS_SSE_MAX_DURATION", 30))
+        deadline = time.monotonic() + max_duration
+        last_payload = None
+
+        yield f"retry: {int(poll_interval * 1000)}\n\n"
+
+        while True:
+            job = DocumentGenerationJob.objects.filter(pk=job_id).first()
+            if job is None:
+                yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+                return
+
+            payload = build_job_payload(job)
+            if payload != last_payload:
+                data = json.dumps(payload, ensure_ascii=False)
+                event = "done" if job.is_finished else "progress"
+                yield f"event: {event}\ndata: {data}\n\n"
+                last_payload = payload
+            else:
+                # keep-alive, чтобы прокси не рвали соединение
+                yield ": ping\n\n"
+
+            if job.is_finished or time.monotonic() >= deadline:
+                return
+
+            # между опросами соединение с БД не держим
+            if not connection.in_atomic_block:
+                connection.close()
+            time.sleep(poll_interval)
+
+
+@extend_schema(
+    tags=["Documents"],
+    summary="Потоковая генерация Vision/Scope (SSE)",
+    description=(
+        "Server-Sent Events: генерирует документ vision или scope и отдаёт разделы "
+        "по мере их готовности — событие `section` ({doc_type, key, value}) на каждый "
+        "дописанный раздел верхнего уровня, затем `done` с сохранённым документом "
+        "или `error`.\n\n"
+        "Если документ уже сгенерирован, разделы сразу отдаются из сохранённых данных; "
+        "`?force=1` — сгенерировать заново."
+    ),
+    request=None,
+    responses={
+        200: OpenApiResponse(
+            description="text/event-stream",
+            response=OpenApiTypes.STR,
+        )
+    },
+)
+class CaseDocumentStreamView(generics.GenericAPIView):
+    """
+    GET/POST /api/cases/{id}/documents/{doc_type}/stream/
+    """
+
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, pk, doc_type, *args, **kwargs):
+        try:
+            case = Case.objects.get(pk=pk)
+        except Case.DoesNotExist:
+            raise NotFound("Case not found")
+
+        check_case_access(request.user, case)
+
+        if doc_type not in STREAMABLE_DOC_TYPES:
+            raise ValidationError(
+                {"doc_type": f"Streaming is supported only for: {', '.join(STREAMABLE_DOC_TYPES)}"}
+            )
+
+        force = request.query_params.get("force") in ("1", "true")
+
+        response = StreamingHttpResponse(
+            self._event_stream(case, doc_type, force),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def post(self, request, pk, doc_type, *args, **kwargs):
+        return self.get(request, pk, doc_type, *args, **kwargs)
+
+    @staticmethod
+    def _event_stream(case, doc_type, force):
+        events = stream_document_generation(case, doc_type, force=force)
+        try:
+            for event, payload in events:
+                data = json.dumps(payload, ensure_ascii=False)
+                yield f"event: {event}\ndata: {data}\n\n"
+        finally:
+            # клиент отключился — закрываем генерацию сразу, а не при сборке мусора
+            events.close()
+
+
+@extend_schema(
+    tags=["Documents"],
+    summary="Картинка диаграммы (PNG/SVG) из локального кэша",
+    description=(
+        "Отдаёт отрендеренную PlantUML-диаграмму по sha256 её исходника. "
+        "Если нужного формата ещё нет в кэше — рендерит его из сохранённого исходника.\n"
+        "Адрес неизменяемый (содержимое определяется хэшем), поэтому отдаётся "
+        "с долгим Cache-Control и ETag. Авторизация не нужна — ссылка вставляется в <img>."
+    ),
+    responses={
+        200: OpenApiResponse(description="image/png или image/svg+xml", response=OpenApiTypes.BINARY),
+        304: OpenApiResponse(description="Не изменилось (If-None-Match)"),
+    },
+)
+class DiagramImageView(generics.GenericAPIView):
+    """
+    GET /api/diagrams/{sha256}.{png|svg}
+    """
+
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request, digest, fmt, *args, **kwargs):
+        if fmt not in SUPPORTED_FORMATS or len(digest) != 64:
+            raise NotFound("Diagram not found")
+        try:
+            int(digest, 16)
+        except ValueError:
+            raise NotFound("Diagram not found")
+
+        # 304 только для диаграмм, которые у нас есть: иначе любой sha из
+        # If-None-Match «подтверждался» бы анонимному клиенту
+        if not diagram_exists(digest, fmt):
+            raise NotFound("Diagram not found")
+
+        etag = f'"{digest}.{fmt}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            try:
+                path = get_or_render_by_digest(digest, fmt)
+            except Exception:
+                logger.exception("Failed to render diagram %s.%s", digest, fmt)
+                raise ValidationError("Failed to render diagram")
+            if path is None:
+                raise NotFound("Diagram not found")
+            response = FileResponse(open(path, "rb"), content_type=SUPPORTED_FORMATS[fmt])
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
 @extend_schema(
     tags=["Documents"],
     summary="Подтвердить или отклонить документ (роль ANALYTIC / AUTHORITY)",
@@ -175,7 +483,8 @@ class CaseDocumentsView(generics.GenericAPIView):
         "Позволяет роли ANALYTIC (и AUTHORITY) менять статус документа: "
         "`draft` / `approved_by_ba` / `rejected_by_ba`.\n\n"
         "Если после изменения статуса ВСЕ документы кейса имеют статус "
-        "`approved_by_ba`, вызывается publish_case_to_confluence(case)."
+        "`approved_by_ba`, публикация кейса в Confluence ставится в фон "
+        "(ответ её не ждёт)."
     ),
     request=DocumentReviewSerializer,
     responses={200: GeneratedDocumentSerializer},
@@ -183,6 +492,9 @@ class CaseDocumentsView(generics.GenericAPIView):
 class DocumentReviewView(generics.GenericAPIView):
     serializer_class = DocumentReviewSerializer
 
+    # публикация в Confluence идёт в фоне и в бюджет запроса не входит
+    query_budgets = {"patch": 4}
+
     def patch(self, request, pk, *args, **kwargs):
         try:
             doc = GeneratedDocument.objects.select_related("case").get(pk=pk)
@@ -203,12 +515,16 @@ class DocumentReviewView(generics.GenericAPIView):
         case = doc.case
 
         if new_status == DocumentStatus.APPROVED_BY_BA:
-            all_docs = list(case.documents.all())
-            if all_docs and all(
-                d.status == DocumentStatus.APPROVED_BY_BA for d in all_docs
-            ):
+            # текущий документ только что одобрен, поэтому кейс не пуст —
+            # достаточно одного EXISTS по неодобренным
+            has_unapproved = (
+                GeneratedDocument.objects.filter(case_id=case.pk)
+                .exclude(status=DocumentStatus.APPROVED_BY_BA)
+                .exists()
+            )
+            if not has_unapproved:
                 try:
-                    publish_case_to_confluence(case)
+                    schedule_case_publish(case)
                 except Exception as e:
                     logger.exception(
                         "Failed to publish case %s to Confluence: %s",
@@ -217,7 +533,7 @@ class DocumentReviewView(generics.GenericAPIView):
                     )
 
         return Response(
-            GeneratedDocumentSerializer(doc).data,
+            GeneratedDocumentSerializer(doc, context={"request": request}).data,
             status=status.HTTP_200_OK,
         )
 
@@ -253,11 +569,12 @@ class DocumentUploadDocxView(generics.GenericAPIView):
             raise ValidationError("No file uploaded. Use form-data field 'file'.")
 
         doc.docx_file = file_obj
+        doc.docx_hash = None  # файл загружен вручную, а не собран из structured_data
         doc.docx_generated_at = timezone.now()
-        doc.save(update_fields=["docx_file", "docx_generated_at", "updated_at"])
+        doc.save(update_fields=["docx_file", "docx_hash", "docx_generated_at", "updated_at"])
 
         return Response(
-            GeneratedDocumentSerializer(doc).data,
+            GeneratedDocumentSerializer(doc, context={"request": request}).data,
             status=status.HTTP_200_OK,
         )
 
@@ -301,7 +618,7 @@ class DocumentLLMEditView(generics.GenericAPIView):
             create_document_version_snapshot(doc, reason="llm_edit")
 
             return Response(
-                GeneratedDocumentSerializer(doc).data,
+                GeneratedDocumentSerializer(doc, context={"request": request}).data,
                 status=status.HTTP_200_OK,
             )
 
@@ -320,7 +637,7 @@ class DocumentLLMEditView(generics.GenericAPIView):
             create_document_version_snapshot(doc, reason="diagram_edit")
 
             return Response(
-                GeneratedDocumentSerializer(doc).data,
+                GeneratedDocumentSerializer(doc, context={"request": request}).data,
                 status=status.HTTP_200_OK,
             )
 
@@ -344,8 +661,21 @@ class DocumentVersionsListView(generics.GenericAPIView):
 
         check_case_access(request.user, doc.case)
 
-        versions = doc.versions.all().order_by("-version")
-        serializer = self.get_serializer(versions, many=True)
+        fields = DocumentVersionSerializer.resolve_fields(request)
+        versions = doc.versions.only(
+            *only_fields_for(DocumentVersion, fields, always=("id", "version"))
+        ).order_by("-version")
+        context = self.get_serializer_context()
+        if "content" in fields or "structured_data" in fields:
+            # keyframe'ы для delta-версий — одним запросом на всю страницу
+            versions = list(versions)
+            context["version_payloads"] = get_version_payloads(versions)
+        serializer = self.get_serializer_class()(
+            versions,
+            many=True,
+            fields=fields,
+            context=context,
+        )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -392,10 +722,11 @@ class DocumentUseVersionView(generics.GenericAPIView):
             except DocumentVersion.DoesNotExist:
                 raise NotFound("Version not found for this document")
 
-        # подмена текущего состояния документа
-        doc.title = version_obj.title
-        doc.content = version_obj.content
-        doc.structured_data = version_obj.structured_data
+        # подмена текущего состояния документа (delta-версия восстанавливается из keyframe)
+        payload = get_version_payload(version_obj)
+        doc.title = payload["title"]
+        doc.content = payload["content"]
+        doc.structured_data = payload["structured_data"]
         doc.save(update_fields=["title", "content", "structured_data", "updated_at"])
 
         # перегенерим файлы/диаграммы
@@ -413,6 +744,6 @@ class DocumentUseVersionView(generics.GenericAPIView):
         create_document_version_snapshot(doc, reason="restore_version")
 
         return Response(
-            GeneratedDocumentSerializer(doc).data,
+            GeneratedDocumentSerializer(doc, context={"request": request}).data,
             status=status.HTTP_200_OK,
         )
\ No newline at end of file
@@ -0,0 +1,74 @@
+# forte_ai_back/background.py
+"""
+Лёгкие фоновые задачи в пуле потоков процесса — для коротких действий,
+которые не должны держать HTTP-запрос (план уточняющих вопросов и т.п.).
+
+- submit(fn, *args) — выполнить в пуле (BACKGROUND_TASKS_MAX_WORKERS потоков);
+- submit_on_commit(fn, *args) — то же, но после коммита текущей транзакции,
+  чтобы задача увидела записанные данные.
+
+Задачи живут в памяти процесса и не переживают его рестарт, поэтому
+вызывающий код должен уметь восстановиться (см. cases.services.followup).
+С BACKGROUND_TASKS_SYNC=1 задачи выполняются сразу в текущем потоке.
+Долгая и повторяемая работа — через очередь в БД (documents.services.jobs).
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(getattr(settings, "BACKGROUND_TASKS_MAX_WORKERS", 4)),
+                    thread_name_prefix="background",
+                )
+    return _executor
+
+
+def _run(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(fn, "__qualname__", fn))
+        raise
+    finally:
+        # у потока пула своё соединение с БД — не оставляем его висеть
+        connections.close_all()
+
+
+def submit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    if getattr(settings, "BACKGROUND_TASKS_SYNC", False):
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            logger.exception("Background task %s failed", getattr(fn, "__qualname__", fn))
+            future.set_exception(e)
+        return future
+
+    return get_executor().submit(_run, fn, *args, **kwargs)
+
+
+def submit_on_commit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+    transaction.on_commit(lambda: submit(fn, *args, **kwargs))
+
+
+def shutdown(wait: bool = True) -> None:
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+        _executor = None
@@ -0,0 +1,91 @@
+"""
+Бюджет SQL-запросов на эндпоинт.
+
+- count_queries() — считает запросы через connection.execute_wrapper
+  (работает и при DEBUG=False, в отличие от connection.queries);
+- assert_max_queries(n) — то же, но падает QueryBudgetExceeded, если запросов больше n;
+- QueryBudgetMiddleware — отдаёт X-Query-Count в ответе и пишет warning,
+  если view превысил свой бюджет: атрибут query_budgets = {"get": 3, "post": 10}.
+  С QUERY_BUDGET_STRICT=True превышение — исключение (для dev/CI).
+
+Проверка бюджетов на фикстурах: manage.py check_query_budgets и тесты
+(documents/tests.py, cases/tests.py — assertNumQueries с настоящим JWT).
+"""
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def format_statements(self) -> str:
+        return "\n".join(f"{i}. {sql}" for i, sql in enumerate(self.statements, 1))
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, label: str = "") -> Iterator[QueryCounter]:
+    with count_queries() as counter:
+        yield counter
+
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{label or 'block'}: {counter.count} queries, budget {max_queries}\n"
+            f"{counter.format_statements()}"
+        )
+
+
+def get_view_budget(view_func: Any, method: str) -> Optional[int]:
+    view_class = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None)
+    budgets: Dict[str, int] = getattr(view_class, "query_budgets", None) or {}
+    return budgets.get(method.lower())
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._query_budget = None
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        response["X-Query-Count"] = str(counter.count)
+
+        budget = request._query_budget
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{request.method} {request.path}: {counter.count} queries, budget {budget}"
+            )
+            if getattr(settings, "QUERY_BUDGET_STRICT", False):
+                raise QueryBudgetExceeded(f"{message}\n{counter.format_statements()}")
+            logger.warning(message)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = get_view_budget(view_func, request.method)
+        return None
@@ -4,6 +4,7 @@ Django settings for forte_ai_back project.
 Django 5.2.8
 """
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 from corsheaders.defaults import default_headers, default_methods
@@ -57,6 +58,12 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Счётчик SQL-запросов на запрос (X-Query-Count) и проверка query_budgets у view
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "1" if DEBUG else "0") == "1"
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+if QUERY_BUDGET_ENABLED:
+    MIDDLEWARE.append("forte_ai_back.query_budget.QueryBudgetMiddleware")
+
 ROOT_URLCONF = "forte_ai_back.urls"
 WSGI_APPLICATION = "forte_ai_back.wsgi.application"
 
@@ -125,8 +132,25 @@ else:
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
             "OPTIONS": {"timeout": int(os.getenv("SQLITE_TIMEOUT", "30"))},
+            # тестовая БД в файле, а не in-memory: потоки TransactionTestCase
+            # (параллельные писатели) получают собственные соединения.
+            # Файл — во временном каталоге, чтобы не засорять рабочую копию
+            "TEST": {
+                "NAME": os.getenv(
+                    "SQLITE_TEST_NAME",
+                    str(Path(tempfile.gettempdir()) / "forte_ai_back_test.sqlite3"),
+                ),
+            },
         }
     }
+    # SQLITE_TRANSACTION_MODE=IMMEDIATE — для нагрузочных прогонов на dev-SQLite
+    # (bench_generation --concurrency > 1): DEFERRED-транзакция, перешедшая от чтения
+    # к записи, при конкуренции сразу падает с "database is locked", а IMMEDIATE
+    # берёт лок на запись в BEGIN и ждёт его (timeout). Цена — сериализация всех
+    # atomic-блоков, даже читающих, поэтому по умолчанию выключено.
+    SQLITE_TRANSACTION_MODE = os.getenv("SQLITE_TRANSACTION_MODE", "")
+    if SQLITE_TRANSACTION_MODE:
+        DATABASES["default"]["OPTIONS"]["transaction_mode"] = SQLITE_TRANSACTION_MODE.upper()
 
 # Static / Media
 STATIC_URL = "static/"
@@ -162,9 +186,120 @@ OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.2"))
 
 PLANTUML_SERVER_URL = os.getenv("PLANTUML_SERVER_URL", "https://www.plantuml.com/plantuml")
 
+# Рендер диаграмм: url (ссылка на сервер) / auto (локальный jar, иначе сервер) /
+# local / server. Пусто (по умолчанию) — auto, если PLANTUML_JAR_PATH указывает
+# на jar и есть java, иначе url. Генерация документов рендерит заранее только
+# локальным jar, PlantUML-сервер вызывается лениво — при первом GET /api/diagrams/...
+PLANTUML_RENDER_MODE = os.getenv("PLANTUML_RENDER_MODE", "")
+PLANTUML_JAR_PATH = os.getenv("PLANTUML_JAR_PATH", "")
+PLANTUML_JAVA_BIN = os.getenv("PLANTUML_JAVA_BIN", "java")
+PLANTUML_POOL_SIZE = int(os.getenv("PLANTUML_POOL_SIZE", "2"))
+PLANTUML_RENDER_TIMEOUT = float(os.getenv("PLANTUML_RENDER_TIMEOUT", "30"))
+PLANTUML_CACHE_DIR = os.getenv("PLANTUML_CACHE_DIR", "diagrams")  # внутри MEDIA_ROOT
+
+# Публичный адрес бэкенда для ссылок, которые строятся вне запроса (картинки диаграмм)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
+
 CONFLUENCE_BASE_URL = os.getenv("CONFLUENCE_BASE_URL", "")
 CONFLUENCE_USERNAME = os.getenv("CONFLUENCE_USERNAME", "")
 CONFLUENCE_API_TOKEN = os.getenv("CONFLUENCE_API_TOKEN", "")
 
 OPENAI_USECASE_WORKFLOW_ID = os.getenv("OPENAI_USECASE_WORKFLOW_ID", "")
-OPENAI_AGENT_MODEL = os.getenv("OPENAI_AGENT_MODEL", "gpt-5.1-mini")
\ No newline at end of file
+OPENAI_AGENT_MODEL = os.getenv("OPENAI_AGENT_MODEL", "gpt-5.1-mini")
+
+# LLM gateway (documents/services/llm_gateway.py): пул HTTP-соединений и повторы
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "300"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+# Retry-After соблюдается как есть (MAX_DELAY ограничивает только backoff);
+# все повторы одного вызова укладываются в DEADLINE секунд, иначе — исходная ошибка
+LLM_RETRY_DEADLINE = float(os.getenv("LLM_RETRY_DEADLINE", "300"))
+
+# Document generation
+DOCUMENTS_GENERATION_PARALLEL = os.getenv("DOCUMENTS_GENERATION_PARALLEL", "1") == "1"
+DOCUMENTS_GENERATION_MAX_WORKERS = int(os.getenv("DOCUMENTS_GENERATION_MAX_WORKERS", "5"))
+DOCUMENTS_GENERATION_TIMEOUT = int(os.getenv("DOCUMENTS_GENERATION_TIMEOUT", "600"))
+
+# Document generation jobs (очередь в БД, воркер: manage.py run_document_jobs)
+DOCUMENT_JOBS_POLL_INTERVAL = float(os.getenv("DOCUMENT_JOBS_POLL_INTERVAL", "2"))
+DOCUMENT_JOBS_MAX_ATTEMPTS = int(os.getenv("DOCUMENT_JOBS_MAX_ATTEMPTS", "3"))
+# Без выделенного воркера задачу выполняет пул фоновых задач веб-процесса
+# (forte_ai_back.background); при запущенных run_document_jobs можно выключить
+DOCUMENT_JOBS_RUN_IN_PROCESS = os.getenv("DOCUMENT_JOBS_RUN_IN_PROCESS", "1") == "1"
+DOCUMENT_JOBS_SSE_POLL_INTERVAL = float(os.getenv("DOCUMENT_JOBS_SSE_POLL_INTERVAL", "1"))
+# SSE держит поток-воркер: поток короткий, EventSource переподключается сам
+DOCUMENT_JOBS_SSE_MAX_DURATION = float(os.getenv("DOCUMENT_JOBS_SSE_MAX_DURATION", "30"))
+
+# LLM response cache (таблица documents.LLMResponseCache)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# put() вытесняет записи раз в N сохранений процесса (0 — только manage.py prune_llm_cache)
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "100"))
+
+# Размер страницы списка кейсов (cursor-пагинация)
+CASES_PAGE_SIZE = int(os.getenv("CASES_PAGE_SIZE", "20"))
+
+# Версии документов: keyframe каждые N версий, остальные — delta к keyframe
+DOCUMENT_VERSION_KEYFRAME_INTERVAL = int(os.getenv("DOCUMENT_VERSION_KEYFRAME_INTERVAL", "10"))
+DOCUMENT_VERSION_DELTA_MAX_RATIO = float(os.getenv("DOCUMENT_VERSION_DELTA_MAX_RATIO", "0.5"))
+DOCUMENT_VERSION_LRU_SIZE = int(os.getenv("DOCUMENT_VERSION_LRU_SIZE", "128"))
+
+# Кэш контекста кейса (case_id:revision) в памяти процесса; 0 — выключен
+CASE_CONTEXT_CACHE_SIZE = int(os.getenv("CASE_CONTEXT_CACHE_SIZE", "256"))
+
+# Фоновые задачи в пуле потоков процесса (forte_ai_back.background)
+BACKGROUND_TASKS_MAX_WORKERS = int(os.getenv("BACKGROUND_TASKS_MAX_WORKERS", "4"))
+BACKGROUND_TASKS_SYNC = os.getenv("BACKGROUND_TASKS_SYNC", "0") == "1"
+
+# План уточняющих вопросов: строится в фоне, на ответ LLM — латентный бюджет,
+# дальше — fallback-план; зависший PLANNING чинится fallback'ом через STALE_SECONDS
+FOLLOWUP_PLAN_ASYNC = os.getenv("FOLLOWUP_PLAN_ASYNC", "1") == "1"
+FOLLOWUP_PLAN_LLM_TIMEOUT = float(os.getenv("FOLLOWUP_PLAN_LLM_TIMEOUT", "20"))
+FOLLOWUP_PLAN_STALE_SECONDS = float(os.getenv("FOLLOWUP_PLAN_STALE_SECONDS", "120"))
+
+# Корпоративный шаблон DOCX (стили, нумерация, колонтитулы); пусто — шаблон python-docx
+DOCX_TEMPLATE_PATH = os.getenv("DOCX_TEMPLATE_PATH", "")
+
+# Confluence: общий пул соединений, таймауты (сек) и повторы на 429/5xx с jitter;
+# публикация кейса после ревью — в фоне
+CONFLUENCE_HTTP_POOL_SIZE = int(os.getenv("CONFLUENCE_HTTP_POOL_SIZE", "10"))
+CONFLUENCE_HTTP_CONNECT_TIMEOUT = float(os.getenv("CONFLUENCE_HTTP_CONNECT_TIMEOUT", "5"))
+CONFLUENCE_HTTP_TIMEOUT = float(os.getenv("CONFLUENCE_HTTP_TIMEOUT", "30"))
+CONFLUENCE_MAX_RETRIES = int(os.getenv("CONFLUENCE_MAX_RETRIES", "3"))
+CONFLUENCE_RETRY_BASE_DELAY = float(os.getenv("CONFLUENCE_RETRY_BASE_DELAY", "0.5"))
+CONFLUENCE_RETRY_MAX_DELAY = float(os.getenv("CONFLUENCE_RETRY_MAX_DELAY", "10"))
+# Retry-After соблюдается как есть (MAX_DELAY ограничивает только backoff);
+# все повторы одного запроса укладываются в DEADLINE секунд, иначе — ошибка
+CONFLUENCE_RETRY_DEADLINE = float(os.getenv("CONFLUENCE_RETRY_DEADLINE", "120"))
+CONFLUENCE_PUBLISH_ASYNC = os.getenv("CONFLUENCE_PUBLISH_ASYNC", "1") == "1"
+
+# Справочник space'ов Confluence в кэше Django: свежий TTL секунд, дальше —
+# отдаётся устаревший и обновляется в фоне ещё STALE_SECONDS
+CONFLUENCE_SPACES_TTL = float(os.getenv("CONFLUENCE_SPACES_TTL", "300"))
+CONFLUENCE_SPACES_STALE_SECONDS = float(os.getenv("CONFLUENCE_SPACES_STALE_SECONDS", str(24 * 3600)))
+
+# Markdown -> Confluence storage: блоки plantuml как вложения-картинки ("attachment")
+# или макрос плагина PlantUML ("macro"); LRU отрендеренных фрагментов по хэшу текста
+CONFLUENCE_PLANTUML_MODE = os.getenv("CONFLUENCE_PLANTUML_MODE", "attachment")
+CONFLUENCE_STORAGE_CACHE_SIZE = int(os.getenv("CONFLUENCE_STORAGE_CACHE_SIZE", "512"))
+
+# LLM-бэкенд: "openai", "fake" (локальный заменитель без сети для бенчмарков,
+# manage.py bench_generation) или dotted path к фабрике клиента.
+# FAKE_LLM_*: медиана задержки до первого токена (сек) и её разброс (логнормальный),
+# скорость "печати" (токенов/сек, 0 — мгновенно), доля и виды сбоев
+# (rate_limit, server_error, timeout), Retry-After для 429, размер ответов, seed
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.3"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_ERROR_KINDS = os.getenv("FAKE_LLM_ERROR_KINDS", "rate_limit,server_error,timeout")
+FAKE_LLM_RETRY_AFTER = float(os.getenv("FAKE_LLM_RETRY_AFTER", "1"))
+FAKE_LLM_ITEMS = int(os.getenv("FAKE_LLM_ITEMS", "5"))
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED", "")
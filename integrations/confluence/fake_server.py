@@ -0,0 +1,335 @@
+# integrations/confluence/fake_server.py
+"""
+Локальный заменитель Confluence REST API для интеграционных и нагрузочных
+прогонов без настоящего Atlassian (manage.py fake_confluence,
+manage.py load_test_confluence_publish).
+
+Поддерживает то, чем пользуемся мы:
+- GET  /rest/api/space?start=&limit=            — постраничный список space'ов;
+- POST /rest/api/content                         — создание страницы (уникальный title в space);
+- GET  /rest/api/content/{id}[?expand=version]   — страница и её версия;
+- PUT  /rest/api/content/{id}                    — новая версия (строго текущая + 1, иначе 409);
+- PUT|POST /rest/api/content/{id}/child/attachment — вложение (нужен X-Atlassian-Token).
+
+Сбои и задержки: latency (+ случайный jitter), доля ответов 429 с Retry-After
+и 503 — такие запросы не выполняются, как и у настоящего сервера.
+GET /__stats__ — счётчики (операции, инъекции, число TCP-соединений),
+POST /__reset__ — сбросить счётчики и данные.
+"""
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+_CONTENT_RE = re.compile(r"^/rest/api/content/([^/]+)$")
+_ATTACHMENT_RE = re.compile(r"^/rest/api/content/([^/]+)/child/attachment$")
+_FILENAME_RE = re.compile(rb'filename="([^"]*)"')
+
+
+class FakeConfluenceState:
+    def __init__(
+        self,
+        *,
+        spaces: int = 250,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_429: float = 0.0,
+        rate_5xx: float = 0.0,
+        retry_after: float = 1.0,
+        username: Optional[str] = None,
+        api_token: Optional[str] = None,
+        seed: Optional[int] = None,
+    ):
+        self.space_count = spaces
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.auth = (
+            "Basic " + base64.b64encode(f"{username}:{api_token}".encode()).decode()
+            if username else None
+        )
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.pages: Dict[str, Dict[str, Any]] = {}
+            self.titles: Dict[Tuple[str, str], str] = {}
+            self.next_id = 1000
+            self.ops: Counter = Counter()
+            self.requests = 0
+            self.injected: Counter = Counter()
+            self.connections = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "ops": dict(self.ops),
+                "injected": dict(self.injected),
+                "pages": len(self.pages),
+                "attachments": sum(len(p["attachments"]) for p in self.pages.values()),
+            }
+
+    def fault(self) -> Optional[int]:
+        with self.lock:
+            roll = self.random.random()
+            if roll < self.rate_429:
+                self.injected["429"] += 1
+                return 429
+            if roll < self.rate_429 + self.rate_5xx:
+                self.injected["503"] += 1
+                return 503
+        return None
+
+    def delay(self) -> float:
+        if not self.latency and not self.jitter:
+            return 0.0
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeConfluence/1.0"
+    state: FakeConfluenceState  # задаётся в FakeConfluenceServer
+
+    # один экземпляр обработчика = одно TCP-соединение (keep-alive внутри);
+    # считаем его при первом запросе к API, служебные /__stats__ не в счёт
+    counted = False
+
+    def log_message(self, format, *args):
+        pass
+
+    # --- ответы ---
+
+    def _send(self, code: int, body: Any = None, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body if body is not None else {}).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, code: int, message: str) -> None:
+        self._send(code, {"statusCode": code, "message": message})
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _page_json(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": page["id"],
+            "type": "page",
+            "title": page["title"],
+            "space": {"key": page["space"]},
+            "version": {"number": page["version"]},
+            "ancestors": [{"id": a} for a in page["ancestors"]],
+            "_links": {"webui": f"/spaces/{page['space']}/pages/{page['id']}"},
+        }
+
+    # --- диспетчер ---
+
+    def _dispatch(self, method: str) -> None:
+        body = self._body()  # читаем всегда, иначе keep-alive соединение сломается
+        url = urlparse(self.path)
+        state = self.state
+
+        if url.path == "/__stats__" and method == "GET":
+            return self._send(200, state.stats())
+        if url.path == "/__reset__" and method == "POST":
+            state.reset()
+            return self._send(200, {})
+
+        with state.lock:
+            state.requests += 1
+            if not self.counted:
+                self.counted = True
+                state.connections += 1
+
+        delay = state.delay()
+        if delay:
+            time.sleep(delay)
+
+        if state.auth and self.headers.get("Authorization") != state.auth:
+            return self._error(401, "Unauthorized")
+
+        code = state.fault()
+        if code == 429:
+            return self._error_with_retry(429)
+        if code == 503:
+            return self._error_with_retry(503)
+
+        query = parse_qs(url.query)
+        if url.path == "/rest/api/space" and method == "GET":
+            return self._list_spaces(query)
+        if url.path == "/rest/api/content" and method == "POST":
+            return self._create_page(body)
+        match = _ATTACHMENT_RE.match(url.path)
+        if match and method in ("PUT", "POST"):
+            return self._put_attachment(match.group(1), body)
+        match = _CONTENT_RE.match(url.path)
+        if match and method == "GET":
+            return self._get_page(match.group(1))
+        if match and method == "PUT":
+            return self._update_page(match.group(1), body)
+        return self._error(404, f"No route for {method} {url.path}")
+
+    def _error_with_retry(self, code: int) -> None:
+        self._send(
+            code,
+            {"statusCode": code, "message": "injected"},
+            headers={"Retry-After": f"{self.state.retry_after:g}"},
+        )
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    # --- операции ---
+
+    def _list_spaces(self, query: Dict[str, Any]) -> None:
+        start = int(query.get("start", ["0"])[0])
+        limit = min(int(query.get("limit", ["25"])[0]), 500)
+        end = min(start + limit, self.state.space_count)
+        results = [
+            {"key": f"SP{i}", "name": f"Space {i}", "type": "global"}
+            for i in range(start, end)
+        ]
+        with self.state.lock:
+            self.state.ops["space.list"] += 1
+        self._send(200, {"results": results, "start": start, "limit": limit, "size": len(results)})
+
+    def _create_page(self, body: bytes) -> None:
+        data = json.loads(body or b"{}")
+        space = (data.get("space") or {}).get("key")
+        title = data.get("title")
+        if not space or not title:
+            return self._error(400, "space and title are required")
+
+        state = self.state
+        with state.lock:
+            if (space, title) in state.titles:
+                duplicate = True
+            else:
+                duplicate = False
+                page_id = str(state.next_id)
+                state.next_id += 1
+                page = {
+                    "id": page_id,
+                    "space": space,
+                    "title": title,
+                    "version": 1,
+                    "body": ((data.get("body") or {}).get("storage") or {}).get("value", ""),
+                    "ancestors": [a["id"] for a in data.get("ancestors") or []],
+                    "attachments": {},
+                }
+                state.pages[page_id] = page
+                state.titles[(space, title)] = page_id
+                state.ops["content.create"] += 1
+        if duplicate:
+            return self._error(400, "A page with this title already exists")
+        self._send(200, self._page_json(page))
+
+    def _get_page(self, page_id: str) -> None:
+        with self.state.lock:
+            page = self.state.pages.get(page_id)
+            self.state.ops["content.get"] += 1
+        if page is None:
+            return self._error(404, "Page not found")
+        self._send(200, self._page_json(page))
+
+    def _update_page(self, page_id: str, body: bytes) -> None:
+        data = json.loads(body or b"{}")
+        number = int((data.get("version") or {}).get("number") or 0)
+
+        state = self.state
+        with state.lock:
+            page = state.pages.get(page_id)
+            if page is None:
+                result = 404
+            elif number != page["version"] + 1:
+                result = 409
+            else:
+                result = 200
+                page["version"] = number
+                page["title"] = data.get("title") or page["title"]
+                page["body"] = ((data.get("body") or {}).get("storage") or {}).get("value", "")
+                state.ops["content.update"] += 1
+        if result == 404:
+            return self._error(404, "Page not found")
+        if result == 409:
+            return self._error(409, f"Version must be {page['version'] + 1}")
+        self._send(200, self._page_json(page))
+
+    def _put_attachment(self, page_id: str, body: bytes) -> None:
+        if self.headers.get("X-Atlassian-Token") != "no-check":
+            return self._error(403, "XSRF check failed")
+        match = _FILENAME_RE.search(body)
+        if match is None:
+            return self._error(400, "No file in multipart body")
+        filename = match.group(1).decode("utf-8", "replace")
+
+        with self.state.lock:
+            page = self.state.pages.get(page_id)
+            if page is not None:
+                page["attachments"][filename] = len(body)
+                self.state.ops["attachment.put"] += 1
+        if page is None:
+            return self._error(404, "Page not found")
+        self._send(200, {"results": [{"id": f"att-{page_id}-{filename}", "title": filename}]})
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # по умолчанию 5 — под нагрузкой соединения отбрасывались бы ещё в accept()
+    request_queue_size = 128
+
+
+class FakeConfluenceServer:
+    """
+    Сервер в фоновом потоке: start() -> url, stop() в конце.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **options: Any):
+        self.state = FakeConfluenceState(**options)
+        handler = type("FakeConfluenceHandler", (_Handler,), {"state": self.state})
+        self.httpd = _HTTPServer((host, port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-confluence", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self) -> None:
+        self.httpd.serve_forever()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
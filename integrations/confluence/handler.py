@@ -1,9 +1,8 @@
 # integrations/confluence/handler.py
 
-import requests
-import time
 from typing import List, Dict, Optional, Any
-from requests.auth import HTTPBasicAuth
+
+from .transport import get_async_transport, get_transport
 
 
 class ConfluenceHandler:
@@ -22,8 +21,7 @@ class ConfluenceHandler:
         self.default_space_key = default_space_key
         self.connection_timeout = connection_timeout / 1000
         self.request_timeout = request_timeout / 1000
-        self.auth = HTTPBasicAuth(username, api_token)
-        self.api_base = f"{self.base_url}/rest/api"
+        self.transport = get_transport(self.base_url, username, api_token)
 
     def _make_request(
         self,
@@ -31,17 +29,12 @@ class ConfluenceHandler:
         params: Optional[Dict[str, Any]] = None,
         method: str = "GET",
     ) -> Dict[str, Any]:
-        url = f"{self.api_base}/{endpoint}"
-
-        response = requests.request(
-            method=method,
-            url=url,
-            auth=self.auth,
+        return self.transport.request(
+            method,
+            endpoint,
             params=params,
             timeout=(self.connection_timeout, self.request_timeout),
         )
-        response.raise_for_status()
-        return response.json()
 
     def get_all_spaces(self) -> List[Dict[str, Any]]:
         spaces: List[Dict[str, Any]] = []
@@ -59,7 +52,35 @@ class ConfluenceHandler:
             if len(results) < limit:
                 break
 
+            # без паузы: при 429 транспорт сам подождёт Retry-After
             start += limit
-            time.sleep(0.1)
+
+        return spaces
+
+    async def aget_all_spaces(self) -> List[Dict[str, Any]]:
+        """
+        Асинхронный вариант get_all_spaces для кода, живущего в event loop.
+        """
+        spaces: List[Dict[str, Any]] = []
+        start = 0
+        limit = 100
+
+        transport = get_async_transport(self.base_url, self.username, self.api_token)
+        try:
+            while True:
+                response = await transport.request(
+                    "GET",
+                    "space",
+                    params={"start": start, "limit": limit},
+                )
+                results = response.get("results", [])
+                spaces.extend(results)
+
+                if len(results) < limit:
+                    break
+
+                start += limit
+        finally:
+            await transport.aclose()
 
         return spaces
@@ -1,10 +1,37 @@
 # integrations/confluence/service.py
+"""
+Справочник space'ов Confluence для формы кейса.
+
+Полный список space'ов — это десятки страниц API, поэтому он хранится
+в кэше Django (stale-while-revalidate):
+- свежее CONFLUENCE_SPACES_TTL — отдаём как есть;
+- старше — отдаём сразу, а обновление ставим в фон (одно на все процессы,
+  если кэш общий);
+- запись живёт ещё CONFLUENCE_SPACES_STALE_SECONDS — на это время
+  недоступность Confluence не ломает форму.
+Холодный кэш заполняется синхронно (в процессе — один запрос к Confluence).
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List
 
-from typing import List, Dict
 from django.conf import settings
+from django.core.cache import cache
+
+from forte_ai_back import background
 
 from .handler import ConfluenceHandler
 
+logger = logging.getLogger(__name__)
+
+SPACES_CACHE_KEY = "confluence:spaces:v1"
+SPACES_REFRESH_LOCK_KEY = "confluence:spaces:refresh"
+
+_fill_lock = threading.Lock()
+
 
 def get_confluence_client() -> ConfluenceHandler:
     if not settings.CONFLUENCE_BASE_URL:
@@ -19,7 +46,7 @@ def get_confluence_client() -> ConfluenceHandler:
 
 def list_spaces_short() -> List[Dict[str, str]]:
     """
-    Вернуть только key + name для фронта.
+    Вернуть только key + name для фронта (живой запрос в Confluence).
     """
     client = get_confluence_client()
     spaces = client.get_all_spaces()
@@ -33,3 +60,71 @@ def list_spaces_short() -> List[Dict[str, str]]:
             }
         )
     return result
+
+
+def _ttl() -> float:
+    return float(getattr(settings, "CONFLUENCE_SPACES_TTL", 300))
+
+
+def refresh_space_directory() -> Dict[str, Any]:
+    """
+    Перечитывает space'ы из Confluence и кладёт в кэш уже отсортированными.
+    """
+    spaces = sorted(list_spaces_short(), key=lambda x: x["name"].lower())
+    payload = json.dumps(spaces, ensure_ascii=False, sort_keys=True)
+    directory = {
+        "spaces": spaces,
+        "etag": hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32],
+        "fetched_at": time.time(),
+    }
+    cache.set(
+        SPACES_CACHE_KEY,
+        directory,
+        timeout=_ttl() + float(getattr(settings, "CONFLUENCE_SPACES_STALE_SECONDS", 24 * 3600)),
+    )
+    logger.info("Confluence space directory refreshed: %d spaces", len(spaces))
+    return directory
+
+
+def _refresh_in_background() -> None:
+    try:
+        refresh_space_directory()
+    finally:
+        cache.delete(SPACES_REFRESH_LOCK_KEY)
+
+
+def get_space_directory() -> Dict[str, Any]:
+    """
+    {"spaces": [...], "etag": str, "fetched_at": float} из кэша;
+    устаревшая запись отдаётся сразу, обновление — в фоне.
+    """
+    directory = cache.get(SPACES_CACHE_KEY)
+    if directory is None:
+        with _fill_lock:
+            directory = cache.get(SPACES_CACHE_KEY)
+            if directory is None:
+                return refresh_space_directory()
+
+    if time.time() - directory["fetched_at"] > _ttl():
+        # cache.add атомарен: обновление запускает только первый запрос;
+        # таймаут замка — на случай, если процесс умер посреди обновления
+        if cache.add(SPACES_REFRESH_LOCK_KEY, 1, timeout=float(getattr(settings, "CONFLUENCE_HTTP_TIMEOUT", 30)) * 4):
+            background.submit(_refresh_in_background)
+    return directory
+
+
+def search_spaces(spaces: List[Dict[str, str]], query: str) -> List[Dict[str, str]]:
+    """
+    Поиск по префиксу без учёта регистра: key целиком или любое слово в name.
+    """
+    query = (query or "").strip().lower()
+    if not query:
+        return spaces
+
+    result: List[Dict[str, str]] = []
+    for s in spaces:
+        key = s["key"].lower()
+        name = s["name"].lower()
+        if key.startswith(query) or name.startswith(query) or any(w.startswith(query) for w in name.split()):
+            result.append(s)
+    return result
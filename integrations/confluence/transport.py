@@ -0,0 +1,308 @@
+# integrations/confluence/transport.py
+"""
+Единый HTTP-транспорт к Confluence REST API.
+
+- get_transport() — общий на процесс транспорт поверх requests.Session
+  с пулом соединений (keep-alive) и ограниченными таймаутами из settings;
+- get_async_transport() — асинхронный близнец на httpx.AsyncClient;
+- одна политика повторов: 429 и 5xx/сетевые ошибки, экспоненциальный backoff
+  с "full jitter", Retry-After от сервера имеет приоритет и соблюдается как есть;
+  общее время повторов одного запроса ограничено CONFLUENCE_RETRY_DEADLINE.
+
+Не-идемпотентные запросы (POST) повторяются только там, где сервер их точно
+не выполнил: 429, 503 и ошибка установки соединения. Иначе повтор создания
+страницы мог бы завести её дубликат.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# сервер гарантированно не обработал запрос — можно повторять и POST
+SAFE_RETRY_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class ConfluenceError(Exception):
+    """
+    Ошибка Confluence API после всех повторов.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _timeout() -> Tuple[float, float]:
+    return (
+        float(getattr(settings, "CONFLUENCE_HTTP_CONNECT_TIMEOUT", 5)),
+        float(getattr(settings, "CONFLUENCE_HTTP_TIMEOUT", 30)),
+    )
+
+
+def _max_retries() -> int:
+    return int(getattr(settings, "CONFLUENCE_MAX_RETRIES", 3))
+
+
+def compute_backoff(attempt: int) -> float:
+    base = float(getattr(settings, "CONFLUENCE_RETRY_BASE_DELAY", 0.5))
+    cap = float(getattr(settings, "CONFLUENCE_RETRY_MAX_DELAY", 10))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After: секунды или HTTP-дата.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _next_delay(retry_after: Optional[str], attempt: int) -> float:
+    # Retry-After не режем: повтор раньше срока сервер снова отклонит
+    delay = parse_retry_after(retry_after)
+    if delay is not None:
+        return delay
+    return compute_backoff(attempt)
+
+
+def _retry_deadline() -> float:
+    """
+    Момент (time.monotonic), после которого запрос больше не повторяем.
+    """
+    return time.monotonic() + float(getattr(settings, "CONFLUENCE_RETRY_DEADLINE", 120))
+
+
+def _past_deadline(deadline: float, delay: float) -> bool:
+    return time.monotonic() + delay > deadline
+
+
+def _should_retry_status(method: str, status_code: int) -> bool:
+    if status_code not in RETRYABLE_STATUSES:
+        return False
+    return method in IDEMPOTENT_METHODS or status_code in SAFE_RETRY_STATUSES
+
+
+def _decode(response_status: int, text: str, json_fn, url: str) -> Dict[str, Any]:
+    if response_status >= 400:
+        raise ConfluenceError(
+            f"Confluence {response_status} for {url}: {text[:500]}",
+            status_code=response_status,
+        )
+    if response_status == 204 or not text:
+        return {}
+    return json_fn()
+
+
+class ConfluenceTransport:
+    def __init__(self, base_url: str, username: str, api_token: str):
+        self.base_url = base_url.rstrip("/")
+        self.api_base = f"{self.base_url}/rest/api"
+
+        pool_size = int(getattr(settings, "CONFLUENCE_HTTP_POOL_SIZE", 10))
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(username, api_token)
+        self.session.headers["Accept"] = "application/json"
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, endpoint: str) -> str:
+        return f"{self.api_base}/{endpoint.lstrip('/')}"
+
+    def request(
+        self,
+        method: str,
+        endpoint: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        files: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[Tuple[float, float]] = None,
+    ) -> Dict[str, Any]:
+        """
+        files — multipart (для вложений): значения должны быть байтами,
+        а не открытыми файлами, иначе повтор отправит пустое тело.
+        """
+        method = method.upper()
+        url = self.url(endpoint)
+        max_retries = _max_retries()
+        deadline = _retry_deadline()
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    params=params,
+                    json=json,
+                    files=files,
+                    headers=headers,
+                    timeout=timeout or _timeout(),
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # ReadTimeout у POST: запрос мог дойти до сервера — не повторяем
+                retryable = method in IDEMPOTENT_METHODS or isinstance(e, requests.ConnectTimeout) or (
+                    isinstance(e, requests.ConnectionError) and not isinstance(e, requests.ReadTimeout)
+                )
+                delay = compute_backoff(attempt)
+                if not retryable or attempt >= max_retries or _past_deadline(deadline, delay):
+                    raise ConfluenceError(f"Confluence request {method} {url} failed: {e}") from e
+                reason = type(e).__name__
+            else:
+                if not _should_retry_status(method, response.status_code) or attempt >= max_retries:
+                    return _decode(response.status_code, response.text, response.json, url)
+                delay = _next_delay(response.headers.get("Retry-After"), attempt)
+                if _past_deadline(deadline, delay):
+                    return _decode(response.status_code, response.text, response.json, url)
+                reason = f"HTTP {response.status_code}"
+
+            logger.warning(
+                "Confluence %s %s failed (%s), retry %d/%d in %.2fs",
+                method, endpoint, reason, attempt + 1, max_retries, delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncConfluenceTransport:
+    """
+    Асинхронный близнец ConfluenceTransport.
+    httpx.AsyncClient привязан к event loop — создавайте и используйте
+    его из одного долгоживущего loop.
+    """
+
+    def __init__(self, base_url: str, username: str, api_token: str):
+        self.base_url = base_url.rstrip("/")
+        self.api_base = f"{self.base_url}/rest/api"
+
+        pool_size = int(getattr(settings, "CONFLUENCE_HTTP_POOL_SIZE", 10))
+        connect, read = _timeout()
+        self.client = httpx.AsyncClient(
+            auth=(username, api_token),
+            headers={"Accept": "application/json"},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+
+    def url(self, endpoint: str) -> str:
+        return f"{self.api_base}/{endpoint.lstrip('/')}"
+
+    async def request(
+        self,
+        method: str,
+        endpoint: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        files: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        method = method.upper()
+        url = self.url(endpoint)
+        max_retries = _max_retries()
+        deadline = _retry_deadline()
+
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(
+                    method, url, params=params, json=json, files=files, headers=headers
+                )
+            except httpx.TransportError as e:
+                retryable = method in IDEMPOTENT_METHODS or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                delay = compute_backoff(attempt)
+                if not retryable or attempt >= max_retries or _past_deadline(deadline, delay):
+                    raise ConfluenceError(f"Confluence request {method} {url} failed: {e}") from e
+                reason = type(e).__name__
+            else:
+                if not _should_retry_status(method, response.status_code) or attempt >= max_retries:
+                    return _decode(response.status_code, response.text, response.json, url)
+                delay = _next_delay(response.headers.get("Retry-After"), attempt)
+                if _past_deadline(deadline, delay):
+                    return _decode(response.status_code, response.text, response.json, url)
+                reason = f"HTTP {response.status_code}"
+
+            logger.warning(
+                "Async Confluence %s %s failed (%s), retry %d/%d in %.2fs",
+                method, endpoint, reason, attempt + 1, max_retries, delay,
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_lock = threading.Lock()
+_transports: Dict[Tuple[str, str, str], ConfluenceTransport] = {}
+
+
+def get_transport(
+    base_url: Optional[str] = None,
+    username: Optional[str] = None,
+    api_token: Optional[str] = None,
+) -> ConfluenceTransport:
+    """
+    Общий на процесс транспорт (по base_url + учётке), по умолчанию — из settings.
+    """
+    key = (
+        (base_url or settings.CONFLUENCE_BASE_URL).rstrip("/"),
+        username or settings.CONFLUENCE_USERNAME,
+        api_token or settings.CONFLUENCE_API_TOKEN,
+    )
+    transport = _transports.get(key)
+    if transport is None:
+        with _lock:
+            transport = _transports.get(key)
+            if transport is None:
+                transport = ConfluenceTransport(*key)
+                _transports[key] = transport
+    return transport
+
+
+def get_async_transport(
+    base_url: Optional[str] = None,
+    username: Optional[str] = None,
+    api_token: Optional[str] = None,
+) -> AsyncConfluenceTransport:
+    """
+    Новый асинхронный транспорт: вызывающий владеет им и закрывает через aclose().
+    """
+    return AsyncConfluenceTransport(
+        base_url or settings.CONFLUENCE_BASE_URL,
+        username or settings.CONFLUENCE_USERNAME,
+        api_token or settings.CONFLUENCE_API_TOKEN,
+    )
+
+
+def reset_transports() -> None:
+    with _lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
@@ -1,13 +1,16 @@
 # integrations/confluence/views.py
 
+import hashlib
+
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
-from drf_spectacular.utils import extend_schema, OpenApiResponse
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 from drf_spectacular.types import OpenApiTypes
 
-from .service import list_spaces_short
+from .service import get_space_directory, search_spaces
 
 
 @extend_schema(
@@ -15,20 +18,41 @@ from .service import list_spaces_short
     summary="Список доступных Confluence spaces",
     description=(
         "Возвращает список space'ов в Confluence, чтобы пользователь мог выбрать, "
-        "куда будут выгружаться артефакты / где уже лежит документация."
+        "куда будут выгружаться артефакты / где уже лежит документация.\n\n"
+        "Список берётся из кэша и обновляется в фоне (CONFLUENCE_SPACES_TTL). "
+        "`q` — поиск по префиксу key или слова в name. "
+        "Ответ с ETag: при совпадении If-None-Match — 304 без тела."
     ),
+    parameters=[
+        OpenApiParameter("q", OpenApiTypes.STR, description="Префикс key или name (без учёта регистра)"),
+    ],
     responses={
         200: OpenApiResponse(
             description="Список space'ов",
             response=OpenApiTypes.OBJECT,
-        )
+        ),
+        304: OpenApiResponse(description="Не изменилось (If-None-Match)"),
     },
 )
 class ConfluenceSpacesView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        spaces = list_spaces_short()
-        # Можно дополнительно отсортировать по name
-        spaces = sorted(spaces, key=lambda x: x["name"].lower())
-        return Response({"spaces": spaces})
+        directory = get_space_directory()
+        query = request.query_params.get("q", "").strip()
+
+        # тело зависит от версии справочника и от q
+        etag = f'"{directory["etag"]}'
+        if query:
+            etag += "-" + hashlib.sha256(query.lower().encode("utf-8")).hexdigest()[:8]
+        etag += '"'
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            # справочник уже отсортирован по name при обновлении
+            response = Response({"spaces": search_spaces(directory["spaces"], query)})
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
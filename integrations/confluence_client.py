@@ -1,11 +1,11 @@
 # integrations/confluence_client.py
 from typing import Any, Dict, Optional, Tuple
 
-import requests
-from requests.auth import HTTPBasicAuth
 from django.conf import settings
 import logging
 
+from integrations.confluence.transport import ConfluenceError, get_transport
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,16 +19,22 @@ class ConfluenceClient:
         self.base_url = (base_url or settings.CONFLUENCE_BASE_URL).rstrip("/")
         self.username = username or settings.CONFLUENCE_USERNAME
         self.api_token = api_token or settings.CONFLUENCE_API_TOKEN
-        self.api_base = f"{self.base_url}/rest/api"
-        self.auth = HTTPBasicAuth(self.username, self.api_token)
+        # общий пул соединений, таймауты и повторы — в транспорте
+        self.transport = get_transport(self.base_url, self.username, self.api_token)
 
-    def _request(self, method: str, endpoint: str, json: Dict[str, Any]) -> Dict[str, Any]:
-        url = f"{self.api_base}/{endpoint.lstrip('/')}"
-        resp = requests.request(method, url, auth=self.auth, json=json)
-        resp.raise_for_status()
-        return resp.json()
+    def _request(self, method: str, endpoint: str, json: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self.transport.request(method, endpoint, json=json)
 
-    def create_page(self, space_key: str, title: str, html_body: str) -> Tuple[str, str]:
+    def create_page(
+        self,
+        space_key: str,
+        title: str,
+        html_body: str,
+        parent_id: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """
+        Новая страница (версия 1); parent_id — создать дочерней.
+        """
         payload = {
             "type": "page",
             "title": title,
@@ -40,9 +46,66 @@ class ConfluenceClient:
                 }
             },
         }
+        if parent_id:
+            payload["ancestors"] = [{"id": parent_id}]
         data = self._request("POST", "content", payload)
         page_id = data["id"]
         webui = data.get("_links", {}).get("webui", "")
         url = f"{self.base_url}{webui}"
         logger.info("Created Confluence page %s for space %s", page_id, space_key)
         return page_id, url
+
+    def get_page_version(self, page_id: str) -> int:
+        data = self.transport.request("GET", f"content/{page_id}", params={"expand": "version"})
+        return int(data["version"]["number"])
+
+    def update_page(self, page_id: str, title: str, html_body: str, version: int) -> int:
+        """
+        Новая версия страницы поверх version; возвращает номер записанной версии.
+        Если страницу успели поправить в Confluence (409) — перечитываем
+        номер версии и повторяем один раз: источник правды — наш документ.
+        """
+        def payload(number: int) -> Dict[str, Any]:
+            return {
+                "id": page_id,
+                "type": "page",
+                "title": title,
+                "version": {"number": number},
+                "body": {
+                    "storage": {
+                        "value": html_body,
+                        "representation": "storage",
+                    }
+                },
+            }
+
+        number = version + 1
+        try:
+            data = self._request("PUT", f"content/{page_id}", payload(number))
+        except ConfluenceError as e:
+            if e.status_code != 409:
+                raise
+            current = self.get_page_version(page_id)
+            logger.warning(
+                "Confluence page %s version conflict (%s != %s), overwriting",
+                page_id, version, current,
+            )
+            number = current + 1
+            data = self._request("PUT", f"content/{page_id}", payload(number))
+
+        number = int(data.get("version", {}).get("number") or number)
+        logger.info("Updated Confluence page %s to version %s", page_id, number)
+        return number
+
+    def upload_attachment(self, page_id: str, filename: str, data: bytes, content_type: str) -> None:
+        """
+        Создать или заменить вложение страницы (PUT child/attachment — одна операция
+        для обоих случаев, по имени файла).
+        """
+        self.transport.request(
+            "PUT",
+            f"content/{page_id}/child/attachment",
+            files={"file": (filename, data, content_type)},
+            headers={"X-Atlassian-Token": "no-check"},
+        )
+        logger.info("Uploaded attachment %s to Confluence page %s", filename, page_id)
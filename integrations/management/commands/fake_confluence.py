@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from integrations.confluence.fake_server import FakeConfluenceServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Локальный заменитель Confluence REST API (space'ы, страницы, версии, вложения) "
+        "с инъекцией задержек, 429 и 503. Для прогонов без настоящего Atlassian: "
+        "CONFLUENCE_BASE_URL=http://127.0.0.1:<port>. Счётчики — GET /__stats__."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument("--spaces", type=int, default=250, help="Сколько space'ов отдавать.")
+        parser.add_argument("--latency-ms", type=float, default=0, help="Задержка каждого ответа.")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="Случайная добавка к задержке (0..N).")
+        parser.add_argument("--rate-429", type=float, default=0, help="Доля ответов 429 (0..1).")
+        parser.add_argument("--rate-5xx", type=float, default=0, help="Доля ответов 503 (0..1).")
+        parser.add_argument("--retry-after", type=float, default=1, help="Retry-After для 429/503, сек.")
+        parser.add_argument("--username", default=None, help="Требовать Basic-авторизацию с этой учёткой.")
+        parser.add_argument("--api-token", default=None)
+        parser.add_argument("--seed", type=int, default=None, help="Seed для воспроизводимых сбоев.")
+
+    def handle(self, *args, **options):
+        server = FakeConfluenceServer(
+            host=options["host"],
+            port=options["port"],
+            spaces=options["spaces"],
+            latency=options["latency_ms"] / 1000,
+            jitter=options["jitter_ms"] / 1000,
+            rate_429=options["rate_429"],
+            rate_5xx=options["rate_5xx"],
+            retry_after=options["retry_after"],
+            username=options["username"],
+            api_token=options["api_token"],
+            seed=options["seed"],
+        )
+        self.stdout.write(f"Fake Confluence listening on {server.url} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.httpd.server_close()
+            self.stdout.write(f"stats: {server.state.stats()}")
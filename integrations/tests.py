@@ -0,0 +1,267 @@
+import io
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from accounts.models import User
+from documents.testing import jwt_client
+from integrations.confluence import service, transport
+from integrations.confluence.fake_server import FakeConfluenceServer
+from integrations.confluence.transport import ConfluenceError, ConfluenceTransport
+
+
+def _response(status_code, headers=None, payload=None):
+    response = mock.Mock(status_code=status_code, headers=headers or {}, text="{}" if payload else "")
+    response.json.return_value = payload or {}
+    return response
+
+
+@override_settings(CONFLUENCE_MAX_RETRIES=3, CONFLUENCE_RETRY_MAX_DELAY=10)
+class ConfluenceRetryAfterTests(SimpleTestCase):
+    """
+    Retry-After соблюдается как есть, а не обрезается до CONFLUENCE_RETRY_MAX_DELAY;
+    общее время повторов ограничено CONFLUENCE_RETRY_DEADLINE.
+    """
+
+    def setUp(self):
+        self.transport = ConfluenceTransport("https://confluence.invalid", "user", "token")
+        self.addCleanup(self.transport.close)
+        sleep = mock.patch.object(transport.time, "sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    @override_settings(CONFLUENCE_RETRY_DEADLINE=120)
+    def test_retry_after_above_max_delay_is_honoured(self):
+        responses = [_response(429, {"Retry-After": "30"}), _response(200, payload={"id": "1"})]
+        with mock.patch.object(self.transport.session, "request", side_effect=responses):
+            self.assertEqual(self.transport.request("GET", "content/1"), {"id": "1"})
+        self.sleep.assert_called_once_with(30.0)
+
+    @override_settings(CONFLUENCE_RETRY_DEADLINE=20)
+    def test_retry_after_past_deadline_fails_without_waiting(self):
+        with mock.patch.object(
+            self.transport.session, "request", return_value=_response(429, {"Retry-After": "30"})
+        ) as request:
+            with self.assertRaises(ConfluenceError) as ctx:
+                self.transport.request("GET", "content/1")
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertEqual(request.call_count, 1)
+        self.sleep.assert_not_called()
+
+
+SPACES = [
+    {"key": "OPS", "name": "operations wiki"},
+    {"key": "DEV", "name": "Development"},
+    {"key": "ARCH", "name": "Архитектура решений"},
+]
+
+
+@override_settings(CONFLUENCE_SPACES_TTL=300)
+class SpaceDirectoryTests(TestCase):
+    """
+    Справочник space'ов: кэш со stale-while-revalidate и ETag в API.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("spaces@example.invalid", "pw")
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        fetch = mock.patch.object(service, "list_spaces_short", side_effect=lambda: [dict(s) for s in SPACES])
+        self.fetch = fetch.start()
+        self.addCleanup(fetch.stop)
+
+        submit = mock.patch.object(service.background, "submit")
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+
+        self.client = jwt_client(self.user)
+
+    def _age(self, seconds):
+        directory = cache.get(service.SPACES_CACHE_KEY)
+        directory["fetched_at"] = time.time() - seconds
+        cache.set(service.SPACES_CACHE_KEY, directory)
+
+    def test_cold_cache_fills_once_sorted(self):
+        directory = service.get_space_directory()
+        self.assertEqual([s["key"] for s in directory["spaces"]], ["DEV", "OPS", "ARCH"])
+        self.assertEqual(service.get_space_directory(), directory)
+        self.assertEqual(self.fetch.call_count, 1)
+        self.submit.assert_not_called()
+
+    def test_stale_entry_served_while_one_refresh_runs(self):
+        before = service.get_space_directory()
+        self._age(301)
+
+        stale = service.get_space_directory()
+        service.get_space_directory()
+        # ответ — сразу из кэша, обновление в фоне ставится один раз
+        self.assertEqual(stale["etag"], before["etag"])
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(self.submit.call_count, 1)
+
+        self.fetch.side_effect = lambda: SPACES + [{"key": "NEW", "name": "New space"}]
+        self.submit.call_args.args[0]()
+
+        fresh = service.get_space_directory()
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertNotEqual(fresh["etag"], before["etag"])
+        self.assertIn("NEW", [s["key"] for s in fresh["spaces"]])
+        # замок снят — следующее устаревание снова обновит справочник
+        self.assertIsNone(cache.get(service.SPACES_REFRESH_LOCK_KEY))
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        before = service.get_space_directory()
+        self._age(301)
+        service.get_space_directory()
+
+        self.fetch.side_effect = RuntimeError("confluence down")
+        with self.assertRaises(RuntimeError):
+            self.submit.call_args.args[0]()
+
+        self.assertEqual(service.get_space_directory()["spaces"], before["spaces"])
+        self.assertEqual(self.submit.call_count, 2)
+
+    def test_etag_revalidation(self):
+        resp = self.client.get("/api/confluence/spaces/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()["spaces"]), 3)
+        etag = resp["ETag"]
+
+        resp = self.client.get("/api/confluence/spaces/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp["ETag"], etag)
+
+        # другой q — другое тело и другой ETag
+        resp = self.client.get("/api/confluence/spaces/", {"q": "wik"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["spaces"], [{"key": "OPS", "name": "operations wiki"}])
+        self.assertNotEqual(resp["ETag"], etag)
+
+        # после обновления справочника старый ETag не подходит
+        self.fetch.side_effect = lambda: SPACES + [{"key": "NEW", "name": "New space"}]
+        service.refresh_space_directory()
+        resp = self.client.get("/api/confluence/spaces/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.json()["spaces"]), 4)
+
+    def test_search_spaces(self):
+        for query, keys in (("", ["OPS", "DEV", "ARCH"]), ("de", ["DEV"]), ("РЕШ", ["ARCH"]), ("ki", [])):
+            with self.subTest(query=query):
+                self.assertEqual([s["key"] for s in service.search_spaces(SPACES, query)], keys)
+
+
+class FakeConfluenceServerTests(SimpleTestCase):
+    """
+    Заменитель Confluence ведёт себя как настоящий там, где на это
+    полагаются публикация и нагрузочный тест.
+    """
+
+    def setUp(self):
+        self.server = FakeConfluenceServer(spaces=30, username="bot", api_token="token")
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.transport = ConfluenceTransport(self.server.url, "bot", "token")
+        self.addCleanup(self.transport.close)
+        sleep = mock.patch.object(transport.time, "sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def _create(self, title="Page"):
+        return self.transport.request(
+            "POST",
+            "content",
+            json={"type": "page", "title": title, "space": {"key": "OPS"}, "body": {"storage": {"value": "<p/>"}}},
+        )
+
+    def test_pages_and_versions(self):
+        page = self._create()
+        self.assertEqual(page["version"]["number"], 1)
+
+        with self.assertRaises(ConfluenceError) as ctx:
+            self._create()
+        self.assertEqual(ctx.exception.status_code, 400)
+
+        update = {"title": "Page", "version": {"number": 2}, "body": {"storage": {"value": "<p>v2</p>"}}}
+        self.transport.request("PUT", f"content/{page['id']}", json=update)
+        # повтор той же версии — конфликт, как у Confluence
+        with self.assertRaises(ConfluenceError) as ctx:
+            self.transport.request("PUT", f"content/{page['id']}", json=update)
+        self.assertEqual(ctx.exception.status_code, 409)
+
+        data = self.transport.request("GET", f"content/{page['id']}", params={"expand": "version"})
+        self.assertEqual(data["version"]["number"], 2)
+        self.assertEqual(self.server.state.stats()["ops"]["content.update"], 1)
+
+    def test_attachment_requires_xsrf_header(self):
+        page = self._create()
+        files = {"file": ("a.docx", b"data", "application/octet-stream")}
+        with self.assertRaises(ConfluenceError) as ctx:
+            self.transport.request("PUT", f"content/{page['id']}/child/attachment", files=files)
+        self.assertEqual(ctx.exception.status_code, 403)
+
+        self.transport.request(
+            "PUT",
+            f"content/{page['id']}/child/attachment",
+            files=files,
+            headers={"X-Atlassian-Token": "no-check"},
+        )
+        self.assertEqual(list(self.server.state.pages[page["id"]]["attachments"]), ["a.docx"])
+
+    def test_spaces_are_paged(self):
+        first = self.transport.request("GET", "space", params={"start": 0, "limit": 25})
+        rest = self.transport.request("GET", "space", params={"start": 25, "limit": 25})
+        self.assertEqual((first["size"], rest["size"]), (25, 5))
+
+    def test_wrong_credentials_are_rejected(self):
+        bad = ConfluenceTransport(self.server.url, "bot", "wrong")
+        self.addCleanup(bad.close)
+        with self.assertRaises(ConfluenceError) as ctx:
+            bad.request("GET", "space")
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    def test_injected_429_is_not_applied_and_is_retried(self):
+        self.server.state.retry_after = 2
+        with mock.patch.object(self.server.state, "fault", side_effect=[429, None]):
+            page = self._create()
+
+        self.sleep.assert_called_once_with(2.0)
+        # запрос с 429 страницу не создал — после повтора она одна
+        self.assertEqual(list(self.server.state.pages), [page["id"]])
+        stats = self.server.state.stats()
+        self.assertEqual((stats["requests"], stats["ops"]["content.create"]), (2, 1))
+
+
+class ConfluenceLoadTestCommandTests(TransactionTestCase):
+    """
+    manage.py load_test_confluence_publish на маленьком прогоне: сам проверяет
+    «повторная публикация — 0 запросов, правка — один PUT на кейс».
+    """
+
+    def _run(self, **options):
+        out = io.StringIO()
+        call_command(
+            "load_test_confluence_publish",
+            cases=2,
+            docs=2,
+            concurrency=2,
+            items=3,
+            latency_ms=0,
+            stdout=out,
+            **options,
+        )
+        return out.getvalue()
+
+    def test_clean_run_passes(self):
+        self.assertIn("load test passed", self._run())
+
+    def test_run_with_injected_faults_converges(self):
+        with mock.patch.object(transport.time, "sleep"):
+            output = self._run(rate_429=0.3, rate_5xx=0.1, retry_after=0.01, seed=7, max_retries=5)
+        self.assertIn("load test passed", output)